@@ -4,24 +4,9 @@ Written by:
 """
 import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
 
-ANGLE_VALUE = 0.399
-
-
-def compute_fraction(max, min):
-    return (max - min) / (max + min)
-
-
-def compute_angle(max1, max2, min1, min2):
-    max2 = (max2 + np.pi) % (2 * np.pi)
-    min1 = (min1 + 3 / 2 * np.pi) % (2 * np.pi)
-    min2 = (min2 + 1 / 2 * np.pi) % (2 * np.pi)
-    angle = np.mean((max1, max2, min1, min2))
-
-    if angle > np.pi:
-        angle -= np.pi
-    return angle
+from utils.tip_tilt import (degree_of_polarisation, interpolate_map, polarisation_angle, polarisation_vectors,
+                            read_polarisation_scan)
 
 
 def create_label(ticks):
@@ -34,53 +19,19 @@ def create_label(ticks):
     return labels
 
 
-pd.set_option('display.max_columns', 1000)
-
-prop_cycle = plt.rcParams['axes.prop_cycle']
-colors = prop_cycle.by_key()['color']
-
-data = pd.read_csv('../tip_pol.csv')
-data.drop(1)
-coords = data['BBO tip-tilt (hor turns, vert turns)']
-
-x = np.zeros(len(coords))
-y = np.zeros(len(coords))
-
-for i, coord_tuple in enumerate(coords):
-    x[i], y[i] = eval(coord_tuple)
-
-x *= ANGLE_VALUE
-y *= ANGLE_VALUE
-
-angle_min1 = np.deg2rad(data['angle minimum 1'] - 86)
-angle_min2 = np.deg2rad(data['angle minimum 2'] - 86)
-angle_max1 = np.deg2rad(data['angle maximum 1'] - 86)
-angle_max2 = np.deg2rad(data['angle maximum 2'] - 86)
-
-angle_min1_watt = data['minvalue 1 (mW)'].str.replace(',', '.').astype(float)
-angle_min2_watt = data['minvalue 2 (mW)'].str.replace(',', '.').astype(float)
-angle_max1_watt = data['maxvalue 1 (mW)'].str.replace(',', '.').astype(float)
-angle_max2_watt = data['maxvalue 2 (mW)'].str.replace(',', '.').astype(float)
-
-polarisation_fraction = np.zeros(len(angle_min2_watt))
-polarisation_angle = np.zeros(len(angle_max2))
-
-for i in range(len(x)):
-    polarisation_fraction[i] = compute_fraction(np.mean((angle_max1_watt[i], angle_max2_watt[i])),
-                                                np.mean((angle_min1_watt[i], angle_min2_watt[i])))
-
-    polarisation_angle[i] = compute_angle(angle_max1[i], angle_max2[i], angle_min1[i], angle_min2[i])
-
-dx = np.zeros(len(polarisation_angle))
-dy = np.zeros(len(polarisation_angle))
+scan = read_polarisation_scan()
+x, y = scan['tilt'].T
 
-for i in range(len(x)):
-    dx[i] = polarisation_fraction[i] * np.cos(polarisation_angle[i])
-    dy[i] = polarisation_fraction[i] * np.sin(polarisation_angle[i])
+polarisation_fraction = degree_of_polarisation(scan['power_max'], scan['power_min'])
+angle = polarisation_angle(scan['angle_max'], scan['angle_min'])
+dx, dy = polarisation_vectors(polarisation_fraction, angle)
 
 fig = plt.figure()
 ax = fig.add_subplot(111)
 
+# The interpolated degree of polarisation in the background, the measured polarisation on top.
+horizontal, vertical, fraction_map = interpolate_map(scan['tilt'], polarisation_fraction)
+plt.pcolormesh(horizontal, vertical, fraction_map, shading='auto', alpha=.3)
 plt.quiver(x, y, dx, dy, polarisation_fraction, scale=1.6)
 
 x_ticks = np.arange(-0.15, 0.3, 0.05)
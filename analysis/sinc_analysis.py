@@ -2,18 +2,35 @@
 Written by:
     Douwe Remmelts <remmeltsdouwe@gmail.com>
 """
+from itertools import product
 from os import listdir
 
 import matplotlib.pyplot as plt
 import numpy as np
-from scipy.optimize import curve_fit
+from loguru import logger
 
 from measure.schemes.window_shift_effect import WindowShiftEffect
-from utils.delays import DelayLines
+from utils.fitting import damped_sine as sin_fit
+from utils.fitting import fit_damped_sine, multi_start_fit
 
+# Windows wider than this (in ns) are not physical, fits that end up there are rejected.
+MAXIMUM_WINDOW = 20
 
-def sin_fit(x, f, phi, A, b, alpha):
-    return A * np.exp(-alpha * x) * np.sin(2 * np.pi * f * x + phi) + b
+
+def window_guesses(coincidences, targeted_window_size):
+    """
+    Initial guesses for the window fit around the targeted window size, with the parameters in the order of
+    `WindowShiftEffect._distribution`.
+    """
+    window = (targeted_window_size - 11) * 2
+    return np.array([(np.min(coincidences), np.max(coincidences), sigma, offset, window * scale)
+                     for sigma, offset, scale in product([0.5, 1, 2], [-2, 0, 2], [0.75, 1, 1.25])])
+
+
+def validate_window(popt):
+    if popt[-1] > MAXIMUM_WINDOW:
+        return f'window of {popt[-1]:.1f} ns exceeds {MAXIMUM_WINDOW} ns'
+    return None
 
 
 fit_func = WindowShiftEffect._distribution
@@ -38,36 +55,22 @@ for i, file in enumerate(files):
     # if i > 1:
     #     break
     metadata = np.load(PATH + '/' + file)
-    data = metadata['data']
-    coincidences = data[4]
+    data = WindowShiftEffect.convert_run(metadata['data'], metadata)
+    coincidences = data['coincidences']
     targeted_window_size = metadata['window_size']
 
-    shift_line_C = DelayLines.CA if metadata['shift_A'] else DelayLines.CB
-    fixed_line_C = DelayLines.CB if metadata['shift_A'] else DelayLines.CA
-
-    fixed_delay = fixed_line_C.calculate_delays(metadata['fixed_delay_C'])
-    delay = shift_line_C.calculate_delays(data[0, :]) - fixed_delay
-
-    p0 = (np.min(coincidences), np.max(coincidences), 1, 0, (targeted_window_size - 11) * 2)
-    try:
-        popt, pcov = curve_fit(fit_func, delay, coincidences, p0=p0, maxfev=2000)
-        succes = True
-    except RuntimeError:
-        popt = np.empty(len(p0))
-        popt[:] = np.nan
-        pcov = np.empty((len(p0), len(p0)))
-        pcov[:] = np.nan
-        succes = False
-    if popt[-1] > 20:
-        popt = np.empty(len(p0))
-        popt[:] = np.nan
-        pcov = np.empty((len(p0), len(p0)))
-        pcov[:] = np.nan
-        succes = False
+    delay = WindowShiftEffect.delay(data, metadata)
+
+    window_fit = multi_start_fit(fit_func, delay, coincidences, window_guesses(coincidences, targeted_window_size),
+                                 validate=validate_window)
+    popt = window_fit.popt
+    succes = window_fit.success
+    if not succes:
+        logger.warning(f'Window fit for {file} failed: {window_fit.status}')
 
     lin = np.linspace(delay[0], delay[-1], 500)
-    counts1 = data[2]
-    counts2 = data[3]
+    counts1 = data['counts1']
+    counts2 = data['counts2']
 
     if succes:
         fig, count_axis = plt.subplots()
@@ -110,20 +113,23 @@ for i, file in enumerate(files):
         plt.clf()
         res = coincidences - fit_func(delay, *popt)
 
-        p0 = [1 / 5, -np.pi / 2, np.max(res), np.mean(res), 0]
-
         mask_parameter = 2.25 * np.std(res)
         fit_mask = np.abs(res) <= mask_parameter
 
-        popt_sin, pcov_sin = curve_fit(sin_fit, delay[fit_mask], res[fit_mask], p0=p0)
-        errors_sin = np.sqrt(np.diag(pcov_sin))
+        # The initial frequencies and phases are taken from the periodogram of the residuals.
+        sine_fit = fit_damped_sine(delay[fit_mask], res[fit_mask])
+        popt_sin, errors_sin = sine_fit.popt, sine_fit.perr
 
-        parameters[i] = popt_sin
-        errors[i] = errors_sin
+        if sine_fit.success:
+            parameters[i] = popt_sin
+            errors[i] = errors_sin
+        else:
+            logger.warning(f'Sine fit for {file} failed: {sine_fit.status}')
+            parameters[i] = errors[i] = np.nan
 
-        print(f'For {file}:')
-        for i, value in enumerate(popt_sin):
-            print(f'{SIN_LABELS[i]} = {value} ± {errors_sin[i]}')
+        print(f'For {file} ({sine_fit.status}):')
+        for label, value, error in zip(SIN_LABELS, popt_sin, errors_sin):
+            print(f'{label} = {value} ± {error}')
 
         plt.plot(delay, res, '-o')
         plt.plot(lin, sin_fit(lin, *popt_sin))
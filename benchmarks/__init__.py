@@ -0,0 +1,4 @@
+"""
+Offline benchmark suite for the acquisition and analysis hot paths. All benchmarks run against simulated devices in
+virtual time, such that they are reproducible and do not need any hardware. Run it with `python -m benchmarks`.
+"""
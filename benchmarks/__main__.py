@@ -0,0 +1,39 @@
+"""
+Runs the benchmark suite and stores the results. Usage:
+    python -m benchmarks [--repeat N] [--output FILE] [--compare BASELINE] [names ...]
+"""
+import argparse
+import json
+import sys
+
+from loguru import logger
+
+from benchmarks.suite import BENCHMARKS, compare_results, run_benchmarks, save_results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Runs the offline benchmark suite.')
+    parser.add_argument('names', nargs='*', help=f'benchmarks to run, one of: {", ".join(BENCHMARKS)}')
+    parser.add_argument('--repeat', type=int, default=5, help='number of repeats per benchmark')
+    parser.add_argument('--output', help='file to store the results in, defaults to the results folder')
+    parser.add_argument('--compare', help='results of a previous run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative slowdown considered a regression')
+    arguments = parser.parse_args()
+
+    results = run_benchmarks(arguments.names or None, repeat=arguments.repeat)
+    for name, result in results['results'].items():
+        logger.info(f"{name:40s} {result['min'] * 1e3:10.4f} ms (median {result['median'] * 1e3:.4f} ms)")
+    logger.success(f"Results saved to {save_results(results, arguments.output)}.")
+
+    if arguments.compare:
+        with open(arguments.compare) as file:
+            baseline = json.load(file)
+        regressions = compare_results(baseline, results, arguments.threshold)
+        for name, slowdown in regressions.items():
+            logger.error(f"{name} regressed by {slowdown:.0%}.")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
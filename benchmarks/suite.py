@@ -0,0 +1,387 @@
+"""
+Definitions of the benchmarks and the code to run them and compare their results. Each benchmark is a function that
+performs any setup and returns the callable that is timed. A benchmark that has to clean up, e.g. remove a temporary
+directory, yields the callable instead and cleans up after the yield.
+"""
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+from contextlib import closing, contextmanager
+from glob import glob
+from os.path import abspath, dirname, join
+from time import perf_counter
+from typing import Callable, Dict, Generator, Iterable, Iterator, List, Tuple
+from unittest import mock
+
+import numpy as np
+from loguru import logger
+
+from measure import DATA_DIRECTORY
+from utils.delays import DelayLines, validate_delay_steps
+from utils.simulation import (CoincidenceFirmware, CountModel, InterferometerFirmware, SimulatedCoincidenceCircuit,
+                              SimulatedInterferometer, VirtualClock, offline)
+
+# Folder where the results are stored by default.
+RESULTS_DIRECTORY = join(dirname(abspath(__file__)), 'results')
+# Seed used for all random data, such that every run benchmarks the same work.
+SEED = 42
+
+# Registry of the benchmarks, maps the name to a tuple of the setup function and the number of calls per repeat.
+BENCHMARKS: Dict[str, Tuple[Callable[[], object], int]] = {}
+
+
+def benchmark(name: str, number: int = 1):
+    """
+    Decorator that registers a benchmark.
+    :param name: the name under which the results are stored.
+    :param number: the number of calls that are timed together, use more calls for fast operations.
+    """
+
+    def decorator(setup: Callable[[], object]):
+        BENCHMARKS[name] = (setup, number)
+        return setup
+
+    return decorator
+
+
+def simulated_devices(latency: float = 0.) -> Tuple[VirtualClock, SimulatedCoincidenceCircuit,
+                                                    SimulatedInterferometer]:
+    """
+    Creates a simulated coincidence circuit and interferometer that share a virtual clock.
+    """
+    clock = VirtualClock()
+    firmware = CoincidenceFirmware(clock, latency=latency, model=CountModel(seed=SEED))
+    coincidence_circuit = SimulatedCoincidenceCircuit(firmware=firmware, log_commands=False)
+    interferometer = SimulatedInterferometer(firmware=InterferometerFirmware(clock, latency=latency),
+                                             log_commands=False)
+    return clock, coincidence_circuit, interferometer
+
+
+@benchmark('validate_delay_steps/scalar', number=10000)
+def _validate_scalar():
+    return lambda: validate_delay_steps(128)
+
+
+@benchmark('validate_delay_steps/array', number=1000)
+def _validate_array():
+    steps = np.random.default_rng(SEED).integers(0, 256, 10000).astype(float)
+    return lambda: validate_delay_steps(steps)
+
+
+@benchmark('DelayLines/calculate_delays', number=1000)
+def _calculate_delays():
+    steps = np.random.default_rng(SEED).integers(0, 256, 10000)
+    return lambda: DelayLines.CA.calculate_delays(steps)
+
+
+@benchmark('DelayLines/calculate_steps', number=1000)
+def _calculate_steps():
+    delays = np.random.default_rng(SEED).uniform(20, 70, 10000)
+    return lambda: DelayLines.WB.calculate_steps(delays)
+
+
+@benchmark('DelayLines/calibration/fit')
+def _calibration_fit():
+    from utils.delays import reload_calibration
+
+    # Without a cache on disk, the calibration is fitted every time.
+    with tempfile.TemporaryDirectory() as directory, \
+            mock.patch('utils.delays.DELAY_LINE_CALIBRATION_CACHE', join(directory, 'cache')):
+        def run():
+            shutil.rmtree(join(directory, 'cache'), ignore_errors=True)
+            reload_calibration()
+            return DelayLines._calibration()
+
+        yield run
+
+
+@benchmark('DelayLines/calibration/cached')
+def _calibration_cached():
+    from utils.delays import reload_calibration
+
+    # The first call fits the calibration and caches it on disk, from which the other calls load it.
+    with tempfile.TemporaryDirectory() as directory, \
+            mock.patch('utils.delays.DELAY_LINE_CALIBRATION_CACHE', join(directory, 'cache')):
+        def run():
+            reload_calibration()
+            return DelayLines._calibration()
+
+        yield run
+
+
+@benchmark('Arduino/find_pattern', number=10)
+def _find_pattern():
+    from interface import COUNTER_REGEX
+
+    _, coincidence_circuit, _ = simulated_devices()
+    firmware = coincidence_circuit.firmware
+
+    def run():
+        # Every reply is preceded by some verbose chatter that has to be skipped.
+        for i in range(100):
+            firmware.reply(f'Received command: {i}')
+            firmware.reply(f'{30000 + i},{300000 + i},{200 + i}')
+        for _ in range(100):
+            coincidence_circuit.find_pattern(COUNTER_REGEX)
+
+    return run
+
+
+@benchmark('Arduino/read_counter_frames', number=10)
+def _read_counter_frames():
+    from utils.protocol import encode_counter_frames
+
+    _, coincidence_circuit, _ = simulated_devices()
+    coincidence_circuit.enable_binary()
+    firmware = coincidence_circuit.firmware
+    counts = np.random.default_rng(SEED).poisson(3e4, (100, 3))
+    sequence = np.arange(100)
+
+    def run():
+        # The same 100 replies as the find_pattern benchmark, but as binary frames.
+        firmware.reply('Received command: MEASURE')
+        firmware.queue_bytes(encode_counter_frames(sequence + firmware.sequence, counts))
+        firmware.sequence = (firmware.sequence + 100) % 2 ** 16
+        coincidence_circuit.read_counter_frames(100)
+
+    return run
+
+
+@benchmark('WindowShiftEffect/run')
+def _window_shift_effect():
+    from measure.schemes.window_shift_effect import WindowShiftEffect
+
+    def run():
+        clock, coincidence_circuit, interferometer = simulated_devices()
+        with offline(clock):
+            return WindowShiftEffect(coincidence_circuit, interferometer)()
+
+    return run
+
+
+@benchmark('BellTest/run')
+def _bell_test():
+    from measure.schemes.bell_test import BellTest
+
+    def run():
+        clock, coincidence_circuit, interferometer = simulated_devices()
+        with offline(clock):
+            return BellTest(coincidence_circuit, interferometer)()
+
+    return run
+
+
+@benchmark('WindowShiftEffect/replay')
+def _window_shift_effect_replay():
+    from measure.schemes.window_shift_effect import WindowShiftEffect
+    from utils.replay import ReplayCoincidenceCircuit, ReplayInterferometer
+    from utils.trace import read_trace
+
+    # A captured session, such that only the parsing, scheme and storage code are benchmarked.
+    with tempfile.TemporaryDirectory() as directory:
+        coincidence_trace = join(directory, 'coincidence_circuit.trace')
+        interferometer_trace = join(directory, 'interferometer.trace')
+        clock, coincidence_circuit, interferometer = simulated_devices()
+        coincidence_circuit.start_capture(coincidence_trace)
+        interferometer.start_capture(interferometer_trace)
+        with offline(clock):
+            WindowShiftEffect(coincidence_circuit, interferometer)()
+        coincidence_circuit.stop_capture()
+        interferometer.stop_capture()
+        traces = read_trace(coincidence_trace), read_trace(interferometer_trace)
+
+    def run():
+        coincidence_circuit = ReplayCoincidenceCircuit(traces[0], log_commands=False)
+        interferometer = ReplayInterferometer(traces[1], log_commands=False)
+        with offline(clock):
+            return WindowShiftEffect(coincidence_circuit, interferometer)()
+
+    return run
+
+
+@benchmark('BaseScheme/save_and_load', number=10)
+def _save_and_load():
+    from measure.scheme import BaseScheme
+
+    data = np.random.default_rng(SEED).poisson(3e4, (7, 1000)).astype(float)
+    metadata = {'scheme': 'Benchmark', 'timestamp': '2022-01-18-17_18_22', 'window_size': 12, 'shift_A': True}
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = join(directory, 'benchmark.npz')
+
+        def run():
+            np.savez_compressed(file_name, data=data, **metadata)
+            return BaseScheme.load(file_name)
+
+        yield run
+
+
+@benchmark('BaseScheme/save_and_load_records', number=10)
+def _save_and_load_records():
+    from measure.records import from_rows
+    from measure.scheme import BaseScheme
+    from measure.schemes.window_shift_effect import FIELDS
+
+    # The same amount of data as `BaseScheme/save_and_load`, stored as uint8 steps and uint32 counts.
+    rng = np.random.default_rng(SEED)
+    data = from_rows(np.concatenate([rng.integers(0, 256, (4, 1000)), rng.poisson(3e4, (3, 1000))]), FIELDS)
+    metadata = {'scheme': 'Benchmark', 'timestamp': '2022-01-18-17_18_22', 'window_size': 12, 'shift_A': True}
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = join(directory, 'benchmark.npz')
+
+        def run():
+            np.savez_compressed(file_name, data=data, **metadata)
+            return BaseScheme.load(file_name)
+
+        yield run
+
+
+@benchmark('WindowShiftEffect/erf_fits')
+def _erf_fits():
+    from scipy.optimize import curve_fit
+
+    from measure.schemes.window_shift_effect import WindowShiftEffect
+
+    runs = []
+    for file_name in sorted(glob(join(DATA_DIRECTORY, 'WindowShiftEffect', '*.npz'))):
+        with np.load(file_name) as file_contents:
+            data = WindowShiftEffect.convert_run(file_contents['data'], file_contents)
+            runs.append((WindowShiftEffect.delay(data, file_contents), data['coincidences'].astype(float),
+                         int(file_contents['window_size'])))
+
+    def run():
+        for delay, coincidences, window_size in runs:
+            p0 = (np.min(coincidences), np.max(coincidences), 1, 0, (window_size - 11) * 2)
+            curve_fit(WindowShiftEffect._distribution, delay, coincidences, p0=p0, maxfev=2000)
+
+    return run
+
+
+@benchmark('synthetic/window_scan', number=10)
+def _synthetic_window_scan():
+    from measure.schemes.window_shift_effect import WindowShiftEffect
+    from utils.synthetic import PhotonPairSource
+
+    clock, coincidence_circuit, interferometer = simulated_devices()
+    data = WindowShiftEffect(coincidence_circuit, interferometer).data
+    steps = {line: data[line.name] for line in DelayLines}
+    source = PhotonPairSource(seed=SEED)
+    # 10000 runs of 48 points, i.e. 480000 measurements per call.
+    return lambda: source.window_scan(steps, runs=10000, dtype=np.uint32)
+
+
+@benchmark('synthetic/bell_test', number=10)
+def _synthetic_bell_test():
+    from measure.schemes.bell_test import ALPHA_ANGLES, BETA_ANGLES, MEASUREMENTS_PER_ITERATION
+    from utils.synthetic import PhotonPairSource
+
+    source = PhotonPairSource(seed=SEED)
+    return lambda: source.bell_test(ALPHA_ANGLES, BETA_ANGLES, MEASUREMENTS_PER_ITERATION, runs=10000, dtype=np.uint32)
+
+
+def git_commit() -> str:
+    """
+    :return: the hash of the current commit, or 'unknown' if it cannot be determined.
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=dirname(abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+@contextmanager
+def prepare(setup: Callable[[], object]) -> Iterator[Callable[[], object]]:
+    """
+    Runs the setup of a benchmark and provides the callable that is timed. A setup that yields the callable is
+    resumed afterwards, such that it can clean up.
+    """
+    function = setup()
+    if not isinstance(function, Generator):
+        yield function
+        return
+    with closing(function):
+        yield next(function)
+
+
+def run_benchmarks(names: Iterable[str] = None, repeat: int = 5) -> dict:
+    """
+    Runs the benchmarks.
+    :param names: the names of the benchmarks to run, defaults to all benchmarks.
+    :param repeat: the number of times each benchmark is repeated.
+    :return: a dictionary with information on the environment and the timings (in s per call) of each benchmark.
+    """
+    names = list(BENCHMARKS) if names is None else list(names)
+    results = {}
+
+    # The benchmarks should not be slowed down by logging.
+    logger.disable('')
+    try:
+        for name in names:
+            setup, number = BENCHMARKS[name]
+            with prepare(setup) as function:
+                # Warm up, such that caches and lazy imports are not included in the timings.
+                function()
+
+                timings: List[float] = []
+                for _ in range(repeat):
+                    start = perf_counter()
+                    for _ in range(number):
+                        function()
+                    timings.append((perf_counter() - start) / number)
+
+            results[name] = {
+                'min':    min(timings),
+                'median': statistics.median(timings),
+                'mean':   statistics.mean(timings),
+                'repeat': repeat,
+                'number': number,
+            }
+    finally:
+        logger.enable('')
+
+    return {
+        'commit':   git_commit(),
+        'python':   platform.python_version(),
+        'numpy':    np.__version__,
+        'platform': platform.platform(),
+        'results':  results,
+    }
+
+
+def save_results(results: dict, file_name: str = None) -> str:
+    """
+    Saves the results as JSON, by default in the results folder under the hash of the commit.
+    :return: the name of the file the results were written to.
+    """
+    if file_name is None:
+        os.makedirs(RESULTS_DIRECTORY, exist_ok=True)
+        file_name = join(RESULTS_DIRECTORY, f"{results['commit'][:10]}.json")
+    with open(file_name, 'w') as file:
+        json.dump(results, file, indent=4)
+    return file_name
+
+
+def compare_results(baseline: dict, current: dict, threshold: float = 0.1) -> Dict[str, float]:
+    """
+    Compares two sets of results using the minimum timing, which is the least sensitive to noise.
+    :param baseline: the results to compare against.
+    :param current: the new results.
+    :param threshold: the relative slowdown that is considered a regression.
+    :return: the benchmarks that regressed, mapped to their relative slowdown.
+    """
+    regressions = {}
+    for name, result in current['results'].items():
+        if name not in baseline['results']:
+            continue
+        ratio = result['min'] / baseline['results'][name]['min']
+        logger.info(f"{name:40s} {baseline['results'][name]['min'] * 1e3:10.4f} ms -> {result['min'] * 1e3:10.4f} ms "
+                    f"({ratio:.2f}x)")
+        if ratio > 1 + threshold:
+            regressions[name] = ratio - 1
+    return regressions
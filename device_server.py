@@ -0,0 +1,490 @@
+"""
+This file, device_server.py, provides a local server that owns the serial connections to the Arduinos and serves their
+commands to any number of clients over TCP. This allows several tools, e.g. the live rate monitor and a measurement
+scheme, to share the hardware. Opening the serial port only happens once, so clients do not pay the reset of the
+Arduino either.
+
+The protocol consists of JSON objects, one per line. A request has the form
+    {"id": 1, "device": "coincidence circuit", "method": "measure", "args": [1], "kwargs": {}}
+and is answered with either {"id": 1, "result": [...]} or {"id": 1, "error": {"type": "...", "message": "..."}}. A
+client may have several requests outstanding, the replies are matched to the requests by their ID.
+
+Every device has its own worker thread that executes the requests one at a time. Pending requests are queued per
+client and the queues are served round-robin, such that a client that sends many requests cannot starve the others.
+
+Run the server with e.g.
+    python device_server.py --coincidence-circuit /dev/cu.usbmodem14301
+and use `CoincidenceCircuitProxy` and `InterferometerProxy` instead of the interfaces in the clients.
+"""
+import argparse
+import builtins
+import itertools
+import json
+import socket
+import socketserver
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Any, Dict, Hashable, Iterable, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from interface import Arduino, CoincidenceCircuit, Interferometer, wait_until_ready
+from utils.delays import DelayLines
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 5757
+
+# The methods that clients are allowed to call on each type of device.
+EXPOSED_METHODS = {
+    CoincidenceCircuit: ('toggle_verbose', 'clear_counters', 'save_counts_to_register', 'read_counts_from_register',
+                         'save_and_read_counts', 'set_delay', 'measure', 'measure_ms', 'measure_many',
+                         'reset_input_buffer', 'enable_binary', 'disable_binary'),
+    Interferometer:     ('rotate',),
+    Arduino:            ('ping',),
+}
+
+# Key under which delay lines are encoded, since JSON has no notion of enums.
+DELAY_LINE_KEY = '__delay_line__'
+
+
+class DeviceServerError(RuntimeError):
+    """
+    Raised by a client when the server could not execute a request.
+    """
+    pass
+
+
+def encode_value(value: Any) -> Any:
+    """
+    Converts a value to something that can be represented in JSON.
+    """
+    if isinstance(value, DelayLines):
+        return {DELAY_LINE_KEY: value.name}
+    if hasattr(value, 'tolist'):
+        # NumPy scalars and arrays.
+        return value.tolist()
+    if isinstance(value, (list, tuple)):
+        return [encode_value(item) for item in value]
+    return value
+
+
+def decode_value(value: Any) -> Any:
+    """
+    Inverse of `encode_value`, sequences are decoded as lists.
+    """
+    if isinstance(value, dict) and DELAY_LINE_KEY in value:
+        return DelayLines[value[DELAY_LINE_KEY]]
+    if isinstance(value, list):
+        return [decode_value(item) for item in value]
+    return value
+
+
+class FairQueue:
+    """
+    A queue that holds the pending items of each client separately and hands them out round-robin: after a client is
+    served it moves to the back of the line.
+    """
+
+    def __init__(self):
+        self._queues: 'OrderedDict[Hashable, deque]' = OrderedDict()
+        self._condition = threading.Condition()
+        self._closed = False
+
+    def __len__(self) -> int:
+        with self._condition:
+            return sum(len(queue) for queue in self._queues.values())
+
+    def put(self, client: Hashable, item):
+        with self._condition:
+            self._queues.setdefault(client, deque()).append(item)
+            self._condition.notify()
+
+    def get(self):
+        """
+        Blocks until an item is available.
+        :return: the next item, or None once the queue is closed.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._queues or self._closed)
+            if self._closed:
+                return None
+            client, queue = self._queues.popitem(last=False)
+            item = queue.popleft()
+            if queue:
+                self._queues[client] = queue
+            return item
+
+    def discard(self, client: Hashable):
+        """
+        Drops the pending items of a client, e.g. when it has disconnected.
+        """
+        with self._condition:
+            self._queues.pop(client, None)
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+
+class _ConnectionHandler(socketserver.StreamRequestHandler):
+    """
+    Handles the requests of a single client connection. Requests are put in the queue of their device, replies are
+    written by the device workers.
+    """
+
+    server: 'DeviceServer'
+
+    def setup(self):
+        super().setup()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._write_lock = threading.Lock()
+
+    def send(self, reply: dict):
+        data = (json.dumps(reply) + '\n').encode()
+        with self._write_lock:
+            try:
+                self.wfile.write(data)
+            except OSError:
+                # The client has disconnected, there is nobody left to reply to.
+                pass
+
+    def handle(self):
+        logger.info(f"Client {self.client_address} connected.")
+        try:
+            for line in self.rfile:
+                try:
+                    request = json.loads(line)
+                    request_id = request['id']
+                except (ValueError, KeyError, TypeError):
+                    logger.warning(f"Ignoring malformed request from {self.client_address}: {line!r}")
+                    continue
+                self.server.submit(self, request_id, request)
+        except OSError:
+            pass
+        finally:
+            self.server.disconnect(self)
+            logger.info(f"Client {self.client_address} disconnected.")
+
+
+class DeviceServer(socketserver.ThreadingTCPServer):
+    """
+    Serves the commands of one or more Arduinos to clients over TCP. The server opens the serial connections when it
+    is started and closes them when it is shut down.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, devices: Iterable[Arduino], host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+        """
+        :param devices: the devices to serve, clients address them by their name.
+        :param host: the address to listen on, only local clients can connect by default.
+        :param port: the port to listen on, 0 picks a free port.
+        """
+        super().__init__((host, port), _ConnectionHandler)
+        self.devices: Dict[str, Arduino] = {device.name: device for device in devices}
+        self._methods = {name: self._exposed_methods(device) for name, device in self.devices.items()}
+        self._queues = {name: FairQueue() for name in self.devices}
+        self._workers = [threading.Thread(target=self._work, args=(name,), name=f'{name} worker', daemon=True)
+                         for name in self.devices]
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _exposed_methods(device: Arduino) -> Tuple[str, ...]:
+        return tuple(itertools.chain.from_iterable(
+            methods for cls, methods in EXPOSED_METHODS.items() if isinstance(device, cls)))
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self.server_address[:2]
+
+    def submit(self, client: _ConnectionHandler, request_id, request: dict):
+        """
+        Queues a request of a client for its device, invalid requests are answered right away.
+        """
+        device, method = request.get('device'), request.get('method')
+        if device not in self.devices:
+            client.send({'id': request_id, 'error': {'type': 'KeyError', 'message': f'Unknown device: {device}'}})
+        elif method not in self._methods[device]:
+            client.send({'id': request_id, 'error': {
+                'type': 'AttributeError', 'message': f'The {device} does not expose method: {method}'}})
+        else:
+            self._queues[device].put(client, (client, request_id, method, request.get('args', []),
+                                              request.get('kwargs', {})))
+
+    def disconnect(self, client: _ConnectionHandler):
+        for queue in self._queues.values():
+            queue.discard(client)
+
+    def _work(self, name: str):
+        """
+        Executes the requests for a single device, one at a time.
+        """
+        device = self.devices[name]
+        queue = self._queues[name]
+        while True:
+            item = queue.get()
+            if item is None:
+                return
+            client, request_id, method, args, kwargs = item
+            try:
+                result = getattr(device, method)(*decode_value(args),
+                                                 **{key: decode_value(value) for key, value in kwargs.items()})
+                reply = {'id': request_id, 'result': encode_value(result)}
+            except Exception as error:
+                logger.exception(f"Request {method} for the {name} failed.")
+                reply = {'id': request_id, 'error': {'type': type(error).__name__, 'message': str(error)}}
+            client.send(reply)
+
+    def start(self) -> 'DeviceServer':
+        """
+        Opens the devices and serves clients from a background thread.
+        """
+        opened = [device for device in self.devices.values() if not device.is_open]
+        for device in opened:
+            device.__enter__()
+        # The clients do not wait for the devices, see `DeviceProxy.wait_until_ready`.
+        wait_until_ready(opened)
+        for worker in self._workers:
+            worker.start()
+        self._thread = threading.Thread(target=self.serve_forever, name='device server', daemon=True)
+        self._thread.start()
+        logger.info(f"Serving {', '.join(self.devices)} on {self.address[0]}:{self.address[1]}.")
+        return self
+
+    def stop(self):
+        """
+        Stops serving clients and closes the devices.
+        """
+        self.shutdown()
+        for queue in self._queues.values():
+            queue.close()
+        for worker in self._workers:
+            worker.join()
+        self.server_close()
+        for device in self.devices.values():
+            device.__exit__()
+
+    def __enter__(self) -> 'DeviceServer':
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+class DeviceConnection:
+    """
+    A persistent connection to a device server. It can be shared between threads and proxies: requests are sent
+    immediately and a reader thread hands every reply to the request with the same ID.
+    """
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+        self.address = (host, port)
+        self._socket = socket.create_connection(self.address)
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self._socket.makefile('rb')
+        self._ids = itertools.count()
+        self._pending: Dict[int, Future] = {}
+        self._lock = threading.Lock()
+        self.closed = False
+        self._reader = threading.Thread(target=self._read, name='device connection reader', daemon=True)
+        self._reader.start()
+
+    def _read(self):
+        try:
+            for line in self._file:
+                reply = json.loads(line)
+                with self._lock:
+                    future = self._pending.pop(reply['id'], None)
+                if future is not None:
+                    future.set_result(reply)
+        except (OSError, ValueError):
+            pass
+        finally:
+            self._fail_pending(ConnectionError(f'Lost the connection to the device server at {self.address}.'))
+
+    def _fail_pending(self, error: Exception):
+        with self._lock:
+            self.closed = True
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.set_exception(error)
+
+    def submit(self, device: str, method: str, *args, **kwargs) -> Future:
+        """
+        Sends a request without waiting for the reply.
+        :return: a future that resolves to the reply of the server.
+        """
+        future = Future()
+        with self._lock:
+            if self.closed:
+                raise ConnectionError(f'The connection to the device server at {self.address} is closed.')
+            request_id = next(self._ids)
+            self._pending[request_id] = future
+            request = {'id': request_id, 'device': device, 'method': method, 'args': encode_value(list(args)),
+                       'kwargs': {key: encode_value(value) for key, value in kwargs.items()}}
+            self._socket.sendall((json.dumps(request) + '\n').encode())
+        return future
+
+    def call(self, device: str, method: str, *args, timeout: Optional[float] = None, **kwargs):
+        """
+        Calls a method of a device on the server and waits for the result.
+        :param timeout: the maximum time in s to wait for the reply, by default there is no limit.
+        :raises DeviceServerError: if the server could not execute the request. Errors of built-in types are raised as
+            that type instead, such that e.g. invalid arguments raise a ValueError as they would locally.
+        """
+        reply = self.submit(device, method, *args, **kwargs).result(timeout)
+        if 'error' in reply:
+            error_type = getattr(builtins, reply['error']['type'], None)
+            message = f"{reply['error']['message']} (raised by the {device} on the device server)"
+            if isinstance(error_type, type) and issubclass(error_type, Exception):
+                raise error_type(message)
+            raise DeviceServerError(f"{reply['error']['type']}: {message}")
+        return decode_value(reply['result'])
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._socket.close()
+
+
+# Connections shared by all proxies in this process, per server address.
+_connections: Dict[Tuple[str, int], DeviceConnection] = {}
+_connections_lock = threading.Lock()
+
+
+def connect(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> DeviceConnection:
+    """
+    Returns the pooled connection to a device server, a new connection is only made if there is none or it was lost.
+    """
+    with _connections_lock:
+        connection = _connections.get((host, port))
+        if connection is None or connection.closed:
+            connection = _connections[(host, port)] = DeviceConnection(host, port)
+        return connection
+
+
+class DeviceProxy:
+    """
+    Stands in for an Arduino that is served by a device server. Entering and exiting the proxy does nothing, since the
+    server owns the serial connection.
+    """
+
+    def __init__(self, name: str, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+        self.name = name
+        self.address = (host, port)
+
+    @property
+    def is_open(self) -> bool:
+        # The server keeps the serial connection open.
+        return True
+
+    def ping(self, timeout: Optional[float] = None) -> bool:
+        return self._call('ping', *([] if timeout is None else [timeout]))
+
+    def wait_until_ready(self, *args, **kwargs) -> bool:
+        # The server waited until the device was ready when it opened the connection, waiting through the server would
+        # block the other clients.
+        return True
+
+    def _call(self, method: str, *args, **kwargs):
+        return connect(*self.address).call(self.name, method, *args, **kwargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        return self
+
+
+class CoincidenceCircuitProxy(DeviceProxy):
+    """
+    Drop-in replacement for `CoincidenceCircuit` that sends its commands to a device server. See `CoincidenceCircuit`
+    for the documentation of the methods.
+    """
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, name: str = 'coincidence circuit'):
+        super().__init__(name, host, port)
+
+    def toggle_verbose(self):
+        self._call('toggle_verbose')
+
+    def clear_counters(self):
+        self._call('clear_counters')
+
+    def save_counts_to_register(self):
+        self._call('save_counts_to_register')
+
+    def read_counts_from_register(self, timeout: Optional[float] = None) -> Tuple[int, int, int]:
+        return tuple(self._call('read_counts_from_register', timeout))
+
+    def save_and_read_counts(self, timeout: Optional[float] = None) -> Tuple[int, int, int]:
+        return tuple(self._call('save_and_read_counts', timeout))
+
+    def set_delay(self, steps: int, delay_line: DelayLines):
+        self._call('set_delay', steps, delay_line)
+
+    def measure(self, time: int, timeout: Optional[float] = None) -> Tuple[int, int, int]:
+        return tuple(self._call('measure', time, timeout))
+
+    def measure_ms(self, gate: int, timeout: Optional[float] = None) -> Tuple[int, int, int]:
+        return tuple(self._call('measure_ms', gate, timeout))
+
+    def measure_many(self, n: int, gate: int, timeout: Optional[float] = None) -> np.ndarray:
+        return np.array(self._call('measure_many', n, gate, timeout), dtype=np.int64).reshape(n, 3)
+
+    def reset_input_buffer(self):
+        self._call('reset_input_buffer')
+
+    def enable_binary(self, timeout: float = 1.0) -> bool:
+        return self._call('enable_binary', timeout)
+
+    def disable_binary(self):
+        self._call('disable_binary')
+
+
+class InterferometerProxy(DeviceProxy):
+    """
+    Drop-in replacement for `Interferometer` that sends its commands to a device server.
+    """
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, name: str = 'interferometer'):
+        super().__init__(name, host, port)
+
+    def rotate(self, steps: int, delay: float = 1.0):
+        self._call('rotate', steps, delay)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serves the Arduinos of the experiment to local clients.')
+    parser.add_argument('--coincidence-circuit', metavar='PORT', help='serial port of the coincidence circuit')
+    parser.add_argument('--interferometer', metavar='PORT', help='serial port of the interferometer')
+    parser.add_argument('--baudrate', type=int, default=115200)
+    parser.add_argument('--host', default=DEFAULT_HOST, help='address to listen on')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='port to listen on')
+    arguments = parser.parse_args()
+
+    devices = []
+    if arguments.coincidence_circuit:
+        devices.append(CoincidenceCircuit(baudrate=arguments.baudrate, port=arguments.coincidence_circuit))
+    if arguments.interferometer:
+        devices.append(Interferometer(baudrate=arguments.baudrate, port=arguments.interferometer))
+    if not devices:
+        parser.error('at least one device must be given')
+
+    with DeviceServer(devices, arguments.host, arguments.port):
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            logger.info("Shutting down the device server.")
+
+
+if __name__ == '__main__':
+    main()
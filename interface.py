@@ -9,31 +9,74 @@ Written by:
 CCD interface code based on code previously written by Matthijs Rog <rog@physics.leidenuniv.nl>.
 """
 import re
-from time import sleep
-from typing import Tuple, TypeVar
+import threading
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from queue import SimpleQueue
+from time import perf_counter, sleep
+from typing import Callable, Dict, Optional, Sequence, Tuple, TypeVar
 
 import numpy as np
 from loguru import logger
 from serial import Serial
 
+from utils import profiling
 from utils.delays import DelayLines, validate_delay_steps
+from utils.metrics import CommandMetrics
+from utils.protocol import COUNTER_FRAME_SIZE, CounterFrameDecoder
 from utils.steps import validate_interferometer_steps
-
-try:
-    import ftd2xx as ftd
-except ImportError:
-    logger.warning("FTD2XX library not found, do not use the CCD interface.")
-    ftd = None
-except OSError:
-    logger.warning("FTD2XX binaries not found, do not use the CCD interface.")
-    ftd = None
+from utils.trace import DATA, LINE, WRITE, TraceWriter
 
 # Regex values are used to parse the output of the Arduino.
 COUNTER_REGEX = re.compile(r'(\d+),(\d+),(\d+)')
 DELAY_REGEX = re.compile(r'(\d+)')
+BINARY_ACKNOWLEDGEMENT_REGEX = re.compile(r'BINARY OK')
+PONG_REGEX = re.compile(r'PONG')
+
+# Maximum time in s the Arduino takes to boot. Opening the serial port resets the Arduino.
+BOOT_TIMEOUT = 5.
+# Time in s to wait for the reply to a single ping.
+PING_TIMEOUT = 0.1
+# Time in s to wait for firmware that does not reply to pings, before the handshake this was always waited. The
+# firmware on the Arduinos does not reply to pings, see `Arduino.wait_until_ready`.
+UNRESPONSIVE_DELAY = 1.
+
+# Time in s to wait for the reply to the empty gate that detects whether gates in ms are supported.
+PROBE_TIMEOUT = 1.
+
+# Number of gates of a burst that are sent ahead of their replies, see `CoincidenceCircuit.measure_many`.
+BURST_DEPTH = 2
+# Interval in s at which a burst checks whether its reader failed.
+BURST_POLL_INTERVAL = 0.1
 
 # Used for type hints.
 C = TypeVar('C', bound='Arduino')
+R = TypeVar('R')
+
+
+def wait_until_ready(devices: Sequence, timeout: float = BOOT_TIMEOUT) -> bool:
+    """
+    Waits until all devices are ready, see `Arduino.wait_until_ready`. Devices that were opened together boot at the
+    same time, so the fixed delay for firmware that does not reply to pings is waited once for all of them, rather than
+    once per device.
+    :param devices: the devices to wait for.
+    :param timeout: the maximum time in s to wait for each Arduino to boot.
+    :return: whether all devices replied to a ping.
+    """
+    start = perf_counter()
+    ready = True
+    delay = 0.
+    for device in devices:
+        if not device.wait_until_ready(timeout, fixed_delay=False):
+            ready = False
+            delay = max(delay, getattr(device, 'unresponsive_delay', UNRESPONSIVE_DELAY))
+    # The time spent on the other devices counts towards the delay, including detecting the support of pings.
+    remaining = start + delay - perf_counter()
+    if remaining > 0:
+        with profiling.timed(profiling.WAIT):
+            sleep(remaining)
+    return ready
 
 
 class Arduino(Serial):
@@ -43,13 +86,85 @@ class Arduino(Serial):
     """
 
     ARDUINO_EOL = b'\r\n'
+    # Name under which numeric arguments are recorded in the metrics.
+    ARGUMENT_COMMAND = 'ARGUMENT'
+
+    def __init__(self, *args, name: str = "Arduino", log_commands: bool = True, metrics: bool = False,
+                 thread_safe: bool = False, trace: Optional[str] = None, supports_ping: Optional[bool] = False,
+                 **kwargs):
+        """
+        :param log_commands: whether every command and reply is logged (at the DEBUG level). Disabling this removes
+            all logging overhead from tight measurement loops.
+        :param metrics: whether to record latency and traffic metrics, see `enable_metrics`.
+        :param thread_safe: whether the methods of the interface may be called from several threads at once, see
+            `request`.
+        :param trace: a file to capture the serial traffic to, see `start_capture`.
+        :param supports_ping: whether the firmware replies to pings, see `wait_until_ready`. The firmware on the
+            Arduinos does not, so by default a fixed delay is waited. None detects it with the first handshake.
+        """
+        # Serializes the writes, a re-entrant lock such that a request can send several commands as a whole.
+        self._write_lock = threading.RLock()
+        self.thread_safe = thread_safe
+        # The replies that the reader thread still has to read, in the order in which the commands were sent.
+        self._pending: SimpleQueue = SimpleQueue()
+        self._reader: Optional[threading.Thread] = None
+        self.capture: Optional[TraceWriter] = None
 
-    def __init__(self, *args, name: str = "Arduino", **kwargs):
         super().__init__(*args, **kwargs)
         self.name = name
+        self.log_commands = log_commands
+        self.metrics: Optional[CommandMetrics] = None
+        # Whether the firmware replies to pings, None until it is known, see `wait_until_ready`.
+        self.supports_ping = supports_ping
+        # The last command that was sent along with the time it was sent, used to measure the reply latency.
+        self._last_command: Tuple[str, float] = ('', 0.)
+        # The commands of which the reply has not been read yet along with the time they were sent, oldest first.
+        # Gates that are sent ahead of their replies are so measured from their own command, see `_record_reply`.
+        self._outstanding: deque = deque()
+
+        if metrics:
+            self.enable_metrics()
+        if trace is not None:
+            self.start_capture(trace)
 
         logger.info(f"Serial interface to the {self.name} initialized.")
 
+    def enable_metrics(self) -> CommandMetrics:
+        """
+        Starts recording metrics for this device. Metrics that were already recorded are kept.
+        :return: the metrics object, which can be exported with `utils.metrics.export_metrics`.
+        """
+        if self.metrics is None:
+            self.metrics = CommandMetrics(self.name)
+        return self.metrics
+
+    def disable_metrics(self):
+        """
+        Stops recording metrics for this device.
+        """
+        self.metrics = None
+
+    def start_capture(self, file_name: str) -> TraceWriter:
+        """
+        Starts capturing every command that is written and every line and block of binary data that is read, along
+        with the time at which it happened. The trace can be fed back into the interfaces with `utils.replay`.
+        :param file_name: the trace file, it is overwritten if it exists.
+        :return: the writer of the trace.
+        """
+        self.stop_capture()
+        self.capture = TraceWriter(file_name, self.name)
+        logger.info(f"Capturing the serial traffic of the {self.name} to {file_name}.")
+        return self.capture
+
+    def stop_capture(self):
+        """
+        Stops capturing the serial traffic and closes the trace file.
+        """
+        if self.capture is not None:
+            capture, self.capture = self.capture, None
+            capture.close()
+            logger.info(f"Captured {capture.events} events of the {self.name} to {capture.file_name}.")
+
     def send_command(self, command):
         """
         Identical to the write method of Serial, however this method will automatically encode the data if it is a str
@@ -57,25 +172,178 @@ class Arduino(Serial):
         concatenated strings if commands are rapidly sent after each other.
         """
         if not isinstance(command, str):
-            logger.debug(f"Automatically converting command from {type(command).__name__} to str.")
             command = str(command)
 
-        logger.info(f"Sending the following command to the {self.name}: {command}")
+        if self.log_commands:
+            logger.debug("Sending the following command to the {}: {}", self.name, command)
         if not command.endswith('\n'):
-            logger.debug("Appending a newline (\\n) to command.")
             command += '\n'
-        self.write(command.encode())
+        data = command.encode()
+        with self._write_lock, profiling.timed(profiling.IO):
+            self.write(data)
+            if self.capture is not None:
+                self.capture.record(WRITE, data)
+
+        if self.metrics is not None:
+            name = command.strip()
+            if name.lstrip('-').isdigit():
+                name = self.ARGUMENT_COMMAND
+            self.metrics.record_command(name, len(data))
+            self._last_command = (name, perf_counter())
+
+    def send_commands(self, commands: Sequence, reply: bool = False):
+        """
+        Sends several commands, see `send_command`.
+        :param reply: whether the firmware replies to the commands. The latency of the reply is then measured from the
+            last command, see `_record_reply`.
+        """
+        with self._write_lock:
+            for command in commands:
+                self.send_command(command)
+            if reply and self.metrics is not None:
+                self._outstanding.append(self._last_command)
 
     def __enter__(self: C) -> C:
         logger.info(f"Serial interface to the {self.name} is being opened.")
+        if not self.is_open:
+            # Opening the port resets the Arduino.
+            self._forget_state()
+            self._outstanding.clear()
         super().__enter__()
         return self
 
+    def _forget_state(self):
+        """
+        Called when the Arduino is reset, subclasses forget the state of the firmware they keep track of.
+        """
+        pass
+
+    def ping(self, timeout: float = PING_TIMEOUT) -> bool:
+        """
+        Sends a ping and waits for the reply. The firmware processes the commands in order, so a reply also means that
+        all commands that were sent before have been processed.
+        :param timeout: the time in s to wait for the reply.
+        :return: whether the firmware replied in time.
+        """
+        return self.request(['PING'], lambda read_timeout: self.find_pattern(PONG_REGEX, read_timeout) is not None,
+                            timeout)
+
+    @property
+    def unresponsive_delay(self) -> float:
+        """
+        The time in s to wait for firmware that does not reply to pings, see `wait_until_ready`.
+        """
+        return UNRESPONSIVE_DELAY
+
+    def wait_until_ready(self, timeout: float = BOOT_TIMEOUT, fixed_delay: bool = True) -> bool:
+        """
+        Waits until the firmware replies to a ping, e.g. after the Arduino was reset by opening the port. This replaces
+        waiting for a fixed time: a device that is already running replies within a single round trip.
+
+        The handshake requires firmware that replies to PING with PONG. The firmware on the Arduinos does not, only the
+        simulated firmware of `utils.simulation` does. Unless `supports_ping` is set, the fixed delay
+        `unresponsive_delay` is waited instead. If it is None, the support is detected once, which takes the full
+        timeout for firmware without support.
+        :param timeout: the maximum time in s to wait for the Arduino to boot.
+        :param fixed_delay: whether to wait the fixed delay for firmware that does not reply to pings. Disabled by
+            `wait_until_ready` of this module, which waits it once for several devices.
+        :return: whether the firmware replied.
+        :raises TimeoutError: if firmware that replied to pings before stopped replying.
+        """
+        if self.supports_ping is False:
+            if fixed_delay:
+                with profiling.timed(profiling.WAIT):
+                    sleep(self.unresponsive_delay)
+            return False
+
+        deadline = perf_counter() + timeout
+        while not self.ping():
+            if perf_counter() >= deadline:
+                if self.supports_ping:
+                    raise TimeoutError(f'The {self.name} did not reply to a ping within {timeout} s.')
+                logger.warning(f"The {self.name} does not reply to pings, falling back to a fixed delay.")
+                self.supports_ping = False
+                return False
+            # Pings sent while the Arduino boots are lost, retry after a short while.
+            with profiling.timed(profiling.WAIT):
+                sleep(PING_TIMEOUT)
+        self.supports_ping = True
+        return True
+
     def __exit__(self, *args, **kwargs):
         logger.info(f"Serial interface to the {self.name} is being closed.")
+        self._stop_reader()
+        if self.capture is not None:
+            self.capture.flush()
         super().__exit__(*args, **kwargs)
         return self
 
+    def request(self, commands: Sequence, read: Callable[[Optional[float]], R] = None,
+                timeout: Optional[float] = None) -> Optional[R]:
+        """
+        Sends one or more commands and reads the reply to them as a single transaction. In thread-safe mode the
+        commands are written while holding the write lock, and the reply is read by a single reader thread. The reader
+        reads the replies in the order in which the commands were sent, so every caller gets the reply to its own
+        commands, even if several threads use the interface at once. Without thread-safe mode the reply is read
+        directly by the caller.
+
+        Note that the firmware does not tag its replies, so a reply that arrives after its request timed out is
+        taken as the reply to the next request. Timeouts should therefore be generous.
+        :param commands: the commands to send, see `send_command`.
+        :param read: reads the reply, it is called with the timeout. If omitted the commands have no reply.
+        :param timeout: the maximum time in s to wait for the reply, by default there is no limit. What happens when
+            the timeout expires is up to `read`, the readers of the interfaces raise a TimeoutError.
+        :return: the result of `read`.
+        """
+        if not self.thread_safe:
+            self.send_commands(commands, reply=read is not None)
+            return read(timeout) if read is not None else None
+
+        future = None
+        with self._write_lock:
+            self.send_commands(commands, reply=read is not None)
+            if read is not None:
+                future = self._queue_read(read, timeout)
+        return future.result() if future is not None else None
+
+    def _queue_read(self, read: Callable[[Optional[float]], R], timeout: Optional[float]) -> Future:
+        """
+        Hands a reply to the reader thread. Must be called while holding the write lock, right after sending the
+        commands, such that the queue has the same order as the commands.
+        """
+        future = Future()
+        self._start_reader()
+        self._pending.put((future, read, timeout))
+        return future
+
+    def _start_reader(self):
+        if self._reader is None or not self._reader.is_alive():
+            self._reader = threading.Thread(target=self._read_replies, name=f'{self.name} reader', daemon=True)
+            self._reader.start()
+
+    def _stop_reader(self):
+        """
+        Stops the reader thread after it has read the replies that are still pending.
+        """
+        if self._reader is not None and self._reader.is_alive():
+            self._pending.put(None)
+            self._reader.join()
+        self._reader = None
+
+    def _read_replies(self):
+        """
+        Runs in the reader thread: reads the pending replies one by one and hands them to the waiting callers.
+        """
+        while True:
+            pending = self._pending.get()
+            if pending is None:
+                return
+            future, read, timeout = pending
+            try:
+                future.set_result(read(timeout))
+            except Exception as error:
+                future.set_exception(error)
+
     def readline(self, **kwargs) -> str:
         """
         Performs a super call to readline. This function reads until it encounters a '\n'. However, since the Arduino
@@ -85,24 +353,86 @@ class Arduino(Serial):
         :param kwargs: optional characters to pass to the super call.
         :return: a str containing all text up to (excluding) the newline characters.
         """
-        message = super().readline(**kwargs)
+        with profiling.timed(profiling.IO):
+            message = super().readline(**kwargs)
+        if self.capture is not None:
+            self.capture.record(LINE, message)
+        # A read that timed out without receiving anything is not a line.
+        if self.metrics is not None and message:
+            self.metrics.record_line(len(message))
         message = message.rstrip(self.ARDUINO_EOL).decode()
 
         return message
 
-    def find_pattern(self, pattern: re.Pattern) -> re.Match:
+    @contextmanager
+    def read_timeout(self, timeout: Optional[float]):
+        """
+        Temporarily changes the read timeout of the serial port.
+        :param timeout: the timeout in s, None blocks indefinitely.
+        """
+        previous = self.timeout
+        if timeout != previous:
+            self.timeout = timeout
+        try:
+            yield
+        finally:
+            if self.timeout != previous:
+                self.timeout = previous
+
+    def _record_reply(self):
+        """
+        Records the latency of the reply to the oldest command that is waiting for one in the metrics, or to the last
+        command if none is.
+        """
+        command, sent = self._outstanding.popleft() if self._outstanding else self._last_command
+        self.metrics.record_latency(command, perf_counter() - sent)
+
+    def _forget_reply(self):
+        """
+        Forgets the oldest command that is waiting for a reply, if its reply was not received or if it has none.
+        """
+        if self._outstanding:
+            self._outstanding.popleft()
+
+    def find_pattern(self, pattern: re.Pattern, timeout: float = None) -> Optional[re.Match]:
         """
         Reads lines until it finds a line that matches the specified pattern.
         :param pattern: the pattern to match the lines against.
-        :return: a match to the pattern.
+        :param timeout: the maximum time in s to wait for a matching line, by default there is no limit.
+        :return: a match to the pattern, or None if no matching line was received before the timeout.
         """
-        while True:
-            message = self.readline()
-            match = pattern.fullmatch(message)
+        if timeout is not None:
+            deadline = perf_counter() + timeout
+            with self.read_timeout(timeout):
+                while perf_counter() < deadline:
+                    match = self._match_line(pattern)
+                    if match:
+                        return match
+            self._forget_reply()
+            return None
 
+        while True:
+            match = self._match_line(pattern)
             if match:
                 return match
 
+    def _match_line(self, pattern: re.Pattern) -> Optional[re.Match]:
+        """
+        Reads a single line and matches it against the pattern.
+        """
+        message = self.readline()
+        match = pattern.fullmatch(message)
+
+        if match:
+            if self.metrics is not None:
+                self._record_reply()
+            if self.log_commands:
+                logger.debug("Received the following reply from the {}: {}", self.name, message)
+            return match
+        if self.metrics is not None and message:
+            self.metrics.record_discarded()
+        return None
+
 
 class CoincidenceCircuit(Arduino):
     """
@@ -111,41 +441,227 @@ class CoincidenceCircuit(Arduino):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, name='coincidence circuit', **kwargs)
+        # Whether the counters reply with binary frames, see `enable_binary`.
+        self.binary = False
+        self._decoder = CounterFrameDecoder()
+        self._sequence: Optional[int] = None
+        # The steps of each delay line as they were last set, unknown lines are missing.
+        self.delays: Dict[DelayLines, int] = {}
+        # Whether the firmware supports gates in ms, None until it is known, see `detect_ms_gates`.
+        self.supports_ms_gates: Optional[bool] = None
+
+    def _forget_state(self):
+        # The firmware starts in ASCII mode with unknown delays.
+        self.binary = False
+        self._decoder = CounterFrameDecoder()
+        self._sequence = None
+        self.delays = {}
+
+    def enable_binary(self, timeout: float = 1.0) -> bool:
+        """
+        Asks the firmware to reply to counter requests with binary frames (see `utils.protocol`), which are cheaper
+        to parse than ASCII lines. Firmware that does not support binary frames does not acknowledge the request, in
+        which case the ASCII protocol remains in use.
+        :param timeout: the time in s to wait for the acknowledgement.
+        :return: True if binary frames are used from now on.
+        """
+        return self.request(['BINARY'], self._acknowledge_binary, timeout)
+
+    def _acknowledge_binary(self, timeout: Optional[float]) -> bool:
+        # The format is switched by the reader, such that replies to earlier commands are still read as ASCII.
+        self.binary = self.find_pattern(BINARY_ACKNOWLEDGEMENT_REGEX, timeout=timeout) is not None
+        if self.binary:
+            logger.info(f"The {self.name} replies with binary counter frames.")
+        else:
+            logger.warning(f"The {self.name} does not support binary counter frames, falling back to ASCII.")
+        self._decoder = CounterFrameDecoder()
+        self._sequence = None
+        return self.binary
+
+    def disable_binary(self):
+        """
+        Switches the counter replies back to ASCII.
+        """
+        self.request(['ASCII'], self._acknowledge_ascii)
+
+    def _acknowledge_ascii(self, _):
+        # The firmware does not acknowledge the switch, the read only keeps the order of the replies.
+        self._forget_reply()
+        self.binary = False
+
+    def read_counter_frames(self, frames: int, timeout: Optional[float] = None) -> np.ndarray:
+        """
+        Reads binary counter frames, skipping any other data that is interleaved with them.
+        :param frames: the number of frames to read.
+        :param timeout: the maximum time in s to wait for the frames, by default the timeout of the port. A port
+            without timeout waits until the frames are received.
+        :return: an array of shape (frames, 3) with the counts of each frame.
+        :raises TimeoutError: if the frames were not received in time.
+        """
+        if not self.binary:
+            raise RuntimeError(f'Binary counter frames are not enabled for the {self.name}.')
+        if timeout is None:
+            # Reads of a port with a timeout return empty once the Arduino stops sending, without a deadline they
+            # would be repeated forever.
+            timeout = self.timeout
+
+        decoded = []
+        received = 0
+        discarded = self._decoder.discarded
+        deadline = perf_counter() + timeout if timeout is not None else None
+        with self.read_timeout(timeout):
+            while received < frames:
+                if deadline is not None and perf_counter() > deadline:
+                    self._forget_reply()
+                    raise TimeoutError(f'Received {received} of {frames} counter frames from the {self.name} '
+                                       f'within {timeout} s.')
+                # Exactly the number of bytes that are still needed, such that no data of a next reply is consumed.
+                with profiling.timed(profiling.IO):
+                    data = self.read(self._decoder.missing() + (frames - received - 1) * COUNTER_FRAME_SIZE)
+                if self.capture is not None:
+                    self.capture.record(DATA, data)
+                if self.metrics is not None:
+                    self.metrics.record_bytes(len(data))
+                self._decoder.feed(data)
+                block = self._decoder.decode()
+                decoded.append(block)
+                received += len(block)
+
+        result = np.concatenate(decoded) if len(decoded) > 1 else decoded[0]
+        self._check_sequence(result['sequence'])
+        if self.metrics is not None:
+            self._record_reply()
+            if self._decoder.discarded > discarded:
+                self.metrics.record_discarded()
+        return result['counts']
+
+    def _check_sequence(self, sequence: np.ndarray):
+        """
+        Warns if frames went missing, based on their sequence numbers.
+        """
+        if self._sequence is not None:
+            expected = (self._sequence + 1 + np.arange(len(sequence))) % 2 ** 16
+            if np.any(sequence != expected):
+                logger.warning(f"Counter frames of the {self.name} are out of sequence, frames may have been lost.")
+        self._sequence = int(sequence[-1])
+
+    def _read_counts(self, timeout: Optional[float] = None) -> Tuple[int, int, int]:
+        """
+        Reads the reply to a counter request in either the binary or the ASCII format.
+        :raises TimeoutError: if no reply was received within the timeout.
+        """
+        if self.binary:
+            # noinspection PyTypeChecker
+            return tuple(int(x) for x in self.read_counter_frames(1, timeout)[0])
+        match = self.find_pattern(COUNTER_REGEX, timeout)
+        if match is None:
+            raise TimeoutError(f'No counts were received from the {self.name} within {timeout} s.')
+        # noinspection PyTypeChecker
+        return tuple([int(x) for x in match.group(1, 2, 3)])
+
+    def _gate_timeout(self, gate: float, timeout: Optional[float]) -> Optional[float]:
+        """
+        The time in s to wait for the reply to a gate of the specified time in s. Without a timeout, the reply is due
+        within the gate plus the timeout of the port. A port without timeout waits until the reply is received.
+        """
+        if timeout is None and self.timeout is not None:
+            return gate + self.timeout
+        return timeout
+
+    def _read_gate(self, timeout: Optional[float] = None) -> Tuple[int, int, int]:
+        """
+        Reads the reply to a gate, see `_read_counts`. The time spent waiting for it is profiled separately from the
+        other I/O, since it mostly is the gate itself.
+        """
+        with profiling.timed(profiling.GATE):
+            return self._read_counts(timeout)
+
+    def measure_many(self, n: int, gate: int, timeout: Optional[float] = None,
+                     out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Measures n back-to-back gates as a single transaction. The gates are pipelined: the command of the next gate
+        is already waiting on the Arduino while the current gate is running, such that the idle time between the gates
+        is only the time the firmware takes to parse a command, rather than a full round trip. The replies are stored
+        in a preallocated array as they arrive. Gates of whole seconds are measured with MEASURE, which any firmware
+        supports, shorter gates require firmware that supports them, see `detect_ms_gates`.
+        :param n: the number of gates.
+        :param gate: the time in ms of each gate, at least 1 ms.
+        :param timeout: the maximum time in s to wait for the reply of each gate, see `measure`.
+        :param out: optionally the array of shape (n, 3) to store the counts in.
+        :return: an array of shape (n, 3) with the counts on each counter for every gate.
+        :raises ValueError: if the gate is not a whole number of ms of at least 1 ms.
+        :raises RuntimeError: if the firmware does not support the gate, see `detect_ms_gates`.
+        """
+        counts = out if out is not None else np.empty((n, 3), dtype=np.int64)
+        command = self._gate_command(gate)
+        timeout = self._gate_timeout(gate / 1000, timeout)
+        if n == 0:
+            return counts
+        profiling.add_counting(n * gate / 1000)
+        # The gates that are sent ahead of their replies, limited such that the commands fit in the serial buffer of
+        # the Arduino.
+        ahead = min(BURST_DEPTH, n)
+
+        with self._write_lock:
+            for _ in range(ahead):
+                self.send_commands(command, reply=True)
+
+            if not self.thread_safe:
+                for k in range(n):
+                    counts[k] = self._read_gate(timeout)
+                    if k + ahead < n:
+                        self.send_commands(command, reply=True)
+                return counts
+
+            # The reader thread reads the replies and signals each one, after which the next gate is sent. The write
+            # lock is held throughout, such that no other commands end up between the gates.
+            replies = threading.Semaphore(0)
+
+            def read(read_timeout):
+                for k in range(n):
+                    counts[k] = self._read_gate(read_timeout)
+                    replies.release()
+                return counts
+
+            future = self._queue_read(read, timeout)
+            for _ in range(n - ahead):
+                while not replies.acquire(timeout=BURST_POLL_INTERVAL):
+                    if future.done():
+                        return future.result()
+                self.send_commands(command, reply=True)
+        return future.result()
 
     def toggle_verbose(self):
         """
         Turns verbose mode on or off on the Arduino.
         """
-        self.send_command('VERB')
+        self.request(['VERB'])
 
     def clear_counters(self):
         """
         Clears all the counts on the counters. Note that the registers remain unaffected.
         """
-        self.send_command('CLEAR')
+        self.request(['CLEAR'])
 
     def save_counts_to_register(self):
         """
         Saves the counts in the counters to their register. This allows them to be read out by the Arduino.
         """
-        self.send_command('SAVE')
+        self.request(['SAVE'])
 
-    def read_counts_from_register(self) -> Tuple[int, int, int]:
+    def read_counts_from_register(self, timeout: Optional[float] = None) -> Tuple[int, int, int]:
         """
         Reads the counts from the registers of the counter chips.
+        :param timeout: the maximum time in s to wait for the reply, by default there is no limit.
         :return: a tuple with the count on each counter.
         """
-        self.send_command('READ')
-        match = self.find_pattern(COUNTER_REGEX)
-        # noinspection PyTypeChecker
-        return tuple([int(x) for x in match.group(1, 2, 3)])
+        return self.request(['READ'], self._read_counts, timeout)
 
-    def save_and_read_counts(self) -> Tuple[int, int, int]:
+    def save_and_read_counts(self, timeout: Optional[float] = None) -> Tuple[int, int, int]:
         """
         Combines save_counts_to_register with read_counts_from_register. See their docstrings.
         """
-        self.save_counts_to_register()
-        return self.read_counts_from_register()
+        return self.request(['SAVE', 'READ'], self._read_counts, timeout)
 
     def set_delay(self, steps: int, delay_line: DelayLines):
         """
@@ -154,26 +670,84 @@ class CoincidenceCircuit(Arduino):
         """
         steps = validate_delay_steps(steps)
 
-        logger.debug(
-            f"Setting delay of {delay_line.name} to {steps} steps ({delay_line.calculate_delays(steps):3f} [ns]).")
+        if self.log_commands:
+            logger.debug(
+                f"Setting delay of {delay_line.name} to {steps} steps ({delay_line.calculate_delays(steps):3f} [ns]).")
 
-        self.send_command(steps)
-        self.send_command('SD' + str(delay_line))
+        self.request([steps, 'SD' + str(delay_line)])
+        self.delays[delay_line] = steps
 
-    def measure(self, time: int) -> Tuple[int, int, int]:
+    def measure(self, time: int, timeout: Optional[float] = None) -> Tuple[int, int, int]:
         """
         Clears the counters and measures for the specified time. Should be the preferred method for gathering data.
         :param time: the time in s to measure for.
+        :param timeout: the maximum time in s to wait for the reply, including the measurement itself. By default the
+            measurement plus the timeout of the port, a port without timeout waits until the reply is received.
         :return: a tuple with the counts on each counter.
         """
-        self.send_command(time)
-        self.send_command('MEASURE')
-        match = self.find_pattern(COUNTER_REGEX)
-        # noinspection PyTypeChecker
-        return tuple([int(x) for x in match.group(1, 2, 3)])
+        profiling.add_counting(time)
+        return self.request([time, 'MEASURE'], self._read_gate, self._gate_timeout(time, timeout))
+
+    def detect_ms_gates(self, timeout: float = PROBE_TIMEOUT) -> bool:
+        """
+        Detects whether the firmware supports gates in ms, i.e. the MEASUREMS command, by measuring an empty gate.
+        The firmware on the Arduinos only has MEASURE, which measures whole seconds, and ignores MEASUREMS, so firmware
+        without support does not reply. This is detected once and remembered.
+        :param timeout: the time in s to wait for the reply to the empty gate.
+        :return: whether gates in ms are supported.
+        """
+        with self._write_lock:
+            if self.supports_ms_gates is None:
+                self.supports_ms_gates = self.request([0, 'MEASUREMS'], self._acknowledge_ms_gates, timeout)
+        return self.supports_ms_gates
+
+    def _acknowledge_ms_gates(self, timeout: Optional[float]) -> bool:
+        try:
+            self._read_counts(timeout)
+        except TimeoutError:
+            logger.warning(f"The {self.name} does not support gates in ms, only whole seconds can be measured.")
+            return False
+        return True
+
+    def _gate_command(self, gate: int) -> list:
+        """
+        :param gate: the time in ms of the gate.
+        :return: the commands that measure a gate: MEASURE for whole seconds, which all firmware supports, and
+            MEASUREMS otherwise.
+        :raises ValueError: if the gate is not a whole number of ms of at least 1 ms.
+        :raises RuntimeError: if the gate is not a whole number of seconds and the firmware does not support gates in
+            ms.
+        """
+        if gate < 1 or gate != int(gate):
+            raise ValueError(f'The gate time must be a whole number of ms of at least 1 ms, not {gate}.')
+        gate = int(gate)
+        if gate % 1000 == 0:
+            return [gate // 1000, 'MEASURE']
+        if not self.detect_ms_gates():
+            raise RuntimeError(f'The {self.name} only measures whole seconds, it does not support gates of {gate} ms.')
+        return [gate, 'MEASUREMS']
+
+    def measure_ms(self, gate: int, timeout: Optional[float] = None) -> Tuple[int, int, int]:
+        """
+        Identical to measure, however the gate time is specified in ms. This allows for gates shorter than a second,
+        e.g. to follow fluctuations of the rates or to perform quick scans. Such gates require firmware that supports
+        them, see `detect_ms_gates`. Whole seconds are measured with MEASURE on any firmware.
+        :param gate: the time in ms to measure for, at least 1 ms.
+        :param timeout: the maximum time in s to wait for the reply, see `measure`.
+        :return: a tuple with the counts on each counter.
+        :raises ValueError: if the gate is not a whole number of ms of at least 1 ms.
+        :raises RuntimeError: if the firmware does not support the gate, see `detect_ms_gates`.
+        """
+        command = self._gate_command(gate)
+        profiling.add_counting(gate / 1000)
+        return self.request(command, self._read_gate, self._gate_timeout(gate / 1000, timeout))
 
 
 class Interferometer(Arduino):
+    # The position in steps relative to where the interferometer was when the interface was created. The stepper
+    # motor keeps its position when the Arduino is reset.
+    position: int = 0
+
     def __init__(self, *args, **kwargs):
         """
         There is a hardware issue where the stepper motor will turn and shake if it is powered on when initializing a
@@ -196,8 +770,10 @@ class Interferometer(Arduino):
         :param delay: the delay in s to wait after the command is sent.
         """
         steps = validate_interferometer_steps(steps)
-        self.send_command(steps)
-        sleep(delay)
+        self.request([steps])
+        self.position += steps
+        with profiling.timed(profiling.WAIT):
+            sleep(delay)
 
 
 class CCDInterface:
@@ -213,13 +789,18 @@ class CCDInterface:
     PIXELS = 3648
 
     def __init__(self):
-        if not ftd:
+        # The FTD2XX library is only imported when the CCD is used, such that the other interfaces do not depend on it.
+        try:
+            import ftd2xx as ftd
+        except ImportError:
             raise ImportError('Could not import FTD2XX library, as such the CCD interface is not available.')
+        except OSError:
+            raise ImportError('FTD2XX binaries not found, as such the CCD interface is not available.')
 
         # Initialize the CCD.
         self.ccd = ftd.open(self.CCD_PORT)
         # Set the timeouts for the CCD.
-        self.cdd.setTimeouts(self.TIMEOUT, self.TIMEOUT)
+        self.ccd.setTimeouts(self.TIMEOUT, self.TIMEOUT)
 
         # Set the integration time.
         self.ccd.write(b"\xc1")
@@ -242,3 +823,22 @@ class CCDInterface:
         response = self.ccd.read(2 * self.PIXELS)
         data = np.frombuffer(response, dtype='>u2')
         return data
+
+    def acquire(self, shots: int = None, out: np.ndarray = None) -> np.ndarray:
+        """
+        Takes several snapshots in a row and stores them in a single array. When `out` is given the frames are written
+        into it directly, which allows a recording loop to reuse the same buffer for every acquisition.
+        :param shots: the number of snapshots to take, defaults to NUMBER_OF_SHOTS.
+        :param out: optional preallocated array of shape (shots, PIXELS).
+        :return: an array of shape (shots, PIXELS) with one snapshot per row.
+        """
+        if shots is None:
+            shots = self.NUMBER_OF_SHOTS
+        if out is None:
+            out = np.empty((shots, self.PIXELS), dtype=np.uint16)
+        elif out.shape != (shots, self.PIXELS):
+            raise ValueError(f'Output array must have shape {(shots, self.PIXELS)}, was {out.shape}.')
+
+        for shot in range(shots):
+            out[shot] = self.snapshot()
+        return out
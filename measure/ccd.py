@@ -0,0 +1,261 @@
+"""
+Provides a recording mode for the CCD. Frames are streamed straight to disk, appended to a raw binary file that can be
+opened as a memory map afterwards. This way an hour-long recording never has to sit in memory as a whole.
+
+A recording consists of three files sharing the same base name:
+    - `<name>.frames`: the (co-added) frames as raw binary data, one row of PIXELS values per frame.
+    - `<name>.timestamps`: the time (in s since the epoch) at which each frame was completed, as float64.
+    - `<name>.json`: a small header describing the data type, the number of pixels and the shots per frame.
+If running statistics are enabled, the per-pixel mean and variance of all individual shots are stored in
+`<name>.stats.npz` when the recording is closed. An existing recording is continued if it has the same layout, its
+statistics then include the shots of the earlier sessions.
+"""
+import json
+import os
+from datetime import datetime
+from os.path import join
+from time import time
+from typing import Tuple
+
+import numpy as np
+from loguru import logger
+
+from interface import CCDInterface
+from measure import DATA_DIRECTORY, DATETIME_FORMAT
+
+FRAMES_EXTENSION = '.frames'
+TIMESTAMPS_EXTENSION = '.timestamps'
+HEADER_EXTENSION = '.json'
+STATISTICS_EXTENSION = '.stats.npz'
+
+# Folder where CCD recordings are stored by default.
+CCD_DATA_FOLDER = join(DATA_DIRECTORY, 'CCD')
+
+
+class FrameRecorder:
+    """
+    Appends CCD frames to a recording on disk. Every frame that is written is the co-added (or averaged) result of a
+    fixed number of shots. Optionally the recorder keeps track of the per-pixel mean and variance of all individual
+    shots, using a numerically stable parallel update such that whole stacks of shots can be processed at once.
+    """
+
+    def __init__(self, file_name: str, pixels: int = CCDInterface.PIXELS,
+                 shots: int = CCDInterface.NUMBER_OF_SHOTS, average: bool = False, statistics: bool = True):
+        """
+        :param file_name: the base name of the recording, the extensions are appended automatically.
+        :param pixels: the number of pixels per frame.
+        :param shots: the number of shots that are combined into a single frame.
+        :param average: if True the shots are averaged (float32), otherwise they are co-added (integers).
+        :param statistics: if True a running per-pixel mean and variance of all shots is kept.
+        :raises ValueError: if a recording with this name exists with a different layout.
+        """
+        if shots < 1:
+            raise ValueError(f'The number of shots per frame must be at least 1, was {shots}.')
+
+        self.file_name = file_name
+        self.pixels = pixels
+        self.shots = shots
+        self.average = average
+        self.statistics = statistics
+
+        if average:
+            self.dtype = np.dtype(np.float32)
+        elif shots == 1:
+            self.dtype = np.dtype(np.uint16)
+        else:
+            self.dtype = np.dtype(np.uint32)
+
+        self.frames = 0
+        # Preallocated buffers, such that appending frames does not allocate any memory.
+        self._frame = np.empty(pixels, dtype=self.dtype)
+        self._timestamp = np.empty(1, dtype=np.float64)
+        self._shots = 0
+        self._mean = np.zeros(pixels)
+        self._m2 = np.zeros(pixels)
+        self._batch_mean = np.empty(pixels)
+        self._batch_m2 = np.empty(pixels)
+        self._delta = np.empty(pixels)
+        self._deviations = np.empty((shots, pixels)) if statistics else None
+        self._resume()
+
+        self._frames_file = open(file_name + FRAMES_EXTENSION, 'ab')
+        self._timestamps_file = open(file_name + TIMESTAMPS_EXTENSION, 'ab')
+        self._write_header()
+        logger.info(f"Recording CCD frames to {file_name}{FRAMES_EXTENSION}.")
+
+    def __enter__(self) -> 'FrameRecorder':
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        self.close()
+
+    @property
+    def header(self) -> dict:
+        """
+        The header describing the layout of the recording.
+        """
+        return {
+            'dtype':   self.dtype.str,
+            'pixels':  self.pixels,
+            'shots':   self.shots,
+            'average': self.average,
+        }
+
+    @property
+    def mean(self) -> np.ndarray:
+        """
+        :return: the per-pixel mean of all shots recorded so far.
+        """
+        return self._mean.copy()
+
+    @property
+    def variance(self) -> np.ndarray:
+        """
+        :return: the per-pixel (sample) variance of all shots recorded so far.
+        """
+        if self._shots < 2:
+            return np.full(self.pixels, np.nan)
+        return self._m2 / (self._shots - 1)
+
+    def _resume(self):
+        """
+        Continues an existing recording, including its running statistics. Frames of a different layout would be
+        misread, so the layout has to match.
+        :raises ValueError: if the recording exists with a different layout.
+        """
+        if not os.path.exists(self.file_name + HEADER_EXTENSION):
+            return
+        with open(self.file_name + HEADER_EXTENSION) as file:
+            header = json.load(file)
+        if header != self.header:
+            raise ValueError(f'{self.file_name} was recorded with {header}, it can not be continued with '
+                             f'{self.header}.')
+
+        logger.info(f"Continuing the recording {self.file_name}.")
+        if not self.statistics:
+            return
+        if not os.path.exists(self.file_name + STATISTICS_EXTENSION):
+            logger.warning(f"{self.file_name} has no statistics, they only include the shots from now on.")
+            return
+        with np.load(self.file_name + STATISTICS_EXTENSION) as statistics:
+            self._shots = int(statistics['shots'])
+            self._mean[:] = statistics['mean']
+            if self._shots > 1:
+                self._m2[:] = statistics['variance'] * (self._shots - 1)
+
+    def _write_header(self):
+        with open(self.file_name + HEADER_EXTENSION, 'w') as file:
+            json.dump(self.header, file)
+
+    def _update_statistics(self, shots: np.ndarray):
+        """
+        Merges a stack of shots into the running mean and variance (Chan et al. parallel algorithm).
+        """
+        n_a, n_b = self._shots, len(shots)
+        n = n_a + n_b
+
+        np.mean(shots, axis=0, out=self._batch_mean)
+        # The sum of squared deviations of the batch itself.
+        np.subtract(shots, self._batch_mean, out=self._deviations)
+        np.square(self._deviations, out=self._deviations)
+        np.sum(self._deviations, axis=0, out=self._batch_m2)
+
+        np.subtract(self._batch_mean, self._mean, out=self._delta)
+        # The mean of the batch is no longer needed, its buffer holds the correction of the mean.
+        np.multiply(self._delta, n_b / n, out=self._batch_mean)
+        self._mean += self._batch_mean
+        self._m2 += self._batch_m2
+        np.square(self._delta, out=self._delta)
+        self._delta *= n_a * n_b / n
+        self._m2 += self._delta
+        self._shots = n
+
+    def append(self, shots: np.ndarray, timestamp: float = None):
+        """
+        Combines a stack of shots into a single frame and appends it to the recording.
+        :param shots: an array of shape (shots, pixels), a single shot of shape (pixels,) is also accepted.
+        :param timestamp: the time at which the frame was completed, defaults to the current time.
+        """
+        shots = np.atleast_2d(shots)
+        if shots.shape != (self.shots, self.pixels):
+            raise ValueError(f'Expected shots of shape {(self.shots, self.pixels)}, got {shots.shape}.')
+
+        np.sum(shots, axis=0, dtype=self._frame.dtype, out=self._frame)
+        if self.average:
+            self._frame /= self.shots
+        if self.statistics:
+            self._update_statistics(shots)
+
+        self._timestamp[0] = time() if timestamp is None else timestamp
+        self._frames_file.write(self._frame.tobytes())
+        self._timestamps_file.write(self._timestamp.tobytes())
+        self.frames += 1
+
+    def flush(self):
+        """
+        Flushes the recorded frames to disk, such that they can be read while the recording is still running.
+        """
+        self._frames_file.flush()
+        self._timestamps_file.flush()
+
+    def close(self):
+        """
+        Closes the recording and stores the running statistics.
+        """
+        if self._frames_file.closed:
+            return
+
+        self._frames_file.close()
+        self._timestamps_file.close()
+        if self.statistics:
+            np.savez_compressed(self.file_name + STATISTICS_EXTENSION, mean=self.mean, variance=self.variance,
+                                shots=self._shots)
+        logger.info(f"Finished recording {self.frames} CCD frames to {self.file_name}{FRAMES_EXTENSION}.")
+
+
+def load_recording(file_name: str) -> Tuple[np.memmap, np.ndarray, dict]:
+    """
+    Opens a recording without reading it into memory. The number of frames is derived from the size of the frames
+    file, such that recordings that were interrupted can still be opened.
+    :param file_name: the base name of the recording.
+    :return: a tuple with a read-only memory map of shape (frames, pixels), the timestamps and the header.
+    """
+    with open(file_name + HEADER_EXTENSION) as file:
+        header = json.load(file)
+
+    dtype = np.dtype(header['dtype'])
+    frame_size = dtype.itemsize * header['pixels']
+    frames = os.path.getsize(file_name + FRAMES_EXTENSION) // frame_size
+
+    timestamps = np.fromfile(file_name + TIMESTAMPS_EXTENSION, dtype=np.float64)[:frames]
+    if frames == 0:
+        return np.empty((0, header['pixels']), dtype=dtype), timestamps, header
+    data = np.memmap(file_name + FRAMES_EXTENSION, dtype=dtype, mode='r', shape=(frames, header['pixels']))
+    return data, timestamps, header
+
+
+def record(ccd: CCDInterface, frames: int, file_name: str = None, shots: int = CCDInterface.NUMBER_OF_SHOTS,
+           average: bool = False, statistics: bool = True) -> str:
+    """
+    Records the specified number of frames from the CCD directly to disk.
+    :param ccd: the CCD to record from.
+    :param frames: the number of frames to record.
+    :param file_name: the base name of the recording, defaults to a timestamp in the CCD data folder.
+    :param shots: the number of shots per frame.
+    :param average: whether to average the shots rather than co-adding them.
+    :param statistics: whether to keep a running per-pixel mean and variance.
+    :return: the base name of the recording.
+    """
+    if file_name is None:
+        if not os.path.exists(CCD_DATA_FOLDER):
+            logger.debug(f"Creating data folder: {CCD_DATA_FOLDER}!")
+            os.makedirs(CCD_DATA_FOLDER)
+        file_name = join(CCD_DATA_FOLDER, datetime.now().strftime(DATETIME_FORMAT))
+
+    # A single buffer is reused for all acquisitions.
+    buffer = np.empty((shots, ccd.PIXELS), dtype=np.uint16)
+    with FrameRecorder(file_name, pixels=ccd.PIXELS, shots=shots, average=average,
+                       statistics=statistics) as recorder:
+        for _ in range(frames):
+            recorder.append(ccd.acquire(shots, out=buffer))
+    return file_name
@@ -0,0 +1,239 @@
+"""
+Loads many runs of a measurement scheme at once. Each run is a compressed `.npz` file as written by
+`BaseScheme.save`. Decompressing the files mostly happens outside of the GIL, so the files are loaded with a pool of
+threads.
+
+Runs that fit in memory can be loaded into a `Dataset`. It stacks the data of all runs into a single array and gathers
+the metadata into a table with one column per key. Directories that are too large to load at once can be reduced by
+streaming over the runs instead (`reduce_sum`, `reduce_mean`, `reduce_histogram` and `fit_table`). At most a few runs
+are in memory at any time. Records (see `measure.records`) are reduced field by field, in the layout of `to_rows`.
+"""
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from glob import glob
+from os.path import isdir, join
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from loguru import logger
+
+from measure import DATA_DIRECTORY
+from measure.records import is_records, to_rows
+
+# Number of threads used to load runs when not specified.
+WORKERS = min(8, os.cpu_count() or 1)
+
+Run = Tuple[np.ndarray, dict]
+
+
+def find_runs(location: str) -> List[str]:
+    """
+    Finds the runs at a location, sorted by name. The runs are named after their timestamp, so this also sorts them
+    chronologically.
+    :param location: a directory, a glob pattern or the name of a scheme, in which case the runs in its data folder are
+        found.
+    :return: the file names of the runs.
+    """
+    if not isdir(location) and not any(character in location for character in '*?['):
+        location = join(DATA_DIRECTORY, location)
+    if isdir(location):
+        location = join(location, '*.npz')
+    return sorted(glob(location))
+
+
+def _as_files(runs: Union[str, Iterable[str]]) -> List[str]:
+    return find_runs(runs) if isinstance(runs, str) else list(runs)
+
+
+def load_run(file_name: str) -> Run:
+    """
+    Loads the data and metadata of a single run. This is equivalent to `BaseScheme.load`, except that scalar metadata
+    is converted to Python values.
+    :param file_name: the file to load.
+    :return: a tuple containing the data and the metadata.
+    """
+    with np.load(file_name) as file_contents:
+        metadata = {key: file_contents[key] for key in file_contents.files if key != 'data'}
+        data = file_contents['data']
+    metadata = {key: value.item() if value.ndim == 0 else value for key, value in metadata.items()}
+    return data, metadata
+
+
+def iterate_runs(runs: Union[str, Iterable[str]], workers: int = WORKERS, prefetch: Optional[int] = None) \
+        -> Iterator[Run]:
+    """
+    Loads runs in the background while yielding them in order. Only a bounded number of runs is loaded ahead, so the
+    memory usage does not depend on the number of runs.
+    :param runs: the file names of the runs or a location as accepted by `find_runs`.
+    :param workers: the number of threads that load runs.
+    :param prefetch: the number of runs that are loaded ahead, twice the number of workers by default.
+    """
+    files = iter(_as_files(runs))
+    prefetch = prefetch if prefetch is not None else 2 * workers
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque(executor.submit(load_run, file) for _, file in zip(range(prefetch), files))
+        while pending:
+            run = pending.popleft().result()
+            file = next(files, None)
+            if file is not None:
+                pending.append(executor.submit(load_run, file))
+            yield run
+
+
+def metadata_table(metadata: Sequence[dict]) -> Dict[str, np.ndarray]:
+    """
+    Gathers the metadata of several runs in a table with a column for every key. Keys that are missing in some runs
+    are filled in with None.
+    :param metadata: the metadata of each run.
+    :return: a dictionary mapping each key to an array with a value per run.
+    """
+    keys = list(dict.fromkeys(key for entry in metadata for key in entry))
+    table = {}
+    for key in keys:
+        values = [entry.get(key) for entry in metadata]
+        if any(value is None or isinstance(value, np.ndarray) for value in values):
+            column = np.empty(len(values), dtype=object)
+            column[:] = values
+        else:
+            column = np.array(values)
+        table[key] = column
+    return table
+
+
+class Dataset:
+    """
+    The data and metadata of several runs of the same scheme, loaded concurrently. The data of all runs is stacked into
+    a single array of shape (runs, data points, iterations).
+    """
+
+    def __init__(self, files: Sequence[str], data: np.ndarray, metadata: Sequence[dict]):
+        self.files = list(files)
+        self.data = data
+        self.metadata = metadata_table(metadata)
+        self._metadata = list(metadata)
+
+    @classmethod
+    def load(cls, runs: Union[str, Iterable[str]], workers: int = WORKERS) -> 'Dataset':
+        """
+        :param runs: the file names of the runs or a location as accepted by `find_runs`.
+        :param workers: the number of threads that load runs.
+        :raises ValueError: if the runs do not all have data of the same shape.
+        """
+        files = _as_files(runs)
+        logger.info(f"Loading {len(files)} runs using {workers} threads.")
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            loaded = list(executor.map(load_run, files))
+
+        shapes = {data.shape for data, _ in loaded}
+        if len(shapes) > 1:
+            raise ValueError(f"Runs with different data shapes ({', '.join(map(str, sorted(shapes)))}) can not be "
+                             f"stacked, use `iterate_runs` to process them one by one.")
+        data = np.stack([data for data, _ in loaded]) if loaded else np.empty((0, 0, 0))
+        return cls(files, data, [metadata for _, metadata in loaded])
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def __getitem__(self, i: int) -> Run:
+        """
+        :return: the data and metadata of a single run.
+        """
+        return self.data[i], self._metadata[i]
+
+    def __iter__(self) -> Iterator[Run]:
+        return (self[i] for i in range(len(self)))
+
+    def select(self, **conditions) -> 'Dataset':
+        """
+        Selects the runs of which the metadata has the given values, e.g. `dataset.select(shift_A=True)`.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for key, value in conditions.items():
+            mask &= self.metadata[key] == value
+        indices = np.flatnonzero(mask)
+        return Dataset([self.files[i] for i in indices], self.data[indices], [self._metadata[i] for i in indices])
+
+
+def reduce_sum(runs: Union[str, Iterable[str]], workers: int = WORKERS) -> Tuple[np.ndarray, int]:
+    """
+    Sums the data of all runs without loading them all at once.
+    :return: the sum of the data and the number of runs.
+    :raises ValueError: if the runs do not all have data of the same shape.
+    """
+    total = None
+    count = 0
+    for data, _ in iterate_runs(runs, workers):
+        data = to_rows(data) if is_records(data) else data
+        if total is None:
+            total = np.zeros(data.shape)
+        elif data.shape != total.shape:
+            raise ValueError(f"Can not reduce data of shape {data.shape} with data of shape {total.shape}.")
+        total += data
+        count += 1
+    return total, count
+
+
+def reduce_mean(runs: Union[str, Iterable[str]], workers: int = WORKERS) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Computes the mean and the (sample) standard deviation of the data over all runs, without loading them all at once.
+    The running variance is updated using Welford's algorithm to stay numerically stable.
+    :raises ValueError: if the runs do not all have data of the same shape.
+    """
+    mean = m2 = None
+    count = 0
+    for data, _ in iterate_runs(runs, workers):
+        data = to_rows(data) if is_records(data) else data
+        if mean is None:
+            mean, m2 = np.zeros(data.shape), np.zeros(data.shape)
+        elif data.shape != mean.shape:
+            raise ValueError(f"Can not reduce data of shape {data.shape} with data of shape {mean.shape}.")
+        count += 1
+        delta = data - mean
+        mean += delta / count
+        m2 += delta * (data - mean)
+    if mean is None:
+        raise ValueError("Can not compute the mean of zero runs.")
+    std = np.sqrt(m2 / (count - 1)) if count > 1 else np.full(mean.shape, np.nan)
+    return mean, std
+
+
+def reduce_histogram(runs: Union[str, Iterable[str]], bins: np.ndarray,
+                     select: Callable[[np.ndarray, dict], np.ndarray] = lambda data, _: data,
+                     workers: int = WORKERS) -> np.ndarray:
+    """
+    Histograms values from all runs without loading them all at once.
+    :param bins: the edges of the bins.
+    :param select: selects the values to histogram from the data and metadata of a run, all data by default.
+    :return: the number of values in each bin.
+    """
+    counts = np.zeros(len(bins) - 1, dtype=np.int64)
+    for data, metadata in iterate_runs(runs, workers):
+        counts += np.histogram(select(data, metadata), bins)[0]
+    return counts
+
+
+def fit_table(runs: Union[str, Iterable[str]], fit: Callable[[np.ndarray, dict], Tuple[np.ndarray, np.ndarray]],
+              workers: int = WORKERS) -> Tuple[np.ndarray, np.ndarray, Dict[str, np.ndarray]]:
+    """
+    Fits every run and gathers the results in a table. Runs for which the fit fails (raises a RuntimeError, as
+    `curve_fit` does) get NaN parameters.
+    :param fit: fits the data and metadata of a run, returning the optimal parameters and their standard deviations.
+    :return: the parameters and standard deviations, both of shape (runs, parameters), along with the metadata table.
+    """
+    parameters, errors, metadata = [], [], []
+    for data, run_metadata in iterate_runs(runs, workers):
+        try:
+            popt, pstd = fit(data, run_metadata)
+        except RuntimeError as error:
+            logger.warning(f"Fit failed for run {run_metadata.get('timestamp')}: {error}")
+            popt = pstd = None
+        parameters.append(popt)
+        errors.append(pstd)
+        metadata.append(run_metadata)
+
+    size = max((len(popt) for popt in parameters if popt is not None), default=0)
+    nan = np.full(size, np.nan)
+    parameters = np.array([nan if popt is None else popt for popt in parameters]).reshape(-1, size)
+    errors = np.array([nan if pstd is None else pstd for pstd in errors]).reshape(-1, size)
+    return parameters, errors, metadata_table(metadata)
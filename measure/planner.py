@@ -0,0 +1,275 @@
+"""
+Predicts how long a scheme takes before occupying the setup. A dry run walks the planned iterations of a scheme on
+simulated devices in virtual time (see `utils.simulation`). The commands take the latencies of a `LatencyModel`, which
+can be measured on the real devices with their metrics (see `Arduino.enable_metrics`), and the interferometer moves at
+the modelled speed. The gate time is taken from the profile of the run (see `utils.profiling`), such that the time spent
+counting photons can be compared with the overhead.
+
+Example:
+    plan = dry_run('WindowShiftEffect', model=LatencyModel.from_metrics(coincidence_circuit.metrics))
+    logger.info(plan)
+    for trade_off in plan.suggest(budget=30 * 60):
+        logger.info(trade_off)
+
+Or from the command line:
+    python -m measure.planner WindowShiftEffect --budget 1800
+"""
+import argparse
+import sys
+from typing import Dict, List, NamedTuple, Optional, Tuple, Type, Union
+from unittest import mock
+
+import numpy as np
+from loguru import logger
+
+from interface import Arduino
+from measure.scheme import BaseScheme
+from measure.schemes import get_scheme
+from utils.metrics import CommandMetrics
+from utils.simulation import (CoincidenceFirmware, CountModel, InterferometerFirmware, SimulatedCoincidenceCircuit,
+                              SimulatedInterferometer, VirtualClock, offline)
+
+# Time in s the firmware takes to process a command including the serial round trip, when it was not measured.
+COMMAND_LATENCY = 0.002
+# Commands of which the reply only arrives after the gate, so their measured latency includes the gate time.
+GATE_COMMANDS = ('MEASURE', 'MEASUREMS')
+# Factors by which the gate time is changed in the suggested trade-offs.
+GATE_FACTORS = (0.1, 0.2, 0.5, 1, 2, 5, 10)
+# Number of prompts that are answered during a dry run, more prompts indicate a scheme that needs actual input.
+MAXIMUM_PROMPTS = 10000
+
+
+class LatencyModel:
+    """
+    The time the devices take to process commands and to move the interferometer.
+    """
+
+    def __init__(self, latency: float = COMMAND_LATENCY, latencies: Optional[Dict[str, float]] = None,
+                 step_time: float = InterferometerFirmware.STEP_TIME, boot_time: float = 0., ping: bool = False):
+        """
+        :param latency: the time in s to process a command, including the serial round trip.
+        :param latencies: the time in s to process specific commands, overriding `latency`. Numeric arguments are
+            named `Arduino.ARGUMENT_COMMAND`.
+        :param step_time: the time in s the stepper motor of the interferometer takes per step.
+        :param boot_time: the time in s the Arduinos take to boot when a scheme opens their serial ports.
+        :param ping: whether the firmware replies to pings. The firmware on the Arduinos does not, so by default the
+            fixed delay `interface.UNRESPONSIVE_DELAY` is waited whenever the Arduinos are reset, as in the lab.
+        """
+        self.latency = latency
+        self.latencies = dict(latencies) if latencies else {}
+        self.step_time = step_time
+        self.boot_time = boot_time
+        self.ping = ping
+
+    @classmethod
+    def from_metrics(cls, *metrics: CommandMetrics, step_time: float = InterferometerFirmware.STEP_TIME,
+                     boot_time: float = 0., ping: bool = False) -> 'LatencyModel':
+        """
+        Takes the mean latency of every command from the metrics of the devices. The latencies of the gates are
+        skipped, as they include the gate time. Commands that were not measured take the mean latency of all
+        measured commands.
+        :param metrics: the metrics of one or more devices.
+        """
+        sums: Dict[str, float] = {}
+        counts: Dict[str, int] = {}
+        for device_metrics in metrics:
+            for command, histogram in device_metrics.latencies.items():
+                if command in GATE_COMMANDS or not histogram.count:
+                    continue
+                sums[command] = sums.get(command, 0.) + histogram.sum
+                counts[command] = counts.get(command, 0) + histogram.count
+        latencies = {command: sums[command] / counts[command] for command in sums}
+        latency = sum(sums.values()) / sum(counts.values()) if counts else COMMAND_LATENCY
+        return cls(latency, latencies, step_time, boot_time, ping)
+
+    def command_latency(self, command: str) -> float:
+        return self.latencies.get(command, self.latency)
+
+    def devices(self, clock: VirtualClock) -> Tuple[SimulatedCoincidenceCircuit, SimulatedInterferometer]:
+        """
+        :return: simulated devices that follow the model, with their metrics enabled.
+        """
+        supports_ping = None if self.ping else False
+        coincidence_circuit = SimulatedCoincidenceCircuit(
+            firmware=CoincidenceFirmware(clock, latency=self.latency, latencies=self.latencies, model=CountModel()),
+            log_commands=False, metrics=True, supports_ping=supports_ping)
+        interferometer = SimulatedInterferometer(
+            firmware=InterferometerFirmware(clock, latency=self.latency, latencies=self.latencies,
+                                            step_time=self.step_time),
+            log_commands=False, metrics=True, supports_ping=supports_ping)
+        for device in (coincidence_circuit, interferometer):
+            device.firmware.supports_ping = self.ping
+        return coincidence_circuit, interferometer
+
+
+class TradeOff(NamedTuple):
+    """
+    A way to run a scheme within a time budget. The repeat is the number of gates relative to the plan, e.g. 2 for
+    measuring every point twice or 0.5 for half the points.
+    """
+    gate_time: float
+    repeat: float
+    duration: float
+    counting_fraction: float
+
+    def __str__(self) -> str:
+        return (f"gates of {self.gate_time:.3f} s, repeated {self.repeat:g} times: {self.duration:.1f} s, "
+                f"{self.counting_fraction:.0%} counting")
+
+
+class Plan:
+    """
+    The predicted duration of a scheme, see `dry_run`.
+    """
+
+    def __init__(self, scheme: str, duration: float, counting: float, gates: int, gate_overhead: float,
+                 commands: Dict[str, int], prompts: int):
+        """
+        :param duration: the predicted duration in s.
+        :param counting: the total gate time in s.
+        :param gates: the number of gates.
+        :param gate_overhead: the time in s each gate takes on top of the gate time.
+        :param commands: the number of times each command is sent.
+        :param prompts: the number of times the scheme asks the operator for input, which is not included.
+        """
+        self.scheme = scheme
+        self.duration = duration
+        self.counting = counting
+        self.gates = gates
+        self.gate_overhead = gate_overhead
+        self.commands = commands
+        self.prompts = prompts
+
+    @property
+    def overhead(self) -> float:
+        """
+        The fraction of the duration that is not spent counting photons.
+        """
+        return 1 - self.counting / self.duration if self.duration else 0.
+
+    @property
+    def gate_time(self) -> float:
+        """
+        The mean gate time in s.
+        """
+        return self.counting / self.gates if self.gates else 0.
+
+    @property
+    def fixed_time(self) -> float:
+        """
+        The time in s that does not depend on the gates, such as setting the delays and moving the interferometer.
+        """
+        return self.duration - self.gates * (self.gate_time + self.gate_overhead)
+
+    def trade_off(self, gate_time: float, repeat: float) -> TradeOff:
+        """
+        Predicts the duration for another gate time and number of repeats, assuming the fixed time stays the same.
+        """
+        duration = self.fixed_time + self.gates * repeat * (gate_time + self.gate_overhead)
+        return TradeOff(gate_time, repeat, duration, self.gates * repeat * gate_time / duration)
+
+    def suggest(self, budget: float) -> List[TradeOff]:
+        """
+        Suggests gate times and numbers of repeats that fit in a time budget: the longest gate time for the planned
+        gates, followed by the most repeats that fit for several multiples of the planned gate time.
+        :param budget: the time budget in s.
+        :return: the trade-offs, empty if not even the fixed time fits.
+        """
+        available = budget - self.fixed_time
+        if self.gates == 0 or available <= 0:
+            return []
+
+        trade_offs = []
+        gate_time = available / self.gates - self.gate_overhead
+        if gate_time > 0:
+            trade_offs.append(self.trade_off(gate_time, 1))
+        for factor in GATE_FACTORS:
+            gate_time = factor * self.gate_time
+            repeat = available / (self.gates * (gate_time + self.gate_overhead))
+            # Whole repeats of the plan, or a fraction of its gates if it does not fit once.
+            repeat = float(np.floor(repeat)) if repeat >= 1 else np.floor(100 * repeat) / 100
+            if repeat > 0:
+                trade_offs.append(self.trade_off(gate_time, repeat))
+        return trade_offs
+
+    def __str__(self) -> str:
+        text = (f"{self.scheme}: {self.gates} gates of {self.gate_time:.3f} s take {self.duration:.1f} s, of which "
+                f"{self.duration - self.counting:.1f} s ({self.overhead:.1%}) overhead.")
+        if self.prompts:
+            text += f" The scheme prompts {self.prompts} times, the time the operator takes is not included."
+        return text
+
+
+def dry_run(scheme: Union[str, Type[BaseScheme]], model: Optional[LatencyModel] = None, **kwargs) -> Plan:
+    """
+    Runs a scheme on simulated devices in virtual time to predict its duration. The data is discarded and all prompts
+    are answered with enter.
+    :param scheme: the scheme class or its name, see `measure.schemes.get_scheme`.
+    :param model: the latencies of the devices, `LatencyModel()` by default.
+    :param kwargs: passed on to the scheme, e.g. the sweep of a `ParameterSweep`.
+    :raises RuntimeError: if the scheme keeps prompting, e.g. for values that have to be entered.
+    """
+    scheme_class = get_scheme(scheme) if isinstance(scheme, str) else scheme
+    model = model if model is not None else LatencyModel()
+    clock = VirtualClock()
+    coincidence_circuit, interferometer = model.devices(clock)
+    prompts = []
+
+    def answer(*args) -> str:
+        prompts.append(args)
+        if len(prompts) > MAXIMUM_PROMPTS:
+            raise RuntimeError(f'{scheme_class.__name__} prompted more than {MAXIMUM_PROMPTS} times, it can not be '
+                               f'run without an operator.')
+        return ''
+
+    # The scheme opens the ports and waits for the Arduinos, as when it is run on its own.
+    for device in (coincidence_circuit, interferometer):
+        device.close()
+
+    logger.info(f"Dry run of {scheme_class.__name__}.")
+    with offline(clock), mock.patch('builtins.input', answer):
+        instance = scheme_class(coincidence_circuit, interferometer, **dict(kwargs, profile=True))
+        instance()
+
+    commands: Dict[str, int] = {}
+    for device in (coincidence_circuit, interferometer):
+        for command, count in device.metrics.commands.items():
+            commands[command] = commands.get(command, 0) + count
+    gates = sum(commands.get(command, 0) for command in GATE_COMMANDS)
+    if coincidence_circuit.supports_ms_gates is not None:
+        # The empty gate that detected the support of gates in ms is not a gate of the scheme.
+        gates -= 1
+    gate_command = max(GATE_COMMANDS, key=lambda command: commands.get(command, 0))
+    gate_overhead = model.command_latency(Arduino.ARGUMENT_COMMAND) + model.command_latency(gate_command)
+
+    return Plan(scheme_class.__name__, clock.time() + model.boot_time, instance.profiler.totals()['counting'], gates,
+                gate_overhead, commands, len(prompts))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Predicts how long a measurement scheme takes.')
+    parser.add_argument('scheme', help='the name of the scheme')
+    parser.add_argument('--budget', type=float, help='time budget in s, to suggest gate times and repeats for')
+    parser.add_argument('--latency', type=float, default=COMMAND_LATENCY * 1e3, help='command latency in ms')
+    parser.add_argument('--step-time', type=float, default=InterferometerFirmware.STEP_TIME * 1e3,
+                        help='time per step of the interferometer in ms')
+    parser.add_argument('--boot-time', type=float, default=0., help='time in s the Arduinos take to boot')
+    parser.add_argument('--ping', action='store_true', help='model firmware that replies to pings')
+    arguments = parser.parse_args()
+
+    model = LatencyModel(arguments.latency / 1e3, step_time=arguments.step_time / 1e3,
+                         boot_time=arguments.boot_time, ping=arguments.ping)
+    plan = dry_run(arguments.scheme, model)
+    logger.success(plan)
+    if arguments.budget is not None:
+        trade_offs = plan.suggest(arguments.budget)
+        if not trade_offs:
+            logger.error(f"Not even the {plan.fixed_time:.1f} s outside of the gates fit in {arguments.budget} s.")
+            return 1
+        for trade_off in trade_offs:
+            logger.info(trade_off)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
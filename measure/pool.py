@@ -0,0 +1,168 @@
+"""
+Parallel acquisition on several coincidence circuits, e.g. boards that watch different detector pairs or that use
+different window sizes. A pool behaves like a single coincidence circuit, such that it can be passed to any scheme.
+The gates are started simultaneously on all boards and the replies are read in parallel, so a measurement takes as long
+on all boards as on a single one.
+
+The counts of a pool have a trailing device axis: `measure` returns an array of shape (3, devices), such that
+`counts1, counts2, coincidences = pool.measure(1)` gives the counts of each channel on all devices. Schemes that are run
+with a pool store their data with the same trailing device axis, see `BaseScheme.devices`.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from loguru import logger
+
+from interface import CoincidenceCircuit
+from utils.delays import DelayLines
+
+# Maximum time in s to wait for all boards to be ready to start a gate.
+START_TIMEOUT = 5.
+
+
+class CircuitPool:
+    """
+    A pool of coincidence circuits that are operated in parallel.
+    """
+
+    def __init__(self, circuits: Sequence[CoincidenceCircuit], devices: Optional[Sequence[str]] = None):
+        """
+        :param circuits: the coincidence circuits.
+        :param devices: a name for each circuit, stored with the data. Defaults to the ports of the circuits.
+        """
+        if not circuits:
+            raise ValueError('A pool needs at least one coincidence circuit.')
+        if devices is not None and len(devices) != len(circuits):
+            raise ValueError(f'Got {len(devices)} names for {len(circuits)} coincidence circuits.')
+        self.circuits = list(circuits)
+        self.devices: List[str] = list(devices) if devices is not None else [
+            str(circuit.port) if circuit.port is not None else f'device {i}' for i, circuit in enumerate(circuits)]
+        self.name = f'pool of {len(self.circuits)} coincidence circuits'
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def __len__(self) -> int:
+        return len(self.circuits)
+
+    def __enter__(self):
+        for circuit in self.circuits:
+            if not circuit.is_open:
+                circuit.__enter__()
+        self._start_executor()
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        for circuit in self.circuits:
+            circuit.__exit__(*args, **kwargs)
+        return self
+
+    @property
+    def is_open(self) -> bool:
+        return all(circuit.is_open for circuit in self.circuits)
+
+    def wait_until_ready(self, *args, **kwargs) -> bool:
+        """
+        Waits until all boards reply to a ping, see `Arduino.wait_until_ready`.
+        """
+        return all(self.run(lambda circuit: circuit.wait_until_ready(*args, **kwargs)))
+
+    def _start_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(len(self.circuits), thread_name_prefix='coincidence circuit pool')
+        return self._executor
+
+    def per_device(self, value) -> list:
+        """
+        :param value: a single value for all devices, or a sequence with a value for each device.
+        :return: a list with the value for each device.
+        """
+        if np.ndim(value) == 0:
+            return [value] * len(self.circuits)
+        if len(value) != len(self.circuits):
+            raise ValueError(f'Got {len(value)} values for {len(self.circuits)} devices.')
+        return list(value)
+
+    def run(self, call: Callable, *arguments: list, synchronise: bool = False) -> list:
+        """
+        Calls a function for every circuit in parallel and waits for all of them.
+        :param call: called with the circuit and its arguments.
+        :param arguments: lists with an argument for each circuit, see `per_device`.
+        :param synchronise: if True the calls start at the same time, once every board is ready.
+        :return: the results for each circuit. If any of the calls raised, the first exception is raised after all
+            calls finished.
+        """
+        barrier = Barrier(len(self.circuits)) if synchronise else None
+
+        def task(circuit, *args):
+            if barrier is not None:
+                barrier.wait(START_TIMEOUT)
+            return call(circuit, *args)
+
+        executor = self._start_executor()
+        futures = [executor.submit(task, circuit, *args) for circuit, *args in zip(self.circuits, *arguments)]
+        # Waits for every call, such that no board is still busy when an exception is raised.
+        errors = [future.exception() for future in futures]
+        for device, error in zip(self.devices, errors):
+            if error is not None:
+                logger.error(f"The coincidence circuit {device} failed: {error!r}")
+        for error in errors:
+            if error is not None:
+                raise error
+        return [future.result() for future in futures]
+
+    def set_delay(self, steps, delay_line: DelayLines):
+        """
+        Sets a delay line on all boards.
+        :param steps: the steps for all boards, or a sequence with the steps for each board.
+        """
+        self.run(lambda circuit, value: circuit.set_delay(value, delay_line), self.per_device(steps))
+
+    def measure(self, time: int, timeout: Optional[float] = None) -> np.ndarray:
+        """
+        Measures on all boards at once, see `CoincidenceCircuit.measure`.
+        :return: the counts with shape (3, devices).
+        """
+        counts = self.run(lambda circuit: circuit.measure(time, timeout), synchronise=True)
+        return np.array(counts).T
+
+    def measure_ms(self, gate: int, timeout: Optional[float] = None) -> np.ndarray:
+        """
+        Measures on all boards at once, see `CoincidenceCircuit.measure_ms`.
+        :return: the counts with shape (3, devices).
+        """
+        counts = self.run(lambda circuit: circuit.measure_ms(gate, timeout), synchronise=True)
+        return np.array(counts).T
+
+    def measure_many(self, n: int, gate: int, timeout: Optional[float] = None) -> np.ndarray:
+        """
+        Measures bursts of gates on all boards at once, see `CoincidenceCircuit.measure_many`.
+        :return: the counts with shape (n, 3, devices).
+        """
+        counts = self.run(lambda circuit: circuit.measure_many(n, gate, timeout), synchronise=True)
+        return np.stack(counts, axis=-1)
+
+    def clear_counters(self):
+        self.run(lambda circuit: circuit.clear_counters(), synchronise=True)
+
+    def save_and_read_counts(self, timeout: Optional[float] = None) -> np.ndarray:
+        """
+        Saves and reads the counters of all boards at once.
+        :return: the counts with shape (3, devices).
+        """
+        counts = self.run(lambda circuit: circuit.save_and_read_counts(timeout), synchronise=True)
+        return np.array(counts).T
+
+
+def split_devices(data: np.ndarray, metadata: dict) -> List[Tuple[np.ndarray, dict]]:
+    """
+    Splits the data of a scheme that was run with a pool into the data of each device.
+    :return: a list with the data and metadata of each device, the metadata holds the name of the device. Data without
+        a device axis is returned as is.
+    """
+    if 'devices' not in metadata:
+        return [(data, metadata)]
+    return [(data[..., i], dict(metadata, device=device)) for i, device in enumerate(metadata['devices'])]
@@ -0,0 +1,88 @@
+"""
+Named, typed fields for the data of measurement schemes. A scheme declares its fields, e.g. the steps of the delay lines
+as uint8 and the counts as uint32, and stores its data as a structured array with a record per measurement. The fields
+are addressed by name, `data['coincidences']` is a view rather than a copy, and the records take a fraction of the
+memory (and disk space) of a float64 array with a row per field.
+
+Data that was saved before a scheme declared its fields, a float64 array with a row per field, is converted with
+`from_rows`. `to_rows` converts records back to that layout.
+"""
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from utils.delays import DelayLines
+
+Fields = Dict[str, type]
+
+# Data types of the steps of a delay line (0 to DELAY_STEPS), a position of the interferometer and the counts of a gate.
+STEPS = np.uint8
+POSITION = np.int32
+COUNTS = np.uint32
+
+# The steps of every delay line, named after the delay line.
+STEP_FIELDS: Fields = {delay_line.name: STEPS for delay_line in DelayLines}
+# The counts on counter 1, counter 2 and the coincidences, in the order in which the coincidence circuit returns them.
+COUNT_FIELDS: Fields = {'counts1': COUNTS, 'counts2': COUNTS, 'coincidences': COUNTS}
+
+
+def record_dtype(fields: Fields) -> np.dtype:
+    """
+    :param fields: the name and data type of each field.
+    :return: the structured data type of a record.
+    """
+    return np.dtype([(name, dtype) for name, dtype in fields.items()])
+
+
+def empty_records(fields: Fields, shape: Tuple[int, ...]) -> np.ndarray:
+    """
+    :return: a zeroed structured array with the given fields and shape.
+    """
+    return np.zeros(shape, dtype=record_dtype(fields))
+
+
+def is_records(data: np.ndarray) -> bool:
+    return data.dtype.names is not None
+
+
+def from_rows(data: np.ndarray, fields: Fields, axis: int = 0) -> np.ndarray:
+    """
+    Converts data with a row per field, as saved before the fields were declared, to records. Integer fields are
+    rounded, the values were stored as floats.
+    :param data: the data with the fields along an axis.
+    :param fields: the name and data type of each field, in the order of the rows.
+    :param axis: the axis of the data along which the fields are.
+    :return: the records, with the shape of the data without the field axis.
+    :raises ValueError: if the number of rows does not match the number of fields.
+    """
+    rows = np.moveaxis(np.asarray(data), axis, 0)
+    if len(rows) != len(fields):
+        raise ValueError(f"Got {len(rows)} rows for {len(fields)} fields ({', '.join(fields)}).")
+    records = empty_records(fields, rows.shape[1:])
+    for row, (name, dtype) in zip(rows, fields.items()):
+        records[name] = np.rint(row) if np.issubdtype(dtype, np.integer) else row
+    return records
+
+
+def to_rows(records: np.ndarray, dtype=np.float64, names: Optional[Tuple[str, ...]] = None) -> np.ndarray:
+    """
+    Converts records to an array with a row per field, the layout of the data before the fields were declared.
+    :param names: the fields to convert, all by default.
+    :return: an array of shape (fields,) + records.shape.
+    """
+    names = records.dtype.names if names is None else names
+    rows = np.empty((len(names),) + records.shape, dtype=dtype)
+    for row, name in zip(rows, names):
+        row[...] = records[name]
+    return rows
+
+
+def assign_counts(records: np.ndarray, index, counts, axis: int = 0):
+    """
+    Stores counts as returned by the coincidence circuit in the count fields of records.
+    :param index: the records to store the counts in.
+    :param counts: the counts on counter 1, counter 2 and the coincidences along an axis.
+    :param axis: the axis of the counts along which the counters are.
+    """
+    for name, values in zip(COUNT_FIELDS, np.moveaxis(np.asarray(counts), axis, 0)):
+        records[name][index] = values
@@ -0,0 +1,257 @@
+"""
+Renders the figures of many runs without a display and gathers them in a single indexed report. The figures are drawn
+on an Agg canvas, bypassing pyplot and its backend, in a pool of processes. Every process builds the figure of a scheme
+once, from its `FigureTemplate`, and only updates the data of the artists for every run, which is much faster than
+building the axes of each figure again.
+
+Schemes provide their figure with the `figure_template` attribute. Schemes without one get a plot of their counts, if
+their data has the count fields (see `measure.records`).
+
+Example:
+    python -m measure.report WindowShiftEffect --output reports/window_shift_effect
+"""
+import argparse
+import html
+import os
+import sys
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from os.path import basename, join, splitext
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from loguru import logger
+
+from measure.datasets import WORKERS, find_runs, load_run
+from measure.pool import split_devices
+from measure.records import COUNT_FIELDS, is_records
+from measure.schemes import get_scheme
+
+# Resolution of the figures in dots per inch.
+DPI = 80
+# Width in pixels of the figures in the index, they link to the full size figure.
+THUMBNAIL_WIDTH = 480
+
+Summary = Dict[str, float]
+
+
+def headless_figure(size: Tuple[float, float] = (6.4, 4.8)):
+    """
+    :param size: the size of the figure in inches.
+    :return: a figure on an Agg canvas that is not managed by pyplot, so it never opens a window and is only saved.
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    figure = Figure(figsize=size)
+    FigureCanvasAgg(figure)
+    return figure
+
+
+class FigureTemplate(ABC):
+    """
+    A figure that is built once and updated for every run. The figure is not managed by pyplot, so it never opens a
+    window and can be drawn in any process.
+    """
+
+    # Size of the figure in inches.
+    size: Tuple[float, float] = (6.4, 4.8)
+
+    def __init__(self):
+        self.figure = headless_figure(self.size)
+        self.build(self.figure)
+
+    @abstractmethod
+    def build(self, figure) -> None:
+        """
+        Creates the axes and the (empty) artists of the figure.
+        """
+        pass
+
+    @abstractmethod
+    def update(self, data: np.ndarray, metadata: dict) -> Summary:
+        """
+        Shows a run in the figure.
+        :return: values that summarise the run in the report, such as fit parameters.
+        """
+        pass
+
+    def render(self, data: np.ndarray, metadata: dict, file_name: str, dpi: int = DPI) -> Summary:
+        """
+        Shows a run in the figure and saves it.
+        """
+        summary = self.update(data, metadata)
+        self.figure.savefig(file_name, dpi=dpi)
+        return summary
+
+    @staticmethod
+    def rescale(axes):
+        """
+        Fits the limits of the axes to the updated artists.
+        """
+        axes.relim()
+        axes.autoscale_view()
+
+
+class CountsFigure(FigureTemplate):
+    """
+    The counts of every measurement of a run, for schemes without a figure of their own.
+    """
+
+    def build(self, figure):
+        self.axes = figure.subplots(len(COUNT_FIELDS), 1, sharex=True)
+        self.lines = [axes.plot([], [], '.')[0] for axes in self.axes]
+        for axes, name in zip(self.axes, COUNT_FIELDS):
+            axes.set_ylabel(name)
+        self.axes[-1].set_xlabel('Measurement')
+        figure.tight_layout()
+
+    def update(self, data, metadata):
+        self.axes[0].set_title(f"{metadata.get('scheme')}\n{metadata.get('timestamp')}")
+        summary = {}
+        for axes, line, name in zip(self.axes, self.lines, COUNT_FIELDS):
+            counts = data[name].ravel()
+            line.set_data(np.arange(len(counts)), counts)
+            self.rescale(axes)
+            summary[f'mean {name}'] = float(np.mean(counts)) if len(counts) else float('nan')
+        return summary
+
+
+# The figure templates of each process, by scheme name, such that every process builds each figure only once.
+_templates: Dict[str, Optional[FigureTemplate]] = {}
+
+
+def _template(scheme, data: np.ndarray) -> Optional[FigureTemplate]:
+    if scheme.__name__ not in _templates:
+        template_class = getattr(scheme, 'figure_template', None)
+        if template_class is None and is_records(data) and set(COUNT_FIELDS) <= set(data.dtype.names):
+            template_class = CountsFigure
+        _templates[scheme.__name__] = template_class() if template_class is not None else None
+    return _templates[scheme.__name__]
+
+
+def render_run(file_name: str, output: str, dpi: int = DPI) -> List[dict]:
+    """
+    Renders the figure of a run. The data of a pool of coincidence circuits gets a figure per device.
+    :param file_name: the file of the run.
+    :param output: the folder to store the figure in.
+    :return: an entry for the report per figure, with the scheme, timestamp, summary, file name of the figure and the
+        error if the run could not be rendered.
+    """
+    entry = {'file': file_name, 'scheme': None, 'timestamp': None, 'summary': {}, 'image': None, 'error': None}
+    try:
+        data, metadata = load_run(file_name)
+        entry.update(scheme=str(metadata.get('scheme')), timestamp=str(metadata.get('timestamp')))
+        scheme = get_scheme(entry['scheme'])
+        data = scheme.convert(data)
+    except Exception as error:
+        return [dict(entry, error=f'{type(error).__name__}: {error}')]
+
+    entries = []
+    for device_data, device_metadata in split_devices(data, metadata):
+        device_entry = dict(entry, device=device_metadata.get('device'))
+        try:
+            template = _template(scheme, device_data)
+            if template is not None:
+                name = splitext(basename(file_name))[0]
+                if device_entry['device'] is not None:
+                    name += f"_{device_entry['device']}"
+                image = f"{entry['scheme']}_{name}.png".replace(os.sep, '_')
+                device_entry['summary'] = template.render(device_data, device_metadata, join(output, image), dpi)
+                device_entry['image'] = image
+        except Exception as error:
+            device_entry['error'] = f'{type(error).__name__}: {error}'
+        entries.append(device_entry)
+    return entries
+
+
+def render_runs(files: Sequence[str], output: str, workers: int = WORKERS, dpi: int = DPI) -> List[dict]:
+    """
+    Renders the figures of runs in a pool of processes, see `render_run`.
+    :param workers: the number of processes, with a single worker the figures are rendered in this process.
+    :return: the entries of all figures, in the order of the files.
+    """
+    if workers <= 1 or len(files) <= 1:
+        return [entry for file_name in files for entry in render_run(file_name, output, dpi)]
+
+    # Large chunks keep the templates of each process busy, small chunks balance the load between the processes.
+    chunk_size = max(1, len(files) // (4 * workers))
+    with ProcessPoolExecutor(workers) as executor:
+        rendered = executor.map(render_run, files, repeat(output), repeat(dpi), chunksize=chunk_size)
+        return [entry for entries in rendered for entry in entries]
+
+
+def write_index(entries: Sequence[dict], output: str, title: str = 'Report') -> str:
+    """
+    Writes an HTML page with a section per scheme and a row per figure.
+    :return: the file name of the page.
+    """
+    sections: Dict[str, List[dict]] = {}
+    for entry in entries:
+        sections.setdefault(entry['scheme'] or 'Unreadable runs', []).append(entry)
+
+    lines = ['<!DOCTYPE html>', '<html>', '<head>', '<meta charset="utf-8">', f'<title>{html.escape(title)}</title>',
+             '<style>body { font-family: sans-serif; } td { vertical-align: top; padding: 4px; } '
+             '.error { color: #b00; }</style>', '</head>', '<body>', f'<h1>{html.escape(title)}</h1>', '<ul>']
+    lines += [f'<li><a href="#{html.escape(scheme)}">{html.escape(scheme)}</a> ({len(section)} figures)</li>'
+              for scheme, section in sections.items()]
+    lines.append('</ul>')
+
+    for scheme, section in sections.items():
+        lines += [f'<h2 id="{html.escape(scheme)}">{html.escape(scheme)}</h2>', '<table>']
+        for entry in section:
+            description = [f"<b>{html.escape(str(entry['timestamp']))}</b>", html.escape(entry['file'])]
+            if entry.get('device') is not None:
+                description.append(f"device {html.escape(str(entry['device']))}")
+            description += [f'{html.escape(name)}: {value:.4g}' for name, value in entry['summary'].items()]
+            if entry['error'] is not None:
+                description.append(f"<span class=\"error\">{html.escape(entry['error'])}</span>")
+            image = ''
+            if entry['image'] is not None:
+                source = html.escape(entry['image'])
+                image = f'<a href="{source}"><img src="{source}" width="{THUMBNAIL_WIDTH}"></a>'
+            lines.append(f"<tr><td>{image}</td><td>{'<br>'.join(description)}</td></tr>")
+        lines.append('</table>')
+    lines += ['</body>', '</html>']
+
+    file_name = join(output, 'index.html')
+    with open(file_name, 'w', encoding='utf-8') as file:
+        file.write('\n'.join(lines) + '\n')
+    return file_name
+
+
+def generate_report(runs: Union[str, Iterable[str]], output: str, workers: int = WORKERS, dpi: int = DPI,
+                    title: str = 'Report') -> str:
+    """
+    Renders the figures of runs and writes the index of the report.
+    :param runs: the file names of the runs or a location as accepted by `find_runs`.
+    :param output: the folder of the report, it is created if it does not exist.
+    :return: the file name of the index.
+    """
+    files = find_runs(runs) if isinstance(runs, str) else list(runs)
+    os.makedirs(output, exist_ok=True)
+    logger.info(f"Rendering the figures of {len(files)} runs using {workers} processes.")
+    entries = render_runs(files, output, workers, dpi)
+    failed = sum(entry['error'] is not None for entry in entries)
+    if failed:
+        logger.warning(f"{failed} of {len(entries)} figures could not be rendered, see the report for the errors.")
+    return write_index(entries, output, title)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Renders the figures of many runs into a single report.')
+    parser.add_argument('runs', help='a directory, a glob pattern or the name of a scheme')
+    parser.add_argument('--output', default='report', help='the folder of the report')
+    parser.add_argument('--workers', type=int, default=WORKERS, help='the number of processes')
+    parser.add_argument('--dpi', type=int, default=DPI, help='the resolution of the figures')
+    arguments = parser.parse_args()
+
+    index = generate_report(arguments.runs, arguments.output, arguments.workers, arguments.dpi,
+                            title=f'Report of {arguments.runs}')
+    logger.success(f"Report written to {index}.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
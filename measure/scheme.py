@@ -4,17 +4,19 @@ Written by:
 """
 import os
 from abc import ABC, abstractmethod
+from contextlib import nullcontext
 from datetime import datetime
 from os.path import join
-from time import sleep
-from typing import Tuple, final
+from typing import List, Optional, Tuple, final
 
 import numpy as np
 from loguru import logger
 from numpy.lib.npyio import NpzFile
 
-from interface import CoincidenceCircuit, Interferometer
+from interface import CoincidenceCircuit, Interferometer, wait_until_ready
 from measure import DATA_DIRECTORY, DATETIME_FORMAT
+from measure.records import Fields, empty_records, from_rows, is_records
+from utils.profiling import Profiler
 
 
 class BaseScheme(ABC):
@@ -23,17 +25,40 @@ class BaseScheme(ABC):
     setting up the serial interfaces and closing them when we are done. It furthermore takes care of saving and
     compressing data (along with metadata).
     """
+    # The name and data type of each field of the data, see `measure.records`. Schemes that declare fields store their
+    # data as records, other schemes as a float64 array with a row per data point.
+    fields: Optional[Fields] = None
 
-    def __init__(self, coincidence_circuit: CoincidenceCircuit, interferometer: Interferometer, data_points: int,
-                 iterations: int):
+    def __init__(self, coincidence_circuit: CoincidenceCircuit, interferometer: Interferometer,
+                 data_points: Optional[int] = None, iterations: int = 1, shape: Optional[Tuple[int, ...]] = None,
+                 profile: bool = True, trace_memory: bool = False):
+        """
+        :param data_points: the number of rows of the data, only for schemes that do not declare their fields.
+        :param iterations: the number of times `iteration` is called.
+        :param shape: the shape of the records, (iterations,) by default. Only for schemes that declare their fields.
+        :param profile: whether to profile the phases of the run, see `utils.profiling`. The profile is saved next to
+            the data.
+        :param trace_memory: whether the profile includes the memory usage of each phase, this slows down the run.
+        """
         self.coincidence_circuit = coincidence_circuit
         self.interferometer = interferometer
 
-        data_shape = (data_points, iterations)
-        self.data: np.ndarray = np.zeros(data_shape)
+        if self.fields is not None:
+            data_shape = shape if shape is not None else (iterations,)
+        elif data_points is not None:
+            data_shape = (data_points, iterations)
+        else:
+            raise ValueError(f'{self.scheme_name} declares no fields, so the number of data points is required.')
+        self.data: np.ndarray = self.allocate(data_shape)
 
         self._iterations = iterations
         self._timestamp: datetime = datetime.now()
+        self.profile = profile or trace_memory
+        self.trace_memory = trace_memory
+        # The profile of the last run, if it was profiled.
+        self.profiler: Optional[Profiler] = None
+        # The devices of which the serial connection was opened by this scheme.
+        self._opened = []
 
     @property
     def metadata(self) -> dict:
@@ -42,10 +67,41 @@ class BaseScheme(ABC):
         additional data. You should return `super().metadata.update(d)` where `d` is your dictionary.
         :return: a dictionary with metadata.
         """
-        return {
+        metadata = {
             "scheme":    self.scheme_name,
             "timestamp": self.timestamp,
         }
+        if self.devices is not None:
+            metadata["devices"] = np.array(self.devices)
+        return metadata
+
+    @property
+    def devices(self) -> Optional[List[str]]:
+        """
+        The names of the coincidence circuits if the scheme is run with a pool of them, None for a single circuit.
+        """
+        return getattr(self.coincidence_circuit, 'devices', None)
+
+    def allocate(self, shape: Tuple[int, ...]) -> np.ndarray:
+        """
+        Allocates zeroed data: records if the scheme declares its fields, float64 otherwise. A pool of coincidence
+        circuits (see `measure.pool`) adds a trailing device axis to the data.
+        """
+        if self.devices is not None:
+            shape = tuple(shape) + (len(self.devices),)
+        if self.fields is not None:
+            return empty_records(self.fields, shape)
+        return np.zeros(shape)
+
+    def broadcast(self, values) -> np.ndarray:
+        """
+        Shapes values that are equal for all devices, such as the settings of each iteration, such that they can be
+        assigned to the data with or without a device axis, e.g. `self.data['CA'] = self.broadcast(steps)`.
+        """
+        values = np.asarray(values)
+        if self.devices is None:
+            return values
+        return values[..., None]
 
     @property
     def scheme_name(self) -> str:
@@ -86,43 +142,75 @@ class BaseScheme(ABC):
         """
         return join(self.data_folder, f'{self.timestamp}.npz')
 
+    @property
+    def profile_file(self) -> str:
+        """
+        The file the profile of the run is stored in, next to the data.
+        """
+        return join(self.data_folder, f'{self.timestamp}.profile.json')
+
     @final
     def __call__(self):
         """
         Runs the whole measurement scheme. It will prepare the scheme and do any required setup. It will then iterate,
         acquiring data and finally save that data. Additionally it will run the cleanup and return the acquired data.
+        Every phase is profiled, unless profiling is disabled.
         :return:
         """
-        # Prepares the system.
-        self.prepare()
-        sleep(1)
-        # Runs code that is required once.
-        self.setup()
-        sleep(1)
-
-        # Run the actual measurements.
-        logger.info(f"Starting measurements for {self.scheme_name}.")
-        for i in range(self._iterations):
-            logger.info(f"Acquiring data for iteration {i + 1} of {self._iterations}.")
-            self.iteration(i)
-        logger.info(f"Finished measurements for {self.scheme_name}.")
-        # Save all data.
-        self.save()
-        # Perform any cleanup.
-        self.cleanup()
+        self.profiler = Profiler(self.trace_memory) if self.profile else None
+        with self.profiler or nullcontext():
+            # Prepares the system.
+            with self._phase('prepare'):
+                self.prepare()
+                self.wait_until_ready()
+            # Runs code that is required once.
+            with self._phase('setup'):
+                self.setup()
+
+            # Run the actual measurements.
+            logger.info(f"Starting measurements for {self.scheme_name}.")
+            for i in range(self._iterations):
+                logger.info(f"Acquiring data for iteration {i + 1} of {self._iterations}.")
+                with self._phase('iteration'):
+                    self.iteration(i)
+            logger.info(f"Finished measurements for {self.scheme_name}.")
+            # Save all data.
+            with self._phase('save'):
+                self.save()
+            # Perform any cleanup.
+            with self._phase('cleanup'):
+                self.cleanup()
+
+        if self.profiler is not None:
+            self.profiler.save(self.profile_file)
+            logger.info(f"Profile of {self.scheme_name}:\n{self.profiler.summary()}")
         # Return the acquired data.
         return self.data
 
+    def _phase(self, name: str):
+        return self.profiler.phase(name) if self.profiler is not None else nullcontext()
+
     @final
     def prepare(self) -> None:
         """
-        Prepares the system, initializes serial connections and creates the data folder if it does not exist.
+        Prepares the system and opens the serial connections that are not open yet. Connections that are already open,
+        e.g. those of a `measure.session.Session`, are left as they are, which avoids resetting the Arduinos.
         """
         logger.info(f"Preparing {self.scheme_name} measurement scheme...")
         self.timestamp = datetime.now()
 
-        self.coincidence_circuit.__enter__()
-        self.interferometer.__enter__()
+        self._opened = [device for device in (self.coincidence_circuit, self.interferometer)
+                        if not getattr(device, 'is_open', False)]
+        for device in self._opened:
+            device.__enter__()
+
+    @final
+    def wait_until_ready(self) -> None:
+        """
+        Waits until the devices that were opened by `prepare` are ready, see `interface.wait_until_ready`. Devices that
+        were already open have not been reset.
+        """
+        wait_until_ready([device for device in self._opened if hasattr(device, 'wait_until_ready')])
 
     @abstractmethod
     def setup(self) -> None:
@@ -152,11 +240,12 @@ class BaseScheme(ABC):
     @final
     def cleanup(self) -> None:
         """
-        Closes the serial connections.
+        Closes the serial connections that were opened by `prepare`.
         """
         logger.info(f"Tearing down {self.scheme_name} measurement scheme...")
-        self.coincidence_circuit.__exit__()
-        self.interferometer.__exit__()
+        for device in self._opened:
+            device.__exit__()
+        self._opened = []
 
     @classmethod
     def analyse(cls, data: np.ndarray, metadata) -> None:
@@ -186,6 +275,16 @@ class BaseScheme(ABC):
         data = file_contents['data']
         return data, metadata
 
+    @classmethod
+    def convert(cls, data: np.ndarray) -> np.ndarray:
+        """
+        Converts data that was saved before the scheme declared its fields, with a row per field, to records. Other
+        data is returned as is.
+        """
+        if cls.fields is None or is_records(data):
+            return data
+        return from_rows(data, cls.fields)
+
     @classmethod
     @final
     def load_and_analyse(cls, file_name: str) -> None:
@@ -193,6 +292,13 @@ class BaseScheme(ABC):
         Loads the data from the specified file and analyzes it.
         :param file_name: the file to load.
         """
+        from measure.pool import split_devices
+
         logger.info(f"Loading and analyzing data from file: {file_name}!")
         data, metadata = cls.load(file_name)
-        cls.analyse(data, metadata)
+        data = cls.convert(data)
+        # Data of a pool of coincidence circuits is analysed for each device.
+        for device_data, device_metadata in split_devices(data, metadata):
+            if 'device' in device_metadata:
+                logger.info(f"Analysing the data of device {device_metadata['device']}.")
+            cls.analyse(device_data, device_metadata)
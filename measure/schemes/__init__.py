@@ -0,0 +1,72 @@
+"""
+Registry of the available measurement schemes. Schemes are discovered by scanning the source of the modules in this
+package for subclasses of BaseScheme, directly or through another scheme, without importing them. A scheme module (and
+whatever it depends on) is only imported once the scheme is actually requested with `get_scheme`.
+"""
+import ast
+import pkgutil
+from functools import lru_cache
+from importlib import import_module
+from os.path import dirname, join
+from typing import Dict, List, Tuple, Type
+
+# Name of the base class that identifies a measurement scheme.
+BASE_SCHEME = 'BaseScheme'
+
+
+def _class_bases(file_name: str) -> Dict[str, List[str]]:
+    """
+    Parses a module and returns the names of the bases of every class it defines.
+    """
+    with open(file_name, encoding='utf-8') as file:
+        tree = ast.parse(file.read(), filename=file_name)
+
+    return {node.name: [base.id if isinstance(base, ast.Name) else getattr(base, 'attr', None) for base in node.bases]
+            for node in tree.body if isinstance(node, ast.ClassDef)}
+
+
+def discover_schemes(directory: str, package: str) -> Dict[str, str]:
+    """
+    Scans the modules in a folder for subclasses of BaseScheme, including those that derive from another scheme.
+    :param directory: the folder of the package.
+    :param package: the name of the package.
+    :return: a dictionary mapping the name of each scheme to the module it is defined in.
+    """
+    classes: Dict[str, Tuple[str, List[str]]] = {}
+    for module in pkgutil.iter_modules([directory]):
+        if module.ispkg:
+            continue
+        for name, bases in _class_bases(join(directory, f'{module.name}.py')).items():
+            classes[name] = (f'{package}.{module.name}', bases)
+
+    # Bases are resolved by name, across the modules, until no more schemes are found.
+    schemes: Dict[str, str] = {}
+    found = True
+    while found:
+        found = False
+        for name, (module, bases) in classes.items():
+            if name not in schemes and any(base == BASE_SCHEME or base in schemes for base in bases):
+                schemes[name] = module
+                found = True
+    return schemes
+
+
+@lru_cache(maxsize=1)
+def available_schemes() -> Dict[str, str]:
+    """
+    Discovers the measurement schemes in this package.
+    :return: a dictionary mapping the name of each scheme to the module it is defined in.
+    """
+    return discover_schemes(dirname(__file__), __name__)
+
+
+def get_scheme(name: str) -> Type:
+    """
+    Imports and returns the measurement scheme with the specified name.
+    :param name: the class name of the scheme, e.g. `WindowShiftEffect`.
+    :return: the scheme class.
+    """
+    schemes = available_schemes()
+    if name not in schemes:
+        raise KeyError(f'Unknown measurement scheme {name}, available schemes are: {", ".join(sorted(schemes))}.')
+    return getattr(import_module(schemes[name]), name)
@@ -0,0 +1,389 @@
+"""
+Aligns the delay lines automatically. Rather than measuring every step of the shifted line, as `WindowShiftEffect` does,
+the coincidence peak is bracketed by walking outwards from the expected position and refined with a golden-section
+search. The edges of the coincidence window are then found by bisection at half the height of the peak, and the steps
+that centre the window are stored as a named configuration (see `utils.configurations`) that the other schemes load.
+
+Every comparison accounts for the Poisson noise on the coincidences: settings that can not be told apart are measured
+again, up to MAXIMUM_REPEATS gates per setting, after which they are considered equal.
+"""
+from itertools import zip_longest
+from typing import Callable, Dict, Iterator, NamedTuple, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from measure.records import COUNT_FIELDS, STEP_FIELDS
+from measure.scheme import BaseScheme
+from utils import DELAY_STEPS
+from utils.buffers import ColumnBuffer
+from utils.configurations import DEFAULT_CONFIGURATION, save_configuration
+from utils.delays import DelayLines
+
+# Gate time in s of every measurement.
+MEASURE_TIME = 1
+# Delay in ns between the start and the end of each coincidence window, as in WindowShiftEffect.
+WINDOW_SIZE = 12
+# Delay in ns of the start of the fixed window, the search starts with the shifted window at the same delay.
+FIXED_DELAY = 26
+# Initial and maximum spacing in ns between the settings of a walk. The spacing grows by the golden ratio, up to the
+# maximum, which has to be smaller than the width of the coincidence peak or the walk can step over it.
+INITIAL_SPACING = 0.5
+MAXIMUM_SPACING = 2
+# Number of standard deviations by which the coincidences of two settings have to differ to tell them apart.
+SIGNIFICANCE = 3
+# Maximum number of gates at a single setting. The walks only tell the peak apart from the background, which differ
+# much more than the settings near the top of the peak or near its edges, so the walks and the golden-section search
+# take fewer gates than the bisection of the edges.
+MAXIMUM_REPEATS = 4
+WALK_REPEATS = 1
+GOLDEN_SECTION_REPEATS = 2
+
+GOLDEN_RATIO = (1 + np.sqrt(5)) / 2
+
+# The steps of the delay lines and the counts of every gate, in the order in which the gates were measured.
+FIELDS = {**STEP_FIELDS, **COUNT_FIELDS}
+
+
+class NoisyCoincidences:
+    """
+    The coincidences per gate for each setting of the shifted delay line. A setting is measured when it is first
+    needed and again only when it has to be told apart from another setting or a level.
+    """
+
+    def __init__(self, measure: Callable[[int], int], significance: float = SIGNIFICANCE,
+                 maximum_repeats: int = MAXIMUM_REPEATS):
+        """
+        :param measure: measures a single gate at a setting and returns the coincidences.
+        :param significance: the number of standard deviations by which settings have to differ.
+        :param maximum_repeats: the maximum number of gates at a single setting.
+        """
+        self.measure = measure
+        self.significance = significance
+        self.maximum_repeats = maximum_repeats
+        self.totals: Dict[int, int] = {}
+        self.gates: Dict[int, int] = {}
+
+    def _gate(self, setting: int):
+        self.totals[setting] = self.totals.get(setting, 0) + int(self.measure(setting))
+        self.gates[setting] = self.gates.get(setting, 0) + 1
+
+    def mean(self, setting: int) -> float:
+        """
+        :return: the mean coincidences per gate at a setting, measuring it if it was not measured yet.
+        """
+        if setting not in self.gates:
+            self._gate(setting)
+        return self.totals[setting] / self.gates[setting]
+
+    def variance(self, setting: int) -> float:
+        # Poisson statistics, with at least a single count such that a setting without coincidences is not exact.
+        return max(self.totals[setting], 1) / self.gates[setting] ** 2
+
+    def compare(self, setting: int, other: Optional[int] = None, level: float = 0.,
+                repeats: Optional[int] = None) -> int:
+        """
+        Compares the coincidences at a setting with those at another setting, or with a level if there is none.
+        :param repeats: the maximum number of gates at a setting for this comparison, by default the maximum number of
+            gates of this instance.
+        :return: 1 if there are significantly more coincidences at the setting, -1 if there are significantly fewer
+            and 0 if they can not be told apart within the maximum number of gates.
+        """
+        repeats = self.maximum_repeats if repeats is None else min(repeats, self.maximum_repeats)
+        settings = (setting,) if other is None else (setting, other)
+        while True:
+            difference = self.mean(setting) - (level if other is None else self.mean(other))
+            error = np.sqrt(sum(self.variance(s) for s in settings))
+            if abs(difference) > self.significance * error:
+                return int(np.sign(difference))
+            # Measure again where the fewest gates were taken.
+            candidates = [s for s in settings if self.gates[s] < repeats]
+            if not candidates:
+                return 0
+            self._gate(min(candidates, key=self.gates.get))
+
+    @property
+    def total_gates(self) -> int:
+        return sum(self.gates.values())
+
+
+class Alignment(NamedTuple):
+    """
+    The result of `align`, in (fractional) steps of the shifted delay line.
+    """
+    peak: int
+    left_edge: float
+    right_edge: float
+
+    @property
+    def center(self) -> float:
+        return (self.left_edge + self.right_edge) / 2
+
+
+def _walk(start: int, direction: int, lower: int, upper: int, initial: int, maximum: int) -> Iterator[int]:
+    """
+    Yields settings away from the start in a direction, with a spacing that grows by the golden ratio up to the maximum,
+    until the lower or upper bound is reached.
+    """
+    setting, spacing = start, float(initial)
+    while (setting < upper) if direction > 0 else (setting > lower):
+        setting = int(np.clip(setting + direction * max(1, round(spacing)), lower, upper))
+        yield setting
+        spacing = min(spacing * GOLDEN_RATIO, maximum)
+
+
+def _descend(counts: NoisyCoincidences, peak: int, direction: int, *bounds: int) -> Tuple[int, bool]:
+    """
+    Walks away from the peak until the coincidences have dropped significantly and levelled off.
+    :param bounds: the lower and upper bound and the initial and maximum spacing, see `_walk`.
+    :return: the setting where the walk ended and whether it has more coincidences than the peak.
+    :raises RuntimeError: if the coincidences do not drop before the bound.
+    """
+    previous, dropped = peak, False
+    for setting in _walk(peak, direction, *bounds):
+        comparison = counts.compare(setting, peak, repeats=WALK_REPEATS)
+        if comparison > 0:
+            return setting, True
+        if dropped and counts.compare(setting, previous, repeats=WALK_REPEATS) >= 0:
+            return setting, False
+        dropped = dropped or comparison < 0
+        previous = setting
+    if not dropped:
+        raise RuntimeError('The coincidence peak extends beyond the range of the delay line.')
+    return previous, False
+
+
+def bracket_peak(counts: NoisyCoincidences, start: int, lower: int, upper: int, initial: int,
+                 maximum: int) -> Tuple[int, int, int]:
+    """
+    Brackets the coincidence peak. First the settings on both sides of the start are walked until the coincidences
+    differ from those at the start, such that a setting on the peak is known. Then the walk continues away from that
+    setting on both sides until the coincidences have dropped to the background.
+    :param start: the expected setting of the peak.
+    :param lower: the lowest allowed setting.
+    :param upper: the highest allowed setting.
+    :param initial: the initial spacing of the walks in steps.
+    :param maximum: the maximum spacing of the walks in steps.
+    :return: the settings left of, on and right of the peak.
+    :raises RuntimeError: if no peak is found.
+    """
+    bounds = (lower, upper, initial, maximum)
+    peak = None
+    for settings in zip_longest(*(_walk(start, direction, *bounds) for direction in (-1, 1))):
+        for setting in settings:
+            comparison = 0 if setting is None else counts.compare(setting, start, repeats=WALK_REPEATS)
+            if comparison != 0:
+                # Either the walk found the peak or the start is on it.
+                peak = setting if comparison > 0 else start
+                break
+        if peak is not None:
+            break
+    if peak is None:
+        raise RuntimeError('The coincidences are the same for all settings, there is no coincidence peak.')
+
+    while True:
+        left, higher = _descend(counts, peak, -1, *bounds)
+        if higher:
+            peak = left
+            continue
+        right, higher = _descend(counts, peak, 1, *bounds)
+        if higher:
+            peak = right
+            continue
+        return left, peak, right
+
+
+def golden_section(counts: NoisyCoincidences, lower: int, upper: int) -> int:
+    """
+    Finds the setting with the most coincidences between two settings that bracket the peak. Settings that can not be
+    told apart are both on the top of the peak, which is then between them.
+    """
+    while upper - lower > 3:
+        distance = int(round((upper - lower) / GOLDEN_RATIO))
+        left, right = upper - distance, lower + distance
+        comparison = counts.compare(left, right, repeats=GOLDEN_SECTION_REPEATS)
+        if comparison > 0:
+            upper = right
+        elif comparison < 0:
+            lower = left
+        else:
+            lower, upper = left, right
+    return max(range(lower, upper + 1), key=counts.mean)
+
+
+def find_edge(counts: NoisyCoincidences, outside: int, inside: int, level: float) -> float:
+    """
+    Bisects between a setting with fewer and a setting with more coincidences than a level.
+    :return: the setting at which the coincidences cross the level, interpolated between steps.
+    """
+    # Start from the settings that were already measured closest to the crossing.
+    direction = 1 if inside > outside else -1
+    between = [s for s in sorted(counts.gates, key=lambda s: direction * s)
+               if direction * outside < direction * s < direction * inside]
+    above = [s for s in between if counts.mean(s) > level]
+    if above:
+        inside = above[0]
+    below = [s for s in between if direction * s < direction * inside and counts.mean(s) < level]
+    if below:
+        outside = below[-1]
+
+    while abs(inside - outside) > 1:
+        middle = (inside + outside) // 2
+        comparison = counts.compare(middle, level=level)
+        if comparison > 0:
+            inside = middle
+        elif comparison < 0:
+            outside = middle
+        else:
+            return float(middle)
+    rise = counts.mean(inside) - counts.mean(outside)
+    fraction = (level - counts.mean(outside)) / rise if rise > 0 else 0.5
+    return outside + float(np.clip(fraction, 0, 1)) * (inside - outside)
+
+
+def align(counts: NoisyCoincidences, start: int, lower: int, upper: int, initial: int, maximum: int) -> Alignment:
+    """
+    Finds the coincidence peak and the edges of the coincidence window at half its height above the background, see
+    `bracket_peak` for the parameters.
+    """
+    left, peak, right = bracket_peak(counts, start, lower, upper, initial, maximum)
+    peak = golden_section(counts, left, right)
+    edges = [find_edge(counts, end, peak, (counts.mean(peak) + counts.mean(end)) / 2) for end in (left, right)]
+    return Alignment(peak, *edges)
+
+
+class AutoAlignment(BaseScheme):
+    fields = FIELDS
+
+    def __init__(self, *args, shift_A: bool = True, configuration: Optional[str] = DEFAULT_CONFIGURATION,
+                 measure_time: int = MEASURE_TIME, window_size: float = WINDOW_SIZE, fixed_delay: float = FIXED_DELAY,
+                 maximum_spacing: float = MAXIMUM_SPACING, **kwargs):
+        """
+        :param shift_A: whether to shift the window of counter A or that of counter B.
+        :param configuration: the name under which the aligned steps are stored, None to not store them.
+        :param measure_time: the gate time in s of every measurement.
+        :param window_size: the delay in ns between the start and the end of each window.
+        :param fixed_delay: the delay in ns of the start of the fixed window.
+        :param maximum_spacing: the maximum spacing in ns of the bracketing walks, see MAXIMUM_SPACING.
+        """
+        super().__init__(*args, iterations=1, shape=(0,), **kwargs)
+        if self.devices is not None:
+            raise ValueError('The delay lines can only be aligned with a single coincidence circuit.')
+        self.shift_A = shift_A
+        self.configuration = configuration
+        self.measure_time = measure_time
+        self.window_size = window_size
+        self.fixed_delay = fixed_delay
+
+        if shift_A:
+            self.shift_line, self.shift_window, self.fixed_line, self.fixed_window = DelayLines
+        else:
+            self.fixed_line, self.fixed_window, self.shift_line, self.shift_window = DelayLines
+        self.fixed_steps = {self.fixed_line:   self.fixed_line.calculate_steps(fixed_delay),
+                            self.fixed_window: self.fixed_window.calculate_steps(fixed_delay + window_size)}
+
+        # The settings of the shifted line for which the end of its window is within the range of the delay line.
+        window_delays = self.shift_line.calculate_delays(np.arange(DELAY_STEPS + 1)) + window_size
+        valid = np.flatnonzero((window_delays >= self.shift_window.minimum_delay) &
+                               (window_delays <= self.shift_window.maximum_delay))
+        self.lower, self.upper = int(valid[0]), int(valid[-1])
+        self.start = int(np.clip(self.shift_line.calculate_steps(fixed_delay), self.lower, self.upper))
+        self.initial = max(1, int(round(INITIAL_SPACING / self.shift_line.delay_step)))
+        self.maximum = max(self.initial, int(round(maximum_spacing / self.shift_line.delay_step)))
+
+        self.buffer = ColumnBuffer(FIELDS)
+        # The alignment and the aligned steps of all delay lines, if the alignment succeeded.
+        self.alignment: Optional[Alignment] = None
+        self.steps: Optional[Dict[DelayLines, int]] = None
+
+    @property
+    def metadata(self) -> dict:
+        metadata = super().metadata
+        metadata.update({
+            'shift_A':       self.shift_A,
+            'measure_time':  self.measure_time,
+            'window_size':   self.window_size,
+            'fixed_delay':   self.fixed_delay,
+            'configuration': str(self.configuration),
+            'aligned':       self.alignment is not None,
+        })
+        if self.alignment is not None:
+            metadata.update({
+                'peak':       self.alignment.peak,
+                'left_edge':  self.alignment.left_edge,
+                'right_edge': self.alignment.right_edge,
+                **{f'{line}_steps': steps for line, steps in self.steps.items()},
+            })
+        return metadata
+
+    def window_steps(self, steps: int) -> int:
+        """
+        :return: the steps of the end of the shifted window for a setting of its start.
+        """
+        return self.shift_window.calculate_steps(self.shift_line.calculate_delays(steps) + self.window_size)
+
+    def measure(self, steps: int) -> int:
+        """
+        Measures a single gate with the shifted line at a setting.
+        :return: the coincidences.
+        """
+        settings = {self.shift_line: steps, self.shift_window: self.window_steps(steps), **self.fixed_steps}
+        self.coincidence_circuit.set_delay(settings[self.shift_line], self.shift_line)
+        self.coincidence_circuit.set_delay(settings[self.shift_window], self.shift_window)
+        counts1, counts2, coincidences = self.coincidence_circuit.measure(self.measure_time)
+        self.buffer.append(**{line.name: value for line, value in settings.items()}, counts1=counts1,
+                           counts2=counts2, coincidences=coincidences)
+        return coincidences
+
+    def setup(self):
+        for line, steps in self.fixed_steps.items():
+            self.coincidence_circuit.set_delay(steps, line)
+
+    def iteration(self, _):
+        self.buffer.clear()
+        counts = NoisyCoincidences(self.measure)
+        try:
+            self.alignment = align(counts, self.start, self.lower, self.upper, self.initial, self.maximum)
+        except RuntimeError as error:
+            logger.error(f"The alignment failed after {counts.total_gates} gates: {error}")
+            return
+        finally:
+            self.data = self.buffer.to_records()
+
+        center = int(round(self.alignment.center))
+        steps = {self.shift_line: center, self.shift_window: self.window_steps(center), **self.fixed_steps}
+        self.steps = {line: steps[line] for line in DelayLines}
+        width = (self.alignment.right_edge - self.alignment.left_edge) * self.shift_line.delay_step
+        logger.success(f"Aligned {self.shift_line} in {counts.total_gates} gates: the coincidence peak is at "
+                       f"{self.alignment.peak} steps and the window of {width:.2f} ns is centred at {center} steps.")
+        if self.configuration is not None:
+            save_configuration(self.configuration, self.steps, scheme=self.scheme_name, timestamp=self.timestamp,
+                               gates=counts.total_gates, window_width=width, window_size=self.window_size)
+
+    @classmethod
+    def analyse(cls, data, metadata):
+        from matplotlib import pyplot as plt
+
+        shift_line = DelayLines.CA if metadata['shift_A'] else DelayLines.CB
+        fixed_line = DelayLines.CB if metadata['shift_A'] else DelayLines.CA
+        settings, inverse = np.unique(data[shift_line.name], return_inverse=True)
+        means = np.bincount(inverse, data['coincidences']) / np.bincount(inverse)
+        delay = shift_line.calculate_delays(settings) - fixed_line.calculate_delays(data[fixed_line.name][0])
+        logger.info(f"{len(data)} gates at {len(settings)} settings of {shift_line}.")
+
+        fig, ax = plt.subplots()
+        ax.set_title(f"Auto alignment ({'A' if metadata['shift_A'] else 'B'})\n{metadata['timestamp']}")
+        ax.plot(delay, means, 'x', c='g', label='Coincidences')
+        if metadata['aligned']:
+            def to_delay(steps):
+                return shift_line.delay_step * (steps - settings[0]) + delay[0]
+
+            for name in ('left_edge', 'right_edge'):
+                ax.axvline(to_delay(float(metadata[name])), c='k', ls='--')
+            ax.axvline(to_delay((float(metadata['left_edge']) + float(metadata['right_edge'])) / 2), c='r',
+                       label='Centre')
+        ax.set_xlabel('Delay between lines [ns]')
+        ax.set_ylabel('Coincidences per gate')
+        ax.legend()
+        plt.tight_layout()
+        plt.show()
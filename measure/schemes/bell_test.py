@@ -2,11 +2,15 @@
 Written by:
     Douwe Remmelts <remmeltsdouwe@gmail.com>
 """
-import matplotlib.pyplot as plt
+from typing import Optional, Tuple
+
 import numpy as np
 from loguru import logger
 
+from measure.records import COUNT_FIELDS, assign_counts, from_rows, is_records
+from measure.report import FigureTemplate
 from measure.scheme import BaseScheme
+from utils.configurations import DEFAULT_CONFIGURATION, apply_steps, load_steps
 from utils.delays import DelayLines
 
 MEASURE_TIME = 1
@@ -17,6 +21,8 @@ CA_STEPS = 37
 WA_STEPS = 86
 CB_STEPS = 29
 WB_STEPS = 76
+# The steps of the delay lines if there is no configuration, see `utils.configurations`.
+STEPS = {DelayLines.CA: CA_STEPS, DelayLines.WA: WA_STEPS, DelayLines.CB: CB_STEPS, DelayLines.WB: WB_STEPS}
 
 ALPHA_ANGLES = 2 * np.array([-22.5, -22.5, -22.5, -22.5, 0, 0, 0, 0, 22.5, 22.5, 22.5, 22.5, 45, 45, 45, 45])
 BETA_ANGLES = 2 * np.array([-11.25, 11.25, 33.75, 56.25, 56.25, 33.75, 11.25, -11.25, -11.25, 11.25, 33.75, 56.25,
@@ -60,32 +66,99 @@ def compute_E(N_pp_arr, N_mm_arr, N_pm_arr, N_mp_arr):
     return E, sigma_E
 
 
+def bell_parameters(coincidences: np.ndarray) -> Tuple[float, float, float]:
+    """
+    Computes the Bell parameter S from the coincidences of every measurement for each setting of the polarisers.
+    :return: S for the strong and weak inequality and the uncertainty of S.
+    """
+    E_matrix = np.zeros((2, 2))
+    sigma_E_matrix = np.zeros((2, 2))
+    for i in range(2):
+        a = A_ARRAY[i]
+        a_bot = A_ARRAY[i + 2]
+        for j in range(2):
+            b = B_ARRAY[j]
+            logger.debug(f'{(angle_transform(a), angle_transform(b, False))} {(i, j)}')
+            b_bot = B_ARRAY[j + 2]
+            index = np.where(np.logical_and(ALPHA_ANGLES == a, BETA_ANGLES == b))
+            index_a_bot = np.where(np.logical_and(ALPHA_ANGLES == a_bot, BETA_ANGLES == b))
+            index_b_bot = np.where(np.logical_and(ALPHA_ANGLES == a, BETA_ANGLES == b_bot))
+            index_bot = np.where(np.logical_and(ALPHA_ANGLES == a_bot, BETA_ANGLES == b_bot))
+
+            E_matrix[i, j], sigma_E_matrix[i, j] = compute_E(coincidences[index], coincidences[index_bot],
+                                                             coincidences[index_a_bot], coincidences[index_b_bot])
+
+    S_strong = np.abs(-E_matrix[0, 0] + E_matrix[1, 1] + E_matrix[0, 1] + E_matrix[1, 0])
+    S_weak = np.abs(E_matrix[0, 0] - E_matrix[0, 1]) + np.abs(E_matrix[1, 1] + E_matrix[1, 0])
+    sigma_S = np.sqrt(np.sum(np.square(sigma_E_matrix)))
+    return float(S_strong), float(S_weak), float(sigma_S)
+
+
+class BellTestFigure(FigureTemplate):
+    """
+    The mean counts for each setting of the polarisers, as in `BellTest.analyse` but in a single figure.
+    """
+    size = (8, 10)
+
+    def build(self, figure):
+        x_position = np.arange(0, 2 * len(ALPHA_ANGLES), 2)
+        angle_tuples = [f'({alpha:g}, {beta:g})' for alpha, beta in zip(ALPHA_ANGLES, BETA_ANGLES)]
+        self.axes = figure.subplots(len(COUNT_FIELDS), 1, sharex=True)
+        self.bars = []
+        for axes, title in zip(self.axes, ['Counter 1', 'Counter 2', 'Coincidence counts']):
+            self.bars.append(axes.bar(x_position, np.zeros(len(x_position))))
+            axes.set_ylabel('Counts')
+            axes.set_title(title, fontsize='medium')
+        self.axes[-1].set_xticks(x_position)
+        self.axes[-1].set_xticklabels(angle_tuples, rotation=45, ha='right', rotation_mode='anchor')
+        self.axes[-1].set_xlabel('($\\alpha,\\beta$)')
+        self.title = figure.suptitle('')
+        figure.subplots_adjust(left=0.12, bottom=0.1, top=0.88, hspace=0.3)
+
+    def update(self, data, metadata):
+        S_strong, S_weak, sigma_S = bell_parameters(data['coincidences'])
+        self.title.set_text(f"Bell test {metadata['timestamp']}: S strong = {S_strong:.3f} ± {sigma_S:.3f}, "
+                            f"S weak = {S_weak:.3f} ± {sigma_S:.3f}\n CA steps = {metadata['CA_steps']}, "
+                            f"WA steps = {metadata['WA_steps']}, CB steps = {metadata['CB_steps']}, "
+                            f"WB steps = {metadata['WB_steps']}")
+        for axes, bars, name in zip(self.axes, self.bars, COUNT_FIELDS):
+            means = np.mean(data[name], axis=1)
+            for bar, mean in zip(bars, means):
+                bar.set_height(mean)
+            axes.set_ylim(0, max(np.max(means), 1) * 1.1)
+        return {'S_strong': S_strong, 'S_weak': S_weak, 'sigma_S': sigma_S}
+
+
 class BellTest(BaseScheme):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, data_points=3, iterations=1, **kwargs)
-        self.data: np.ndarray = np.zeros((ITERATIONS, 3, MEASUREMENTS_PER_ITERATION))
+    # The data holds the counts of every measurement for each setting of the polarisers.
+    fields = COUNT_FIELDS
+    figure_template = BellTestFigure
+
+    def __init__(self, *args, configuration: Optional[str] = DEFAULT_CONFIGURATION, **kwargs):
+        """
+        :param configuration: the name of the configuration with the steps of the delay lines, see
+            `utils.configurations`. The steps in STEPS are used if it does not exist or if it is None.
+        """
+        super().__init__(*args, iterations=1, shape=(ITERATIONS, MEASUREMENTS_PER_ITERATION), **kwargs)
+        self.configuration = configuration
+        self.steps = load_steps(configuration, STEPS)
 
     @property
     def metadata(self) -> dict:
         metadata = super().metadata
         metadata.update({
-            'CA_steps':                   CA_STEPS,
-            'WA_steps':                   WA_STEPS,
-            'CB_steps':                   CB_STEPS,
-            'WB_steps':                   WB_STEPS,
+            'configuration':              str(self.configuration),
             'measure_time':               MEASURE_TIME,
             'measurements_per_iteration': MEASUREMENTS_PER_ITERATION,
             'iterations':                 ITERATIONS,
             'alpha_angles':               ALPHA_ANGLES,
             'beta_angles':                BETA_ANGLES
         })
+        metadata.update({f'{line}_steps': steps for line, steps in self.steps.items()})
         return metadata
 
     def setup(self):
-        self.coincidence_circuit.set_delay(CA_STEPS, DelayLines.CA)
-        self.coincidence_circuit.set_delay(WA_STEPS, DelayLines.WA)
-        self.coincidence_circuit.set_delay(CB_STEPS, DelayLines.CB)
-        self.coincidence_circuit.set_delay(WB_STEPS, DelayLines.WB)
+        apply_steps(self.coincidence_circuit, self.steps)
 
     def iteration(self, _):
         i = 0
@@ -94,16 +167,16 @@ class BellTest(BaseScheme):
                     f'β = {angle_transform(BETA_ANGLES[0], False)}°, press enter')
         input()
         while i < ITERATIONS:
-            for j in range(MEASUREMENTS_PER_ITERATION):
-                self.data[i, :, j] = self.coincidence_circuit.measure(MEASURE_TIME)
+            counts = self.coincidence_circuit.measure_many(MEASUREMENTS_PER_ITERATION, MEASURE_TIME * 1000)
+            assign_counts(self.data, i, counts, axis=1)
             logger.info(f'For α = {angle_transform(ALPHA_ANGLES[i])}° and '
                         f'β = {angle_transform(BETA_ANGLES[i], False)}° ({i + 1} out of {ITERATIONS}):')
-            logger.info(f"Counter 1: {np.mean(self.data[i][0]):.1f} ± "
-                        f"{np.std(self.data[i][0]) / np.sqrt(MEASUREMENTS_PER_ITERATION):.1f}")
-            logger.info(f"Counter 2: {np.mean(self.data[i][1]):.1f} ± "
-                        f"{np.std(self.data[i][1]) / np.sqrt(MEASUREMENTS_PER_ITERATION):.1f}")
-            logger.info(f"Coincidences: {np.mean(self.data[i][2]):.1f} ± "
-                        f"{np.std(self.data[i][2]) / np.sqrt(MEASUREMENTS_PER_ITERATION):.1f}")
+            logger.info(f"Counter 1: {np.mean(self.data['counts1'][i]):.1f} ± "
+                        f"{np.std(self.data['counts1'][i]) / np.sqrt(MEASUREMENTS_PER_ITERATION):.1f}")
+            logger.info(f"Counter 2: {np.mean(self.data['counts2'][i]):.1f} ± "
+                        f"{np.std(self.data['counts2'][i]) / np.sqrt(MEASUREMENTS_PER_ITERATION):.1f}")
+            logger.info(f"Coincidences: {np.mean(self.data['coincidences'][i]):.1f} ± "
+                        f"{np.std(self.data['coincidences'][i]) / np.sqrt(MEASUREMENTS_PER_ITERATION):.1f}")
             if i < i_old:
                 i = i_old
             if i != ITERATIONS - 1:
@@ -119,28 +192,18 @@ class BellTest(BaseScheme):
                 i = int(choice) - 1
             i += 1
 
+    @classmethod
+    def convert(cls, data):
+        """
+        Data saved before the fields were declared has shape (settings, counters, measurements).
+        """
+        return data if is_records(data) else from_rows(data, cls.fields, axis=1)
+
     @classmethod
     def analyse(cls, data, metadata):
-        E_matrix = np.zeros((2, 2))
-        sigma_E_matrix = np.zeros((2, 2))
-        for i in range(2):
-            a = A_ARRAY[i]
-            a_bot = A_ARRAY[i + 2]
-            for j in range(2):
-                b = B_ARRAY[j]
-                print((angle_transform(a), angle_transform(b, False)), (i, j))
-                b_bot = B_ARRAY[j + 2]
-                index = np.where(np.logical_and(ALPHA_ANGLES == a, BETA_ANGLES == b))
-                index_a_bot = np.where(np.logical_and(ALPHA_ANGLES == a_bot, BETA_ANGLES == b))
-                index_b_bot = np.where(np.logical_and(ALPHA_ANGLES == a, BETA_ANGLES == b_bot))
-                index_bot = np.where(np.logical_and(ALPHA_ANGLES == a_bot, BETA_ANGLES == b_bot))
-
-                E_matrix[i, j], sigma_E_matrix[i, j] = compute_E(data[index, 2], data[index_bot, 2],
-                                                                 data[index_a_bot, 2], data[index_b_bot, 2])
-
-        S_strong = np.abs(-E_matrix[0, 0] + E_matrix[1, 1] + E_matrix[0, 1] + E_matrix[1, 0])
-        S_weak = np.abs(E_matrix[0, 0] - E_matrix[0, 1]) + np.abs(E_matrix[1, 1] + E_matrix[1, 0])
-        sigma_S = np.sqrt(np.sum(np.square(sigma_E_matrix)))
+        import matplotlib.pyplot as plt
+
+        S_strong, S_weak, sigma_S = bell_parameters(data['coincidences'])
 
         logger.info(f'S_strong = {S_strong} ± {sigma_S}')
         logger.info(f'S_weak = {S_weak} ± {sigma_S}')
@@ -151,10 +214,10 @@ class BellTest(BaseScheme):
         x_position = np.arange(0, 2 * len(ALPHA_ANGLES), 2)
         titles = ['Counter 1', 'Counter 2', 'Coincidence counts']
 
-        for i in range(3):
+        for i, name in enumerate(COUNT_FIELDS):
             fig, ax = plt.subplots()
             fig.subplots_adjust(left=0.15, bottom=0.23)
-            ax.bar(x_position, np.mean(data[:, i], axis=1))
+            ax.bar(x_position, np.mean(data[name], axis=1))
             ax.set_xticks(x_position)
             ax.set_xticklabels(angle_tuples, rotation=45, ha='right', rotation_mode="anchor")
             ax.set_title(titles[i] +
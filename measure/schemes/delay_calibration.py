@@ -0,0 +1,94 @@
+"""
+Calibrates the delay lines. Every delay line is set to a number of steps after which the operator enters the delay as
+measured with the oscilloscope. Each measurement is appended to the calibration file as soon as it is entered, after
+which the calibration is fitted again and cached.
+"""
+import numpy as np
+from loguru import logger
+
+from measure.scheme import BaseScheme
+from utils.delays import DelayLines, append_calibration, load_calibration
+
+# The steps at which the delay lines are measured.
+CALIBRATION_STEPS = np.array([0, 4, 8, 20, 40, 80, 120, 160, 200, 240])
+
+STEPS_INDEX = 0
+
+
+def delay_index(delay_line: DelayLines) -> int:
+    """
+    :return: the row of the data that contains the delay of the delay line, the row below contains its error.
+    """
+    return 1 + 2 * delay_line.index
+
+
+class DelayLineCalibration(BaseScheme):
+    def __init__(self, *args, steps: np.ndarray = CALIBRATION_STEPS, **kwargs):
+        """
+        :param steps: the steps at which the delay lines are measured.
+        """
+        # The data has the same layout as the calibration file: the steps followed by a delay and error per line.
+        super().__init__(*args, data_points=1 + 2 * len(DelayLines), iterations=len(steps), **kwargs)
+        self.data[STEPS_INDEX] = steps
+
+    @property
+    def metadata(self) -> dict:
+        metadata = super().metadata
+        metadata.update({
+            'delay_lines': [str(delay_line) for delay_line in DelayLines],
+        })
+        return metadata
+
+    def setup(self):
+        pass
+
+    @staticmethod
+    def _ask_delay(delay_line: DelayLines, steps: int) -> tuple:
+        """
+        Asks the operator for the measured delay and its error, until a valid answer is given.
+        """
+        while True:
+            logger.info(f"Enter the measured delay of {delay_line} at {steps} steps as 'delay,error' in ns:")
+            try:
+                delay, error = (float(value) for value in input().split(','))
+            except ValueError:
+                logger.warning("Could not parse the delay, please try again.")
+                continue
+            if error <= 0:
+                logger.warning("The error must be positive, please try again.")
+                continue
+            return delay, error
+
+    def iteration(self, i):
+        steps = int(self.data[STEPS_INDEX, i])
+        for delay_line in DelayLines:
+            self.coincidence_circuit.set_delay(steps, delay_line)
+
+        for delay_line in DelayLines:
+            row = delay_index(delay_line)
+            self.data[row, i], self.data[row + 1, i] = self._ask_delay(delay_line, steps)
+
+        # Append the measurement right away, such that nothing is lost if the calibration is interrupted.
+        append_calibration(self.data[:, i])
+
+    @classmethod
+    def analyse(cls, data, metadata):
+        from matplotlib import pyplot as plt
+
+        popt, pcov = load_calibration()
+        steps = data[STEPS_INDEX]
+        for delay_line in DelayLines:
+            row = delay_index(delay_line)
+            slope, offset = popt[:, delay_line.index]
+            slope_std, offset_std = np.sqrt(np.diag(pcov[delay_line.index]))
+            logger.success(f"{delay_line}: delay step = {slope:.4f} ± {slope_std:.4f} ns, "
+                           f"minimum delay = {offset:.2f} ± {offset_std:.2f} ns")
+
+            plt.errorbar(steps, data[row], yerr=data[row + 1], fmt='o', label=str(delay_line))
+            plt.plot(steps, offset + slope * steps, c='k', alpha=.5)
+
+        plt.xlabel('Steps')
+        plt.ylabel('Delay [ns]')
+        plt.title(f"Delay line calibration\n{metadata['timestamp']}")
+        plt.legend()
+        plt.show()
@@ -0,0 +1,140 @@
+"""
+Scans the interferometer while counting, and extracts the period, phase and visibility of the fringes. The fringe
+parameters are updated while the scan progresses, such that the alignment can be judged without waiting for the end
+of the scan.
+"""
+from typing import Callable, Optional
+
+import numpy as np
+from loguru import logger
+
+from measure.records import COUNT_FIELDS, POSITION, assign_counts
+from measure.scheme import BaseScheme
+from measure.sweep import move_interferometer
+from utils.configurations import DEFAULT_CONFIGURATION, apply_steps, load_steps
+from utils.delays import DelayLines
+from utils.fringes import Fringe, extract_fringe, fringe_model
+
+# Number of points in the scan.
+POINTS = 200
+# Number of interferometer steps between points.
+STEP_SIZE = 1
+# Gate time of each point in ms.
+GATE_TIME = 100
+# Time (in s) to let the interferometer settle after each step, when stepping rather than sweeping.
+SETTLE_TIME = 0.05
+# The fringe parameters are updated every this many points, once enough points were measured.
+UPDATE_INTERVAL = 10
+MINIMUM_POINTS = 16
+
+CA_STEPS = 37
+WA_STEPS = 86
+CB_STEPS = 29
+WB_STEPS = 76
+# The steps of the delay lines if there is no configuration, see `utils.configurations`.
+STEPS = {DelayLines.CA: CA_STEPS, DelayLines.WA: WA_STEPS, DelayLines.CB: CB_STEPS, DelayLines.WB: WB_STEPS}
+
+# The position of the interferometer relative to the start of the scan, followed by the counts.
+FIELDS = {'position': POSITION, **COUNT_FIELDS}
+CHANNELS = {'Counts 1': 'counts1', 'Counts 2': 'counts2', 'Coincidences': 'coincidences'}
+
+
+class FringeScan(BaseScheme):
+    fields = FIELDS
+
+    def __init__(self, *args, points: int = POINTS, step_size: int = STEP_SIZE, gate_time: int = GATE_TIME,
+                 sweep: bool = False, channel: str = 'coincidences', return_to_start: bool = True,
+                 on_update: Optional[Callable[[int, Fringe], None]] = None,
+                 configuration: Optional[str] = DEFAULT_CONFIGURATION, **kwargs):
+        """
+        :param points: the number of points in the scan.
+        :param step_size: the number of interferometer steps between points.
+        :param gate_time: the gate time of each point in ms.
+        :param sweep: if True the interferometer keeps moving while counting, rather than settling before each gate.
+            This is faster, but the fringes are averaged over each step.
+        :param channel: the field of the data (see CHANNELS) of which the fringes are followed during the scan.
+        :param return_to_start: whether to move the interferometer back to its starting position after the scan.
+        :param on_update: called with the number of points and the fringe parameters whenever they are updated, e.g. to
+            drive an alignment loop.
+        :param configuration: the name of the configuration with the steps of the delay lines, see
+            `utils.configurations`. The steps in STEPS are used if it does not exist or if it is None.
+        """
+        super().__init__(*args, iterations=points, **kwargs)
+        self.configuration = configuration
+        self.steps = load_steps(configuration, STEPS)
+        self.step_size = step_size
+        self.gate_time = gate_time
+        self.sweep = sweep
+        self.channel = channel
+        self.return_to_start = return_to_start
+        self.on_update = on_update
+        self.fringe: Optional[Fringe] = None
+
+        self.data['position'] = self.broadcast(np.arange(points) * step_size)
+
+    @property
+    def metadata(self) -> dict:
+        metadata = super().metadata
+        metadata.update({
+            'configuration': str(self.configuration),
+            'step_size':     self.step_size,
+            'gate_time':     self.gate_time,
+            'sweep':         self.sweep,
+            'channel':       self.channel,
+        })
+        metadata.update({f'{line}_steps': steps for line, steps in self.steps.items()})
+        if self.fringe is not None:
+            metadata.update({
+                'period':     self.fringe.period,
+                'phase':      self.fringe.phase,
+                'visibility': self.fringe.visibility,
+            })
+        return metadata
+
+    def setup(self):
+        apply_steps(self.coincidence_circuit, self.steps)
+
+    def iteration(self, i):
+        # The first point is measured at the starting position.
+        if i > 0:
+            self.interferometer.rotate(self.step_size, delay=0 if self.sweep else SETTLE_TIME)
+        assign_counts(self.data, i, self.coincidence_circuit.measure_ms(self.gate_time))
+
+        measured = i + 1
+        if measured == self._iterations or (measured >= MINIMUM_POINTS and measured % UPDATE_INTERVAL == 0):
+            self.update(measured)
+
+        if measured == self._iterations and self.return_to_start and i > 0:
+            move_interferometer(self.interferometer, -i * self.step_size)
+
+    def update(self, points: int) -> Fringe:
+        """
+        Extracts the fringes from the first points of the scan.
+        """
+        self.fringe = extract_fringe(self.data['position'][:points], self.data[self.channel][:points])
+        logger.info(f"After {points} points: visibility {self.fringe.visibility:.3f}, "
+                    f"period {self.fringe.period:.2f} steps, phase {self.fringe.phase:.2f} rad.")
+        if self.on_update is not None:
+            self.on_update(points, self.fringe)
+        return self.fringe
+
+    @classmethod
+    def analyse(cls, data, metadata):
+        from matplotlib import pyplot as plt
+
+        positions = data['position']
+        fine_positions = np.linspace(positions[0], positions[-1], 10 * len(positions))
+        fig, axes = plt.subplots(len(CHANNELS), 1, sharex=True)
+        axes[0].set_title(f"Fringe scan\n{metadata['timestamp']}")
+        for axis, (name, field) in zip(axes, CHANNELS.items()):
+            fringe = extract_fringe(positions, data[field])
+            logger.success(f"{name}: visibility {fringe.visibility:.3f}, period {fringe.period:.2f} steps, "
+                           f"phase {fringe.phase:.2f} rad.")
+            axis.scatter(positions, data[field], marker='.', label=name)
+            axis.plot(fine_positions, fringe_model(fine_positions, fringe), c='r',
+                      label=f'V = {fringe.visibility:.3f}')
+            axis.set_ylabel('Counts')
+            axis.legend()
+        axes[-1].set_xlabel('Position [steps]')
+        plt.tight_layout()
+        plt.show()
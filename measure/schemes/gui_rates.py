@@ -4,24 +4,16 @@ Written by:
     Douwe Remmelts <remmeltsdouwe@gmail.com>
 """
 
+import argparse
 import sys
-import time
 import tkinter as tk
 
 from interface import CoincidenceCircuit
+from utils.configurations import DEFAULT_CONFIGURATION, apply_steps, load_steps
 from utils.delays import DelayLines
 
-# Get around the max recursion depth
-sys.setrecursionlimit(100000)
-
 # tkinter stuff
 font = ("Courier", 70)
-root = tk.Tk()
-
-lab_1 = tk.Label(root, font=font)
-lab_2 = tk.Label(root, font=font)
-lab_coinc = tk.Label(root, font=font)
-lab_rel = tk.Label(root, font=font)
 
 # Set constant values for delaylines
 WINDOW_SIZE = 12
@@ -36,77 +28,115 @@ WA_steps = 86
 # CB_steps = DelayLines.CB.calculate_steps(fixed_delay)
 CB_steps = 29
 WB_steps = 76
-
-# Load circuit
-coincidence_circuit = CoincidenceCircuit(baudrate=115200, port='/dev/cu.usbmodem14301')
-coincidence_circuit.__enter__()
-time.sleep(1)
-
-# Set the delays
-coincidence_circuit.set_delay(CA_steps, DelayLines.CA)
-coincidence_circuit.set_delay(WA_steps, DelayLines.WA)
-coincidence_circuit.set_delay(CB_steps, DelayLines.CB)
-coincidence_circuit.set_delay(WB_steps, DelayLines.WB)
-
-counts_1_values = []
-counts_2_values = []
-counts_coinc_values = []
-
-
-def start_function():
-    start_button.destroy()
-
-    tk.Label(root, text='Counter 1', font=font).grid(row=0, column=0)
-    tk.Label(root, text='Counter 2', font=font).grid(row=1, column=0)
-    tk.Label(root, text='Coincidences', font=font).grid(row=2, column=0)
-    tk.Label(root, text='Relative coincidences', font=font).grid(row=3, column=0)
-
-    lab_1.grid(row=0, column=1)
-    lab_2.grid(row=1, column=1)
-    lab_coinc.grid(row=2, column=1)
-    lab_rel.grid(row=3, column=1)
-
-    measure_rate()
-
-
-def measure_rate():
-    # Function that continuously measures the rate
-
-    # Measure for 2 seconds
-    measurement = coincidence_circuit.measure(1)
-    # measurement = (random.random() * 1e6, random.random() * 1e6, random.random() * 1e6)
-    # Split the measurements and convert to Hz
-
-    global counts_1_values, counts_2_values, counts_coinc_values
-    counts_1_values.append(measurement[0])
-    counts_2_values.append(measurement[1])
-    counts_coinc_values.append(measurement[2])
-
-    if len(counts_1_values) > MEASURE_TIME:
-        counts_1_values.pop(0)
-        counts_2_values.pop(0)
-        counts_coinc_values.pop(0)
-
-    if len(counts_1_values) == MEASURE_TIME:
-        counts_1 = f'{sum(counts_1_values) / MEASURE_TIME:.2E} /s'
-        counts_2 = f'{sum(counts_2_values) / MEASURE_TIME:.2E} /s'
-        counts_coinc = f'{sum(counts_coinc_values) / MEASURE_TIME:.2E} /s'
-        try:
-            relative = f'{MEASURE_TIME * sum(counts_coinc_values) / (sum(counts_1_values) * sum(counts_2_values)):.2E}'
-        except ZeroDivisionError:
-            relative = 'Division by zero'
-        # Update the labels
-        lab_1.config(text=counts_1)
-        lab_2.config(text=counts_2)
-        lab_coinc.config(text=counts_coinc)
-        lab_rel.config(text=relative)
-    coincidence_circuit.reset_input_buffer()
-    root.after(1000, measure_rate)  # Runs itself again after 1000 milliseconds
-
-
-start_button = tk.Button(root, text='Start', font=font, command=start_function)
-start_button.pack()
-time.sleep(1)
-# start the loop
-
-root.mainloop()
+# The steps of the delay lines if there is no configuration, see `utils.configurations`.
+STEPS = {DelayLines.CA: CA_steps, DelayLines.WA: WA_steps, DelayLines.CB: CB_steps, DelayLines.WB: WB_steps}
+
+
+class RateMonitor:
+    """
+    Window that continuously displays the count rates. Nothing is opened until the monitor is created, such that
+    importing this module does not claim the serial port or open a window.
+    """
+
+    def __init__(self, coincidence_circuit: CoincidenceCircuit):
+        self.coincidence_circuit = coincidence_circuit
+
+        self.root = tk.Tk()
+        self.lab_1 = tk.Label(self.root, font=font)
+        self.lab_2 = tk.Label(self.root, font=font)
+        self.lab_coinc = tk.Label(self.root, font=font)
+        self.lab_rel = tk.Label(self.root, font=font)
+
+        self.counts_1_values = []
+        self.counts_2_values = []
+        self.counts_coinc_values = []
+
+        self.start_button = tk.Button(self.root, text='Start', font=font, command=self.start_function)
+        self.start_button.pack()
+
+    def start_function(self):
+        self.start_button.destroy()
+
+        tk.Label(self.root, text='Counter 1', font=font).grid(row=0, column=0)
+        tk.Label(self.root, text='Counter 2', font=font).grid(row=1, column=0)
+        tk.Label(self.root, text='Coincidences', font=font).grid(row=2, column=0)
+        tk.Label(self.root, text='Relative coincidences', font=font).grid(row=3, column=0)
+
+        self.lab_1.grid(row=0, column=1)
+        self.lab_2.grid(row=1, column=1)
+        self.lab_coinc.grid(row=2, column=1)
+        self.lab_rel.grid(row=3, column=1)
+
+        self.measure_rate()
+
+    def measure_rate(self):
+        # Function that continuously measures the rate
+
+        # Measure for 2 seconds
+        measurement = self.coincidence_circuit.measure(1)
+        # measurement = (random.random() * 1e6, random.random() * 1e6, random.random() * 1e6)
+        # Split the measurements and convert to Hz
+
+        self.counts_1_values.append(measurement[0])
+        self.counts_2_values.append(measurement[1])
+        self.counts_coinc_values.append(measurement[2])
+
+        if len(self.counts_1_values) > MEASURE_TIME:
+            self.counts_1_values.pop(0)
+            self.counts_2_values.pop(0)
+            self.counts_coinc_values.pop(0)
+
+        if len(self.counts_1_values) == MEASURE_TIME:
+            counts_1 = f'{sum(self.counts_1_values) / MEASURE_TIME:.2E} /s'
+            counts_2 = f'{sum(self.counts_2_values) / MEASURE_TIME:.2E} /s'
+            counts_coinc = f'{sum(self.counts_coinc_values) / MEASURE_TIME:.2E} /s'
+            try:
+                relative = MEASURE_TIME * sum(self.counts_coinc_values) / (
+                        sum(self.counts_1_values) * sum(self.counts_2_values))
+                relative = f'{relative:.2E}'
+            except ZeroDivisionError:
+                relative = 'Division by zero'
+            # Update the labels
+            self.lab_1.config(text=counts_1)
+            self.lab_2.config(text=counts_2)
+            self.lab_coinc.config(text=counts_coinc)
+            self.lab_rel.config(text=relative)
+        self.coincidence_circuit.reset_input_buffer()
+        self.root.after(1000, self.measure_rate)  # Runs itself again after 1000 milliseconds
+
+    def mainloop(self):
+        self.root.mainloop()
+
+
+def main():
+    # Get around the max recursion depth
+    sys.setrecursionlimit(100000)
+
+    parser = argparse.ArgumentParser(description='Continuously displays the count rates.')
+    parser.add_argument('--server', action='store_true',
+                        help='use the coincidence circuit of a running device server, such that a measurement scheme '
+                             'can use it at the same time')
+    parser.add_argument('--configuration', default=DEFAULT_CONFIGURATION,
+                        help='the name of the configuration with the steps of the delay lines')
+    arguments = parser.parse_args()
+
+    # Load circuit
+    if arguments.server:
+        from device_server import CoincidenceCircuitProxy
+
+        coincidence_circuit = CoincidenceCircuitProxy()
+    else:
+        coincidence_circuit = CoincidenceCircuit(baudrate=115200, port='/dev/cu.usbmodem14301')
+    coincidence_circuit.__enter__()
+    coincidence_circuit.wait_until_ready()
+
+    # Set the delays
+    apply_steps(coincidence_circuit, load_steps(arguments.configuration, STEPS))
+
+    monitor = RateMonitor(coincidence_circuit)
+    # start the loop
+    monitor.mainloop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Runs any declarative sweep (see `measure.sweep`), such that a new sweep does not need a new scheme. The data holds a row
+for every setting of the sweep, in the order of `Sweep.names`, followed by the counts on counter 1, counter 2 and the
+coincidences.
+"""
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from measure.scheme import BaseScheme
+from measure.sweep import POSITION, Settings, Sweep, apply_settings, move_interferometer
+
+# Gate time of each measurement in ms.
+GATE_TIME = 1000
+# Time (in s) to let the interferometer settle after moving.
+SETTLE_TIME = 1.
+
+
+class ParameterSweep(BaseScheme):
+    def __init__(self, *args, sweep: Sweep, gate_time: int = GATE_TIME, settle_time: float = SETTLE_TIME,
+                 return_to_start: bool = True, **kwargs):
+        """
+        :param sweep: the settings to measure at.
+        :param gate_time: the gate time of each measurement in ms.
+        :param settle_time: the time in s to let the interferometer settle after moving.
+        :param return_to_start: whether to move the interferometer back to its starting position after the sweep.
+        """
+        super().__init__(*args, data_points=len(sweep.names) + 3, iterations=len(sweep), **kwargs)
+        self.sweep = sweep
+        self.gate_time = gate_time
+        self.settle_time = settle_time
+        self.return_to_start = return_to_start
+
+        self.counts_index = len(sweep.names)
+        self._applied: Settings = {}
+        self._schedule: Iterator[Tuple[int, Settings, Optional[int]]] = iter(())
+        self.reused = 0
+
+    @property
+    def metadata(self) -> dict:
+        metadata = super().metadata
+        metadata.update({
+            'settings':  np.array(self.sweep.names),
+            'shape':     np.array(self.sweep.shape),
+            'gate_time': self.gate_time,
+            'reused':    self.reused,
+        })
+        return metadata
+
+    def setup(self):
+        self._applied = {}
+        self._schedule = self.sweep.schedule()
+        self.reused = 0
+
+    def iteration(self, i):
+        # The iterations run in order, so they follow the schedule of the sweep.
+        _, settings, earlier = next(self._schedule)
+        self.data[:self.counts_index, i] = self.broadcast([settings[name] for name in self.sweep.names])
+
+        if earlier is not None:
+            logger.debug(f"Settings of iteration {i + 1} equal those of iteration {earlier + 1}, reusing its counts.")
+            self.data[self.counts_index:, i] = self.data[self.counts_index:, earlier]
+            self.reused += 1
+        else:
+            self._applied = apply_settings(settings, self._applied, self.coincidence_circuit, self.interferometer,
+                                           self.settle_time)
+            self.data[self.counts_index:, i] = self.coincidence_circuit.measure_ms(self.gate_time)
+
+        if i == self._iterations - 1 and self.return_to_start:
+            move_interferometer(self.interferometer, -self._applied.get(POSITION, 0), self.settle_time)
+
+    @classmethod
+    def analyse(cls, data, metadata):
+        from matplotlib import pyplot as plt
+
+        names = list(metadata['settings'])
+        coincidences = data[len(names) + 2]
+        # Only the settings that change during the sweep are worth plotting against.
+        varying = [index for index, name in enumerate(names) if len(np.unique(data[index])) > 1]
+        if not varying:
+            logger.info(f"Coincidences: {np.mean(coincidences)} ± {np.std(coincidences) / np.sqrt(len(coincidences))}")
+            return
+
+        fig, axes = plt.subplots(len(varying), 1, squeeze=False)
+        axes[0, 0].set_title(f"Parameter sweep\n{metadata['timestamp']}")
+        for axis, index in zip(axes[:, 0], varying):
+            axis.scatter(data[index], coincidences, marker='.')
+            axis.set_xlabel(names[index])
+            axis.set_ylabel('Coincidences')
+        plt.tight_layout()
+        plt.show()
@@ -4,10 +4,14 @@ Written by:
     Douwe Remmelts <remmeltsdouwe@gmail.com>
 """
 
+from typing import Optional
+
 import numpy as np
 from loguru import logger
 
+from measure.records import COUNT_FIELDS, assign_counts
 from measure.scheme import BaseScheme
+from utils.configurations import DEFAULT_CONFIGURATION, apply_steps, load_steps
 from utils.delays import DelayLines
 
 ITERATIONS = 10
@@ -17,36 +21,42 @@ CA_steps = 61
 WA_steps = 110
 CB_steps = 37
 WB_steps = 83
+# The steps of the delay lines if there is no configuration, see `utils.configurations`.
+STEPS = {DelayLines.CA: CA_steps, DelayLines.WA: WA_steps, DelayLines.CB: CB_steps, DelayLines.WB: WB_steps}
 
 
 class SingleRun(BaseScheme):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, data_points=3, iterations=ITERATIONS, **kwargs)
+    fields = COUNT_FIELDS
+
+    def __init__(self, *args, configuration: Optional[str] = DEFAULT_CONFIGURATION, **kwargs):
+        """
+        :param configuration: the name of the configuration with the steps of the delay lines, see
+            `utils.configurations`. The steps in STEPS are used if it does not exist or if it is None.
+        """
+        # All measurements are taken in a single burst, rather than one gate per iteration.
+        super().__init__(*args, iterations=1, shape=(ITERATIONS,), **kwargs)
+        self.configuration = configuration
+        self.steps = load_steps(configuration, STEPS)
 
     @property
     def metadata(self) -> dict:
         metadata = super().metadata
         metadata.update({
-            'CA_steps':     CA_steps,
-            'WA_steps':     WA_steps,
-            'CB_steps':     CB_steps,
-            'WB_steps':     WB_steps,
-            'iterations':   ITERATIONS,
-            'measure_time': MEASURE_TIME,
+            'configuration': str(self.configuration),
+            'iterations':    ITERATIONS,
+            'measure_time':  MEASURE_TIME,
         })
+        metadata.update({f'{line}_steps': steps for line, steps in self.steps.items()})
         return metadata
 
     def setup(self):
-        self.coincidence_circuit.set_delay(CA_steps, DelayLines.CA)
-        self.coincidence_circuit.set_delay(WA_steps, DelayLines.WA)
-        self.coincidence_circuit.set_delay(CB_steps, DelayLines.CB)
-        self.coincidence_circuit.set_delay(WB_steps, DelayLines.WB)
+        apply_steps(self.coincidence_circuit, self.steps)
 
     def iteration(self, i):
-        self.data[:, i] = self.coincidence_circuit.measure(MEASURE_TIME)
+        assign_counts(self.data, slice(None), self.coincidence_circuit.measure_many(ITERATIONS, MEASURE_TIME * 1000),
+                      axis=1)
 
     @classmethod
     def analyse(cls, data, metadata):
-        logger.info(f"Counts 1: {np.mean(data[0])} ± {np.std(data[0]) / np.sqrt(ITERATIONS)}")
-        logger.info(f"Counts 2: {np.mean(data[1])} ± {np.std(data[1]) / np.sqrt(ITERATIONS)}")
-        logger.info(f"Coincidences: {np.mean(data[2])} ± {np.std(data[2]) / np.sqrt(ITERATIONS)}")
+        for name, label in zip(COUNT_FIELDS, ['Counts 1', 'Counts 2', 'Coincidences']):
+            logger.info(f"{label}: {np.mean(data[name])} ± {np.std(data[name]) / np.sqrt(ITERATIONS)}")
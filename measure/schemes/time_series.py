@@ -0,0 +1,110 @@
+"""
+Continuously measures the count rates with short (sub-second) gates. This makes fluctuations of the rates visible,
+e.g. due to vibrations or alignment drift.
+"""
+from time import perf_counter
+from typing import Optional
+
+import numpy as np
+from loguru import logger
+
+from measure.records import COUNT_FIELDS
+from measure.scheme import BaseScheme
+from utils.buffers import ColumnBuffer
+from utils.configurations import DEFAULT_CONFIGURATION, apply_steps, load_steps
+from utils.delays import DelayLines
+
+# Gate time in ms.
+GATE_TIME = 50
+# Total duration of the time series in s.
+DURATION = 60
+
+CA_STEPS = 37
+WA_STEPS = 86
+CB_STEPS = 29
+WB_STEPS = 76
+# The steps of the delay lines if there is no configuration, see `utils.configurations`.
+STEPS = {DelayLines.CA: CA_STEPS, DelayLines.WA: WA_STEPS, DelayLines.CB: CB_STEPS, DelayLines.WB: WB_STEPS}
+
+COLUMNS = {'time': np.float64, **COUNT_FIELDS}
+
+
+class TimeSeries(BaseScheme):
+    fields = COLUMNS
+
+    def __init__(self, *args, gate_time: int = GATE_TIME, duration: float = DURATION,
+                 configuration: Optional[str] = DEFAULT_CONFIGURATION, **kwargs):
+        """
+        :param gate_time: the gate time of each measurement in ms.
+        :param duration: the total time to measure for in s.
+        :param configuration: the name of the configuration with the steps of the delay lines, see
+            `utils.configurations`. The steps in STEPS are used if it does not exist or if it is None.
+        """
+        super().__init__(*args, iterations=1, shape=(0,), **kwargs)
+        self.configuration = configuration
+        self.steps = load_steps(configuration, STEPS)
+        self.gate_time = gate_time
+        self.duration = duration
+        self.gates = int(np.ceil(1000 * duration / gate_time))
+        self.buffer = ColumnBuffer(COLUMNS, capacity=self.gates)
+
+    @property
+    def metadata(self) -> dict:
+        metadata = super().metadata
+        metadata.update({
+            'configuration': str(self.configuration),
+            'gate_time':     self.gate_time,
+            'duration':      self.duration,
+        })
+        metadata.update({f'{line}_steps': steps for line, steps in self.steps.items()})
+        return metadata
+
+    def setup(self):
+        apply_steps(self.coincidence_circuit, self.steps)
+
+    def iteration(self, _):
+        """
+        Measures back to back gates, every row is timestamped (in s since the start) when its reply arrives. The time
+        series can be stopped early with a keyboard interrupt, the data acquired up to then is kept.
+        """
+        logger.info(f"Measuring {self.gates} gates of {self.gate_time} ms.")
+        self.buffer.clear()
+        start = perf_counter()
+        try:
+            for _ in range(self.gates):
+                counts1, counts2, coincidences = self.coincidence_circuit.measure_ms(self.gate_time)
+                self.buffer.append(time=perf_counter() - start, counts1=counts1, counts2=counts2,
+                                   coincidences=coincidences)
+        except KeyboardInterrupt:
+            logger.warning(f"Time series interrupted after {len(self.buffer)} gates.")
+        self.data = self.buffer.to_records()
+
+    @classmethod
+    def analyse(cls, data, metadata):
+        from matplotlib import pyplot as plt
+
+        gate_time = metadata['gate_time'] / 1000
+        rates = [data[name] / gate_time for name in COUNT_FIELDS]
+        for name, rate in zip(['Counter 1', 'Counter 2', 'Coincidences'], rates):
+            logger.info(f"{name}: {np.mean(rate):.1f} ± {np.std(rate):.1f} /s")
+
+        fig, (rate_axis, spectrum_axis) = plt.subplots(2, 1)
+        rate_axis.set_title(f"Time series ({metadata['gate_time']} ms gates)\n{metadata['timestamp']}")
+        for name, rate in zip(['Counts 1', 'Counts 2', 'Coincidences'], rates):
+            rate_axis.plot(data['time'], rate, label=name)
+        rate_axis.set_xlabel('Time [s]')
+        rate_axis.set_ylabel('Rate [1/s]')
+        rate_axis.set_yscale('log')
+        rate_axis.legend()
+
+        # The spectrum of the rate fluctuations shows periodic disturbances such as vibrations.
+        frequencies = np.fft.rfftfreq(len(data), gate_time)
+        for name, rate in zip(['Counts 1', 'Counts 2', 'Coincidences'], rates):
+            spectrum = np.abs(np.fft.rfft(rate - np.mean(rate))) ** 2
+            spectrum_axis.semilogy(frequencies[1:], spectrum[1:], label=name)
+        spectrum_axis.set_xlabel('Frequency [Hz]')
+        spectrum_axis.set_ylabel('Power')
+        spectrum_axis.legend()
+
+        plt.tight_layout()
+        plt.show()
@@ -3,13 +3,13 @@ Written by:
     Julian van Doorn <j.c.b.van.doorn@umail.leidenuniv.nl>
     Douwe Remmelts <remmeltsdouwe@gmail.com>
 """
+from typing import Tuple
 
 import numpy as np
 from loguru import logger
-from matplotlib import pyplot as plt
-from scipy.optimize import curve_fit
-from scipy.special import erf
 
+from measure.records import COUNT_FIELDS, STEP_FIELDS, empty_records
+from measure.report import FigureTemplate
 from measure.scheme import BaseScheme
 from utils.delays import DelayLines
 
@@ -21,18 +21,63 @@ WINDOW_SIZE = 12
 REGION_SIZE = 6
 ITERATIONS = 2 * 4 * REGION_SIZE
 
-CA_INDEX = 0
-WA_INDEX = 1
-CB_INDEX = 2
-WB_INDEX = 3
-C1_INDEX = 4
-C2_INDEX = 5
-CO_INDEX = 6
+# The steps of the delay lines followed by the counts, in the order of the rows of data saved before the fields were
+# declared.
+FIELDS = {**STEP_FIELDS, **COUNT_FIELDS}
+# The names of the parameters of `WindowShiftEffect._distribution`.
+FIT_PARAMETERS = ('Nd', 'N', 'sigma', 'delay_offset', 'window')
+
+
+class WindowShiftFigure(FigureTemplate):
+    """
+    The counts and coincidences against the delay between the lines, along with the fit, as in `analyse`.
+    """
+
+    def build(self, figure):
+        self.count_axis = figure.subplots()
+        self.count_axis.set_xlabel('Delay between lines [ns]')
+        self.count_axis.set_ylabel('Counts')
+        self.coincidence_axis = self.count_axis.twinx()
+        self.coincidence_axis.set_ylabel('Coincidences')
+
+        self.counts1, = self.count_axis.plot([], [], '.', label='Counts 1')
+        self.counts2, = self.count_axis.plot([], [], '.', label='Counts 2')
+        self.coincidences, = self.coincidence_axis.plot([], [], 'x', c='g', label='Coincidences')
+        self.fit, = self.coincidence_axis.plot([], [], c='r', label='Fit')
+        self.coincidence_axis.legend(handles=[self.counts1, self.counts2, self.coincidences, self.fit])
+        # Leaves room for the two lines of the title.
+        self.title = self.count_axis.set_title('\n')
+        figure.tight_layout()
+
+    def update(self, data, metadata):
+        delay = WindowShiftEffect.delay(data, metadata)
+        self.title.set_text(f"Window Shift Effect ({'A' if metadata['shift_A'] else 'B'})\n{metadata['timestamp']}")
+        self.counts1.set_data(delay, data['counts1'])
+        self.counts2.set_data(delay, data['counts2'])
+        self.coincidences.set_data(delay, data['coincidences'])
+
+        summary = {'mean counts1': float(np.mean(data['counts1'])), 'mean counts2': float(np.mean(data['counts2']))}
+        try:
+            _, popt = WindowShiftEffect.fit(data, metadata)
+        except RuntimeError:
+            self.fit.set_data([], [])
+        else:
+            fit_delay = np.arange(np.min(delay), np.max(delay), 0.1)
+            self.fit.set_data(fit_delay, WindowShiftEffect._distribution(fit_delay, *popt))
+            summary.update(zip(FIT_PARAMETERS, map(float, popt)))
+
+        self.rescale(self.count_axis)
+        self.count_axis.set_ylim(0, np.max([data['counts1'], data['counts2']]) * 1.1)
+        self.rescale(self.coincidence_axis)
+        return summary
 
 
 class WindowShiftEffect(BaseScheme):
+    fields = FIELDS
+    figure_template = WindowShiftFigure
+
     def __init__(self, *args, shift_A: bool = True, **kwargs):
-        super().__init__(*args, data_points=7, iterations=ITERATIONS, **kwargs)
+        super().__init__(*args, iterations=ITERATIONS, **kwargs)
         self.shift_A = shift_A
 
         fixed_delay = LOWER_DELAY_LIMIT + REGION_SIZE
@@ -44,15 +89,15 @@ class WindowShiftEffect(BaseScheme):
         desired_delays = np.linspace(start_delay, end_delay, self._iterations)
 
         if shift_A:
-            self.data[CA_INDEX, :] = DelayLines.CA.calculate_steps(desired_delays)
-            self.data[WA_INDEX, :] = DelayLines.WA.calculate_steps(desired_delays + WINDOW_SIZE)
-            self.data[CB_INDEX, :] = np.tile(DelayLines.CB.calculate_steps(fixed_delay), self._iterations)
-            self.data[WB_INDEX, :] = np.tile(DelayLines.WB.calculate_steps(fixed_delay + WINDOW_SIZE), self._iterations)
+            self.data['CA'] = self.broadcast(DelayLines.CA.calculate_steps(desired_delays))
+            self.data['WA'] = self.broadcast(DelayLines.WA.calculate_steps(desired_delays + WINDOW_SIZE))
+            self.data['CB'] = DelayLines.CB.calculate_steps(fixed_delay)
+            self.data['WB'] = DelayLines.WB.calculate_steps(fixed_delay + WINDOW_SIZE)
         else:
-            self.data[CA_INDEX, :] = np.tile(DelayLines.CA.calculate_steps(fixed_delay), self._iterations)
-            self.data[WA_INDEX, :] = np.tile(DelayLines.WA.calculate_steps(fixed_delay + WINDOW_SIZE), self._iterations)
-            self.data[CB_INDEX, :] = DelayLines.CB.calculate_steps(desired_delays)
-            self.data[WB_INDEX, :] = DelayLines.WB.calculate_steps(desired_delays + WINDOW_SIZE)
+            self.data['CA'] = DelayLines.CA.calculate_steps(fixed_delay)
+            self.data['WA'] = DelayLines.WA.calculate_steps(fixed_delay + WINDOW_SIZE)
+            self.data['CB'] = self.broadcast(DelayLines.CB.calculate_steps(desired_delays))
+            self.data['WB'] = self.broadcast(DelayLines.WB.calculate_steps(desired_delays + WINDOW_SIZE))
 
     @property
     def metadata(self) -> dict:
@@ -69,18 +114,20 @@ class WindowShiftEffect(BaseScheme):
 
     def iteration(self, i):
         # Set the desired state
-        self.coincidence_circuit.set_delay(self.data[CA_INDEX, i], DelayLines.CA)
-        self.coincidence_circuit.set_delay(self.data[WA_INDEX, i], DelayLines.WA)
-        self.coincidence_circuit.set_delay(self.data[CB_INDEX, i], DelayLines.CB)
-        self.coincidence_circuit.set_delay(self.data[WB_INDEX, i], DelayLines.WB)
+        self.coincidence_circuit.set_delay(self.data['CA'][i], DelayLines.CA)
+        self.coincidence_circuit.set_delay(self.data['WA'][i], DelayLines.WA)
+        self.coincidence_circuit.set_delay(self.data['CB'][i], DelayLines.CB)
+        self.coincidence_circuit.set_delay(self.data['WB'][i], DelayLines.WB)
 
         counts1, counts2, coincidences = self.coincidence_circuit.measure(MEASURE_TIME)
-        self.data[C1_INDEX, i] = counts1
-        self.data[C2_INDEX, i] = counts2
-        self.data[CO_INDEX, i] = coincidences
+        self.data['counts1'][i] = counts1
+        self.data['counts2'][i] = counts2
+        self.data['coincidences'][i] = coincidences
 
     @classmethod
     def _plot_counts(cls, delay, counts1, counts2, coincidences, popt, metadata):
+        from matplotlib import pyplot as plt
+
         fig, count_axis = plt.subplots()
 
         plt.title(f"Window Shift Effect ({'A' if metadata['shift_A'] else 'B'})\n"
@@ -118,24 +165,63 @@ class WindowShiftEffect(BaseScheme):
     @staticmethod
     def _distribution(delay: np.ndarray, Nd: float, N: float, sigma: float, delay_offset: float,
                       window: float) -> np.ndarray:
+        from scipy.special import erf
+
         return Nd + N / 2 * (erf((delay - delay_offset + window) / (np.sqrt(2 * np.pi) * sigma))
                              - erf((delay - delay_offset - window) / (np.sqrt(2 * np.pi) * sigma)))
 
-    @classmethod
-    def analyse(cls, data, metadata):
+    @staticmethod
+    def delay(data, metadata) -> np.ndarray:
+        """
+        :return: the delay in ns of the shifted line relative to the fixed line, for every iteration.
+        """
         if metadata['shift_A']:
-            delay = DelayLines.CA.calculate_delays(data[CA_INDEX, :]) - DelayLines.CB.calculate_delays(
-                data[CB_INDEX, :])
-        else:
-            delay = DelayLines.CB.calculate_delays(data[CB_INDEX, :]) - DelayLines.CA.calculate_delays(
-                data[CA_INDEX, :])
+            return DelayLines.CA.calculate_delays(data['CA']) - DelayLines.CB.calculate_delays(data['CB'])
+        return DelayLines.CB.calculate_delays(data['CB']) - DelayLines.CA.calculate_delays(data['CA'])
 
-        counts1 = data[C1_INDEX, :]
-        counts2 = data[C2_INDEX, :]
-        coincidences = data[CO_INDEX, :]
+    @classmethod
+    def convert_run(cls, data, metadata) -> np.ndarray:
+        """
+        Converts the data of a run to records, see `convert`, including the data of the first runs. Those only stored
+        the steps of the shifted delay line and its window line along with the counts, the steps of the fixed delay
+        line are in their metadata and those of its window line follow from the window size.
+        """
+        if 'fixed_delay_C' not in metadata:
+            return cls.convert(data)
+
+        shifted_C, shifted_W = (DelayLines.CA, DelayLines.WA) if metadata['shift_A'] else (DelayLines.CB, DelayLines.WB)
+        fixed_C, fixed_W = (DelayLines.CB, DelayLines.WB) if metadata['shift_A'] else (DelayLines.CA, DelayLines.WA)
+        records = empty_records(cls.fields, data.shape[1:])
+        records[shifted_C.name] = np.rint(data[0])
+        records[shifted_W.name] = np.rint(data[1])
+        records[fixed_C.name] = metadata['fixed_delay_C']
+        records[fixed_W.name] = np.rint(
+            fixed_W.calculate_steps(fixed_C.calculate_delays(metadata['fixed_delay_C']) + metadata['window_size']))
+        for name, row in zip(COUNT_FIELDS, data[2:]):
+            records[name] = row
+        return records
 
+    @classmethod
+    def fit(cls, data, metadata) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Fits the distribution to the coincidences.
+        :return: the delay (see `delay`) and the optimal parameters, see FIT_PARAMETERS.
+        :raises RuntimeError: if the fit does not converge.
+        """
+        from scipy.optimize import curve_fit
+
+        delay = cls.delay(data, metadata)
+        coincidences = data['coincidences']
         p0 = (np.min(coincidences), np.max(coincidences), 1, 0, (metadata['window_size'] - 11) * 2)
         popt, _ = curve_fit(cls._distribution, delay, coincidences, p0=p0)
+        return delay, popt
+
+    @classmethod
+    def analyse(cls, data, metadata):
+        delay, popt = cls.fit(data, metadata)
+        counts1 = data['counts1']
+        counts2 = data['counts2']
+        coincidences = data['coincidences']
 
         logger.success(f"Fit parameters: {popt}")
         logger.success(f"Mean counts on detector 1: {np.mean(counts1):.0f}")
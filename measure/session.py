@@ -0,0 +1,97 @@
+"""
+Runs several schemes on the same devices without reopening the serial connections in between. Opening a serial port
+resets the Arduino, which then takes a while to boot. A session opens the connections once, waits until the devices
+reply to a ping and restores a known state before every scheme, only sending the commands for what actually changed.
+
+Example:
+    with Session(coincidence_circuit, interferometer) as session:
+        session.run('WindowShiftEffect')
+        session.run('WindowShiftEffect', shift_A=False)
+"""
+from typing import Dict, List, Optional, Type, Union
+
+from loguru import logger
+
+from interface import wait_until_ready
+from measure.scheme import BaseScheme
+from measure.schemes import get_scheme
+from measure.sweep import move_interferometer
+from utils.delays import DelayLines
+
+# The steps of the delay lines that are restored before every scheme, the state of the firmware after a reset.
+DEFAULT_DELAYS: Dict[DelayLines, int] = {line: 0 for line in DelayLines}
+
+
+class Session:
+    """
+    Keeps the devices open across several schemes. The session closes the devices it opened when it exits, devices
+    that were already open are left open.
+    """
+
+    def __init__(self, coincidence_circuit, interferometer, delays: Optional[Dict[DelayLines, int]] = None,
+                 home: bool = True):
+        """
+        :param coincidence_circuit: the coincidence circuit, or a pool of them.
+        :param interferometer: the interferometer.
+        :param delays: the steps of the delay lines that are restored before every scheme, see `DEFAULT_DELAYS`.
+        :param home: whether the interferometer is moved back to where it was at the start of the session before every
+            scheme.
+        """
+        self.coincidence_circuit = coincidence_circuit
+        self.interferometer = interferometer
+        self.delays = dict(DEFAULT_DELAYS if delays is None else delays)
+        self.home = home
+        # The schemes that have been run, in order.
+        self.schemes: List[BaseScheme] = []
+        self._home_position = 0
+        # The devices of which the serial connection was opened by this session.
+        self._opened = []
+
+    @property
+    def devices(self) -> list:
+        return [self.coincidence_circuit, self.interferometer]
+
+    def __enter__(self) -> 'Session':
+        self._opened = [device for device in self.devices if not getattr(device, 'is_open', False)]
+        for device in self._opened:
+            device.__enter__()
+        # Devices that were opened on construction may still be booting as well.
+        wait_until_ready(self.devices)
+        self._home_position = getattr(self.interferometer, 'position', 0)
+        self.reset_state()
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        for device in self._opened:
+            device.__exit__(*args, **kwargs)
+        self._opened = []
+
+    def reset_state(self):
+        """
+        Restores the known state: the delay lines, the position of the interferometer and cleared counters. Only the
+        delay lines that differ from the known state are set.
+        """
+        known = getattr(self.coincidence_circuit, 'delays', {})
+        for line, steps in self.delays.items():
+            if known.get(line) != steps:
+                self.coincidence_circuit.set_delay(steps, line)
+        self.coincidence_circuit.clear_counters()
+
+        position = getattr(self.interferometer, 'position', None)
+        if self.home and position is not None and position != self._home_position:
+            logger.info(f"Moving the interferometer back by {position - self._home_position} steps.")
+            move_interferometer(self.interferometer, self._home_position - position)
+
+    def run(self, scheme: Union[str, Type[BaseScheme]], **kwargs):
+        """
+        Runs a scheme on the devices of the session.
+        :param scheme: the scheme class or its name, see `measure.schemes.get_scheme`.
+        :param kwargs: passed on to the scheme.
+        :return: the data of the scheme.
+        """
+        scheme_class = get_scheme(scheme) if isinstance(scheme, str) else scheme
+        instance = scheme_class(self.coincidence_circuit, self.interferometer, **kwargs)
+        self.reset_state()
+        data = instance()
+        self.schemes.append(instance)
+        return data
@@ -0,0 +1,235 @@
+"""
+Declarative sweeps over the settings of the setup. A sweep is the Cartesian product of axes: the delay lines, the window
+size, the position of the interferometer, repeats or any other parameter. Axes that vary together (e.g. a delay line
+and its window line) are combined with `Zip`, settings that follow from others (e.g. the window lines from the window
+size) are declared as derived settings.
+
+The schedule is expanded lazily, setting by setting, such that long sweeps do not need to be stored in memory. Every
+axis is quantized to what the hardware can actually set, delays are rounded to whole steps. Settings that end up
+identical after quantization are only measured once, later occurrences reuse that measurement.
+
+Example, the sweep of the WindowShiftEffect:
+    Sweep(Zip(delay_axis(DelayLines.CA, delays), window_axis(np.full(len(delays), WINDOW_SIZE))),
+          delay_axis(DelayLines.CB, [fixed_delay]),
+          derived={DelayLines.WA.name: window_line(DelayLines.CA, DelayLines.WA),
+                   DelayLines.WB.name: window_line(DelayLines.CB, DelayLines.WB)})
+"""
+from itertools import product
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from utils.delays import DelayLines, validate_delay_steps
+
+# The largest number of steps the interferometer can rotate with a single command.
+MAXIMUM_ROTATION = 127
+
+# Names of the settings that are not delay lines.
+WINDOW = 'window'
+POSITION = 'position'
+REPEAT = 'repeat'
+
+Settings = Dict[str, float]
+
+
+class Axis:
+    """
+    A single swept setting.
+    """
+
+    def __init__(self, name: str, values: Sequence, quantize: Optional[Callable[[np.ndarray], np.ndarray]] = None,
+                 key: bool = True):
+        """
+        :param name: the name of the setting, the name of a delay line for delays.
+        :param values: the requested values.
+        :param quantize: converts the requested values to the values that are actually set, vectorized.
+        :param key: whether the setting identifies a measurement. Settings that only serve to derive other settings
+            (such as the window size) are not part of the key, only what they are quantized into.
+        """
+        self.name = name
+        self.values = np.atleast_1d(np.asarray(values))
+        self.settings = self.values if quantize is None else np.atleast_1d(quantize(self.values))
+        self.key = key
+
+    @property
+    def names(self) -> List[str]:
+        return [self.name]
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __getitem__(self, i: int) -> Settings:
+        return {self.name: self.settings[i].item()}
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({self.name!r}, {len(self)} values)'
+
+
+class Zip:
+    """
+    Axes of equal length that are swept together, rather than as a product.
+    """
+
+    def __init__(self, *axes: Axis):
+        if len({len(axis) for axis in axes}) != 1:
+            raise ValueError(f'Zipped axes must have equal lengths, got {[len(axis) for axis in axes]}.')
+        self.axes = axes
+
+    @property
+    def names(self) -> List[str]:
+        return [axis.name for axis in self.axes]
+
+    def __len__(self) -> int:
+        return len(self.axes[0])
+
+    def __getitem__(self, i: int) -> Settings:
+        settings = {}
+        for axis in self.axes:
+            settings.update(axis[i])
+        return settings
+
+
+def delay_axis(line: DelayLines, delays: Sequence[float]) -> Axis:
+    """
+    :param delays: the delays in ns, rounded to the nearest step of the delay line.
+    """
+    return Axis(line.name, delays, line.calculate_steps)
+
+
+def steps_axis(line: DelayLines, steps: Sequence[int]) -> Axis:
+    return Axis(line.name, steps, lambda values: validate_delay_steps(np.round(values).astype(int)))
+
+
+def window_axis(sizes: Sequence[float]) -> Axis:
+    """
+    :param sizes: the window sizes in ns, see `window_line` to derive the steps of the window lines from them.
+    """
+    return Axis(WINDOW, sizes, key=False)
+
+
+def position_axis(positions: Sequence[int]) -> Axis:
+    """
+    :param positions: the positions of the interferometer, in steps relative to its position at the start.
+    """
+    return Axis(POSITION, positions, lambda values: np.round(values).astype(int))
+
+
+def repeat_axis(count: int) -> Axis:
+    """
+    Repeats every setting, these measurements are never reused.
+    """
+    return Axis(REPEAT, np.arange(count))
+
+
+def window_line(start: DelayLines, window: DelayLines) -> Callable[[Settings], int]:
+    """
+    Derives the steps of a window line from the steps of its start line and the window size.
+    :param start: the line that starts the window, e.g. CA.
+    :param window: the line that ends the window, e.g. WA.
+    """
+
+    def derive(settings: Settings) -> int:
+        return int(window.calculate_steps(start.calculate_delays(settings[start.name]) + settings[WINDOW]))
+
+    return derive
+
+
+class Sweep:
+    """
+    The Cartesian product of axes, the last axis varies fastest.
+    """
+
+    def __init__(self, *axes: Union[Axis, Zip], derived: Optional[Dict[str, Callable[[Settings], float]]] = None):
+        """
+        :param axes: the axes of the sweep.
+        :param derived: settings that are computed from the other settings, in order.
+        """
+        self.axes = axes
+        self.derived = derived if derived is not None else {}
+        self.shape: Tuple[int, ...] = tuple(len(axis) for axis in axes)
+
+        names = [name for axis in axes for name in axis.names] + list(self.derived)
+        if len(set(names)) != len(names):
+            raise ValueError(f'Settings may only be swept once, got {names}.')
+        self.names: List[str] = names
+        not_key = {axis.name for group in axes for axis in getattr(group, 'axes', [group]) if not axis.key}
+        self.key_names: List[str] = [name for name in names if name not in not_key]
+
+    def __len__(self) -> int:
+        return int(np.prod(self.shape))
+
+    def __getitem__(self, i: int) -> Settings:
+        """
+        :return: the quantized settings of the i-th point of the sweep, without expanding the others.
+        """
+        if not -len(self) <= i < len(self):
+            raise IndexError(f'Sweep index {i} out of range for {len(self)} points.')
+        return self._expand(int(index) for index in np.unravel_index(i % len(self), self.shape))
+
+    def __iter__(self) -> Iterator[Settings]:
+        for indices in product(*(range(length) for length in self.shape)):
+            yield self._expand(indices)
+
+    def _expand(self, indices) -> Settings:
+        """
+        :return: the settings at the given index along each axis, including the derived settings.
+        """
+        settings = {}
+        for axis, index in zip(self.axes, indices):
+            settings.update(axis[index])
+        for name, derive in self.derived.items():
+            settings[name] = derive(settings)
+        return settings
+
+    def key(self, settings: Settings) -> tuple:
+        """
+        :return: the settings that identify a measurement, equal keys are measured once.
+        """
+        return tuple(settings[name] for name in self.key_names)
+
+    def schedule(self) -> Iterator[Tuple[int, Settings, Optional[int]]]:
+        """
+        Expands the sweep lazily.
+        :return: an iterator over tuples of the index, the settings and the index of an earlier point with the same
+            quantized settings, of which the measurement can be reused, or None.
+        """
+        measured: Dict[tuple, int] = {}
+        for i, settings in enumerate(self):
+            key = self.key(settings)
+            yield i, settings, measured.get(key)
+            measured.setdefault(key, i)
+
+    def as_array(self) -> np.ndarray:
+        """
+        :return: the (numeric) settings of the whole sweep with shape (settings, points), in the order of `names`.
+        """
+        return np.array([[settings[name] for name in self.names] for settings in self], dtype=np.float64).T
+
+
+def move_interferometer(interferometer, steps: int, settle_time: float = 1.):
+    """
+    Rotates the interferometer by any number of steps, split into commands the firmware accepts.
+    """
+    while steps != 0:
+        move = int(np.clip(steps, -MAXIMUM_ROTATION, MAXIMUM_ROTATION))
+        steps -= move
+        interferometer.rotate(move, delay=settle_time if steps == 0 else 0)
+
+
+def apply_settings(settings: Settings, previous: Settings, coincidence_circuit=None, interferometer=None,
+                   settle_time: float = 1.) -> Settings:
+    """
+    Sets the delay lines and moves the interferometer, only for the settings that changed.
+    :param settings: the settings to apply.
+    :param previous: the settings that were applied before, empty at the start of a sweep.
+    :param settle_time: the time in s to let the interferometer settle after moving.
+    :return: the applied settings, to pass as previous settings next time.
+    """
+    for name, value in settings.items():
+        if previous.get(name) == value:
+            continue
+        if name in DelayLines.__members__:
+            coincidence_circuit.set_delay(value, DelayLines[name])
+        elif name == POSITION:
+            move_interferometer(interferometer, value - previous.get(POSITION, 0), settle_time)
+    return dict(previous, **settings)
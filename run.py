@@ -1,18 +1,19 @@
 from interface import CoincidenceCircuit, Interferometer
-from measure.schemes.window_shift_effect import WindowShiftEffect
+from measure.schemes import get_scheme
+from measure.session import Session
 
 coincidence_circuit = CoincidenceCircuit(baudrate=115200, port='/dev/cu.usbmodem14301')
 interferometer = Interferometer(baudrate=115200, port='/dev/cu.usbmodem14301')
 
 if __name__ == '__main__':
-    scheme_A = WindowShiftEffect(coincidence_circuit=coincidence_circuit, interferometer=interferometer)
-    scheme_B = WindowShiftEffect(coincidence_circuit=coincidence_circuit, interferometer=interferometer, shift_A=False)
+    WindowShiftEffect = get_scheme('WindowShiftEffect')
 
-    data = scheme_A()
-    scheme_A.analyse(data, scheme_A.metadata)
+    # The serial connections stay open for all schemes, such that the Arduinos are only reset once.
+    with Session(coincidence_circuit, interferometer) as session:
+        data = session.run(WindowShiftEffect)
+        WindowShiftEffect.analyse(data, session.schemes[-1].metadata)
 
-    data = scheme_B()
-    scheme_B.analyse(data, scheme_B.metadata)
-    # scheme = SingleRun(coincidence_circuit=coincidence_circuit, interferometer=interferometer)
-    # data = scheme()
-    # scheme.analyse(data, scheme.metadata)
+        data = session.run(WindowShiftEffect, shift_A=False)
+        WindowShiftEffect.analyse(data, session.schemes[-1].metadata)
+        # data = session.run('SingleRun')
+        # session.schemes[-1].analyse(data, session.schemes[-1].metadata)
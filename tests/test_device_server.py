@@ -0,0 +1,80 @@
+import threading
+from unittest import TestCase
+
+from device_server import CoincidenceCircuitProxy, DeviceServer, FairQueue, InterferometerProxy, connect
+from utils.delays import DelayLines
+from utils.simulation import (CoincidenceFirmware, CountModel, InterferometerFirmware, SimulatedCoincidenceCircuit,
+                              SimulatedInterferometer, VirtualClock)
+
+
+class TestFairQueue(TestCase):
+    def test_round_robin(self):
+        queue = FairQueue()
+        for i in range(3):
+            queue.put('greedy', ('greedy', i))
+        queue.put('other', ('other', 0))
+        queue.put('third', ('third', 0))
+
+        order = [queue.get() for _ in range(5)]
+        self.assertEqual(order, [('greedy', 0), ('other', 0), ('third', 0), ('greedy', 1), ('greedy', 2)])
+
+    def test_discard_and_close(self):
+        queue = FairQueue()
+        queue.put('client', 1)
+        queue.discard('client')
+        self.assertEqual(len(queue), 0)
+        queue.close()
+        self.assertIsNone(queue.get())
+
+
+class TestDeviceServer(TestCase):
+    def setUp(self):
+        clock = VirtualClock()
+        self.coincidence_circuit = SimulatedCoincidenceCircuit(
+            firmware=CoincidenceFirmware(clock, model=CountModel(seed=1)), log_commands=False, timeout=1)
+        self.interferometer = SimulatedInterferometer(firmware=InterferometerFirmware(clock), log_commands=False)
+        self.server = DeviceServer([self.coincidence_circuit, self.interferometer], port=0).start()
+        self.address = self.server.address
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_proxy_commands(self):
+        coincidence_circuit = CoincidenceCircuitProxy(*self.address)
+        with coincidence_circuit:
+            coincidence_circuit.set_delay(12, DelayLines.WA)
+            counts = coincidence_circuit.measure(1)
+        self.assertEqual(self.coincidence_circuit.firmware.steps[DelayLines.WA], 12)
+        self.assertIsInstance(counts, tuple)
+        self.assertEqual(len(counts), 3)
+
+        InterferometerProxy(*self.address).rotate(5, delay=0)
+        self.assertEqual(self.interferometer.firmware.position, 5)
+
+    def test_errors(self):
+        coincidence_circuit = CoincidenceCircuitProxy(*self.address)
+        # Invalid arguments raise the same error as they would locally.
+        self.assertRaises(ValueError, lambda: coincidence_circuit.set_delay(1000, DelayLines.CA))
+        self.assertRaises(AttributeError, lambda: connect(*self.address).call('coincidence circuit', 'close'))
+        # Waiting would hold the device for every client, the server already waited when it opened the device.
+        self.assertRaises(AttributeError,
+                          lambda: connect(*self.address).call('coincidence circuit', 'wait_until_ready'))
+        self.assertTrue(coincidence_circuit.wait_until_ready())
+        self.assertRaises(KeyError, lambda: connect(*self.address).call('CCD', 'snapshot'))
+
+    def test_shared_between_clients(self):
+        self.assertIs(connect(*self.address), connect(*self.address))
+
+        results = []
+
+        def client():
+            proxy = CoincidenceCircuitProxy(*self.address)
+            results.extend(proxy.measure_ms(10) for _ in range(20))
+
+        threads = [threading.Thread(target=client) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(results), 80)
+        self.assertTrue(all(len(counts) == 3 for counts in results))
@@ -0,0 +1,176 @@
+import threading
+from unittest import TestCase
+
+import numpy as np
+
+from interface import BURST_DEPTH
+from utils.delays import DelayLines
+from utils.simulation import CoincidenceFirmware, CountModel, SimulatedCoincidenceCircuit
+
+
+class GateModel(CountModel):
+    """
+    Replies with counts that identify the gate they were measured with.
+    """
+
+    def sample(self, steps, gate):
+        return np.array([round(gate * 1000), 0, 0])
+
+
+class RecordingFirmware(CoincidenceFirmware):
+    """
+    Records every delay that is set.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.delays = []
+
+    def process(self, command: str):
+        super().process(command)
+        if command.startswith('SD'):
+            self.delays.append((command[2:], self.argument))
+
+
+class TestThreadSafety(TestCase):
+    def setUp(self):
+        self.coincidence_circuit = SimulatedCoincidenceCircuit(
+            firmware=RecordingFirmware(model=GateModel()), log_commands=False, thread_safe=True, timeout=0.01)
+
+    def tearDown(self):
+        self.coincidence_circuit.__exit__()
+
+    def _measure_concurrently(self):
+        errors = []
+
+        def acquire(gate):
+            for _ in range(50):
+                counts = self.coincidence_circuit.measure_ms(gate)
+                if counts[0] != gate:
+                    errors.append((gate, counts))
+
+        threads = [threading.Thread(target=acquire, args=(gate,)) for gate in (1, 2, 3, 4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return errors
+
+    def test_replies_reach_their_caller(self):
+        self.assertEqual(self._measure_concurrently(), [])
+
+    def test_binary_replies_reach_their_caller(self):
+        self.assertTrue(self.coincidence_circuit.enable_binary())
+        self.assertEqual(self._measure_concurrently(), [])
+
+    def test_delay_commands_are_not_interleaved(self):
+        def set_delays(steps):
+            for _ in range(50):
+                self.coincidence_circuit.set_delay(steps, DelayLines.CA)
+                self.coincidence_circuit.set_delay(steps, DelayLines.WA)
+
+        threads = [threading.Thread(target=set_delays, args=(steps,)) for steps in (10, 20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # If the steps and the command of two threads were interleaved, one thread would set the steps of the other.
+        delays = self.coincidence_circuit.firmware.delays
+        for delay in [('CA', 10), ('WA', 10), ('CA', 20), ('WA', 20)]:
+            self.assertEqual(delays.count(delay), 50)
+
+    def test_timeout(self):
+        # Clearing the counters does not produce a reply, so reading counts times out.
+        with self.assertRaises(TimeoutError):
+            self.coincidence_circuit.request(['CLEAR'], self.coincidence_circuit._read_counts, timeout=0.05)
+        # The interface remains usable after a timeout.
+        self.assertEqual(self.coincidence_circuit.measure_ms(5, timeout=1)[0], 5)
+
+    def test_bursts_are_not_interleaved(self):
+        errors = []
+
+        def burst(gate):
+            for _ in range(10):
+                counts = self.coincidence_circuit.measure_many(20, gate)
+                if np.any(counts[:, 0] != gate):
+                    errors.append((gate, counts))
+
+        threads = [threading.Thread(target=burst, args=(gate,)) for gate in (1, 2)]
+        threads.append(threading.Thread(target=lambda: errors.extend(self._measure_concurrently())))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+
+class PipelineFirmware(CoincidenceFirmware):
+    """
+    Records how many replies were still unread whenever a gate starts.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.unread = []
+
+    def process(self, command: str):
+        # The empty gate that detects the support of gates in ms is not part of a burst.
+        if command in ('MEASURE', 'MEASUREMS') and self.argument:
+            self.unread.append(self._output.count(b'\n'))
+        super().process(command)
+
+
+class TestMeasureMany(TestCase):
+    def setUp(self):
+        self.coincidence_circuit = SimulatedCoincidenceCircuit(
+            firmware=PipelineFirmware(model=GateModel()), log_commands=False, timeout=0.01)
+
+    def test_burst(self):
+        out = np.zeros((25, 3), dtype=np.int64)
+        counts = self.coincidence_circuit.measure_many(25, 7, out=out)
+        self.assertIs(counts, out)
+        np.testing.assert_array_equal(counts, np.tile([7, 0, 0], (25, 1)))
+        self.assertEqual(len(self.coincidence_circuit.firmware.unread), 25)
+        # Every gate after the first was already queued before the reply of the previous gate was read.
+        self.assertEqual(self.coincidence_circuit.firmware.unread, [0] + [BURST_DEPTH - 1] * 24)
+
+    def test_burst_of_seconds(self):
+        # Gates of whole seconds are measured with MEASURE, which firmware without gates in ms supports.
+        self.coincidence_circuit.firmware.supports_ms_gates = False
+        np.testing.assert_array_equal(self.coincidence_circuit.measure_many(4, 2000)[:, 0], 2000)
+        self.assertEqual(self.coincidence_circuit.firmware.unread, [0] + [BURST_DEPTH - 1] * 3)
+        self.assertIsNone(self.coincidence_circuit.supports_ms_gates)
+
+    def test_burst_latencies(self):
+        metrics = self.coincidence_circuit.enable_metrics()
+        self.coincidence_circuit.detect_ms_gates()
+        self.coincidence_circuit.measure_many(6, 4)
+        # Every reply is matched with its own gate, although the gates were sent ahead of their replies.
+        self.assertEqual(metrics.latencies['MEASUREMS'].count, 7)
+        self.assertEqual(len(self.coincidence_circuit._outstanding), 0)
+
+    def test_binary_burst(self):
+        self.coincidence_circuit.enable_binary()
+        np.testing.assert_array_equal(self.coincidence_circuit.measure_many(5, 3)[:, 0], 3)
+        self.assertEqual(self.coincidence_circuit.measure_many(0, 3).shape, (0, 3))
+
+
+class TestGates(TestCase):
+    def setUp(self):
+        self.coincidence_circuit = SimulatedCoincidenceCircuit(firmware=CoincidenceFirmware(model=GateModel()),
+                                                               log_commands=False, timeout=0.01)
+
+    def test_ms_gates(self):
+        self.assertEqual(self.coincidence_circuit.measure_ms(50)[0], 50)
+        self.assertTrue(self.coincidence_circuit.supports_ms_gates)
+
+    def test_firmware_without_ms_gates(self):
+        self.coincidence_circuit.firmware.supports_ms_gates = False
+        self.assertFalse(self.coincidence_circuit.detect_ms_gates(timeout=0.05))
+        # Whole seconds are measured with MEASURE instead.
+        self.assertEqual(self.coincidence_circuit.measure_ms(2000)[0], 2000)
+        self.assertRaises(RuntimeError, lambda: self.coincidence_circuit.measure_ms(50))
+
+    def test_invalid_gates(self):
+        for gate in (0, 0.5, 1.5, -1000):
+            self.assertRaises(ValueError, lambda: self.coincidence_circuit.measure_ms(gate))
@@ -0,0 +1,83 @@
+from os.path import join
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+import numpy as np
+
+from measure.ccd import FrameRecorder, load_recording, record
+
+
+class FakeCCD:
+    PIXELS = 16
+
+    def __init__(self):
+        self.rng = np.random.default_rng(42)
+
+    def acquire(self, shots, out):
+        out[:] = self.rng.integers(0, 2 ** 16, size=out.shape)
+        return out
+
+
+class TestFrameRecorder(TestCase):
+    def test_co_added_frames(self):
+        shots = np.arange(3 * 16, dtype=np.uint16).reshape(3, 16)
+        with TemporaryDirectory() as directory:
+            file_name = join(directory, 'recording')
+            with FrameRecorder(file_name, pixels=16, shots=3) as recorder:
+                recorder.append(shots, timestamp=1.)
+                recorder.append(shots, timestamp=2.)
+
+            data, timestamps, header = load_recording(file_name)
+            self.assertEqual(data.shape, (2, 16))
+            self.assertEqual(data.dtype, np.uint32)
+            np.testing.assert_array_equal(data[1], shots.sum(axis=0))
+            np.testing.assert_array_equal(timestamps, [1., 2.])
+            self.assertEqual(header['shots'], 3)
+            del data
+
+    def test_running_statistics(self):
+        ccd = FakeCCD()
+        with TemporaryDirectory() as directory:
+            file_name = record(ccd, frames=5, file_name=join(directory, 'recording'), shots=4, average=True)
+            data, _, _ = load_recording(file_name)
+            statistics = np.load(file_name + '.stats.npz')
+
+            # Recreate all individual shots to compare the running statistics against.
+            ccd = FakeCCD()
+            shots = np.concatenate([ccd.acquire(4, np.empty((4, 16))) for _ in range(5)])
+            np.testing.assert_allclose(statistics['mean'], shots.mean(axis=0))
+            np.testing.assert_allclose(statistics['variance'], shots.var(axis=0, ddof=1))
+            np.testing.assert_allclose(data, shots.reshape(5, 4, 16).mean(axis=1), rtol=1e-6)
+            self.assertEqual(statistics['shots'], 20)
+            del data
+
+    def test_continue_recording(self):
+        rng = np.random.default_rng(7)
+        shots = rng.integers(0, 2 ** 16, size=(4, 2, 16))
+        with TemporaryDirectory() as directory:
+            file_name = join(directory, 'recording')
+            for session in (shots[:3], shots[3:]):
+                with FrameRecorder(file_name, pixels=16, shots=2) as recorder:
+                    for frame in session:
+                        recorder.append(frame)
+
+            data, _, _ = load_recording(file_name)
+            self.assertEqual(data.shape, (4, 16))
+            del data
+            # The statistics include the shots of both sessions.
+            statistics = np.load(file_name + '.stats.npz')
+            self.assertEqual(statistics['shots'], 8)
+            np.testing.assert_allclose(statistics['mean'], shots.reshape(8, 16).mean(axis=0))
+            np.testing.assert_allclose(statistics['variance'], shots.reshape(8, 16).var(axis=0, ddof=1))
+
+            # Frames with a different layout would be misread.
+            self.assertRaises(ValueError, lambda: FrameRecorder(file_name, pixels=16, shots=3))
+            self.assertRaises(ValueError, lambda: FrameRecorder(file_name, pixels=16, shots=2, average=True))
+            data, _, header = load_recording(file_name)
+            self.assertEqual((len(data), header['shots']), (4, 2))
+            del data
+
+    def test_shape_validation(self):
+        with TemporaryDirectory() as directory:
+            with FrameRecorder(join(directory, 'recording'), pixels=16, shots=2) as recorder:
+                self.assertRaises(ValueError, lambda: recorder.append(np.zeros((3, 16))))
@@ -0,0 +1,67 @@
+from os.path import join
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+import numpy as np
+
+from measure.datasets import (Dataset, find_runs, fit_table, iterate_runs, reduce_histogram, reduce_mean,
+                              reduce_sum)
+
+
+class TestDatasets(TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        rng = np.random.default_rng(1)
+        self.data = rng.poisson(100, size=(5, 3, 10)).astype(float)
+        for i, data in enumerate(self.data):
+            np.savez_compressed(join(self.directory.name, f'2022-01-18-17_00_0{i}.npz'), data=data,
+                                scheme='Test', timestamp=f'run {i}', shift_A=i % 2 == 0, window_size=10 + i)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_load(self):
+        dataset = Dataset.load(self.directory.name, workers=3)
+        np.testing.assert_array_equal(dataset.data, self.data)
+        np.testing.assert_array_equal(dataset.metadata['window_size'], np.arange(10, 15))
+        self.assertEqual(dataset[1][1]['timestamp'], 'run 1')
+
+        selection = dataset.select(shift_A=True)
+        self.assertEqual(len(selection), 3)
+        np.testing.assert_array_equal(selection.data, self.data[::2])
+
+    def test_different_shapes(self):
+        np.savez_compressed(join(self.directory.name, 'other.npz'), data=np.zeros((3, 2)))
+        with self.assertRaises(ValueError):
+            Dataset.load(self.directory.name)
+
+    def test_iterate_in_order(self):
+        for prefetch in (1, 2, 10):
+            runs = list(iterate_runs(self.directory.name, workers=2, prefetch=prefetch))
+            self.assertEqual([metadata['timestamp'] for _, metadata in runs], [f'run {i}' for i in range(5)])
+
+    def test_reductions(self):
+        total, count = reduce_sum(self.directory.name, workers=2)
+        self.assertEqual(count, 5)
+        np.testing.assert_allclose(total, self.data.sum(axis=0))
+
+        mean, std = reduce_mean(find_runs(join(self.directory.name, '*.npz')), workers=2)
+        np.testing.assert_allclose(mean, self.data.mean(axis=0))
+        np.testing.assert_allclose(std, self.data.std(axis=0, ddof=1))
+
+        bins = np.linspace(50, 150, 11)
+        counts = reduce_histogram(self.directory.name, bins, lambda data, _: data[0])
+        np.testing.assert_array_equal(counts, np.histogram(self.data[:, 0], bins)[0])
+
+    def test_fit_table(self):
+        def fit(data, metadata):
+            if metadata['window_size'] == 12:
+                raise RuntimeError('Optimal parameters not found')
+            return data.mean(axis=1), data.std(axis=1)
+
+        parameters, errors, metadata = fit_table(self.directory.name, fit)
+        self.assertEqual(parameters.shape, (5, 3))
+        np.testing.assert_allclose(parameters[0], self.data[0].mean(axis=1))
+        self.assertTrue(np.isnan(parameters[2]).all())
+        self.assertTrue(np.isnan(errors[2]).all())
+        np.testing.assert_array_equal(metadata['window_size'], np.arange(10, 15))
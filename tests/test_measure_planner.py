@@ -0,0 +1,75 @@
+from unittest import TestCase
+
+from interface import Arduino, UNRESPONSIVE_DELAY
+from measure.planner import LatencyModel, dry_run
+from measure.schemes.bell_test import BellTest, ITERATIONS as BELL_ITERATIONS, MEASUREMENTS_PER_ITERATION
+from measure.schemes.window_shift_effect import ITERATIONS, MEASURE_TIME
+from measure.sweep import Sweep, position_axis, repeat_axis
+from utils.metrics import CommandMetrics
+
+
+class TestPlanner(TestCase):
+    def test_window_shift_effect(self):
+        model = LatencyModel(latency=0.01, ping=True)
+        plan = dry_run('WindowShiftEffect', model)
+        self.assertEqual(plan.scheme, 'WindowShiftEffect')
+        self.assertEqual(plan.gates, ITERATIONS)
+        self.assertEqual(plan.counting, ITERATIONS * MEASURE_TIME)
+        # Every iteration sends four delays and a gate, all with an argument.
+        self.assertAlmostEqual(plan.duration - plan.counting, ITERATIONS * 10 * 0.01, delta=0.1)
+        self.assertAlmostEqual(plan.overhead, 1 - plan.counting / plan.duration)
+        self.assertGreaterEqual(plan.fixed_time, 0)
+
+        # Without latency only the gates take time.
+        self.assertAlmostEqual(dry_run('WindowShiftEffect', LatencyModel(latency=0, ping=True)).overhead, 0)
+
+    def test_suggestions(self):
+        plan = dry_run('WindowShiftEffect', LatencyModel(latency=0.01))
+        budget = plan.duration / 3
+        trade_offs = plan.suggest(budget)
+        self.assertTrue(trade_offs)
+        for trade_off in trade_offs:
+            self.assertLessEqual(trade_off.duration, budget + 1e-9)
+            self.assertLess(trade_off.counting_fraction, 1)
+        # The first suggestion keeps the gates and fills the budget with a shorter gate time.
+        self.assertEqual(trade_offs[0].repeat, 1)
+        self.assertAlmostEqual(trade_offs[0].duration, budget)
+        self.assertLess(trade_offs[0].gate_time, MEASURE_TIME)
+        self.assertEqual(plan.suggest(plan.fixed_time / 2), [])
+
+    def test_motion(self):
+        sweep = Sweep(position_axis([0, 100, 200]), repeat_axis(2))
+        slow = dry_run('ParameterSweep', LatencyModel(latency=0, step_time=0.01, ping=True), sweep=sweep, settle_time=0,
+                       gate_time=100)
+        fast = dry_run('ParameterSweep', LatencyModel(latency=0, step_time=0, ping=True), sweep=sweep, settle_time=0,
+                       gate_time=100)
+        self.assertEqual(slow.gates, 6)
+        self.assertAlmostEqual(fast.duration, 0.6)
+        # There and back again.
+        self.assertAlmostEqual(slow.duration - fast.duration, 400 * 0.01)
+
+    def test_firmware_without_ping(self):
+        with_ping = dry_run('WindowShiftEffect', LatencyModel(latency=0.01, ping=True))
+        without_ping = dry_run('WindowShiftEffect', LatencyModel(latency=0.01))
+        # The scheme opens both ports, after which the fixed delay is waited once.
+        self.assertAlmostEqual(without_ping.duration - with_ping.duration, UNRESPONSIVE_DELAY, delta=0.05)
+        self.assertAlmostEqual(without_ping.fixed_time - with_ping.fixed_time, UNRESPONSIVE_DELAY, delta=0.05)
+
+    def test_prompts(self):
+        plan = dry_run(BellTest, LatencyModel(latency=0))
+        self.assertEqual(plan.gates, BELL_ITERATIONS * MEASUREMENTS_PER_ITERATION)
+        self.assertEqual(plan.prompts, BELL_ITERATIONS + 1)
+        self.assertIn('operator', str(plan))
+
+    def test_from_metrics(self):
+        metrics = CommandMetrics('coincidence circuit')
+        for _ in range(3):
+            metrics.record_latency('PING', 0.004)
+            metrics.record_latency('MEASURE', 1.004)
+        metrics.record_latency(Arduino.ARGUMENT_COMMAND, 0.001)
+        model = LatencyModel.from_metrics(metrics, step_time=0.002)
+        # The gates are not used, their latency includes the gate time.
+        self.assertNotIn('MEASURE', model.latencies)
+        self.assertAlmostEqual(model.command_latency('PING'), 0.004)
+        self.assertAlmostEqual(model.latency, (3 * 0.004 + 0.001) / 4)
+        self.assertEqual(model.step_time, 0.002)
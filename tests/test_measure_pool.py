@@ -0,0 +1,82 @@
+import tempfile
+from time import perf_counter, sleep
+from unittest import TestCase, mock
+
+import numpy as np
+
+from measure.pool import CircuitPool, split_devices
+from measure.scheme import BaseScheme
+from measure.schemes.window_shift_effect import ITERATIONS, WindowShiftEffect
+from utils.delays import DelayLines
+from utils.simulation import (CoincidenceFirmware, CountModel, SimulatedCoincidenceCircuit, SimulatedInterferometer,
+                              VirtualClock, virtual_time)
+
+GATE = 0.1
+
+
+class RealTimeFirmware(CoincidenceFirmware):
+    """
+    Takes the gate time in real time, and records when each gate started.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.starts = []
+
+    def process(self, command: str):
+        # The empty gate that detects the support of gates in ms is skipped.
+        if command == 'MEASUREMS' and self.argument:
+            self.starts.append(perf_counter())
+            sleep(self.argument / 1000)
+        super().process(command)
+
+
+def simulated_pool(boards: int, firmware=CoincidenceFirmware) -> CircuitPool:
+    circuits = [SimulatedCoincidenceCircuit(firmware=firmware(model=CountModel(pair_rate=1e4, seed=i)),
+                                            log_commands=False) for i in range(boards)]
+    return CircuitPool(circuits, [f'board {i}' for i in range(boards)])
+
+
+class TestCircuitPool(TestCase):
+    def test_simultaneous_gates(self):
+        with simulated_pool(4, RealTimeFirmware) as pool:
+            counts = pool.measure_ms(GATE * 1000)
+
+        self.assertEqual(counts.shape, (3, 4))
+        # The gates ran in parallel rather than one after another, in which case the last gate would have started at
+        # least three gates after the first.
+        starts = [circuit.firmware.starts[0] for circuit in pool.circuits]
+        self.assertLess(max(starts) - min(starts), GATE)
+
+    def test_per_device_settings(self):
+        with simulated_pool(2) as pool:
+            pool.set_delay([10, 20], DelayLines.WA)
+            pool.set_delay(5, DelayLines.CA)
+            self.assertEqual([circuit.firmware.steps[DelayLines.WA] for circuit in pool.circuits], [10, 20])
+            self.assertEqual([circuit.firmware.steps[DelayLines.CA] for circuit in pool.circuits], [5, 5])
+            self.assertRaises(ValueError, lambda: pool.set_delay([1, 2, 3], DelayLines.WA))
+
+    def test_errors(self):
+        pool = simulated_pool(3)
+        pool.circuits[1].firmware.process = mock.Mock(side_effect=RuntimeError('broken board'))
+        with pool:
+            self.assertRaisesRegex(RuntimeError, 'broken board', lambda: pool.set_delay(1, DelayLines.CA))
+            # The other boards were still set.
+            self.assertEqual(pool.circuits[2].firmware.steps[DelayLines.CA], 1)
+
+    def test_scheme(self):
+        pool = simulated_pool(2)
+        clock = VirtualClock()
+        with tempfile.TemporaryDirectory() as directory, virtual_time(clock), \
+                mock.patch('measure.scheme.DATA_DIRECTORY', directory):
+            scheme = WindowShiftEffect(pool, SimulatedInterferometer(log_commands=False))
+            scheme()
+            data, metadata = BaseScheme.load(scheme.save_file)
+
+        self.assertEqual(data.shape, (ITERATIONS, 2))
+        devices = split_devices(data, metadata)
+        self.assertEqual([device_metadata['device'] for _, device_metadata in devices], ['board 0', 'board 1'])
+        np.testing.assert_array_equal(devices[0][0]['CA'], devices[1][0]['CA'])
+        # The boards counted independently.
+        self.assertFalse(np.array_equal(devices[0][0]['coincidences'], devices[1][0]['coincidences']))
+        self.assertGreater(np.max(data['coincidences']), 1000)
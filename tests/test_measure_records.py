@@ -0,0 +1,68 @@
+from unittest import TestCase
+
+import numpy as np
+
+from measure.records import COUNT_FIELDS, assign_counts, empty_records, from_rows, record_dtype, to_rows
+from measure.schemes.bell_test import ITERATIONS, MEASUREMENTS_PER_ITERATION, BellTest
+from measure.schemes.window_shift_effect import FIELDS, WindowShiftEffect
+from utils.delays import DelayLines
+from utils.simulation import SimulatedCoincidenceCircuit, SimulatedInterferometer
+
+
+class TestRecords(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        # Data in the layout before the fields were declared: a float64 row per field.
+        self.rows = np.concatenate([rng.integers(0, 256, (4, 48)), rng.poisson(3e4, (3, 48))]).astype(float)
+
+    def test_round_trip(self):
+        records = from_rows(self.rows, FIELDS)
+        self.assertEqual(records.shape, (48,))
+        self.assertEqual(records['CA'].dtype, np.uint8)
+        self.assertEqual(records['coincidences'].dtype, np.uint32)
+        np.testing.assert_array_equal(to_rows(records), self.rows)
+        # The records take less than a third of the memory of the rows.
+        self.assertLess(3 * records.nbytes, self.rows.nbytes)
+
+    def test_fields_are_views(self):
+        records = empty_records(COUNT_FIELDS, (4,))
+        records['coincidences'][1] = 7
+        self.assertEqual(records[1]['coincidences'], 7)
+        self.assertRaises(ValueError, lambda: from_rows(self.rows[:5], FIELDS))
+
+    def test_assign_counts(self):
+        records = empty_records(COUNT_FIELDS, (2, 5))
+        counts = np.arange(15).reshape(5, 3)
+        assign_counts(records, 1, counts, axis=1)
+        np.testing.assert_array_equal(records['counts2'][1], counts[:, 1])
+        np.testing.assert_array_equal(records['coincidences'][0], 0)
+
+    def test_scheme_data(self):
+        data = WindowShiftEffect(SimulatedCoincidenceCircuit(), SimulatedInterferometer()).data
+        self.assertEqual(data.dtype, record_dtype(FIELDS))
+        self.assertEqual(data.dtype.itemsize, 4 * 1 + 3 * 4)
+        # The scheme only converts data with a row per field.
+        np.testing.assert_array_equal(WindowShiftEffect.convert(data), data)
+        np.testing.assert_array_equal(WindowShiftEffect.convert(to_rows(data)), data)
+
+    def test_legacy_window_shift_effect(self):
+        # The first runs stored the steps of the shifted lines and the counts, the fixed line is in the metadata.
+        metadata = {'shift_A': False, 'fixed_delay_C': 37, 'window_size': 12}
+        legacy = np.array([np.arange(20, 30), np.arange(60, 70), np.full(10, 3e4), np.full(10, 3e5), np.arange(10)],
+                          dtype=float)
+        data = WindowShiftEffect.convert_run(legacy, metadata)
+        np.testing.assert_array_equal(data['CB'], legacy[0])
+        np.testing.assert_array_equal(data['CA'], 37)
+        np.testing.assert_array_equal(data['coincidences'], legacy[4])
+        np.testing.assert_allclose(WindowShiftEffect.delay(data, metadata),
+                                   DelayLines.CB.calculate_delays(legacy[0]) - DelayLines.CA.calculate_delays(37))
+
+        data = WindowShiftEffect(SimulatedCoincidenceCircuit(), SimulatedInterferometer()).data
+        np.testing.assert_array_equal(WindowShiftEffect.convert_run(to_rows(data), {'shift_A': True}), data)
+
+    def test_legacy_bell_test(self):
+        legacy = np.arange(ITERATIONS * 3 * MEASUREMENTS_PER_ITERATION, dtype=float).reshape(
+            ITERATIONS, 3, MEASUREMENTS_PER_ITERATION)
+        data = BellTest.convert(legacy)
+        self.assertEqual(data.shape, (ITERATIONS, MEASUREMENTS_PER_ITERATION))
+        np.testing.assert_array_equal(data['coincidences'], legacy[:, 2])
@@ -0,0 +1,85 @@
+import shutil
+import tempfile
+from os import listdir
+from os.path import join
+from unittest import TestCase
+
+import numpy as np
+
+from measure.report import CountsFigure, generate_report, render_run
+from measure.schemes.bell_test import BellTest
+from measure.schemes.single_run import SingleRun
+from measure.schemes.window_shift_effect import WindowShiftEffect
+from utils.simulation import (CoincidenceFirmware, CountModel, InterferometerFirmware, SimulatedCoincidenceCircuit,
+                              SimulatedInterferometer, VirtualClock, offline)
+
+
+class TestReport(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        clock = VirtualClock()
+        coincidence_circuit = SimulatedCoincidenceCircuit(firmware=CoincidenceFirmware(clock, model=CountModel(seed=3)),
+                                                          log_commands=False)
+        interferometer = SimulatedInterferometer(firmware=InterferometerFirmware(clock), log_commands=False)
+
+        cls.runs = []
+        with offline(clock):
+            for scheme_class in (WindowShiftEffect, BellTest, SingleRun):
+                scheme = scheme_class(coincidence_circuit, interferometer, profile=False)
+                scheme()
+                file_name = join(cls.directory, f'{scheme_class.__name__}.npz')
+                shutil.copy(scheme.save_file, file_name)
+                cls.runs.append(file_name)
+
+        # A run in the layout of the oldest window shift effect data, which can not be converted.
+        cls.legacy = join(cls.directory, 'legacy.npz')
+        np.savez(cls.legacy, data=np.zeros((5, 48)), scheme='WindowShiftEffect', timestamp='2022-01-18-17_18_22',
+                 window_size=12, shift_A=True, fixed_delay_C=37)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def test_render_run(self):
+        with tempfile.TemporaryDirectory() as output:
+            entries = render_run(self.runs[0], output)
+            self.assertEqual(len(entries), 1)
+            self.assertIsNone(entries[0]['error'])
+            self.assertEqual(entries[0]['scheme'], 'WindowShiftEffect')
+            self.assertIn('mean counts1', entries[0]['summary'])
+            self.assertEqual(listdir(output), [entries[0]['image']])
+
+            entry, = render_run(self.runs[1], output)
+            self.assertEqual(set(entry['summary']), {'S_strong', 'S_weak', 'sigma_S'})
+
+    def test_errors(self):
+        with tempfile.TemporaryDirectory() as output:
+            entry, = render_run(self.legacy, output)
+            self.assertEqual(entry['scheme'], 'WindowShiftEffect')
+            self.assertIn('ValueError', entry['error'])
+            self.assertIsNone(entry['image'])
+
+            entry, = render_run(join(self.directory, 'missing.npz'), output)
+            self.assertIsNone(entry['scheme'])
+            self.assertIsNotNone(entry['error'])
+
+    def test_counts_figure(self):
+        data, metadata = SingleRun.load(self.runs[2])
+        summary = CountsFigure().update(data, metadata)
+        self.assertAlmostEqual(summary['mean coincidences'], np.mean(data['coincidences']))
+
+    def test_generate_report(self):
+        for workers in (1, 2):
+            with tempfile.TemporaryDirectory() as output:
+                index = generate_report(self.runs + [self.legacy], output, workers=workers, title='Test <report>')
+                with open(index, encoding='utf-8') as file:
+                    page = file.read()
+                images = sorted(name for name in listdir(output) if name.endswith('.png'))
+                self.assertEqual(images, ['BellTest_BellTest.png', 'SingleRun_SingleRun.png',
+                                          'WindowShiftEffect_WindowShiftEffect.png'])
+                for image in images:
+                    self.assertIn(f'src="{image}"', page)
+                self.assertIn('Test &lt;report&gt;', page)
+                self.assertIn('<h2 id="BellTest">', page)
+                self.assertIn('class="error"', page)
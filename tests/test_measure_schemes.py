@@ -0,0 +1,212 @@
+import subprocess
+import sys
+import tempfile
+from os.path import abspath, dirname, join
+from unittest import TestCase, mock
+
+import numpy as np
+
+from measure.schemes import available_schemes, discover_schemes, get_scheme
+from measure.schemes.auto_alignment import AutoAlignment, NoisyCoincidences, align
+from measure.schemes.fringe_scan import FringeScan
+from measure.schemes.parameter_sweep import ParameterSweep
+from measure.schemes.single_run import SingleRun
+from measure.schemes.time_series import TimeSeries
+from measure.sweep import Sweep, position_axis, steps_axis
+from utils.configurations import load_configuration
+from utils.delays import DelayLines
+from utils.simulation import (CoincidenceFirmware, CountModel, InterferometerFirmware, SimulatedCoincidenceCircuit,
+                              SimulatedInterferometer, VirtualClock, offline, virtual_time)
+
+ROOT = abspath(join(dirname(__file__), '..'))
+
+
+class TestSchemeRegistry(TestCase):
+    def test_discovery(self):
+        schemes = available_schemes()
+        self.assertEqual(schemes['WindowShiftEffect'], 'measure.schemes.window_shift_effect')
+        self.assertIn('BellTest', schemes)
+        self.assertIn('SingleRun', schemes)
+        # The rate monitor is not a measurement scheme.
+        self.assertNotIn('RateMonitor', schemes)
+
+    def test_derived_schemes(self):
+        modules = {
+            'base.py':    'from measure.scheme import BaseScheme\n\n\nclass First(BaseScheme):\n    pass\n',
+            'derived.py': 'from .base import First\n\n\nclass Second(First):\n    pass\n',
+            'other.py':   'from . import derived\n\n\nclass Third(derived.Second):\n    pass\n\n\n'
+                          'class Unrelated:\n    pass\n',
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            for file_name, source in modules.items():
+                with open(join(directory, file_name), 'w') as file:
+                    file.write(source)
+            schemes = discover_schemes(directory, 'package')
+        self.assertEqual(schemes, {'First': 'package.base', 'Second': 'package.derived', 'Third': 'package.other'})
+
+    def test_get_scheme(self):
+        self.assertEqual(get_scheme('SingleRun').__name__, 'SingleRun')
+        self.assertRaises(KeyError, lambda: get_scheme('DoesNotExist'))
+
+    def test_lazy_imports(self):
+        # Run in a fresh interpreter, such that modules imported by other tests do not interfere.
+        code = ("import sys; from measure.schemes import available_schemes, get_scheme; available_schemes(); "
+                "get_scheme('WindowShiftEffect'); get_scheme('BellTest'); "
+                "print(any(m in sys.modules for m in ('matplotlib', 'scipy', 'ftd2xx', 'tkinter')))")
+        output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+        self.assertEqual(output.stdout.strip(), 'False')
+
+
+class FringeModel(CountModel):
+    """
+    Modulates the coincidences with the position of a simulated interferometer.
+    """
+
+    def __init__(self, interferometer: InterferometerFirmware, period: float, visibility: float, **kwargs):
+        super().__init__(**kwargs)
+        self.interferometer = interferometer
+        self.period = period
+        self.visibility = visibility
+
+    def expected(self, steps, gate):
+        expected = super().expected(steps, gate)
+        expected[2] *= 1 + self.visibility * np.cos(2 * np.pi * self.interferometer.position / self.period)
+        return expected
+
+
+class TestFringeScan(TestCase):
+    def test_scan(self):
+        clock = VirtualClock()
+        interferometer = SimulatedInterferometer(firmware=InterferometerFirmware(clock), log_commands=False)
+        model = FringeModel(interferometer.firmware, period=17.3, visibility=0.7, pair_rate=1e5, seed=2)
+        coincidence_circuit = SimulatedCoincidenceCircuit(firmware=CoincidenceFirmware(clock, model=model),
+                                                          log_commands=False)
+        updates = []
+
+        with tempfile.TemporaryDirectory() as directory, virtual_time(clock), \
+                mock.patch('measure.scheme.DATA_DIRECTORY', directory):
+            # More than 128 points, such that returning to the start takes several commands.
+            scheme = FringeScan(coincidence_circuit, interferometer, points=150, on_update=lambda *u: updates.append(u))
+            scheme()
+            _, metadata = FringeScan.load(scheme.save_file)
+
+        self.assertEqual(updates[-1][0], 150)
+        self.assertAlmostEqual(metadata['period'], 17.3, delta=0.3)
+        self.assertAlmostEqual(metadata['visibility'], 0.7, delta=0.05)
+        # The interferometer returned to its starting position.
+        self.assertEqual(interferometer.firmware.position, 0)
+
+
+class TestTimeSeries(TestCase):
+    def test_time_series(self):
+        clock = VirtualClock()
+        coincidence_circuit = SimulatedCoincidenceCircuit(firmware=CoincidenceFirmware(clock, model=CountModel(seed=4)),
+                                                          log_commands=False)
+        interferometer = SimulatedInterferometer(firmware=InterferometerFirmware(clock), log_commands=False)
+
+        with offline(clock):
+            scheme = TimeSeries(coincidence_circuit, interferometer, gate_time=50, duration=2, profile=False)
+            data = scheme()
+            loaded, metadata = TimeSeries.load(scheme.save_file)
+
+        self.assertEqual(len(data), 40)
+        np.testing.assert_array_equal(loaded['coincidences'], data['coincidences'])
+        self.assertEqual(metadata['gate_time'], 50)
+        self.assertTrue(np.all(np.diff(data['time']) >= 0))
+        self.assertAlmostEqual(np.mean(data['counts1']) / 0.05, 3e4, delta=1e3)
+        self.assertAlmostEqual(clock.time(), 2)
+
+    def test_whole_seconds_without_ms_gates(self):
+        clock = VirtualClock()
+        coincidence_circuit = SimulatedCoincidenceCircuit(firmware=CoincidenceFirmware(clock, model=CountModel(seed=4)),
+                                                          log_commands=False)
+        coincidence_circuit.firmware.supports_ms_gates = False
+        interferometer = SimulatedInterferometer(firmware=InterferometerFirmware(clock), log_commands=False)
+
+        with offline(clock):
+            data = TimeSeries(coincidence_circuit, interferometer, gate_time=1000, duration=3, profile=False)()
+
+        self.assertEqual(len(data), 3)
+        self.assertIsNone(coincidence_circuit.supports_ms_gates)
+
+
+class TestParameterSweep(TestCase):
+    def test_sweep(self):
+        clock = VirtualClock()
+        interferometer = SimulatedInterferometer(firmware=InterferometerFirmware(clock), log_commands=False)
+        model = FringeModel(interferometer.firmware, period=40, visibility=0.5, pair_rate=1e4, seed=5)
+        coincidence_circuit = SimulatedCoincidenceCircuit(firmware=CoincidenceFirmware(clock, model=model),
+                                                          log_commands=False)
+        sweep = Sweep(steps_axis(DelayLines.CA, [37, 37.2, 38]), position_axis([0, 100, 200]),
+                      derived={'WA': lambda settings: settings['CA'] + 49})
+
+        with tempfile.TemporaryDirectory() as directory, virtual_time(clock), \
+                mock.patch('measure.scheme.DATA_DIRECTORY', directory):
+            scheme = ParameterSweep(coincidence_circuit, interferometer, sweep=sweep, gate_time=100)
+            data = scheme()
+            _, metadata = ParameterSweep.load(scheme.save_file)
+
+        self.assertEqual(list(metadata['settings']), ['CA', 'position', 'WA'])
+        np.testing.assert_array_equal(data[0], [37] * 6 + [38] * 3)
+        np.testing.assert_array_equal(data[2], data[0] + 49)
+        # The second CA setting rounds to the first, its measurements are reused rather than repeated.
+        self.assertEqual(metadata['reused'], 3)
+        np.testing.assert_array_equal(data[3:, 3:6], data[3:, 0:3])
+        self.assertEqual(coincidence_circuit.firmware.steps[DelayLines.CA], 38)
+        # The coincidences follow the fringes at each position.
+        self.assertGreater(data[5, 0], data[5, 1])
+        self.assertEqual(interferometer.firmware.position, 0)
+
+
+class TestAutoAlignment(TestCase):
+    def test_noisy_coincidences(self):
+        # A plateau of 300 coincidences from 40 to 60 on a background of 100, with a fixed amount of noise.
+        noise = iter(np.tile([5, -5, 3, -3], 1000))
+        counts = NoisyCoincidences(lambda setting: (300 if 40 <= setting <= 60 else 100) + next(noise))
+        self.assertEqual(counts.compare(50, 10), 1)
+        self.assertEqual(counts.compare(10, 50), -1)
+        self.assertEqual(counts.gates, {50: 1, 10: 1})
+        # Settings that can not be told apart are measured up to the maximum number of times.
+        self.assertEqual(counts.compare(45, 55), 0)
+        self.assertEqual(counts.gates[45] + counts.gates[55], 2 * counts.maximum_repeats)
+        self.assertEqual(counts.compare(45, level=200), 1)
+
+        alignment = align(counts, start=30, lower=0, upper=255, initial=2, maximum=8)
+        self.assertTrue(40 <= alignment.peak <= 60)
+        self.assertAlmostEqual(alignment.left_edge, 39.5, delta=1)
+        self.assertAlmostEqual(alignment.right_edge, 60.5, delta=1)
+
+    def test_without_peak(self):
+        counts = NoisyCoincidences(lambda setting: 100)
+        self.assertRaises(RuntimeError, lambda: align(counts, start=100, lower=0, upper=255, initial=2, maximum=8))
+
+    def test_alignment(self):
+        for shift_A, delay_offset in ((True, 2.5), (False, -1.5)):
+            clock = VirtualClock()
+            model = CountModel(delay_offset=delay_offset, seed=2)
+            coincidence_circuit = SimulatedCoincidenceCircuit(firmware=CoincidenceFirmware(clock, model=model),
+                                                              log_commands=False)
+            interferometer = SimulatedInterferometer(firmware=InterferometerFirmware(clock), log_commands=False)
+
+            with offline(clock):
+                scheme = AutoAlignment(coincidence_circuit, interferometer, shift_A=shift_A, window_size=4,
+                                       fixed_delay=30, profile=False)
+                data = scheme()
+                _, metadata = AutoAlignment.load(scheme.save_file)
+                configuration = load_configuration('aligned')
+                single_run = SingleRun(coincidence_circuit, interferometer, profile=False)
+
+            # Far fewer gates than the settings of the shifted line.
+            self.assertLess(len(data), (scheme.upper - scheme.lower) / 4)
+            self.assertTrue(metadata['aligned'])
+            self.assertEqual(configuration['steps'], scheme.steps)
+            self.assertEqual(configuration['gates'], len(data))
+            # The window is centred on the peak of the coincidences.
+            steps = scheme.steps
+            relative_delay = (DelayLines.CA.calculate_delays(steps[DelayLines.CA]) -
+                              DelayLines.CB.calculate_delays(steps[DelayLines.CB]))
+            self.assertAlmostEqual(relative_delay, delay_offset, delta=1)
+            self.assertAlmostEqual(configuration['window_width'], 2 * 4, delta=2)
+            # Other schemes use the aligned steps.
+            self.assertEqual(single_run.steps, steps)
+            self.assertEqual(single_run.metadata['CA_steps'], steps[DelayLines.CA])
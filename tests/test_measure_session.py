@@ -0,0 +1,145 @@
+import tempfile
+from time import perf_counter
+from unittest import TestCase, mock
+
+from interface import UNRESPONSIVE_DELAY, wait_until_ready
+from measure.schemes import get_scheme
+from measure.session import DEFAULT_DELAYS, Session
+from utils.delays import DelayLines
+from utils.simulation import (CoincidenceFirmware, CountModel, InterferometerFirmware, SimulatedCoincidenceCircuit,
+                              SimulatedInterferometer, VirtualClock, virtual_time)
+
+BOOT_TIME = 0.3
+
+
+class RecordingFirmware(CoincidenceFirmware):
+    """
+    Records the delay commands.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.delay_commands = 0
+
+    def process(self, command: str):
+        if command.startswith('SD'):
+            self.delay_commands += 1
+        super().process(command)
+
+
+class TestSession(TestCase):
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.coincidence_circuit = SimulatedCoincidenceCircuit(
+            firmware=RecordingFirmware(self.clock, boot_time=BOOT_TIME, model=CountModel(seed=1)), log_commands=False)
+        self.interferometer = SimulatedInterferometer(firmware=InterferometerFirmware(self.clock, boot_time=BOOT_TIME),
+                                                      log_commands=False)
+        # Both Arduinos were reset by opening their ports on construction, and are still booting.
+
+    def test_handshake(self):
+        with virtual_time(self.clock):
+            # Commands sent while booting are lost, the handshake waits until the firmware replies.
+            self.assertFalse(self.coincidence_circuit.ping())
+            self.assertTrue(self.coincidence_circuit.wait_until_ready())
+            self.assertTrue(self.coincidence_circuit.supports_ping)
+            self.assertGreaterEqual(self.clock.time(), BOOT_TIME)
+
+            # Once booted, readiness takes a single round trip.
+            start = self.clock.time()
+            self.assertTrue(self.coincidence_circuit.wait_until_ready())
+            self.assertEqual(self.clock.time(), start)
+
+    def test_firmware_without_ping(self):
+        self.clock.sleep(BOOT_TIME)
+        self.coincidence_circuit.firmware.supports_ping = False
+        with virtual_time(self.clock):
+            self.assertFalse(self.coincidence_circuit.wait_until_ready(timeout=0.2))
+            self.assertFalse(self.coincidence_circuit.supports_ping)
+            # The fallback is a fixed delay, without pinging again.
+            start = perf_counter()
+            self.assertFalse(self.coincidence_circuit.wait_until_ready())
+            self.assertLess(perf_counter() - start, 0.1)
+
+    def test_schemes_share_connections(self):
+        with tempfile.TemporaryDirectory() as directory, virtual_time(self.clock), \
+                mock.patch('measure.scheme.DATA_DIRECTORY', directory):
+            with Session(self.coincidence_circuit, self.interferometer) as session:
+                self.assertEqual(self.coincidence_circuit.delays, DEFAULT_DELAYS)
+                delay_commands = self.coincidence_circuit.firmware.delay_commands
+
+                session.run('SingleRun')
+                session.run('FringeScan', points=20, return_to_start=False)
+                session.run('SingleRun')
+
+                self.assertTrue(self.coincidence_circuit.is_open)
+                # The delay lines were restored before the second and third scheme, but not before the first, since
+                # they were still in the known state.
+                self.assertEqual(self.coincidence_circuit.firmware.delay_commands - delay_commands, 4 + 2 * (4 + 4))
+                # The interferometer was moved back after the fringe scan.
+                self.assertEqual(self.interferometer.firmware.position, 0)
+                self.assertEqual(len(session.schemes), 3)
+
+        # The ports were opened on construction rather than by the session, so they are left open.
+        self.assertTrue(self.coincidence_circuit.is_open)
+        self.assertTrue(self.interferometer.is_open)
+        # The Arduinos were only reset when the ports were opened on construction.
+        self.assertEqual(self.coincidence_circuit.firmware.resets, 1)
+        self.assertEqual(self.interferometer.firmware.resets, 1)
+
+    def test_session_closes_what_it_opened(self):
+        self.coincidence_circuit.close()
+        with virtual_time(self.clock), Session(self.coincidence_circuit, self.interferometer):
+            self.assertTrue(self.coincidence_circuit.is_open)
+        self.assertFalse(self.coincidence_circuit.is_open)
+        self.assertTrue(self.interferometer.is_open)
+        self.assertEqual(self.coincidence_circuit.firmware.resets, 2)
+
+    def test_firmware_without_ping_by_default(self):
+        coincidence_circuit = SimulatedCoincidenceCircuit(firmware=CoincidenceFirmware(self.clock), log_commands=False,
+                                                          supports_ping=False)
+        with virtual_time(self.clock):
+            start = self.clock.time()
+            self.assertFalse(coincidence_circuit.wait_until_ready())
+            self.assertEqual(self.clock.time() - start, UNRESPONSIVE_DELAY)
+        # No pings were sent, the fixed delay of the old firmware was waited instead.
+        self.assertEqual(coincidence_circuit.firmware.in_waiting, 0)
+
+    def test_fixed_delay_waited_once(self):
+        coincidence_circuit = SimulatedCoincidenceCircuit(firmware=CoincidenceFirmware(self.clock), log_commands=False,
+                                                          supports_ping=False)
+        interferometer = SimulatedInterferometer(firmware=InterferometerFirmware(self.clock), log_commands=False,
+                                                 supports_ping=False)
+        with virtual_time(self.clock):
+            start = self.clock.time()
+            self.assertFalse(wait_until_ready([coincidence_circuit, interferometer]))
+            # The Arduinos boot at the same time, so the delay is not waited per device.
+            self.assertAlmostEqual(self.clock.time() - start, UNRESPONSIVE_DELAY, delta=0.05)
+
+    def test_scheme_waits_for_what_it_opened(self):
+        self.clock.sleep(BOOT_TIME)
+        self.coincidence_circuit.supports_ping = False
+        self.interferometer.supports_ping = False
+        with tempfile.TemporaryDirectory() as directory, virtual_time(self.clock), \
+                mock.patch('measure.scheme.DATA_DIRECTORY', directory), \
+                mock.patch.object(self.coincidence_circuit, 'wait_until_ready') as coincidence_circuit_wait, \
+                mock.patch.object(self.interferometer, 'wait_until_ready') as interferometer_wait:
+            coincidence_circuit_wait.return_value = interferometer_wait.return_value = False
+            get_scheme('SingleRun')(self.coincidence_circuit, self.interferometer, profile=False)()
+            # Both ports were already open, so the Arduinos were not reset and there is nothing to wait for.
+            interferometer_wait.assert_not_called()
+            coincidence_circuit_wait.assert_not_called()
+
+            self.coincidence_circuit.close()
+            get_scheme('SingleRun')(self.coincidence_circuit, self.interferometer, profile=False)()
+            coincidence_circuit_wait.assert_called_once()
+            interferometer_wait.assert_not_called()
+
+    def test_reopen_forgets_state(self):
+        self.coincidence_circuit.firmware.boot_time = 0
+        self.clock.sleep(BOOT_TIME)
+        self.coincidence_circuit.set_delay(10, DelayLines.CA)
+        self.assertEqual(self.coincidence_circuit.delays, {DelayLines.CA: 10})
+        self.coincidence_circuit.close()
+        with self.coincidence_circuit:
+            self.assertEqual(self.coincidence_circuit.delays, {})
+            self.assertEqual(self.coincidence_circuit.firmware.steps[DelayLines.CA], 0)
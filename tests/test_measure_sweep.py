@@ -0,0 +1,55 @@
+from unittest import TestCase
+
+import numpy as np
+
+from measure.schemes.window_shift_effect import LOWER_DELAY_LIMIT, REGION_SIZE, WINDOW_SIZE, WindowShiftEffect
+from measure.sweep import (POSITION, REPEAT, WINDOW, Sweep, Zip, delay_axis, position_axis, repeat_axis, steps_axis,
+                           window_axis, window_line)
+from utils.delays import DelayLines
+from utils.simulation import SimulatedCoincidenceCircuit, SimulatedInterferometer
+
+
+class TestSweep(TestCase):
+    def test_window_shift_effect(self):
+        # The sweep of the WindowShiftEffect, declared rather than hand-coded.
+        fixed_delay = LOWER_DELAY_LIMIT + REGION_SIZE
+        delays = np.linspace(fixed_delay - REGION_SIZE, fixed_delay + REGION_SIZE, 2 * 4 * REGION_SIZE)
+        sweep = Sweep(Zip(delay_axis(DelayLines.CA, delays), window_axis(np.full(len(delays), WINDOW_SIZE))),
+                      delay_axis(DelayLines.CB, [fixed_delay]),
+                      derived={DelayLines.WA.name: window_line(DelayLines.CA, DelayLines.WA),
+                               DelayLines.WB.name: window_line(DelayLines.CB, DelayLines.WB)})
+        self.assertEqual(sweep.names, ['CA', WINDOW, 'CB', 'WA', 'WB'])
+        self.assertEqual(sweep.key_names, ['CA', 'CB', 'WA', 'WB'])
+
+        expected = WindowShiftEffect(SimulatedCoincidenceCircuit(), SimulatedInterferometer()).data
+        settings = sweep.as_array()
+        for name in ['CA', 'WA', 'CB', 'WB']:
+            # The window line is derived from the quantized start line, which may differ by a step.
+            np.testing.assert_allclose(settings[sweep.names.index(name)], expected[name], atol=1)
+
+    def test_lazy_expansion(self):
+        sweep = Sweep(steps_axis(DelayLines.CA, range(0, 200, 10)), position_axis(np.arange(-5, 5)), repeat_axis(3))
+        self.assertEqual(len(sweep), 20 * 10 * 3)
+        self.assertEqual(sweep.shape, (20, 10, 3))
+        # Random access expands a single point, consistent with iterating.
+        for i, settings in enumerate(sweep):
+            self.assertEqual(sweep[i], settings)
+        self.assertEqual(sweep[-1], {'CA': 190, POSITION: 4, REPEAT: 2})
+        self.assertRaises(IndexError, lambda: sweep[len(sweep)])
+
+    def test_deduplication(self):
+        # Delays closer together than a step end up at the same steps.
+        step = DelayLines.CA.delay_step
+        delays = DelayLines.CA.calculate_delays(100) + np.array([0, 0.1, 0.2, 1, 1.1, 2]) * step
+        sweep = Sweep(delay_axis(DelayLines.CA, delays), repeat_axis(2))
+        schedule = list(sweep.schedule())
+
+        reused = [original for _, _, original in schedule]
+        self.assertEqual(reused, [None, None, 0, 1, 0, 1, None, None, 6, 7, None, None])
+        # Repeats are never reused.
+        self.assertEqual(sum(original is None for original in reused), 6)
+
+    def test_validation(self):
+        self.assertRaises(ValueError, lambda: Zip(steps_axis(DelayLines.CA, [1, 2]), steps_axis(DelayLines.CB, [1])))
+        self.assertRaises(ValueError, lambda: Sweep(steps_axis(DelayLines.CA, [1]), steps_axis(DelayLines.CA, [2])))
+        self.assertRaises(ValueError, lambda: steps_axis(DelayLines.CA, [300]))
@@ -0,0 +1,25 @@
+from unittest import TestCase
+
+import numpy as np
+
+from utils.buffers import ColumnBuffer
+
+
+class TestColumnBuffer(TestCase):
+    def test_growth(self):
+        buffer = ColumnBuffer({'time': np.float64, 'counts': np.uint32}, capacity=2)
+        for i in range(5):
+            buffer.append(time=i / 10, counts=i)
+        buffer.extend(time=np.arange(3), counts=np.arange(3))
+
+        self.assertEqual(len(buffer), 8)
+        self.assertGreaterEqual(buffer.capacity, 8)
+        self.assertEqual(buffer['counts'].dtype, np.uint32)
+        np.testing.assert_array_equal(buffer['counts'], [0, 1, 2, 3, 4, 0, 1, 2])
+        self.assertEqual(buffer.to_array().shape, (2, 8))
+        records = buffer.to_records()
+        self.assertEqual(records.dtype.names, ('time', 'counts'))
+        np.testing.assert_array_equal(records['counts'], buffer['counts'])
+
+        buffer.clear()
+        self.assertEqual(len(buffer['time']), 0)
@@ -0,0 +1,57 @@
+import json
+from tempfile import TemporaryDirectory
+from unittest import TestCase, mock
+
+import numpy as np
+
+from utils.configurations import (apply_steps, available_configurations, configuration_file, load_configuration,
+                                  load_steps, save_configuration)
+from utils.delays import DelayLines
+
+STEPS = {DelayLines.CA: 37, DelayLines.WA: 86, DelayLines.CB: 29, DelayLines.WB: 76}
+
+
+class TestConfigurations(TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        patcher = mock.patch('utils.configurations.CONFIGURATIONS_DIRECTORY', self.directory.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.directory.cleanup)
+
+    def test_save_and_load(self):
+        file_name = save_configuration('aligned', STEPS, gates=np.int64(31), window_width=np.float64(8.5))
+        self.assertEqual(file_name, configuration_file('aligned'))
+        with open(file_name) as file:
+            contents = json.load(file)
+        self.assertEqual(contents['steps'], {'CA': 37, 'WA': 86, 'CB': 29, 'WB': 76})
+
+        configuration = load_configuration('aligned')
+        self.assertEqual(configuration['steps'], STEPS)
+        self.assertEqual(configuration['gates'], 31)
+        self.assertEqual(configuration['window_width'], 8.5)
+        self.assertIn('created', configuration)
+
+        save_configuration('other', STEPS)
+        self.assertEqual(available_configurations(), ['aligned', 'other'])
+
+    def test_invalid_steps(self):
+        self.assertRaises(ValueError, lambda: save_configuration('missing', {DelayLines.CA: 37}))
+        self.assertRaises(ValueError, lambda: save_configuration('range', {**STEPS, DelayLines.CA: 300}))
+        self.assertEqual(available_configurations(), [])
+
+    def test_load_steps(self):
+        default = dict(STEPS)
+        self.assertEqual(load_steps('aligned', default), default)
+        self.assertEqual(load_steps(None, default), default)
+
+        aligned = {**STEPS, DelayLines.CA: 40}
+        save_configuration('aligned', aligned)
+        self.assertEqual(load_steps('aligned', default), aligned)
+        self.assertEqual(load_steps(None, default), default)
+        self.assertRaises(FileNotFoundError, lambda: load_configuration('missing'))
+
+    def test_apply_steps(self):
+        coincidence_circuit = mock.Mock()
+        apply_steps(coincidence_circuit, STEPS)
+        coincidence_circuit.set_delay.assert_has_calls([mock.call(steps, line) for line, steps in STEPS.items()])
@@ -2,13 +2,17 @@
 Written by:
     Julian van Doorn <j.c.b.van.doorn@umail.leidenuniv.nl>
 """
-
-from unittest import TestCase
+import os
+import shutil
+import tempfile
+from os.path import join
+from unittest import TestCase, mock
 
 import numpy as np
 
 from utils import DELAY_LINE_CALIBRATION_FILE, DELAY_STEPS
-from utils.delays import DelayLines, validate_delay_steps
+from utils.delays import (DelayLines, append_calibration, fit_calibration, load_calibration, reload_calibration,
+                          validate_delay_steps)
 
 
 class TestDelayLines(TestCase):
@@ -99,3 +103,56 @@ class TestDelayLines(TestCase):
     def test_delay_line_name(self):
         self.assertEqual(str(DelayLines.CA), 'CA')
         self.assertEqual(str(DelayLines.WB), 'WB')
+
+
+class TestCalibrationCache(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.calibration_file = join(self.directory.name, 'delay_lines.csv')
+        shutil.copy(DELAY_LINE_CALIBRATION_FILE, self.calibration_file)
+
+        self.patches = [
+            mock.patch('utils.delays.DELAY_LINE_CALIBRATION_FILE', self.calibration_file),
+            mock.patch('utils.delays.DELAY_LINE_CALIBRATION_CACHE', join(self.directory.name, 'cache')),
+        ]
+        for patch in self.patches:
+            patch.start()
+        reload_calibration()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        reload_calibration()
+        self.directory.cleanup()
+
+    def test_vectorized_fit(self):
+        calibration_data = np.loadtxt(self.calibration_file, delimiter=',', skiprows=1)
+        popt, pcov = fit_calibration(calibration_data)
+        for delay_line in DelayLines:
+            expected_popt, expected_pcov = np.polyfit(calibration_data[:, 0],
+                                                      calibration_data[:, 1 + 2 * delay_line.index], 1,
+                                                      w=1 / calibration_data[:, 2 + 2 * delay_line.index], cov=True)
+            np.testing.assert_allclose(popt[:, delay_line.index], expected_popt)
+            np.testing.assert_allclose(pcov[delay_line.index], expected_pcov)
+
+    def test_disk_cache(self):
+        popt, _ = load_calibration()
+        self.assertEqual(len(os.listdir(join(self.directory.name, 'cache'))), 1)
+
+        # A second process would load the fit from the cache.
+        reload_calibration()
+        with mock.patch('utils.delays.fit_calibration') as fit:
+            np.testing.assert_array_equal(load_calibration()[0], popt)
+        fit.assert_not_called()
+
+    def test_append_calibration(self):
+        rows = np.loadtxt(self.calibration_file, delimiter=',', skiprows=1)
+        minimum_delay = DelayLines.CA.minimum_delay
+        append_calibration(rows[-1] + [10, 2.5, 0, 2.5, 0, 2.5, 0, 2.5, 0])
+
+        updated = np.loadtxt(self.calibration_file, delimiter=',', skiprows=1)
+        self.assertEqual(len(updated), len(rows) + 1)
+        self.assertEqual(updated[-1, 0], rows[-1, 0] + 10)
+        # The calibration is fitted again after appending.
+        self.assertNotEqual(DelayLines.CA.minimum_delay, minimum_delay)
+        self.assertEqual(len(os.listdir(join(self.directory.name, 'cache'))), 2)
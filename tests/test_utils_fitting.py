@@ -0,0 +1,41 @@
+from unittest import TestCase
+
+import numpy as np
+
+from utils.fitting import damped_sine, fit_damped_sine, frequency_grid, lomb_scargle, multi_start_fit, sine_seeds
+
+
+class TestFitting(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        # Unevenly spaced samples, as delays computed from the calibration are.
+        self.x = np.sort(rng.uniform(-30, 30, 60))
+        self.y = damped_sine(self.x, 0.2, -1.2, 15, 2, 0.01) + rng.normal(0, 1, len(self.x))
+
+    def test_periodogram(self):
+        frequencies = frequency_grid(self.x)
+        power = lomb_scargle(self.x, self.y, frequencies)
+        self.assertAlmostEqual(frequencies[np.argmax(power)], 0.2, delta=0.01)
+
+        frequency, phase, amplitude, offset = sine_seeds(self.x, self.y)[0]
+        self.assertAlmostEqual(frequency, 0.2, delta=0.01)
+        self.assertAlmostEqual(offset, 2, delta=1)
+
+    def test_fit_damped_sine(self):
+        result = fit_damped_sine(self.x, self.y)
+        self.assertTrue(result.success, result.status)
+        np.testing.assert_allclose(result.popt, [0.2, -1.2, 15, 2, 0.01], atol=0.3)
+        self.assertEqual(result.perr.shape, (5,))
+
+    def test_multi_start_escapes_local_minimum(self):
+        # A single guess at a wrong frequency converges to a local minimum, the other guesses do not.
+        guesses = np.array([[0.45, 0, 15, 2, 0], [0.2, -1, 10, 0, 0], [0.1, 0, 10, 0, 0]])
+        result = multi_start_fit(damped_sine, self.x, self.y, guesses, refine=3)
+        self.assertAlmostEqual(result.popt[0], 0.2, delta=0.01)
+
+    def test_failures_are_reported(self):
+        result = multi_start_fit(damped_sine, self.x, self.y, [[0.2, -1.2, 15, 2, 0.01]],
+                                 validate=lambda popt: 'always rejected')
+        self.assertFalse(result.success)
+        self.assertIn('always rejected', result.status)
+        self.assertTrue(np.isnan(result.pcov).all())
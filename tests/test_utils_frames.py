@@ -0,0 +1,51 @@
+from unittest import TestCase
+
+import numpy as np
+
+from utils.frames import (FrameProcessor, PIXELS, bin_pixels, find_centroids, find_peaks, fringe_visibility,
+                          subtract_background)
+
+
+class TestFrames(TestCase):
+    def setUp(self):
+        self.x = np.arange(PIXELS)
+
+    def test_subtract_background_unsigned(self):
+        frames = np.full((4, PIXELS), 10, dtype=np.uint16)
+        dark = np.full(PIXELS, 12, dtype=np.uint16)
+        corrected = subtract_background(frames, dark, bias=1)
+        # Unsigned frames should not wrap around.
+        np.testing.assert_array_equal(corrected, -3)
+
+    def test_bin_pixels(self):
+        frames = np.ones((3, 10))
+        np.testing.assert_array_equal(bin_pixels(frames, 3), np.full((3, 3), 3))
+
+    def test_peaks_and_centroids(self):
+        centres = np.array([100.3, 1800.5, 3000.75])
+        frames = 1000 * np.exp(-np.square(self.x - centres[:, np.newaxis]) / (2 * 5 ** 2)) + 50
+
+        np.testing.assert_allclose(find_peaks(frames), centres, atol=0.05)
+        np.testing.assert_allclose(find_centroids(frames, threshold=50), centres, atol=1e-6)
+        self.assertTrue(np.isnan(find_centroids(np.zeros(PIXELS))[0]))
+
+    def test_fringe_visibility(self):
+        visibilities = np.array([0.2, 0.5, 0.9])
+        period = 3648 / 40
+        frames = 1000 * (1 + visibilities[:, np.newaxis] * np.cos(2 * np.pi * self.x / period + 0.3))
+
+        visibility, fringe_period, phase = fringe_visibility(frames, window=False)
+        np.testing.assert_allclose(visibility, visibilities)
+        np.testing.assert_allclose(fringe_period, period)
+        np.testing.assert_allclose(phase, 0.3)
+
+    def test_processor_reuses_buffers(self):
+        processor = FrameProcessor(2, dark=np.zeros(PIXELS), binning=4)
+        frames = np.zeros((2, PIXELS), dtype=np.uint16)
+        frames[:, 400] = 100
+
+        first = processor(frames)
+        second = processor(frames)
+        self.assertIs(first, second)
+        self.assertEqual(first.shape, (2, PIXELS // 4))
+        np.testing.assert_allclose(processor.centroids, 100)
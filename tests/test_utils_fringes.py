@@ -0,0 +1,40 @@
+from unittest import TestCase
+
+import numpy as np
+
+from utils.fringes import extract_fringe, fft_period, fringe_model, project_sine
+
+
+class TestFringes(TestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(3)
+        self.positions = np.arange(200)
+
+    def scan(self, period, phase, visibility, mean=1000.):
+        expected = mean * (1 + visibility * np.cos(2 * np.pi * self.positions / period + phase))
+        return self.rng.poisson(expected)
+
+    def test_extract_fringe(self):
+        # The periods do not fit an integer number of times in the scan.
+        for period, phase, visibility in [(23.7, 1., 0.6), (51.3, -2., 0.9), (8.2, 0.3, 0.3)]:
+            fringe = extract_fringe(self.positions, self.scan(period, phase, visibility))
+            self.assertAlmostEqual(fringe.period, period, delta=0.01 * period)
+            self.assertAlmostEqual(fringe.phase, phase, delta=0.05)
+            self.assertAlmostEqual(fringe.visibility, visibility, delta=0.01)
+
+    def test_known_period(self):
+        counts = self.scan(20, 0.5, 0.8)
+        fringe = extract_fringe(self.positions, counts, period=20)
+        self.assertEqual(fringe.period, 20)
+        # The residuals are consistent with Poisson noise.
+        self.assertAlmostEqual(fringe.residual, np.std(counts - fringe_model(self.positions, fringe)), places=6)
+        self.assertLess(fringe.residual, 2 * np.sqrt(1000))
+
+    def test_project_sine_exact(self):
+        counts = 5 + 2 * np.cos(2 * np.pi * self.positions / 13) - 1 * np.sin(2 * np.pi * self.positions / 13)
+        (offset, cosine, sine, residual), = project_sine(self.positions, counts, 13)
+        np.testing.assert_allclose([offset, cosine, sine, residual], [5, 2, -1, 0], atol=1e-9)
+
+    def test_short_scan(self):
+        self.assertTrue(np.isnan(fft_period(self.positions[:3], np.ones(3))))
+        self.assertTrue(np.isnan(extract_fringe(self.positions[:3], np.ones(3)).visibility))
@@ -0,0 +1,39 @@
+from os.path import join
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from utils.metrics import CommandMetrics, LatencyHistogram, export_metrics
+
+
+class TestMetrics(TestCase):
+    def test_histogram(self):
+        histogram = LatencyHistogram(buckets=(0.1, 1.))
+        for latency in (0.05, 0.5, 0.7, 5.):
+            histogram.observe(latency)
+
+        self.assertEqual(histogram.counts, [1, 2, 1])
+        self.assertAlmostEqual(histogram.mean, 6.25 / 4)
+        self.assertEqual(histogram.quantile(0.5), 1.)
+        self.assertEqual(histogram.quantile(1.), 5.)
+
+    def test_prometheus_export(self):
+        metrics = CommandMetrics('coincidence circuit', buckets=(0.1, 1.))
+        metrics.record_command('MEASURE', 8)
+        metrics.record_line(10)
+        metrics.record_discarded()
+        metrics.record_latency('MEASURE', 0.5)
+
+        with TemporaryDirectory() as directory:
+            file_name = join(directory, 'metrics.prom')
+            export_metrics(file_name, [metrics], prometheus=True)
+            with open(file_name) as file:
+                lines = file.read().splitlines()
+
+        labels = 'device="coincidence circuit",command="MEASURE"'
+        self.assertIn('# TYPE arduino_command_latency_seconds histogram', lines)
+        self.assertIn(f'arduino_command_latency_seconds_bucket{{{labels},le="0.1"}} 0', lines)
+        self.assertIn(f'arduino_command_latency_seconds_bucket{{{labels},le="+Inf"}} 1', lines)
+        self.assertIn('arduino_lines_discarded_total{device="coincidence circuit"} 1', lines)
+        # Samples must directly follow the header of their family.
+        index = lines.index('# TYPE arduino_bytes_sent_total counter')
+        self.assertEqual(lines[index + 1], 'arduino_bytes_sent_total{device="coincidence circuit"} 8')
@@ -0,0 +1,93 @@
+import json
+import tempfile
+from os.path import exists
+from time import sleep
+from unittest import TestCase, mock
+
+from measure.schemes.window_shift_effect import ITERATIONS, MEASURE_TIME, WindowShiftEffect
+from utils import profiling
+from utils.profiling import GATE, IO, WAIT, Profiler
+from utils.simulation import (CoincidenceFirmware, CountModel, InterferometerFirmware, SimulatedCoincidenceCircuit,
+                              SimulatedInterferometer, VirtualClock, virtual_time)
+
+
+class TestProfiler(TestCase):
+    def test_phases(self):
+        with Profiler() as profiler:
+            with profiler.phase('setup'):
+                with profiling.timed(WAIT):
+                    sleep(0.02)
+                profiling.add_counting(1.5)
+            # Time outside of a phase is not recorded.
+            profiling.add_counting(10)
+        # Once inactive, nothing is recorded.
+        self.assertIsNone(profiling.active())
+        with profiling.timed(IO):
+            pass
+
+        phase, = profiler.phases
+        self.assertEqual(phase.name, 'setup')
+        self.assertGreaterEqual(phase.times[WAIT], 0.02)
+        self.assertGreaterEqual(phase.wall, phase.times[WAIT])
+        self.assertEqual(phase.times[IO], 0)
+        self.assertEqual(profiler.totals()['counting'], 1.5)
+        self.assertIsNone(phase.memory)
+
+    def test_nested_timings(self):
+        with Profiler() as profiler:
+            with profiler.phase('gate'):
+                with profiling.timed(GATE):
+                    with profiling.timed(IO):
+                        sleep(0.02)
+                with profiling.timed(IO):
+                    pass
+
+        phase, = profiler.phases
+        # The I/O while waiting for the gate is only booked as waiting for the gate.
+        self.assertGreaterEqual(phase.times[GATE], 0.02)
+        self.assertLess(phase.times[IO], 0.01)
+
+    def test_summary_in_virtual_time(self):
+        with Profiler() as profiler:
+            with profiler.phase('iteration'):
+                profiling.add_counting(48)
+        summary = profiler.summary()
+        # Counting took longer than the wall time, so it is not given as part of the wall time.
+        self.assertIn('48.000 s of simulated gate time', summary)
+        self.assertNotIn('of which', summary)
+        self.assertNotIn('%', summary)
+
+    def test_memory(self):
+        with Profiler(trace_memory=True) as profiler:
+            with profiler.phase('allocate'):
+                data = bytearray(2 ** 22)
+        del data
+        self.assertGreaterEqual(profiler.phases[0].memory_peak, 2 ** 22)
+        self.assertIn('memory peak', profiler.summary())
+
+    def test_scheme(self):
+        clock = VirtualClock()
+        coincidence_circuit = SimulatedCoincidenceCircuit(firmware=CoincidenceFirmware(clock, model=CountModel(seed=1)),
+                                                          log_commands=False)
+        interferometer = SimulatedInterferometer(firmware=InterferometerFirmware(clock), log_commands=False)
+        with tempfile.TemporaryDirectory() as directory, virtual_time(clock), \
+                mock.patch('measure.scheme.DATA_DIRECTORY', directory):
+            scheme = WindowShiftEffect(coincidence_circuit, interferometer)
+            scheme()
+            self.assertTrue(exists(scheme.profile_file))
+            with open(scheme.profile_file) as file:
+                profile = json.load(file)
+
+        names = [phase['name'] for phase in profile['phases']]
+        self.assertEqual(names, ['prepare', 'setup'] + ['iteration'] * ITERATIONS + ['save', 'cleanup'])
+        self.assertEqual(profile['totals']['counting'], ITERATIONS * MEASURE_TIME)
+        self.assertGreater(profile['totals'][IO], 0)
+        self.assertGreater(profile['totals'][GATE], 0)
+        for phase in profile['phases']:
+            self.assertAlmostEqual(phase['wall'], phase[IO] + phase[GATE] + phase[WAIT] + phase['compute'],
+                                   delta=1e-3)
+
+    def test_disabled(self):
+        scheme = WindowShiftEffect(SimulatedCoincidenceCircuit(), SimulatedInterferometer(), profile=False)
+        self.assertFalse(scheme.profile)
+        self.assertIsNone(scheme.profiler)
@@ -0,0 +1,76 @@
+from unittest import TestCase
+
+import numpy as np
+
+from utils.protocol import COUNTER_FRAME_SIZE, CounterFrameDecoder, decode_counter_frames, encode_counter_frames
+from utils.simulation import CoincidenceFirmware, CountModel, SimulatedCoincidenceCircuit
+
+
+class TestCounterFrames(TestCase):
+    def setUp(self):
+        self.counts = np.array([[30000, 300000, 200], [1, 2, 3], [2 ** 32 - 1, 0, 7]])
+        self.data = encode_counter_frames(np.arange(3), self.counts)
+
+    def test_round_trip(self):
+        self.assertEqual(len(self.data), 3 * COUNTER_FRAME_SIZE)
+        frames, valid = decode_counter_frames(self.data)
+        self.assertTrue(valid.all())
+        np.testing.assert_array_equal(frames['counts'], self.counts)
+        np.testing.assert_array_equal(frames['sequence'], [0, 1, 2])
+
+    def test_checksum_detects_corruption(self):
+        corrupted = bytearray(self.data)
+        corrupted[COUNTER_FRAME_SIZE + 5] ^= 0x01
+        _, valid = decode_counter_frames(bytes(corrupted))
+        np.testing.assert_array_equal(valid, [True, False, True])
+
+    def test_decoder_resynchronises(self):
+        decoder = CounterFrameDecoder()
+        stream = b'Received command: MEASURE\r\n' + self.data[:20] + b'chatter\r\n' + self.data[20:]
+        # Feed the stream in small pieces, as it would arrive from the port.
+        frames = []
+        for i in range(0, len(stream), 7):
+            decoder.feed(stream[i:i + 7])
+            frames.append(decoder.decode())
+        frames = np.concatenate(frames)
+
+        # The second frame was interrupted by the chatter and is lost, the others are recovered.
+        np.testing.assert_array_equal(frames['sequence'], [0, 2])
+        np.testing.assert_array_equal(frames['counts'], self.counts[[0, 2]])
+
+
+class TestBinaryNegotiation(TestCase):
+    def setUp(self):
+        self.firmware = CoincidenceFirmware(model=CountModel(seed=3))
+        self.coincidence_circuit = SimulatedCoincidenceCircuit(firmware=self.firmware, log_commands=False,
+                                                               metrics=True)
+
+    def test_binary_replies(self):
+        self.coincidence_circuit.toggle_verbose()
+        self.assertTrue(self.coincidence_circuit.enable_binary())
+
+        counts = [self.coincidence_circuit.measure(1) for _ in range(3)]
+        self.assertTrue(all(len(c) == 3 and isinstance(c[0], int) for c in counts))
+        self.assertEqual(self.firmware.sequence, 3)
+
+        self.coincidence_circuit.disable_binary()
+        self.assertEqual(len(self.coincidence_circuit.measure(1)), 3)
+
+    def test_fallback_to_ascii(self):
+        self.firmware.supports_binary = False
+        self.assertFalse(self.coincidence_circuit.enable_binary(timeout=0.01))
+        # Reads that timed out without a reply are neither received nor discarded lines.
+        self.assertEqual(self.coincidence_circuit.metrics.lines_received, 0)
+        self.assertEqual(self.coincidence_circuit.metrics.lines_discarded, 0)
+        self.assertEqual(len(self.coincidence_circuit.measure(1)), 3)
+        self.assertEqual(self.coincidence_circuit.metrics.lines_received, 1)
+        # The request that was not acknowledged does not shift the latencies of the next ones.
+        self.assertEqual(len(self.coincidence_circuit._outstanding), 0)
+
+    def test_device_stops_sending(self):
+        self.assertTrue(self.coincidence_circuit.enable_binary())
+        self.coincidence_circuit.timeout = 0.01
+        # Clearing the counters does not produce a reply, the reads are bounded by the timeout of the port.
+        self.coincidence_circuit.clear_counters()
+        self.assertRaises(TimeoutError, lambda: self.coincidence_circuit.read_counter_frames(1))
+        self.assertEqual(len(self.coincidence_circuit.measure(1)), 3)
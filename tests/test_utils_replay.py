@@ -0,0 +1,119 @@
+import tempfile
+from os.path import join
+from time import perf_counter
+from unittest import TestCase
+
+import numpy as np
+
+from measure.schemes.window_shift_effect import WindowShiftEffect
+from utils.delays import DelayLines
+from utils.replay import ReplayCoincidenceCircuit, ReplayInterferometer
+from utils.simulation import (CoincidenceFirmware, CountModel, InterferometerFirmware, SimulatedCoincidenceCircuit,
+                              SimulatedInterferometer, VirtualClock, offline, virtual_time)
+from utils.trace import LINE, WRITE, Trace, TraceEvent, read_trace
+
+
+def session(coincidence_circuit):
+    """
+    A session with ASCII, pipelined and binary replies.
+    """
+    with coincidence_circuit:
+        results = [coincidence_circuit.measure(1)]
+        coincidence_circuit.set_delay(10, DelayLines.CA)
+        results.append(coincidence_circuit.measure_many(3, 100))
+        coincidence_circuit.enable_binary()
+        results.append(coincidence_circuit.measure_many(4, 100))
+        results.append(coincidence_circuit.measure_ms(50))
+    return results
+
+
+class TestReplay(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.file_name = join(self.directory.name, 'session.trace')
+        self.clock = VirtualClock()
+
+    def capture(self):
+        coincidence_circuit = SimulatedCoincidenceCircuit(
+            firmware=CoincidenceFirmware(self.clock, model=CountModel(seed=2)), log_commands=False,
+            trace=self.file_name)
+        with virtual_time(self.clock):
+            results = session(coincidence_circuit)
+        coincidence_circuit.stop_capture()
+        return results
+
+    def test_replay(self):
+        captured = self.capture()
+        coincidence_circuit = ReplayCoincidenceCircuit(self.file_name, log_commands=False)
+        replayed = session(coincidence_circuit)
+        self.assertTrue(coincidence_circuit.replayed)
+        for expected, result in zip(captured, replayed):
+            np.testing.assert_array_equal(result, expected)
+
+    def test_mismatch(self):
+        self.capture()
+        coincidence_circuit = ReplayCoincidenceCircuit(self.file_name, log_commands=False)
+        with coincidence_circuit:
+            self.assertRaises(RuntimeError, lambda: coincidence_circuit.measure(2))
+
+        coincidence_circuit = ReplayCoincidenceCircuit(self.file_name, log_commands=False, strict=False)
+        with coincidence_circuit:
+            self.assertEqual(len(coincidence_circuit.measure(2)), 3)
+
+    def test_exhausted(self):
+        coincidence_circuit = ReplayCoincidenceCircuit(Trace('coincidence circuit', []), log_commands=False)
+        coincidence_circuit.timeout = None
+        self.assertRaises(RuntimeError, coincidence_circuit.readline)
+        coincidence_circuit.timeout = 0.1
+        self.assertEqual(coincidence_circuit.readline(), '')
+
+    def test_timed_out_lines(self):
+        trace = Trace('interferometer', [TraceEvent(0., WRITE, b'PING\n'), TraceEvent(0.1, LINE, b''),
+                                         TraceEvent(0.2, LINE, b'PON'), TraceEvent(0.3, LINE, b'G\r\n')])
+        interferometer = ReplayInterferometer(trace, log_commands=False, timeout=1)
+        interferometer.send_command('PING')
+        self.assertEqual([interferometer.readline() for _ in range(3)], ['', 'PON', 'G'])
+        self.assertTrue(interferometer.replayed)
+
+    def test_speed(self):
+        trace = Trace('coincidence circuit', [TraceEvent(0., WRITE, b'PING\n'), TraceEvent(0.4, LINE, b'PONG\r\n')])
+        for speed, minimum, maximum in ((None, 0., 0.1), (2., 0.2, 1.)):
+            coincidence_circuit = ReplayCoincidenceCircuit(trace, log_commands=False, speed=speed)
+            start = perf_counter()
+            self.assertTrue(coincidence_circuit.ping())
+            self.assertGreaterEqual(perf_counter() - start, minimum)
+            self.assertLess(perf_counter() - start, maximum)
+        self.assertRaises(ValueError, lambda: ReplayCoincidenceCircuit(trace, speed=0))
+
+    def test_firmware_without_ping(self):
+        # The capture did not ping, so the fixed delay is waited instead, at the replay speed.
+        for speed, minimum, maximum in ((None, 0., 0.1), (4., 0.2, 1.)):
+            coincidence_circuit = ReplayCoincidenceCircuit(Trace('coincidence circuit', []), log_commands=False,
+                                                           speed=speed)
+            start = perf_counter()
+            self.assertFalse(coincidence_circuit.wait_until_ready())
+            self.assertGreaterEqual(perf_counter() - start, minimum)
+            self.assertLess(perf_counter() - start, maximum)
+
+    def test_scheme(self):
+        coincidence_trace = join(self.directory.name, 'coincidence_circuit.trace')
+        interferometer_trace = join(self.directory.name, 'interferometer.trace')
+        coincidence_circuit = SimulatedCoincidenceCircuit(
+            firmware=CoincidenceFirmware(self.clock, model=CountModel(seed=3)), log_commands=False,
+            trace=coincidence_trace)
+        interferometer = SimulatedInterferometer(firmware=InterferometerFirmware(self.clock), log_commands=False,
+                                                 trace=interferometer_trace)
+        with offline(self.clock):
+            captured = WindowShiftEffect(coincidence_circuit, interferometer, profile=False)()
+        coincidence_circuit.stop_capture()
+        interferometer.stop_capture()
+        self.assertEqual(read_trace(interferometer_trace).name, 'interferometer')
+
+        coincidence_circuit = ReplayCoincidenceCircuit(coincidence_trace, log_commands=False)
+        interferometer = ReplayInterferometer(interferometer_trace, log_commands=False)
+        with offline(self.clock):
+            replayed = WindowShiftEffect(coincidence_circuit, interferometer, profile=False)()
+        self.assertTrue(coincidence_circuit.replayed)
+        for name in captured.dtype.names:
+            np.testing.assert_array_equal(replayed[name], captured[name])
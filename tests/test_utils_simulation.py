@@ -0,0 +1,57 @@
+import tempfile
+from unittest import TestCase, mock
+
+import numpy as np
+
+from interface import COUNTER_REGEX
+from measure.schemes.single_run import SingleRun
+from utils.delays import DelayLines
+from utils.simulation import (CoincidenceFirmware, CountModel, InterferometerFirmware, SimulatedCoincidenceCircuit,
+                              SimulatedInterferometer, VirtualClock, virtual_time)
+
+
+class TestSimulation(TestCase):
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.coincidence_circuit = SimulatedCoincidenceCircuit(
+            firmware=CoincidenceFirmware(self.clock, model=CountModel(seed=1)), log_commands=False)
+        self.interferometer = SimulatedInterferometer(firmware=InterferometerFirmware(self.clock), log_commands=False)
+
+    def test_measure_advances_clock(self):
+        counts = self.coincidence_circuit.measure(2)
+        self.assertEqual(len(counts), 3)
+        self.assertEqual(self.clock.time(), 2)
+        # The singles should be close to the modelled rates.
+        self.assertAlmostEqual(counts[0] / 2, 3e4, delta=1e3)
+
+    def test_verbose_chatter_is_skipped(self):
+        self.coincidence_circuit.toggle_verbose()
+        self.coincidence_circuit.set_delay(10, DelayLines.CA)
+        self.assertTrue(self.coincidence_circuit.firmware.in_waiting)
+        self.assertEqual(self.coincidence_circuit.firmware.steps[DelayLines.CA], 10)
+        self.assertEqual(len(self.coincidence_circuit.read_counts_from_register()), 3)
+
+    def test_read_without_reply_fails(self):
+        self.assertRaises(RuntimeError, lambda: self.coincidence_circuit.find_pattern(COUNTER_REGEX))
+
+    def test_interferometer_position(self):
+        with virtual_time(self.clock):
+            self.interferometer.rotate(10)
+            self.interferometer.rotate(-4)
+        self.assertEqual(self.interferometer.firmware.position, 6)
+
+    def test_scheme_in_virtual_time(self):
+        with tempfile.TemporaryDirectory() as directory, virtual_time(self.clock), \
+                mock.patch('measure.scheme.DATA_DIRECTORY', directory):
+            # The scheme opens the closed coincidence circuit, and only closes what it opened.
+            self.coincidence_circuit.close()
+            scheme = SingleRun(self.coincidence_circuit, self.interferometer)
+            data = scheme()
+            loaded, metadata = SingleRun.load(scheme.save_file)
+
+        np.testing.assert_array_equal(data, loaded)
+        self.assertEqual(loaded.dtype, data.dtype)
+        for name in data.dtype.names:
+            self.assertTrue(np.all(data[name] > 0))
+        self.assertFalse(self.coincidence_circuit.is_open)
+        self.assertTrue(self.interferometer.is_open)
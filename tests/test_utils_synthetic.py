@@ -0,0 +1,55 @@
+from unittest import TestCase
+
+import numpy as np
+
+from measure.schemes.bell_test import ALPHA_ANGLES, BETA_ANGLES, MEASUREMENTS_PER_ITERATION, compute_E
+from measure.schemes.window_shift_effect import WindowShiftEffect
+from utils.delays import DelayLines
+from utils.simulation import CountModel
+from utils.synthetic import CO_INDEX, PhotonPairSource, coincidence_window, delays_from_steps
+
+
+class TestPhotonPairSource(TestCase):
+    def setUp(self):
+        self.source = PhotonPairSource(rate1=3e4, rate2=3e4, pair_rate=5000, sigma=1, delay_offset=2, seed=4)
+
+    def test_window_shape(self):
+        delay = np.linspace(-30, 30, 61)
+        # The distribution of the WindowShiftEffect without accidentals and with unit amplitude.
+        np.testing.assert_allclose(coincidence_window(delay, 8, 1, 2),
+                                   WindowShiftEffect._distribution(delay, 0, 1, 1, 2, 8))
+
+    def test_matches_count_model(self):
+        model = CountModel(rate1=3e4, rate2=3e4, pair_rate=5000, sigma=1, delay_offset=2)
+        steps = {DelayLines.CA: 40, DelayLines.WA: 90, DelayLines.CB: 35, DelayLines.WB: 80}
+        batch = {line: np.full(5, value) for line, value in steps.items()}
+        np.testing.assert_allclose(self.source.expected_window(*delays_from_steps(batch), 0.5),
+                                   np.tile(model.expected(steps, 0.5), (5, 1)))
+
+    def test_window_scan(self):
+        steps = {DelayLines.CA: np.arange(20, 80, 3), DelayLines.CB: np.full(20, 50)}
+        steps[DelayLines.WA] = steps[DelayLines.CA] + 60
+        steps[DelayLines.WB] = steps[DelayLines.CB] + 60
+        data = self.source.window_scan(steps, runs=2000, dtype=np.uint32)
+        self.assertEqual(data.shape, (2000, 20, 3))
+        self.assertEqual(data.dtype, np.uint32)
+
+        expected = self.source.expected_window(*delays_from_steps(steps))
+        mean = data.mean(axis=0)
+        np.testing.assert_allclose(mean, expected, atol=5 * np.sqrt(expected.max() / 2000))
+        # The variance of Poisson counts equals their mean.
+        np.testing.assert_allclose(data.var(axis=0)[:, CO_INDEX] / expected[:, CO_INDEX], 1, atol=0.15)
+
+    def test_bell_test(self):
+        data = self.source.bell_test(ALPHA_ANGLES, BETA_ANGLES, MEASUREMENTS_PER_ITERATION, runs=3)
+        self.assertEqual(data.shape, (3, len(ALPHA_ANGLES), 3, MEASUREMENTS_PER_ITERATION))
+
+        # The maximally entangled state violates the CHSH inequality by the visibility times 2 sqrt(2).
+        def E(alpha, beta):
+            coincidences = [data[0, (ALPHA_ANGLES == a) & (BETA_ANGLES == b), CO_INDEX]
+                            for a, b in [(alpha, beta), (alpha + 90, beta + 90), (alpha + 90, beta),
+                                         (alpha, beta + 90)]]
+            return compute_E(*coincidences)[0]
+
+        S = abs(E(-45, -22.5) - E(-45, 22.5)) + abs(E(0, 22.5) + E(0, -22.5))
+        self.assertAlmostEqual(S, 2 * np.sqrt(2), delta=0.1)
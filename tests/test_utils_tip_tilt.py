@@ -0,0 +1,50 @@
+from os.path import join
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+import numpy as np
+
+from utils.tip_tilt import (ANGLE_PER_TURN, degree_of_polarisation, interpolate_map, parse_coordinate, parse_number,
+                            polarisation_angle, read_polarisation_scan, read_ratio_scan, sp_ratio)
+
+
+class TestTipTilt(TestCase):
+    def test_parsers(self):
+        self.assertEqual(parse_coordinate('(1/4,-3/4)   '), (0.25, -0.75))
+        self.assertEqual(parse_number('0,491'), 0.491)
+        self.assertTrue(np.isnan(parse_number('   ')))
+
+    def test_read_polarisation_scan(self):
+        with TemporaryDirectory() as directory:
+            file_name = join(directory, 'scan.csv')
+            with open(file_name, 'w') as file:
+                file.write('"BBO tip-tilt (hor turns, vert turns)",angle minimum 1,minvalue 1 (mW),angle minimum 2,'
+                           'minvalue 2 (mW),angle maximum 1,maxvalue 1 (mW),angle maximum 2,maxvalue 2 (mW)\n'
+                           '"(1/4,-1)"  ,311 ,"0,378" ,130 ,"0,398" ,219 ,"0,680" ,30 ,"0,683"\n'
+                           '"(0,0)"     ,42  ,        ,242 ,"0,491" ,356 ,        ,150,"0,577"\n')
+            scan = read_polarisation_scan(file_name)
+
+        np.testing.assert_allclose(scan['tilt'], np.array([[0.25, -1], [0, 0]]) * ANGLE_PER_TURN)
+        np.testing.assert_allclose(scan['power_max'][0], [0.680, 0.683])
+        # Missing powers are ignored when computing the degree of polarisation.
+        degree = degree_of_polarisation(scan['power_max'], scan['power_min'])
+        self.assertAlmostEqual(degree[1], (0.577 - 0.491) / (0.577 + 0.491))
+
+    def test_polarisation_angle(self):
+        # Maxima at 0 and 180 degrees and minima at 90 and 270 degrees after the offset: horizontal polarisation.
+        angle = polarisation_angle(np.array([[86, 266]]), np.array([[176, 356]]))
+        np.testing.assert_allclose(angle % np.pi, [0], atol=1e-12)
+        angle = polarisation_angle(np.array([[86 + 30, 266 + 30]]), np.array([[176 + 30, 356 + 30]]))
+        np.testing.assert_allclose(angle, [np.pi / 6])
+
+    def test_sp_ratio(self):
+        np.testing.assert_array_equal(sp_ratio([4, 1], [2, 0]), [2, np.nan])
+
+    def test_interpolate_map(self):
+        points, ratios = read_ratio_scan()
+        self.assertEqual(points.shape, (48, 2))
+        horizontal, vertical, ratio_map = interpolate_map(points, ratios, resolution=50, method='linear', log=True)
+        self.assertEqual(ratio_map.shape, (50, 50))
+        # The map is bounded by the measured values.
+        self.assertGreaterEqual(np.nanmin(ratio_map), ratios.min() - 1e-9)
+        self.assertLessEqual(np.nanmax(ratio_map), ratios.max() + 1e-9)
@@ -0,0 +1,63 @@
+import tempfile
+from os.path import join
+from unittest import TestCase
+
+from utils.simulation import CoincidenceFirmware, CountModel, SimulatedCoincidenceCircuit, VirtualClock, virtual_time
+from utils.trace import DATA, LINE, WRITE, TraceWriter, read_trace
+
+
+class TestTrace(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.file_name = join(self.directory.name, 'session.trace')
+
+    def test_write_and_read(self):
+        with TraceWriter(self.file_name, 'coincidence circuit') as writer:
+            writer.record(WRITE, b'PING\n', time=0.5)
+            writer.record(LINE, b'PONG\r\n', time=0.75)
+            writer.record(DATA, bytes(range(256)), time=1.)
+            writer.record(LINE, b'', time=2.)
+        writer.record(LINE, b'ignored')
+        self.assertEqual(writer.events, 4)
+
+        trace = read_trace(self.file_name)
+        self.assertEqual(trace.name, 'coincidence circuit')
+        self.assertEqual([event.kind for event in trace.events], [WRITE, LINE, DATA, LINE])
+        self.assertEqual(trace.events[2].data, bytes(range(256)))
+        self.assertEqual(trace.events[1].time, 0.75)
+        self.assertEqual(trace.duration, 2.)
+        self.assertIn('4 events', str(trace))
+
+    def test_interrupted_capture(self):
+        with TraceWriter(self.file_name, 'Arduino') as writer:
+            writer.record(WRITE, b'MEASURE\n')
+            writer.record(LINE, b'1,2,3\r\n')
+        with open(self.file_name, 'rb+') as file:
+            file.truncate(file.seek(0, 2) - 2)
+        self.assertEqual(len(read_trace(self.file_name)), 1)
+
+        with open(self.file_name, 'wb') as file:
+            file.write(b'not a trace')
+        self.assertRaises(ValueError, lambda: read_trace(self.file_name))
+
+    def test_capture(self):
+        clock = VirtualClock()
+        coincidence_circuit = SimulatedCoincidenceCircuit(firmware=CoincidenceFirmware(clock, model=CountModel(seed=1)),
+                                                          log_commands=False, trace=self.file_name)
+        with virtual_time(clock), coincidence_circuit:
+            coincidence_circuit.measure(1)
+            coincidence_circuit.enable_binary()
+            coincidence_circuit.measure_many(3, 100)
+        coincidence_circuit.stop_capture()
+        self.assertIsNone(coincidence_circuit.capture)
+
+        trace = read_trace(self.file_name)
+        self.assertEqual(trace.name, 'coincidence circuit')
+        written = b''.join(event.data for event in trace.of_kind(WRITE))
+        self.assertIn(b'MEASURE\n', written)
+        self.assertIn(b'BINARY\n', written)
+        self.assertTrue(trace.of_kind(DATA))
+        self.assertTrue(all(event.data.endswith(b'\r\n') for event in trace.of_kind(LINE)))
+        times = [event.time for event in trace.events]
+        self.assertEqual(times, sorted(times))
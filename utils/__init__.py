@@ -4,3 +4,12 @@ from os.path import abspath, dirname, join
 DELAY_STEPS: int = 2 ** 8 - 1
 # File containing the calibration data.
 DELAY_LINE_CALIBRATION_FILE = abspath(join(dirname(__file__), '../data/calibration/delay_lines.csv'))
+# Folder containing the cached delay line calibrations.
+DELAY_LINE_CALIBRATION_CACHE = abspath(join(dirname(__file__), '../data/calibration/.cache'))
+# Version of the calibration cache, increment it when the calibration procedure changes.
+DELAY_LINE_CALIBRATION_VERSION = 1
+# Scans of the pump polarisation and of the S/P ratio of the coincidences as a function of the BBO tip-tilt.
+TIP_TILT_POLARISATION_FILE = abspath(join(dirname(__file__), '../tip_pol.csv'))
+TIP_TILT_COINCIDENCES_FILE = abspath(join(dirname(__file__), '../data/tip_tilt/coincidences.csv'))
+# Folder containing the named configurations of the delay lines, see `utils.configurations`.
+CONFIGURATIONS_DIRECTORY = abspath(join(dirname(__file__), '../data/configurations'))
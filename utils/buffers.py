@@ -0,0 +1,95 @@
+"""
+Growable buffers for data of which the final size is not known in advance.
+"""
+from typing import Dict, Iterator
+
+import numpy as np
+
+
+class ColumnBuffer:
+    """
+    Stores rows of data column by column. Each column is a NumPy array that doubles in size when it is full, such that
+    appending a row takes amortised constant time and the columns can always be viewed without copying.
+    """
+
+    def __init__(self, columns: Dict[str, np.dtype], capacity: int = 1024):
+        """
+        :param columns: the name and data type of each column.
+        :param capacity: the initial number of rows that fit in the buffer.
+        """
+        self._columns = {name: np.empty(capacity, dtype=dtype) for name, dtype in columns.items()}
+        self._length = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        """
+        :return: a view of the filled part of a column.
+        """
+        return self._columns[name][:self._length]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._columns)
+
+    @property
+    def capacity(self) -> int:
+        return len(next(iter(self._columns.values())))
+
+    def _reserve(self, length: int):
+        """
+        Makes sure the buffer can hold at least `length` rows.
+        """
+        if length <= self.capacity:
+            return
+        capacity = max(length, 2 * self.capacity)
+        for name, column in self._columns.items():
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self._length] = column[:self._length]
+            self._columns[name] = grown
+
+    def append(self, **values):
+        """
+        Appends a single row, a value must be given for every column.
+        """
+        self._reserve(self._length + 1)
+        for name, column in self._columns.items():
+            column[self._length] = values[name]
+        self._length += 1
+
+    def extend(self, **values: np.ndarray):
+        """
+        Appends several rows at once, an equally long array must be given for every column.
+        """
+        length = len(values[next(iter(self._columns))])
+        self._reserve(self._length + length)
+        for name, column in self._columns.items():
+            column[self._length:self._length + length] = values[name]
+        self._length += length
+
+    def clear(self):
+        self._length = 0
+
+    def to_dict(self) -> Dict[str, np.ndarray]:
+        """
+        :return: a copy of the filled part of each column.
+        """
+        return {name: self[name].copy() for name in self._columns}
+
+    def to_records(self) -> np.ndarray:
+        """
+        :return: a copy of the filled part of the columns as a structured array, with a field per column.
+        """
+        records = np.empty(self._length, dtype=[(name, column.dtype) for name, column in self._columns.items()])
+        for name in self._columns:
+            records[name] = self[name]
+        return records
+
+    def to_array(self, dtype=np.float64) -> np.ndarray:
+        """
+        :return: the data as an array of shape (columns, rows).
+        """
+        array = np.empty((len(self._columns), self._length), dtype=dtype)
+        for i, name in enumerate(self._columns):
+            array[i] = self[name]
+        return array
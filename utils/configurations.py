@@ -0,0 +1,117 @@
+"""
+Named configurations of the delay lines. A configuration stores the steps of every delay line as JSON, along with
+metadata on how the steps were found, e.g. by `measure.schemes.auto_alignment.AutoAlignment`. Schemes load the steps of
+a configuration when they are created, rather than having them copied into their source by hand.
+
+Example:
+    steps = {DelayLines.CA: 37, DelayLines.WA: 86, DelayLines.CB: 29, DelayLines.WB: 76}
+    save_configuration('aligned', steps, note='Aligned by hand')
+    # The default steps are used if there is no configuration with that name.
+    steps = load_steps('aligned', default=steps)
+"""
+import json
+import os
+from datetime import datetime
+from glob import glob
+from os.path import basename, join, splitext
+from typing import Dict, List, Optional
+
+import numpy as np
+from loguru import logger
+
+from utils import CONFIGURATIONS_DIRECTORY
+from utils.delays import DelayLines, validate_delay_steps
+
+# Name of the configuration that is written by the alignment and loaded by the schemes by default.
+DEFAULT_CONFIGURATION = 'aligned'
+
+Steps = Dict[DelayLines, int]
+
+
+def configuration_file(name: str, directory: Optional[str] = None) -> str:
+    """
+    :param directory: the folder of the configurations, CONFIGURATIONS_DIRECTORY by default.
+    :return: the file a configuration is stored in.
+    """
+    return join(CONFIGURATIONS_DIRECTORY if directory is None else directory, f'{name}.json')
+
+
+def available_configurations(directory: Optional[str] = None) -> List[str]:
+    """
+    :return: the names of the stored configurations, sorted.
+    """
+    files = glob(configuration_file('*', directory))
+    return sorted(splitext(basename(file_name))[0] for file_name in files)
+
+
+def _json_value(value):
+    """
+    Converts numpy scalars and arrays in the metadata to values that can be stored as JSON.
+    """
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def save_configuration(name: str, steps: Steps, directory: Optional[str] = None, **metadata) -> str:
+    """
+    Stores the steps of all delay lines under a name, replacing the configuration with that name if it exists.
+    :param steps: the steps of every delay line.
+    :param metadata: additional information on the configuration, e.g. the scheme that determined the steps.
+    :return: the file the configuration was stored in.
+    :raises ValueError: if steps are missing or out of range.
+    """
+    missing = [line.name for line in DelayLines if line not in steps]
+    if missing:
+        raise ValueError(f"The configuration lacks the steps of {', '.join(missing)}.")
+
+    contents = {
+        'steps':   {line.name: validate_delay_steps(steps[line]) for line in DelayLines},
+        'created': datetime.now().isoformat(timespec='seconds'),
+        **{key: _json_value(value) for key, value in metadata.items()},
+    }
+    file_name = configuration_file(name, directory)
+    os.makedirs(os.path.dirname(file_name), exist_ok=True)
+    with open(file_name, 'w') as file:
+        json.dump(contents, file, indent=4)
+    logger.info(f"Stored configuration {name}: "
+                f"{', '.join(f'{line} = {value}' for line, value in contents['steps'].items())}.")
+    return file_name
+
+
+def load_configuration(name: str, directory: Optional[str] = None) -> dict:
+    """
+    :return: the contents of a configuration, with the steps by delay line under 'steps'.
+    :raises FileNotFoundError: if there is no configuration with that name.
+    """
+    with open(configuration_file(name, directory)) as file:
+        contents = json.load(file)
+    contents['steps'] = {DelayLines[line]: validate_delay_steps(value) for line, value in contents['steps'].items()}
+    return contents
+
+
+def load_steps(name: Optional[str], default: Steps, directory: Optional[str] = None) -> Steps:
+    """
+    Loads the steps of a configuration, falling back to default steps if it does not exist.
+    :param name: the name of the configuration, None for the default steps.
+    :param default: the steps to use without a configuration.
+    :return: the steps of every delay line.
+    """
+    if name is None:
+        return dict(default)
+    try:
+        steps = load_configuration(name, directory)['steps']
+    except FileNotFoundError:
+        logger.warning(f"There is no configuration {name}, using the default steps of the delay lines.")
+        return dict(default)
+    return {**default, **steps}
+
+
+def apply_steps(coincidence_circuit, steps: Steps):
+    """
+    Sets the delay lines of a coincidence circuit to the steps of a configuration.
+    """
+    for line in DelayLines:
+        coincidence_circuit.set_delay(steps[line], line)
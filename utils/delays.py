@@ -2,14 +2,18 @@
 Written by:
     Julian van Doorn <j.c.b.van.doorn@umail.leidenuniv.nl>
 """
+import hashlib
+import os
 from enum import Enum, auto
 from functools import lru_cache
+from os.path import join
 from typing import Tuple, overload
 
 import numpy as np
 from loguru import logger
 
-from utils import DELAY_LINE_CALIBRATION_FILE, DELAY_STEPS
+from utils import (DELAY_LINE_CALIBRATION_CACHE, DELAY_LINE_CALIBRATION_FILE, DELAY_LINE_CALIBRATION_VERSION,
+                   DELAY_STEPS)
 
 
 @overload
@@ -35,6 +39,94 @@ def validate_delay_steps(steps):
     return steps
 
 
+def fit_calibration(calibration_data: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Performs a weighted linear fit of the delay versus the steps for all delay lines at once. The normal equations of
+    all lines are stacked and solved in a single call, which gives the same result as a weighted `np.polyfit` per line.
+    :param calibration_data: the calibration data, with the columns as in the calibration file.
+    :return: a tuple with the optimal values as a 2xN matrix (slope, offset) and the full covariance matrices as an
+        Nx2x2 array, where N is the number of delay lines.
+    """
+    steps = calibration_data[:, 0]
+    delays = calibration_data[:, 1::2]
+    weights = np.square(1 / calibration_data[:, 2::2])
+
+    design = np.stack((steps, np.ones_like(steps)), axis=1)
+    # The weighted normal equations (A^T W A) p = A^T W y for every delay line.
+    normal = np.einsum('nk,ni,nj->kij', weights, design, design)
+    projection = np.einsum('nk,ni,nk->ki', weights, design, delays)
+    popt = np.linalg.solve(normal, projection[..., np.newaxis])[..., 0]
+
+    # Scale the covariance with the reduced chi squared, as np.polyfit does.
+    residuals = delays - design @ popt.T
+    chi_squared = np.sum(weights * np.square(residuals), axis=0)
+    pcov = np.linalg.inv(normal) * (chi_squared / (len(steps) - 2))[:, np.newaxis, np.newaxis]
+    return popt.T, pcov
+
+
+def _calibration_cache_file(contents: bytes) -> str:
+    """
+    :return: the cache file for calibration data with the specified contents.
+    """
+    key = hashlib.sha256(contents + str(DELAY_LINE_CALIBRATION_VERSION).encode()).hexdigest()[:16]
+    return join(DELAY_LINE_CALIBRATION_CACHE, f'delay_lines-v{DELAY_LINE_CALIBRATION_VERSION}-{key}.npz')
+
+
+@lru_cache(maxsize=1)
+def load_calibration() -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Loads the calibration of the delay lines, see `fit_calibration`. The fit is cached on disk, keyed by the contents
+    of the calibration file and the version of the calibration procedure. Every process thus only fits the calibration
+    data once after the calibration file has changed.
+    """
+    with open(DELAY_LINE_CALIBRATION_FILE, 'rb') as file:
+        contents = file.read()
+    cache_file = _calibration_cache_file(contents)
+
+    if os.path.exists(cache_file):
+        logger.debug(f'Loading delay line calibration from {cache_file}.')
+        with np.load(cache_file) as cache:
+            return cache['popt'], cache['pcov']
+
+    logger.info('Calculating delay line calibration data.')
+    logger.debug(f'Reading calibration data from {DELAY_LINE_CALIBRATION_FILE}.')
+    calibration_data: np.ndarray = np.loadtxt(DELAY_LINE_CALIBRATION_FILE, delimiter=',', skiprows=1)
+    popt, pcov = fit_calibration(calibration_data)
+
+    try:
+        os.makedirs(DELAY_LINE_CALIBRATION_CACHE, exist_ok=True)
+        np.savez(cache_file, popt=popt, pcov=pcov, version=DELAY_LINE_CALIBRATION_VERSION)
+    except OSError as error:
+        logger.warning(f'Could not cache the delay line calibration: {error}')
+    return popt, pcov
+
+
+def append_calibration(rows: np.ndarray):
+    """
+    Appends measurements to the calibration file. The values are aligned with the columns of the header.
+    :param rows: an array with a row for every measurement and the columns as in the calibration file.
+    """
+    with open(DELAY_LINE_CALIBRATION_FILE, 'r+') as file:
+        contents = file.read()
+        widths = [len(column) for column in contents.splitlines()[0].split(',')]
+        if not contents.endswith('\n'):
+            file.write('\n')
+        for row in np.atleast_2d(rows):
+            values = [str(int(row[0]))] + [f'{value:g}' for value in row[1:]]
+            file.write(','.join(value.ljust(width) for value, width in zip(values, widths)).rstrip() + '\n')
+
+    # Make sure the new calibration is used from now on.
+    reload_calibration()
+
+
+def reload_calibration():
+    """
+    Clears the in-process caches, such that the calibration file is read again.
+    """
+    load_calibration.cache_clear()
+    DelayLines._calibration.cache_clear()
+
+
 class DelayLines(Enum):
     """
     Provides an enum with the delay lines in our coincidence circuit. The delay lines are calibrated at run time with
@@ -65,27 +157,12 @@ class DelayLines(Enum):
     @lru_cache(maxsize=1)
     def _calibration(cls) -> Tuple[np.ndarray, np.ndarray]:
         """
-        Calculates the calibration data for the delay lines. The calibration data is a 2x4 matrix. The first row
-        contains the slope of the delay. The second row contains the minimum delay.
+        Returns the calibration data for the delay lines. The calibration data is a 2x4 matrix. The first row
+        contains the slope of the delay. The second row contains the minimum delay. The second element of the tuple
+        contains the variances in the same layout.
         """
-        logger.info('Calculating delay line calibration data.')
-        logger.debug(f'Reading calibration data from {DELAY_LINE_CALIBRATION_FILE}.')
-        calibration_data: np.ndarray = np.loadtxt(DELAY_LINE_CALIBRATION_FILE, delimiter=',', skiprows=1)
-
-        steps = calibration_data[:, 0]
-        delays = calibration_data[:, 1::2]
-        sigmas = calibration_data[:, 2::2]
-        weights = 1 / sigmas
-
-        # Create an empty array for the optimal values.
-        popt = np.empty((2, len(cls)))
-        pcov = np.empty((2, 2, len(cls)))
-        # We use a for-loop to get around the issue that polyfit does not accept a 2D-weight array.
-        for i in range(len(cls)):
-            # noinspection PyTupleAssignmentBalance
-            popt[:, i], pcov[:, :, i] = np.polyfit(steps, delays[:, i], 1, w=weights[:, i], cov=True)
-        pcov = np.diagonal(pcov).T
-        return popt, pcov
+        popt, pcov = load_calibration()
+        return popt, np.diagonal(pcov, axis1=1, axis2=2).T
 
     def __str__(self):
         """
@@ -126,9 +203,14 @@ class DelayLines(Enum):
         ...
 
     def calculate_delays_std(self, steps):
+        """
+        Calculates the error in the delay (in ns) for a given number of steps, including the correlation between the
+        delay step and the minimum delay.
+        """
         steps = validate_delay_steps(steps)
         return np.sqrt(
             self.delay_step_cov * np.square(steps) +
+            2 * self.covariance[0, 1] * steps +
             self.minimum_delay_cov
         )
 
@@ -185,3 +267,10 @@ class DelayLines(Enum):
         :return: the delay step cov in ns.
         """
         return self._calibration()[1][0, self.index]
+
+    @property
+    def covariance(self) -> np.ndarray:
+        """
+        :return: the full 2x2 covariance matrix of the delay step and the minimum delay.
+        """
+        return load_calibration()[1][self.index]
@@ -0,0 +1,179 @@
+"""
+Robust curve fitting for the analysis scripts. A nonlinear fit from a single fixed initial guess easily converges to a
+local minimum or not at all. Here many initial guesses are scored at once (the model is evaluated for all of them in a
+single vectorized call). Only the most promising few are refined with `curve_fit`. Every fit reports whether it
+converged and why not, such that failed fits are visible rather than silently turned into NaN.
+
+For oscillating models the initial frequencies and phases are taken from a Lomb-Scargle periodogram, which, unlike an
+FFT, handles unevenly spaced samples such as delays computed from the delay line calibration.
+"""
+import warnings
+from typing import Callable, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from utils.fringes import project_sine
+
+# Number of initial guesses that are refined with a nonlinear fit.
+REFINE = 3
+# Maximum number of function evaluations of each refinement.
+MAXFEV = 2000
+
+
+class FitResult(NamedTuple):
+    popt: np.ndarray
+    pcov: np.ndarray
+    # Whether the fit converged and passed validation.
+    success: bool
+    # Description of the outcome, e.g. why the fit failed.
+    status: str
+    # Sum of the squared (weighted) residuals.
+    cost: float
+
+    @property
+    def perr(self) -> np.ndarray:
+        """
+        The standard deviations of the parameters.
+        """
+        return np.sqrt(np.diag(self.pcov))
+
+
+def lomb_scargle(x: np.ndarray, y: np.ndarray, frequencies: np.ndarray) -> np.ndarray:
+    """
+    Computes the Lomb-Scargle periodogram of unevenly spaced samples for all frequencies at once.
+    :param x: the sample positions.
+    :param y: the sample values, the mean is subtracted.
+    :param frequencies: the (ordinary, not angular) frequencies to evaluate.
+    :return: the power at each frequency.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64) - np.mean(y)
+    omega = 2 * np.pi * np.asarray(frequencies, dtype=np.float64)[:, None]
+
+    # The time offset tau makes the sine and cosine terms orthogonal.
+    tau = np.arctan2(np.sum(np.sin(2 * omega * x), axis=1), np.sum(np.cos(2 * omega * x), axis=1))[:, None] / 2
+    argument = omega * x - tau
+    cos, sin = np.cos(argument), np.sin(argument)
+    return 0.5 * ((cos @ y) ** 2 / np.sum(cos ** 2, axis=1) + (sin @ y) ** 2 / np.sum(sin ** 2, axis=1))
+
+
+def frequency_grid(x: np.ndarray, oversampling: int = 5, maximum_frequency: Optional[float] = None) -> np.ndarray:
+    """
+    :return: a grid of frequencies suited for the periodogram of samples at the given positions. The lowest frequency
+        fits a single period in the span of the samples, the highest defaults to the mean Nyquist frequency.
+    """
+    x = np.sort(np.asarray(x, dtype=np.float64))
+    span = x[-1] - x[0]
+    if maximum_frequency is None:
+        maximum_frequency = 0.5 * (len(x) - 1) / span
+    return np.arange(1 / span, maximum_frequency, 1 / (oversampling * span))
+
+
+def sine_seeds(x: np.ndarray, y: np.ndarray, count: int = 5, frequencies: np.ndarray = None) -> np.ndarray:
+    """
+    Finds initial guesses for a sine `amplitude * sin(2 π frequency x + phase) + offset` from the highest peaks in the
+    Lomb-Scargle periodogram. The amplitude, phase and offset at each peak follow from a linear least-squares
+    projection.
+    :param count: the maximum number of seeds.
+    :param frequencies: the frequencies to search, see `frequency_grid` for the default.
+    :return: an array of shape (seeds, 4) with the frequency, phase, amplitude and offset of each seed, ordered by
+        decreasing power.
+    """
+    if frequencies is None:
+        frequencies = frequency_grid(x)
+    power = lomb_scargle(x, y, frequencies)
+
+    # Local maxima of the periodogram, the edges count if they are higher than their only neighbour.
+    padded = np.concatenate([[-np.inf], power, [-np.inf]])
+    peaks = np.flatnonzero((power >= padded[:-2]) & (power > padded[2:]))
+    peaks = peaks[np.argsort(power[peaks])[::-1][:count]]
+    seed_frequencies = frequencies[peaks]
+
+    offset, cosine, sine, _ = project_sine(x, y, 1 / seed_frequencies).T
+    # b cos(kx) + c sin(kx) = A sin(kx + phase) with A = hypot(b, c) and phase = atan2(b, c).
+    return np.stack([seed_frequencies, np.arctan2(cosine, sine), np.hypot(cosine, sine), offset], axis=1)
+
+
+def multi_start_fit(function: Callable, x: np.ndarray, y: np.ndarray, guesses: np.ndarray, sigma: np.ndarray = None,
+                    refine: int = REFINE, validate: Callable[[np.ndarray], Optional[str]] = None,
+                    maxfev: int = MAXFEV, **kwargs) -> FitResult:
+    """
+    Fits a model starting from many initial guesses. The guesses are scored by their residuals in a single call of the
+    model with broadcasted parameters, only the best few are refined with `curve_fit`.
+    :param function: the model `function(x, *parameters)`, it must broadcast over parameters of shape (guesses, 1).
+    :param x: the independent variable.
+    :param y: the data.
+    :param guesses: the initial guesses, shape (guesses, parameters).
+    :param sigma: the uncertainty of each data point, used to weigh the residuals.
+    :param refine: the number of guesses that are refined.
+    :param validate: optionally checks the parameters of a converged fit, returning a reason to reject it or None.
+    :param maxfev: the maximum number of function evaluations of each refinement.
+    :param kwargs: passed on to `curve_fit`, e.g. bounds.
+    :return: the best converged and valid fit. If there is none, the best initial guess is returned with NaN
+        covariance and a status explaining why every refinement failed.
+    """
+    from scipy.optimize import OptimizeWarning, curve_fit
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    guesses = np.atleast_2d(np.asarray(guesses, dtype=np.float64))
+    weights = 1 if sigma is None else 1 / np.asarray(sigma, dtype=np.float64)
+
+    with np.errstate(all='ignore'):
+        predictions = function(x[None, :], *guesses.T[:, :, None])
+        costs = np.sum(((y - predictions) * weights) ** 2, axis=-1)
+    costs = np.where(np.isfinite(costs), costs, np.inf)
+    order = np.argsort(costs)
+
+    best: Optional[FitResult] = None
+    failures = []
+    for index in order[:refine]:
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter('error', OptimizeWarning)
+                popt, pcov = curve_fit(function, x, y, p0=guesses[index], sigma=sigma, maxfev=maxfev, **kwargs)
+        except (RuntimeError, ValueError, OptimizeWarning) as error:
+            failures.append(f'guess {index}: {error}')
+            continue
+
+        reason = validate(popt) if validate is not None else None
+        if reason is not None:
+            failures.append(f'guess {index}: rejected, {reason}')
+            continue
+
+        cost = float(np.sum(((y - function(x, *popt)) * weights) ** 2))
+        if best is None or cost < best.cost:
+            best = FitResult(popt, pcov, True, f'converged from guess {index} of {len(guesses)}', cost)
+
+    if best is not None:
+        return best
+    initial = guesses[order[0]]
+    return FitResult(initial, np.full((len(initial), len(initial)), np.nan), False,
+                     'no fit converged: ' + '; '.join(failures), float(costs[order[0]]))
+
+
+def damped_sine(x: np.ndarray, frequency: float, phase: float, amplitude: float, offset: float,
+                damping: float) -> np.ndarray:
+    """
+    `amplitude * exp(-damping x) * sin(2 π frequency x + phase) + offset`
+    """
+    return amplitude * np.exp(-damping * x) * np.sin(2 * np.pi * frequency * x + phase) + offset
+
+
+def fit_damped_sine(x: np.ndarray, y: np.ndarray, seeds: int = 5, dampings: Sequence[float] = None,
+                    **kwargs) -> FitResult:
+    """
+    Fits `damped_sine` with initial frequencies, phases, amplitudes and offsets from the periodogram, each combined
+    with several dampings.
+    :param seeds: the number of periodogram peaks that are used.
+    :param dampings: the initial dampings, by default none and a decay over the full and half the span of x.
+    :param kwargs: passed on to `multi_start_fit`.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    if dampings is None:
+        span = np.ptp(x)
+        dampings = [0, 1 / span, 2 / span]
+    sines = sine_seeds(x, y, seeds)
+    # Every combination of a sine seed and a damping, with the parameters in the order of `damped_sine`.
+    guesses = np.concatenate([np.column_stack([sines, np.full(len(sines), damping)]) for damping in dampings])
+    return multi_start_fit(damped_sine, x, y, guesses, **kwargs)
@@ -0,0 +1,204 @@
+"""
+Vectorized processing of CCD frames. Every function works on a stack of frames with shape (frames, pixels), a single
+frame of shape (pixels,) is treated as a stack of one. Most functions accept an optional `out` array, such that the
+results of a live acquisition can be written into preallocated buffers. `find_peaks`, `find_centroids` and
+`fringe_visibility` still allocate temporaries for every stack.
+"""
+from typing import Tuple
+
+import numpy as np
+
+from interface import CCDInterface
+
+PIXELS = CCDInterface.PIXELS
+
+
+def _as_stack(frames: np.ndarray) -> np.ndarray:
+    """
+    Makes sure that the frames have two dimensions: (frames, pixels).
+    """
+    frames = np.asarray(frames)
+    if frames.ndim == 1:
+        return frames[np.newaxis]
+    if frames.ndim != 2:
+        raise ValueError(f'Frames must be one or two dimensional, got {frames.ndim} dimensions.')
+    return frames
+
+
+def _output(out: np.ndarray, shape: Tuple[int, ...], dtype=np.float32) -> np.ndarray:
+    """
+    Returns `out` if it is given and has the correct shape, else a new array is allocated.
+    """
+    if out is None:
+        return np.empty(shape, dtype=dtype)
+    if out.shape != shape:
+        raise ValueError(f'Output array must have shape {shape}, was {out.shape}.')
+    return out
+
+
+def subtract_background(frames: np.ndarray, dark: np.ndarray = None, bias: np.ndarray = None,
+                        out: np.ndarray = None) -> np.ndarray:
+    """
+    Subtracts a dark frame and/or bias from each frame.
+    :param frames: the frames to correct.
+    :param dark: a dark frame of shape (pixels,), taken with the same integration time as the frames.
+    :param bias: a bias frame of shape (pixels,) or a scalar bias level.
+    :param out: optional output array of shape (frames, pixels).
+    :return: the corrected frames.
+    """
+    frames = _as_stack(frames)
+    out = _output(out, frames.shape)
+
+    # The dtype argument makes sure the subtraction is done in floating point, unsigned frames would wrap around.
+    if dark is None:
+        np.copyto(out, frames, casting='unsafe')
+    else:
+        np.subtract(frames, dark, out=out, dtype=out.dtype)
+    if bias is not None:
+        np.subtract(out, bias, out=out, dtype=out.dtype)
+    return out
+
+
+def bin_pixels(frames: np.ndarray, factor: int, out: np.ndarray = None) -> np.ndarray:
+    """
+    Sums groups of `factor` neighbouring pixels. Pixels that do not fill a complete group at the end of the frame are
+    discarded.
+    :param frames: the frames to bin.
+    :param factor: the number of pixels per bin.
+    :param out: optional output array of shape (frames, pixels // factor).
+    :return: the binned frames.
+    """
+    frames = _as_stack(frames)
+    bins = frames.shape[1] // factor
+    out = _output(out, (frames.shape[0], bins))
+
+    grouped = frames[:, :bins * factor].reshape(frames.shape[0], bins, factor)
+    return np.sum(grouped, axis=2, out=out, dtype=out.dtype)
+
+
+def find_peaks(frames: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    """
+    Finds the position of the maximum of each frame with sub-pixel precision, by fitting a parabola through the
+    maximum and its two neighbours.
+    :param frames: the frames to find the peaks in.
+    :param out: optional output array of shape (frames,).
+    :return: the (fractional) pixel position of the peak in each frame.
+    """
+    frames = _as_stack(frames)
+    out = _output(out, frames.shape[:1], dtype=np.float64)
+
+    rows = np.arange(frames.shape[0])
+    index = np.argmax(frames, axis=1)
+    # Peaks on the edge of the frame cannot be interpolated, the neighbours are clipped to the frame instead.
+    left = frames[rows, np.maximum(index - 1, 0)].astype(np.float64)
+    centre = frames[rows, index].astype(np.float64)
+    right = frames[rows, np.minimum(index + 1, frames.shape[1] - 1)].astype(np.float64)
+
+    curvature = left - 2 * centre + right
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shift = np.where(curvature < 0, 0.5 * (left - right) / curvature, 0)
+    np.add(index, shift, out=out)
+    return out
+
+
+def find_centroids(frames: np.ndarray, threshold: float = 0, out: np.ndarray = None) -> np.ndarray:
+    """
+    Calculates the intensity weighted centroid of each frame. Only the intensity above the threshold is taken into
+    account, which makes the centroid insensitive to a constant background.
+    :param frames: the frames to find the centroids of.
+    :param threshold: the intensity that is subtracted before weighing, negative values are clipped to zero.
+    :param out: optional output array of shape (frames,).
+    :return: the (fractional) pixel position of the centroid of each frame, NaN if a frame has no signal.
+    """
+    frames = _as_stack(frames)
+    out = _output(out, frames.shape[:1], dtype=np.float64)
+
+    weights = np.subtract(frames, threshold, dtype=np.float64)
+    np.maximum(weights, 0, out=weights)
+    # A matrix-vector product with the pixel positions computes all first moments at once.
+    moments = weights @ np.arange(frames.shape[1], dtype=np.float64)
+    totals = weights.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        np.divide(moments, totals, out=out)
+    out[totals == 0] = np.nan
+    return out
+
+
+def fringe_visibility(frames: np.ndarray, minimum_period: float = 2,
+                      window: bool = True) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Determines the visibility of the fringes in each frame from its spectrum. The frame is modelled as
+    `I(x) = I_0 (1 + V cos(2 π x / period + phase))`, the visibility is then the amplitude of the dominant non-zero
+    frequency relative to the mean intensity.
+    :param frames: the frames to analyse.
+    :param minimum_period: the shortest fringe period (in pixels) that is considered.
+    :param window: if True a Hann window is applied to reduce spectral leakage.
+    :return: a tuple with the visibility, the fringe period in pixels and the phase of each frame.
+    """
+    frames = _as_stack(frames).astype(np.float64)
+    pixels = frames.shape[1]
+
+    if window:
+        taper = np.hanning(pixels)
+        spectrum = np.fft.rfft(frames * taper, axis=1)
+        # Normalise with the sum of the window rather than the number of pixels.
+        norm = taper.sum()
+    else:
+        spectrum = np.fft.rfft(frames, axis=1)
+        norm = pixels
+
+    frequencies = np.fft.rfftfreq(pixels)
+    valid = (frequencies > 0) & (frequencies <= 1 / minimum_period)
+    # Only search in the valid part of the spectrum, the index is then shifted back.
+    offset = np.argmax(valid)
+    index = offset + np.argmax(np.abs(spectrum[:, valid]), axis=1)
+
+    rows = np.arange(frames.shape[0])
+    mean = np.abs(spectrum[:, 0]) / norm
+    amplitude = 2 * np.abs(spectrum[rows, index]) / norm
+    with np.errstate(divide='ignore', invalid='ignore'):
+        visibility = amplitude / mean
+    return visibility, 1 / frequencies[index], np.angle(spectrum[rows, index])
+
+
+class FrameProcessor:
+    """
+    Processes stacks of frames as they are acquired. The corrected and binned frames, the peaks and the centroids are
+    stored in buffers that are allocated once for the given stack size. The peak and centroid searches still allocate
+    temporaries for every stack.
+    """
+
+    def __init__(self, stack_size: int, pixels: int = PIXELS, dark: np.ndarray = None, bias: np.ndarray = None,
+                 binning: int = 1, threshold: float = 0):
+        """
+        :param stack_size: the number of frames in each stack.
+        :param pixels: the number of pixels per frame.
+        :param dark: an optional dark frame that is subtracted from every frame.
+        :param bias: an optional bias frame or level that is subtracted from every frame.
+        :param binning: the number of pixels that are binned together.
+        :param threshold: the threshold used for the centroids.
+        """
+        self.dark = None if dark is None else np.asarray(dark, dtype=np.float32)
+        self.bias = bias
+        self.binning = binning
+        self.threshold = threshold
+
+        self.corrected = np.empty((stack_size, pixels), dtype=np.float32)
+        self.binned = np.empty((stack_size, pixels // binning), dtype=np.float32)
+        self.peaks = np.empty(stack_size)
+        self.centroids = np.empty(stack_size)
+
+    def __call__(self, frames: np.ndarray) -> np.ndarray:
+        """
+        Processes a stack of frames, the results are stored in the `peaks` and `centroids` attributes.
+        :param frames: the stack of frames.
+        :return: the background subtracted and binned frames.
+        """
+        subtract_background(frames, self.dark, self.bias, out=self.corrected)
+        frames = self.corrected
+        if self.binning > 1:
+            frames = bin_pixels(frames, self.binning, out=self.binned)
+
+        find_peaks(frames, out=self.peaks)
+        find_centroids(frames, self.threshold, out=self.centroids)
+        return frames
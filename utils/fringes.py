@@ -0,0 +1,135 @@
+"""
+Extraction of interference fringes from scans of the interferometer. A scan is modelled as
+    `N(x) = offset + amplitude * cos(2 π x / period + phase)`,
+with x the position of the interferometer in steps. The period is estimated from a windowed FFT of the scan. The other
+parameters then follow from a linear least-squares projection onto a cosine and a sine of that period. This takes a
+single pass over the data, unlike an iterative nonlinear fit, and is fast enough to run after every point of a scan.
+"""
+from typing import NamedTuple
+
+import numpy as np
+
+# Factor by which the scan is zero-padded before the FFT, which interpolates the spectrum between its bins.
+PADDING = 8
+# Number of periods around the FFT estimate for which the least-squares projection is computed.
+REFINEMENT_CANDIDATES = 21
+
+
+class Fringe(NamedTuple):
+    """
+    The parameters of the fringes in a scan, the period is in the same unit as the positions.
+    """
+    period: float
+    phase: float
+    visibility: float
+    offset: float
+    amplitude: float
+    # Root mean square of the residuals of the model.
+    residual: float
+
+
+def fft_period(positions: np.ndarray, counts: np.ndarray, minimum_period: float = 2., window: bool = True) -> float:
+    """
+    Estimates the fringe period from the dominant frequency in the spectrum of a scan. The positions must be
+    (approximately) evenly spaced.
+    :param positions: the position of each point of the scan.
+    :param counts: the counts at each point of the scan.
+    :param minimum_period: the shortest period (in units of the positions) that is considered.
+    :param window: if True a Hann window is applied to reduce spectral leakage.
+    :return: the estimated period, or NaN if the scan is too short.
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    if len(counts) < 4:
+        return np.nan
+    spacing = (positions[-1] - positions[0]) / (len(positions) - 1)
+
+    signal = counts - counts.mean()
+    if window:
+        signal = signal * np.hanning(len(signal))
+    size = PADDING * 2 ** int(np.ceil(np.log2(len(signal))))
+    magnitude = np.abs(np.fft.rfft(signal, size))
+    frequencies = np.fft.rfftfreq(size, abs(spacing))
+
+    # The lowest frequencies are excluded, at least a single period should fit in the scan.
+    valid = (frequencies >= 1 / (len(counts) * abs(spacing))) & (frequencies <= 1 / minimum_period)
+    if not np.any(valid):
+        return np.nan
+    index = np.argmax(valid) + np.argmax(magnitude[valid])
+
+    # Parabolic interpolation of the peak refines the frequency beyond the (padded) bin spacing.
+    if 0 < index < len(magnitude) - 1:
+        left, centre, right = magnitude[index - 1:index + 2]
+        denominator = left - 2 * centre + right
+        shift = 0.5 * (left - right) / denominator if denominator != 0 else 0.
+    else:
+        shift = 0.
+    frequency = (index + shift) * frequencies[1]
+    return 1 / frequency
+
+
+def project_sine(positions: np.ndarray, counts: np.ndarray, periods) -> np.ndarray:
+    """
+    Projects the scan onto a constant, a cosine and a sine of each given period by linear least squares.
+    :param positions: the position of each point of the scan.
+    :param counts: the counts at each point of the scan.
+    :param periods: one or more candidate periods.
+    :return: an array of shape (periods, 4) with the offset, the cosine and sine coefficients and the root mean square
+        of the residuals for each period.
+    """
+    positions = np.asarray(positions, dtype=np.float64)
+    counts = np.asarray(counts, dtype=np.float64)
+    periods = np.atleast_1d(np.asarray(periods, dtype=np.float64))
+
+    argument = 2 * np.pi * positions[None, :] / periods[:, None]
+    # The design matrices of all periods, shape (periods, points, 3).
+    design = np.stack([np.ones_like(argument), np.cos(argument), np.sin(argument)], axis=-1)
+    normal = np.einsum('mni,mnj->mij', design, design)
+    projection = np.einsum('mni,n->mi', design, counts)
+    coefficients = np.linalg.solve(normal, projection[..., None])[..., 0]
+
+    residuals = counts[None, :] - np.einsum('mni,mi->mn', design, coefficients)
+    rms = np.sqrt(np.mean(residuals ** 2, axis=1))
+    return np.concatenate([coefficients, rms[:, None]], axis=1)
+
+
+def extract_fringe(positions: np.ndarray, counts: np.ndarray, minimum_period: float = 2., period: float = None,
+                   window: bool = True) -> Fringe:
+    """
+    Extracts the period, phase and visibility of the fringes in a scan. The FFT estimate of the period is refined by
+    projecting onto a small set of periods around it, all solved at once, and keeping the one with the smallest
+    residuals.
+    :param positions: the position of each point of the scan.
+    :param counts: the counts at each point of the scan.
+    :param minimum_period: the shortest period (in units of the positions) that is considered.
+    :param period: the period if it is already known, in which case only the projection is performed.
+    :param window: if True a Hann window is applied before the FFT.
+    :return: the fringe parameters, all NaN if the scan is too short.
+    """
+    positions = np.asarray(positions, dtype=np.float64)
+    if period is None:
+        period = fft_period(positions, counts, minimum_period, window)
+        if np.isnan(period):
+            return Fringe(*[np.nan] * 6)
+        # The FFT resolves frequencies up to about one bin of the unpadded spectrum, refine within that range.
+        span = abs(positions[-1] - positions[0])
+        resolution = 1 / span if span else 0.
+        frequencies = 1 / period + np.linspace(-0.5, 0.5, REFINEMENT_CANDIDATES) * resolution
+        candidates = 1 / frequencies[frequencies > 0]
+    else:
+        candidates = np.array([period])
+
+    results = project_sine(positions, counts, candidates)
+    best = np.argmin(results[:, 3])
+    offset, cosine, sine, residual = results[best]
+    amplitude = np.hypot(cosine, sine)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        visibility = amplitude / offset
+    return Fringe(period=candidates[best], phase=np.arctan2(-sine, cosine), visibility=visibility, offset=offset,
+                  amplitude=amplitude, residual=residual)
+
+
+def fringe_model(positions: np.ndarray, fringe: Fringe) -> np.ndarray:
+    """
+    :return: the counts predicted by the fringe parameters at the given positions.
+    """
+    return fringe.offset + fringe.amplitude * np.cos(2 * np.pi * np.asarray(positions) / fringe.period + fringe.phase)
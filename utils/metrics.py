@@ -0,0 +1,189 @@
+"""
+Lightweight metrics for the serial interfaces. Recording a metric only involves a few additions and a bisection, such
+that the metrics can be left enabled during measurements. The metrics can be exported in a human readable text format
+or in the Prometheus text exposition format.
+"""
+from bisect import bisect_left
+from typing import Dict, Iterable, List
+
+# Upper bounds (in s) of the latency histogram buckets, anything slower ends up in the overflow bucket.
+LATENCY_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1., 2., 5., 10., 30., 60.)
+
+
+class LatencyHistogram:
+    """
+    Histogram of latencies with fixed bucket bounds, along with the sum, minimum and maximum of all observations.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        # The last bucket counts everything that is slower than the largest bound.
+        self.counts: List[int] = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.
+        self.min = float('inf')
+        self.max = 0.
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else float('nan')
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimates a quantile as the upper bound of the bucket that contains it.
+        """
+        if not self.count:
+            return float('nan')
+        target = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return min(bound, self.max)
+        return self.max
+
+
+class CommandMetrics:
+    """
+    Collects metrics for a single serial device: the latency between sending a command and receiving the matching
+    reply per command type, the number of bytes sent and received and the number of lines that were discarded while
+    searching for a reply.
+    """
+
+    def __init__(self, device: str, buckets=LATENCY_BUCKETS):
+        self.device = device
+        self.buckets = tuple(buckets)
+        self.latencies: Dict[str, LatencyHistogram] = {}
+        self.commands: Dict[str, int] = {}
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.lines_received = 0
+        self.lines_discarded = 0
+
+    def record_command(self, command: str, size: int):
+        """
+        Records that a command of `size` bytes was sent.
+        """
+        self.commands[command] = self.commands.get(command, 0) + 1
+        self.bytes_sent += size
+
+    def record_line(self, size: int):
+        """
+        Records that a line of `size` bytes (including the EOL characters) was received.
+        """
+        self.lines_received += 1
+        self.bytes_received += size
+
+    def record_bytes(self, size: int):
+        """
+        Records that `size` bytes of binary data were received.
+        """
+        self.bytes_received += size
+
+    def record_discarded(self, lines: int = 1):
+        """
+        Records that lines were discarded because they did not match the expected reply.
+        """
+        self.lines_discarded += lines
+
+    def record_latency(self, command: str, seconds: float):
+        """
+        Records the time between sending a command and receiving its reply.
+        """
+        histogram = self.latencies.get(command)
+        if histogram is None:
+            histogram = self.latencies[command] = LatencyHistogram(self.buckets)
+        histogram.observe(seconds)
+
+    def reset(self):
+        self.__init__(self.device, self.buckets)
+
+    def to_text(self) -> str:
+        """
+        :return: a human readable summary of the metrics.
+        """
+        lines = [
+            f'Device: {self.device}',
+            f'  Bytes sent: {self.bytes_sent}',
+            f'  Bytes received: {self.bytes_received}',
+            f'  Lines received: {self.lines_received}',
+            f'  Lines discarded: {self.lines_discarded}',
+        ]
+        for command, count in sorted(self.commands.items()):
+            lines.append(f'  Command {command}: sent {count} times')
+        for command, histogram in sorted(self.latencies.items()):
+            lines.append(f'  Latency {command}: n={histogram.count}, mean={histogram.mean * 1e3:.3f} ms, '
+                         f'min={histogram.min * 1e3:.3f} ms, p50<={histogram.quantile(0.5) * 1e3:.3f} ms, '
+                         f'p95<={histogram.quantile(0.95) * 1e3:.3f} ms, max={histogram.max * 1e3:.3f} ms')
+        return '\n'.join(lines) + '\n'
+
+    def to_prometheus(self, prefix: str = 'arduino') -> str:
+        """
+        :return: the metrics in the Prometheus text exposition format, without HELP/TYPE headers.
+        """
+        device = f'device="{self.device}"'
+        lines = [
+            f'{prefix}_bytes_sent_total{{{device}}} {self.bytes_sent}',
+            f'{prefix}_bytes_received_total{{{device}}} {self.bytes_received}',
+            f'{prefix}_lines_received_total{{{device}}} {self.lines_received}',
+            f'{prefix}_lines_discarded_total{{{device}}} {self.lines_discarded}',
+        ]
+        for command, count in sorted(self.commands.items()):
+            lines.append(f'{prefix}_commands_total{{{device},command="{command}"}} {count}')
+        for command, histogram in sorted(self.latencies.items()):
+            labels = f'{device},command="{command}"'
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'{prefix}_command_latency_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_command_latency_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f'{prefix}_command_latency_seconds_sum{{{labels}}} {histogram.sum}')
+            lines.append(f'{prefix}_command_latency_seconds_count{{{labels}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+# Type and help of each metric family, used for the headers of the Prometheus export.
+PROMETHEUS_FAMILIES = {
+    'bytes_sent_total':         ('counter', 'Number of bytes sent to the device.'),
+    'bytes_received_total':     ('counter', 'Number of bytes received from the device.'),
+    'lines_received_total':     ('counter', 'Number of lines received from the device.'),
+    'lines_discarded_total':    ('counter', 'Number of received lines that did not match the expected reply.'),
+    'commands_total':           ('counter', 'Number of commands sent to the device.'),
+    'command_latency_seconds':  ('histogram', 'Time between sending a command and receiving the matching reply.'),
+}
+
+
+def export_metrics(file_name: str, metrics: Iterable[CommandMetrics], prometheus: bool = False,
+                   prefix: str = 'arduino'):
+    """
+    Writes the metrics of one or more devices to a file.
+    :param file_name: the file to write to.
+    :param metrics: the metrics of each device.
+    :param prometheus: if True the Prometheus text format is used, otherwise a human readable summary.
+    :param prefix: the prefix of the Prometheus metric names.
+    """
+    metrics = list(metrics)
+    with open(file_name, 'w') as file:
+        if not prometheus:
+            file.write('\n'.join(m.to_text() for m in metrics))
+            return
+
+        # Prometheus requires all samples of a metric family to be grouped below a single header.
+        samples = [line for m in metrics for line in m.to_prometheus(prefix).splitlines()]
+        for family, (kind, description) in PROMETHEUS_FAMILIES.items():
+            name = f'{prefix}_{family}'
+            file.write(f'# HELP {name} {description}\n')
+            file.write(f'# TYPE {name} {kind}\n')
+            for sample in samples:
+                sample_name = sample.split('{', 1)[0]
+                if sample_name == name or (kind == 'histogram' and sample_name.startswith(name + '_')):
+                    file.write(sample + '\n')
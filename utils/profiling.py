@@ -0,0 +1,263 @@
+"""
+Profiles where the time of a measurement goes. A `Profiler` splits a run into phases (see `BaseScheme.__call__`) and
+breaks the wall time of each phase down into device I/O, waiting for the replies to gates, deliberate waits and host
+compute. The serial interfaces report the time they spend reading and writing and sleeping to the active profiler, as
+well as the gate time they request, such that the time spent counting photons can be compared with the overhead.
+Timings that are nested, e.g. the reads while waiting for the reply to a gate, are only added to the outermost
+category.
+
+Only a single profiler is active at a time. When none is active, reporting costs a single global lookup.
+"""
+import json
+import threading
+import tracemalloc
+from contextlib import nullcontext
+from time import perf_counter
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+# Time spent in serial reads and writes, except for those while waiting for the reply to a gate.
+IO = 'io'
+# Time spent waiting for the reply to a gate, which mostly is the gate itself.
+GATE = 'gate'
+# Time spent in deliberate waits, such as letting the interferometer settle or the Arduino boot.
+WAIT = 'wait'
+# Categories that are reported by the devices, the remaining wall time of a phase is host compute.
+CATEGORIES = (IO, GATE, WAIT)
+
+_active: Optional['Profiler'] = None
+_null = nullcontext()
+
+
+class Phase:
+    """
+    The timings of a single phase of a run.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.wall = 0.
+        self.times: Dict[str, float] = {category: 0. for category in CATEGORIES}
+        # The gate time in s that was requested from the coincidence circuit during the phase.
+        self.counting = 0.
+        # The traced memory in bytes at the end of the phase and the peak during the phase, if memory is traced.
+        self.memory: Optional[int] = None
+        self.memory_peak: Optional[int] = None
+
+    @property
+    def compute(self) -> float:
+        """
+        The wall time that was not spent on the devices. Device time is summed over all threads, so with several
+        devices working in parallel this is a lower bound.
+        """
+        return max(0., self.wall - sum(self.times.values()))
+
+    def to_dict(self) -> dict:
+        result = {'name': self.name, 'wall': self.wall, **self.times, 'compute': self.compute,
+                  'counting': self.counting}
+        if self.memory is not None:
+            result.update({'memory': self.memory, 'memory_peak': self.memory_peak})
+        return result
+
+
+class _Timer:
+    """
+    Adds the time spent in a `with` block to a category of the current phase, unless the block is nested in another
+    timed block of the same thread.
+    """
+    __slots__ = ('profiler', 'category', 'start')
+
+    def __init__(self, profiler: 'Profiler', category: str):
+        self.profiler = profiler
+        self.category = category
+
+    def __enter__(self):
+        local = self.profiler._local
+        if getattr(local, 'timing', False):
+            self.start = None
+            return
+        local.timing = True
+        self.start = perf_counter()
+
+    def __exit__(self, *args):
+        if self.start is None:
+            return
+        self.profiler._local.timing = False
+        self.profiler.add(self.category, perf_counter() - self.start)
+
+
+class Profiler:
+    """
+    Records the phases of a run. The profiler receives the device timings while it is active, see `activate`.
+    """
+
+    def __init__(self, trace_memory: bool = False):
+        """
+        :param trace_memory: whether to record the memory usage of every phase with tracemalloc. This slows down
+            allocations considerably, so it is off by default.
+        """
+        self.trace_memory = trace_memory
+        self.phases: List[Phase] = []
+        self._current: Optional[Phase] = None
+        self._lock = threading.Lock()
+        # Whether a thread is in a timed block, see `_Timer`.
+        self._local = threading.local()
+        self._started_tracing = False
+
+    def __enter__(self) -> 'Profiler':
+        self.activate()
+        return self
+
+    def __exit__(self, *args):
+        self.deactivate()
+
+    def activate(self):
+        """
+        Makes this the profiler that the devices report to.
+        """
+        global _active
+        if _active is not None and _active is not self:
+            logger.warning("Another profiler was active, it no longer receives the device timings.")
+        _active = self
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def deactivate(self):
+        global _active
+        if _active is self:
+            _active = None
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def phase(self, name: str) -> 'PhaseContext':
+        """
+        :return: a context manager that records the phase it wraps, e.g. `with profiler.phase('setup'): ...`.
+        """
+        return PhaseContext(self, name)
+
+    def add(self, category: str, seconds: float):
+        """
+        Adds time to a category of the current phase. Time outside of a phase is not recorded.
+        """
+        with self._lock:
+            if self._current is not None:
+                self._current.times[category] += seconds
+
+    def add_counting(self, seconds: float):
+        """
+        Adds gate time that was requested from a coincidence circuit to the current phase.
+        """
+        with self._lock:
+            if self._current is not None:
+                self._current.counting += seconds
+
+    def timed(self, category: str) -> _Timer:
+        return _Timer(self, category)
+
+    def totals(self) -> Dict[str, float]:
+        """
+        :return: the wall, device, compute and counting time summed over all phases.
+        """
+        totals = {key: 0. for key in ('wall',) + CATEGORIES + ('compute', 'counting')}
+        for phase in self.phases:
+            totals['wall'] += phase.wall
+            for category in CATEGORIES:
+                totals[category] += phase.times[category]
+            totals['compute'] += phase.compute
+            totals['counting'] += phase.counting
+        return totals
+
+    def to_dict(self) -> dict:
+        return {'totals': self.totals(), 'phases': [phase.to_dict() for phase in self.phases]}
+
+    def save(self, file_name: str):
+        """
+        Writes the profile as JSON.
+        """
+        with open(file_name, 'w') as file:
+            json.dump(self.to_dict(), file, indent=1)
+
+    def summary(self) -> str:
+        """
+        :return: a short summary of where the wall time went, grouped by phase name.
+        """
+        totals = self.totals()
+        wall = totals['wall'] or float('nan')
+        if totals['counting'] > totals['wall']:
+            # With simulated devices in virtual time the gates take no wall time, so the counting is not part of it.
+            breakdown = (f"{totals['wall']:.3f} s in total, plus {totals['counting']:.3f} s of simulated gate time "
+                         f"counting photons.")
+        else:
+            breakdown = (f"{totals['wall']:.3f} s in total, of which {totals['counting']:.3f} s "
+                         f"({totals['counting'] / wall:.0%}) counting photons and "
+                         f"{totals['wall'] - totals['counting']:.3f} s overhead.")
+        lines = [f"{breakdown} Device I/O {totals[IO]:.3f} s, gate replies {totals[GATE]:.3f} s, "
+                 f"waiting {totals[WAIT]:.3f} s, compute {totals['compute']:.3f} s."]
+        grouped: Dict[str, List[Phase]] = {}
+        for phase in self.phases:
+            grouped.setdefault(phase.name, []).append(phase)
+        for name, phases in grouped.items():
+            wall = sum(phase.wall for phase in phases)
+            line = f"{name:>10s}: {wall:8.3f} s"
+            if len(phases) > 1:
+                line += f" over {len(phases)} calls, slowest {max(phase.wall for phase in phases):.3f} s"
+            peaks = [phase.memory_peak for phase in phases if phase.memory_peak is not None]
+            if peaks:
+                line += f", memory peak {max(peaks) / 2 ** 20:.1f} MiB"
+            lines.append(line)
+        return '\n'.join(lines)
+
+
+class PhaseContext:
+    """
+    Records a phase of a run, see `Profiler.phase`.
+    """
+    __slots__ = ('profiler', 'phase', 'start')
+
+    def __init__(self, profiler: Profiler, name: str):
+        self.profiler = profiler
+        self.phase = Phase(name)
+
+    def __enter__(self) -> Phase:
+        if tracemalloc.is_tracing() and hasattr(tracemalloc, 'reset_peak'):
+            # Before Python 3.9 the peak can not be reset, it is then the peak since tracing started.
+            tracemalloc.reset_peak()
+        with self.profiler._lock:
+            self.profiler._current = self.phase
+        self.start = perf_counter()
+        return self.phase
+
+    def __exit__(self, *args):
+        self.phase.wall = perf_counter() - self.start
+        if tracemalloc.is_tracing():
+            self.phase.memory, self.phase.memory_peak = tracemalloc.get_traced_memory()
+        with self.profiler._lock:
+            self.profiler._current = None
+            self.profiler.phases.append(self.phase)
+
+
+def active() -> Optional[Profiler]:
+    """
+    :return: the profiler that the devices report to, if any.
+    """
+    return _active
+
+
+def timed(category: str):
+    """
+    :return: a context manager that adds the time spent in it to a category of the active profiler, if any.
+    """
+    profiler = _active
+    return _null if profiler is None else _Timer(profiler, category)
+
+
+def add_counting(seconds: float):
+    """
+    Reports gate time that was requested from a coincidence circuit to the active profiler, if any.
+    """
+    profiler = _active
+    if profiler is not None:
+        profiler.add_counting(seconds)
@@ -0,0 +1,129 @@
+"""
+Binary reply protocol of the coincidence circuit. In binary mode the firmware replies to counter requests with fixed
+width little-endian frames instead of decimal ASCII lines:
+
+    offset  size  field
+    0       2     magic (0x55AA, bytes AA 55)
+    2       2     sequence number, incremented for every frame and wrapping around at 2^16
+    4       12    counter 1, counter 2 and the coincidences as unsigned 32-bit integers
+    16      2     Fletcher-16 checksum of bytes 2 up to 16
+
+Frames can be decoded in bulk with `np.frombuffer`. The magic and checksum make it possible to resynchronise on the
+stream when it is interleaved with the ASCII chatter of verbose mode.
+"""
+from typing import Tuple
+
+import numpy as np
+
+COUNTER_FRAME_MAGIC = 0x55AA
+COUNTER_FRAME_DTYPE = np.dtype([
+    ('magic',    '<u2'),
+    ('sequence', '<u2'),
+    ('counts',   '<u4', (3,)),
+    ('checksum', '<u2'),
+])
+COUNTER_FRAME_SIZE = COUNTER_FRAME_DTYPE.itemsize
+
+_MAGIC_BYTES = COUNTER_FRAME_MAGIC.to_bytes(2, 'little')
+# The bytes covered by the checksum.
+_PAYLOAD = slice(2, 16)
+# Weights of each payload byte in the second Fletcher sum.
+_WEIGHTS = np.arange(_PAYLOAD.stop - _PAYLOAD.start, 0, -1)
+
+
+def fletcher16(payload: np.ndarray) -> np.ndarray:
+    """
+    Computes the Fletcher-16 checksum of each row of bytes.
+    :param payload: an array of shape (frames, bytes) with dtype uint8.
+    :return: the checksum of each row.
+    """
+    payload = payload.astype(np.int64)
+    # Closed form of the running sums, such that all rows are handled at once.
+    sum1 = payload.sum(axis=1) % 255
+    sum2 = (payload @ _WEIGHTS) % 255
+    return ((sum2 << 8) | sum1).astype(np.uint16)
+
+
+def encode_counter_frames(sequence, counts) -> bytes:
+    """
+    Encodes counter frames, as the firmware does.
+    :param sequence: the sequence number of each frame.
+    :param counts: an array of shape (frames, 3) with the counts.
+    :return: the encoded frames.
+    """
+    counts = np.atleast_2d(counts)
+    frames = np.zeros(len(counts), dtype=COUNTER_FRAME_DTYPE)
+    frames['magic'] = COUNTER_FRAME_MAGIC
+    frames['sequence'] = np.asarray(sequence) % 2 ** 16
+    frames['counts'] = counts
+    raw = frames.view(np.uint8).reshape(len(frames), COUNTER_FRAME_SIZE)
+    frames['checksum'] = fletcher16(raw[:, _PAYLOAD])
+    return frames.tobytes()
+
+
+def decode_counter_frames(data: bytes) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Decodes a block of consecutive frames without any resynchronisation.
+    :param data: the frames, the length must be a multiple of COUNTER_FRAME_SIZE.
+    :return: a tuple with the frames and a boolean array that indicates which frames are valid.
+    """
+    frames = np.frombuffer(data, dtype=COUNTER_FRAME_DTYPE)
+    raw = np.frombuffer(data, dtype=np.uint8).reshape(len(frames), COUNTER_FRAME_SIZE)
+    valid = (frames['magic'] == COUNTER_FRAME_MAGIC) & (fletcher16(raw[:, _PAYLOAD]) == frames['checksum'])
+    return frames, valid
+
+
+class CounterFrameDecoder:
+    """
+    Decodes a stream of counter frames that may be interleaved with other data. Bytes are fed to the decoder as they
+    arrive, complete frames can then be taken out. Consecutive frames are decoded at once, the decoder only falls back
+    to searching for the next magic when a frame is invalid.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        # The number of bytes that were skipped while searching for frames.
+        self.discarded = 0
+
+    def feed(self, data: bytes):
+        self.buffer += data
+
+    def missing(self) -> int:
+        """
+        :return: the number of bytes needed to complete the next frame.
+        """
+        return COUNTER_FRAME_SIZE - len(self.buffer) % COUNTER_FRAME_SIZE
+
+    def _discard(self, size: int):
+        del self.buffer[:size]
+        self.discarded += size
+
+    def decode(self) -> np.ndarray:
+        """
+        Takes all complete and valid frames out of the buffer.
+        :return: an array with COUNTER_FRAME_DTYPE.
+        """
+        decoded = []
+        while True:
+            start = self.buffer.find(_MAGIC_BYTES)
+            if start < 0:
+                # Keep the last byte, it could be the first half of the magic.
+                self._discard(max(len(self.buffer) - 1, 0))
+                break
+            self._discard(start)
+
+            complete = len(self.buffer) // COUNTER_FRAME_SIZE
+            if not complete:
+                break
+            frames, valid = decode_counter_frames(bytes(self.buffer[:complete * COUNTER_FRAME_SIZE]))
+            good = complete if valid.all() else int(np.argmin(valid))
+            decoded.append(frames[:good])
+            del self.buffer[:good * COUNTER_FRAME_SIZE]
+            if good == complete:
+                break
+            # Skip the magic of the invalid frame and search for the next one.
+            self._discard(1)
+
+        if not decoded:
+            return np.empty(0, dtype=COUNTER_FRAME_DTYPE)
+        return np.concatenate(decoded)
@@ -0,0 +1,169 @@
+"""
+Replays of captured serial sessions, see `Arduino.start_capture`. A replayed device checks the commands that are sent to
+it against the trace and answers with the lines and binary data that were read during the capture, either as fast as
+possible or at the speed at which they were received. Real lab sessions can so serve as deterministic fixtures for the
+parsing, scheme and storage code.
+
+Example:
+    with ReplayCoincidenceCircuit('session.trace') as coincidence_circuit:
+        counts = coincidence_circuit.measure(1)
+"""
+from time import perf_counter, sleep
+from typing import Optional, Tuple, Union
+
+from loguru import logger
+
+from interface import UNRESPONSIVE_DELAY, Arduino, CoincidenceCircuit, Interferometer
+from utils.trace import LINE, WRITE, Trace, TraceEvent, read_trace
+
+
+class ReplayPort:
+    """
+    Mixin that replaces the serial port of an Arduino by a captured trace. It should be placed before the Arduino class
+    in the bases of a class.
+
+    The replies are served in the order in which they were read during the capture. A line is never joined with the
+    next one, such that a read that timed out during the capture times out in the replay as well.
+    """
+
+    trace: Trace
+    # Replay speed relative to the capture, None replays as fast as possible.
+    speed: Optional[float]
+    # Whether a command that differs from the trace raises an error, rather than logging a warning.
+    strict: bool
+
+    def _load_trace(self, trace: Union[str, Trace], speed: Optional[float], strict: bool):
+        if speed is not None and speed <= 0:
+            raise ValueError(f'The replay speed must be positive, not {speed}.')
+        self.trace = read_trace(trace) if isinstance(trace, str) else trace
+        self.speed = speed
+        self.strict = strict
+
+        self._writes = self.trace.of_kind(WRITE)
+        # Whether the capture pinged the firmware, the replay does the same, see `Arduino.wait_until_ready`.
+        self._pinged = any(event.data == b'PING\n' for event in self._writes)
+        self._replies = []
+        for event in self.trace.events:
+            if event.kind == WRITE:
+                continue
+            self._replies.append(event)
+            # A line without end of line was cut short by a timeout, which is replayed as an empty read.
+            if event.kind == LINE and event.data and not event.data.endswith(b'\n'):
+                self._replies.append(TraceEvent(event.time, LINE, b''))
+        self._next_write = 0
+        self._next_reply = 0
+        self._remaining = b''
+        # The time in the trace and the time of the replay at which the last command was sent, the replies are
+        # delayed relative to it.
+        self._anchor: Tuple[float, float] = (0., perf_counter())
+
+    @property
+    def replayed(self) -> bool:
+        """
+        Whether all commands and replies of the trace have been replayed.
+        """
+        return (self._next_write == len(self._writes) and self._next_reply == len(self._replies)
+                and not self._remaining)
+
+    @property
+    def unresponsive_delay(self) -> float:
+        # The fixed delay for firmware that does not reply to pings is replayed at the replay speed as well.
+        return 0. if self.speed is None else UNRESPONSIVE_DELAY / self.speed
+
+    def open(self):
+        self.is_open = True
+        if self._next_write == 0:
+            self._anchor = (0., perf_counter())
+
+    def close(self):
+        self.is_open = False
+
+    def _reconfigure_port(self, *args, **kwargs):
+        pass
+
+    def flush(self):
+        pass
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        if self._next_write < len(self._writes):
+            expected = self._writes[self._next_write]
+            self._next_write += 1
+            self._anchor = (expected.time, perf_counter())
+            if data != expected.data:
+                self._mismatch(f'The {self.name} was sent {data!r}, but command {self._next_write} of the trace is '
+                               f'{expected.data!r}.')
+        else:
+            self._mismatch(f'The {self.name} was sent {data!r} after all {len(self._writes)} commands of the trace.')
+        return len(data)
+
+    def _mismatch(self, message: str):
+        if self.strict:
+            raise RuntimeError(message)
+        logger.warning(message)
+
+    def _wait_for(self, event: TraceEvent):
+        """
+        Waits until a reply is due, at the replay speed relative to the last command.
+        """
+        if self.speed is None:
+            return
+        trace_time, replay_time = self._anchor
+        delay = replay_time + (event.time - trace_time) / self.speed - perf_counter()
+        if delay > 0:
+            sleep(delay)
+
+    def read(self, size: int = 1) -> bytes:
+        data = b''
+        while len(data) < size:
+            if not self._remaining:
+                if self._next_reply == len(self._replies):
+                    if self.timeout is None:
+                        # The host waits for a reply that was not captured, which in a replay always indicates a bug.
+                        raise RuntimeError(f'The trace of the {self.name} has no more replies, reading would block '
+                                           f'forever.')
+                    break
+                event = self._replies[self._next_reply]
+                self._next_reply += 1
+                self._wait_for(event)
+                if not event.data:
+                    break
+                self._remaining = event.data
+            needed = size - len(data)
+            data += self._remaining[:needed]
+            self._remaining = self._remaining[needed:]
+        return data
+
+    @property
+    def in_waiting(self) -> int:
+        return len(self._remaining)
+
+    def reset_input_buffer(self):
+        # The trace only holds what the host read, the data that was discarded during the capture is not in it.
+        pass
+
+
+class ReplayCoincidenceCircuit(ReplayPort, CoincidenceCircuit):
+    def __init__(self, trace: Union[str, Trace], *args, speed: Optional[float] = None, strict: bool = True,
+                 port: str = 'replay', **kwargs):
+        """
+        :param trace: the trace file or a trace read with `utils.trace.read_trace`.
+        :param speed: the replay speed relative to the capture, e.g. 1 for real speed. By default, the replies are
+            served as fast as possible.
+        :param strict: whether a command that differs from the trace raises a RuntimeError, rather than a warning.
+        """
+        self._load_trace(trace, speed, strict)
+        kwargs.setdefault('supports_ping', None if self._pinged else False)
+        super().__init__(*args, port=port, **kwargs)
+
+
+class ReplayInterferometer(ReplayPort, Interferometer):
+    def __init__(self, trace: Union[str, Trace], *args, speed: Optional[float] = None, strict: bool = True,
+                 port: str = 'replay', **kwargs):
+        """
+        See `ReplayCoincidenceCircuit`.
+        """
+        self._load_trace(trace, speed, strict)
+        kwargs.setdefault('supports_ping', None if self._pinged else False)
+        # Nothing is powered in a replay, so the prompts of the interferometer are skipped.
+        Arduino.__init__(self, *args, name='interferometer', port=port, **kwargs)
@@ -0,0 +1,364 @@
+"""
+Simulated versions of the Arduinos, such that schemes, parsing and storage can be run and benchmarked without any
+hardware. The simulated devices emulate the serial protocol of the firmware and run in virtual time: a measurement of
+one second advances a virtual clock instead of blocking for a second.
+"""
+import tempfile
+import threading
+from contextlib import contextmanager
+from os.path import join
+from typing import Dict, Optional
+from unittest import mock
+
+import numpy as np
+
+from interface import Arduino, CoincidenceCircuit, Interferometer
+from utils.delays import DelayLines
+from utils.protocol import encode_counter_frames
+from utils.synthetic import accidental_coincidences, coincidence_window, delays_from_steps
+
+
+class VirtualClock:
+    """
+    A clock that only advances when it is told to.
+    """
+
+    def __init__(self, start: float = 0.):
+        self.now = start
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += seconds
+
+
+class SimulatedFirmware:
+    """
+    Emulates the firmware of an Arduino. Bytes written by the host are split into lines and processed as commands,
+    replies are buffered until the host reads them. Subclasses implement `process` to handle the commands.
+    """
+
+    EOL = b'\r\n'
+
+    def __init__(self, clock: VirtualClock = None, latency: float = 0., boot_time: float = 0.,
+                 latencies: Optional[Dict[str, float]] = None):
+        """
+        :param clock: the clock that is advanced by commands that take time, a new clock is created if not given.
+        :param latency: the time (in s) it takes to process any command, e.g. to model the serial round trip.
+        :param boot_time: the time (in s) it takes to boot after a reset, commands sent while booting are lost.
+        :param latencies: the time (in s) it takes to process specific commands, overriding `latency`. Numeric values
+            are looked up as `Arduino.ARGUMENT_COMMAND`, as in the metrics of the interface.
+        """
+        self.clock = clock if clock is not None else VirtualClock()
+        self.latency = latency
+        self.latencies = dict(latencies) if latencies else {}
+        self.boot_time = boot_time
+        # Older firmware can be emulated by disabling the replies to pings.
+        self.supports_ping = True
+        self.resets = 0
+        self._booted = self.clock.time()
+        self.verbose = False
+        # The last numeric value that was sent, the firmware uses this as the argument of the next command.
+        self.argument = 0
+
+        self._input = bytearray()
+        self._output = bytearray()
+        self._lock = threading.Lock()
+
+    @property
+    def in_waiting(self) -> int:
+        return len(self._output)
+
+    def reply(self, line):
+        """
+        Queues a line to be read by the host.
+        """
+        if isinstance(line, str):
+            line = line.encode()
+        self.queue_bytes(line + self.EOL)
+
+    def queue_bytes(self, data: bytes):
+        """
+        Queues raw data to be read by the host, e.g. binary counter frames.
+        """
+        self._output += data
+
+    def reset(self):
+        """
+        Emulates the reset of the Arduino when the serial port is opened.
+        """
+        with self._lock:
+            self._input.clear()
+            self._output.clear()
+        self.verbose = False
+        self.argument = 0
+        self.resets += 1
+        self._booted = self.clock.time() + self.boot_time
+
+    def write(self, data: bytes) -> int:
+        if self.clock.time() < self._booted:
+            return len(data)
+        with self._lock:
+            self._input += data
+            while b'\n' in self._input:
+                line, _, rest = self._input.partition(b'\n')
+                self._input = bytearray(rest)
+                line = line.decode().strip()
+                self.clock.sleep(self.command_latency(line))
+                self._process_line(line)
+        return len(data)
+
+    def command_latency(self, line: str) -> float:
+        """
+        :return: the time (in s) it takes to process a line.
+        """
+        if not self.latencies:
+            return self.latency
+        name = Arduino.ARGUMENT_COMMAND if line.lstrip('-').isdigit() else line
+        return self.latencies.get(name, self.latency)
+
+    def read(self, size: int = 1) -> bytes:
+        with self._lock:
+            data = bytes(self._output[:size])
+            del self._output[:size]
+        return data
+
+    def reset_input_buffer(self):
+        with self._lock:
+            self._output.clear()
+
+    def _process_line(self, line: str):
+        if self.verbose:
+            self.reply(f'Received command: {line}')
+        if line.lstrip('-').isdigit():
+            self.argument = int(line)
+        else:
+            self.process(line)
+
+    def process(self, command: str):
+        """
+        Processes a single (non-numeric) command.
+        """
+        if command == 'VERB':
+            self.verbose = not self.verbose
+        elif command == 'PING' and self.supports_ping:
+            self.reply('PONG')
+        elif self.verbose:
+            self.reply(f'Unknown command: {command}')
+
+
+class CountModel:
+    """
+    Model of the count rates of the setup. The coincidences follow the window shape that is used to fit the
+    WindowShiftEffect, on top of accidental coincidences from the single count rates. See `utils.synthetic` to
+    generate batches of runs without going through the firmware.
+    """
+
+    def __init__(self, rate1: float = 3e4, rate2: float = 3e5, pair_rate: float = 100., delay_offset: float = 0.,
+                 sigma: float = 1., seed: Optional[int] = None):
+        """
+        :param rate1: the single count rate on detector 1 in Hz.
+        :param rate2: the single count rate on detector 2 in Hz.
+        :param pair_rate: the rate of true coincidences in Hz when the delays are aligned.
+        :param delay_offset: the relative delay (in ns) between the lines at which the coincidences peak.
+        :param sigma: the width (in ns) of the edges of the coincidence window.
+        :param seed: the seed of the random number generator.
+        """
+        self.rate1 = rate1
+        self.rate2 = rate2
+        self.pair_rate = pair_rate
+        self.delay_offset = delay_offset
+        self.sigma = sigma
+        self.rng = np.random.default_rng(seed)
+
+    def expected(self, steps: Dict[DelayLines, int], gate: float) -> np.ndarray:
+        """
+        :param steps: the steps of each delay line.
+        :param gate: the gate time in s.
+        :return: the expected counts on counter 1, counter 2 and the coincidences.
+        """
+        relative_delay, window = delays_from_steps(steps)
+        overlap = coincidence_window(relative_delay, window, self.sigma, self.delay_offset)
+        accidentals = accidental_coincidences(self.rate1, self.rate2, window)
+        return gate * np.array([self.rate1, self.rate2, accidentals + self.pair_rate * overlap])
+
+    def sample(self, steps: Dict[DelayLines, int], gate: float) -> np.ndarray:
+        return self.rng.poisson(self.expected(steps, gate))
+
+
+class CoincidenceFirmware(SimulatedFirmware):
+    """
+    Emulates the firmware of the coincidence circuit: the delay lines and the counters.
+    """
+
+    def __init__(self, *args, model: CountModel = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.model = model if model is not None else CountModel()
+        self.steps = {line: 0 for line in DelayLines}
+        self.counters = np.zeros(3, dtype=np.int64)
+        self.registers = np.zeros(3, dtype=np.int64)
+        self._started = self.clock.time()
+        # Whether counter replies are sent as binary frames, along with the sequence number of the next frame. Older
+        # firmware can be emulated by disabling support for binary frames.
+        self.supports_binary = True
+        # Older firmware can also be emulated by disabling support for gates in ms.
+        self.supports_ms_gates = True
+        self.binary = False
+        self.sequence = 0
+
+    def reset(self):
+        super().reset()
+        self.steps = {line: 0 for line in DelayLines}
+        self.counters[:] = 0
+        self.registers[:] = 0
+        self._started = self.clock.time()
+        self.binary = False
+        self.sequence = 0
+
+    def reply_counts(self, counts: np.ndarray):
+        """
+        Replies with counts in either the ASCII or the binary format.
+        """
+        if self.binary:
+            self.queue_bytes(encode_counter_frames(self.sequence, counts))
+            self.sequence = (self.sequence + 1) % 2 ** 16
+        else:
+            self.reply(','.join(str(count) for count in counts))
+
+    def _accumulate(self):
+        """
+        Adds the counts since the last update to the counters.
+        """
+        now = self.clock.time()
+        self.counters += self.model.sample(self.steps, now - self._started)
+        self._started = now
+
+    def process(self, command: str):
+        if command.startswith('SD') and command[2:] in DelayLines.__members__:
+            self._accumulate()
+            self.steps[DelayLines[command[2:]]] = self.argument
+        elif command == 'MEASURE':
+            self.clock.sleep(self.argument)
+            self.reply_counts(self.model.sample(self.steps, self.argument))
+            self.counters[:] = 0
+            self._started = self.clock.time()
+        elif command == 'MEASUREMS' and self.supports_ms_gates:
+            self.clock.sleep(self.argument / 1000)
+            self.reply_counts(self.model.sample(self.steps, self.argument / 1000))
+            self.counters[:] = 0
+            self._started = self.clock.time()
+        elif command == 'CLEAR':
+            self.counters[:] = 0
+            self._started = self.clock.time()
+        elif command == 'SAVE':
+            self._accumulate()
+            self.registers[:] = self.counters
+        elif command == 'READ':
+            self.reply_counts(self.registers)
+        elif command == 'BINARY' and self.supports_binary:
+            self.binary = True
+            self.reply('BINARY OK')
+        elif command == 'ASCII' and self.supports_binary:
+            self.binary = False
+        else:
+            super().process(command)
+
+
+class InterferometerFirmware(SimulatedFirmware):
+    """
+    Emulates the firmware of the interferometer: every numeric value is a number of steps for the stepper motor.
+    """
+
+    # Time (in s) it takes the stepper motor to make a single step.
+    STEP_TIME = 0.005
+
+    def __init__(self, *args, step_time: float = STEP_TIME, **kwargs):
+        """
+        :param step_time: the time (in s) it takes the stepper motor to make a single step.
+        """
+        super().__init__(*args, **kwargs)
+        self.step_time = step_time
+        self.position = 0
+
+    def _process_line(self, line: str):
+        super()._process_line(line)
+        if line.lstrip('-').isdigit():
+            self.position += self.argument
+            self.clock.sleep(abs(self.argument) * self.step_time)
+
+
+class SimulatedPort:
+    """
+    Mixin that replaces the serial port of an Arduino by a simulated firmware. It should be placed before the
+    Arduino class in the bases of a class.
+    """
+
+    firmware: SimulatedFirmware
+
+    def open(self):
+        self.firmware.reset()
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def _reconfigure_port(self, *args, **kwargs):
+        pass
+
+    def flush(self):
+        pass
+
+    def write(self, data) -> int:
+        return self.firmware.write(bytes(data))
+
+    def read(self, size: int = 1) -> bytes:
+        data = self.firmware.read(size)
+        if len(data) < size and self.timeout is None:
+            # A real port without timeout would block forever, which in a simulation always indicates a bug.
+            raise RuntimeError(f'Reading from the simulated {self.name} would block forever.')
+        return data
+
+    @property
+    def in_waiting(self) -> int:
+        return self.firmware.in_waiting
+
+    def reset_input_buffer(self):
+        self.firmware.reset_input_buffer()
+
+
+class SimulatedCoincidenceCircuit(SimulatedPort, CoincidenceCircuit):
+    def __init__(self, *args, firmware: CoincidenceFirmware = None, port: str = 'simulated', **kwargs):
+        self.firmware = firmware if firmware is not None else CoincidenceFirmware()
+        # The simulated firmware replies to pings unless it emulates older firmware, which is detected.
+        kwargs.setdefault('supports_ping', None)
+        super().__init__(*args, port=port, **kwargs)
+
+
+class SimulatedInterferometer(SimulatedPort, Interferometer):
+    def __init__(self, *args, firmware: InterferometerFirmware = None, port: str = 'simulated', **kwargs):
+        self.firmware = firmware if firmware is not None else InterferometerFirmware()
+        kwargs.setdefault('supports_ping', None)
+        # The simulated stepper motor does not need to be powered off, so the prompts of the interferometer are skipped.
+        Arduino.__init__(self, *args, name='interferometer', port=port, **kwargs)
+
+
+@contextmanager
+def virtual_time(clock: VirtualClock):
+    """
+    Replaces the sleeps in the interface by the virtual clock.
+    """
+    with mock.patch('interface.sleep', clock.sleep):
+        yield clock
+
+
+@contextmanager
+def offline(clock: VirtualClock):
+    """
+    Runs schemes in virtual time, stores their data and the configurations of the delay lines in a temporary directory
+    and answers all prompts with enter.
+    """
+    with tempfile.TemporaryDirectory() as directory, virtual_time(clock), \
+            mock.patch('measure.scheme.DATA_DIRECTORY', directory), mock.patch('builtins.input', return_value=''), \
+            mock.patch('utils.configurations.CONFIGURATIONS_DIRECTORY', join(directory, 'configurations')):
+        yield directory
@@ -0,0 +1,149 @@
+"""
+Generates synthetic counter data of a photon-pair source, for any settings of the delay lines and the polarisers. The
+counts are drawn from Poisson distributions around the expected counts:
+    - the singles on counter 1 and counter 2,
+    - the true coincidences, shaped by the coincidence window as in `WindowShiftEffect._distribution` and modulated by
+      the polarisation correlations of a maximally entangled state for the Bell test,
+    - the accidental coincidences of the singles within the coincidence window.
+Everything is computed for whole batches of runs at once, such that millions of measurements can be generated per
+second to stress-test the analysis and the storage.
+"""
+from typing import Dict, Optional
+
+import numpy as np
+
+from utils.delays import DelayLines
+
+# Indices of the counters in the last axis of the generated data, the same order as the replies of the firmware.
+C1_INDEX = 0
+C2_INDEX = 1
+CO_INDEX = 2
+
+
+def coincidence_window(relative_delay, window, sigma: float = 1., delay_offset: float = 0.) -> np.ndarray:
+    """
+    The fraction of photon pairs that is counted as coincidence, the shape of `WindowShiftEffect._distribution`.
+    :param relative_delay: the delay (in ns) between the start of the windows of the two counters.
+    :param window: half the width (in ns) of the coincidence window.
+    :param sigma: the width (in ns) of the edges of the window.
+    :param delay_offset: the relative delay (in ns) at which the coincidences peak.
+    """
+    from scipy.special import erf
+
+    scale = np.sqrt(2 * np.pi) * sigma
+    shifted = np.asarray(relative_delay) - delay_offset
+    return 0.5 * (erf((shifted + window) / scale) - erf((shifted - window) / scale))
+
+
+def accidental_coincidences(rate1, rate2, window) -> np.ndarray:
+    """
+    :param rate1: the single count rate on detector 1 in Hz.
+    :param rate2: the single count rate on detector 2 in Hz.
+    :param window: half the width (in ns) of the coincidence window.
+    :return: the rate (in Hz) of uncorrelated photons that arrive within the full window, of width 2 * window.
+    """
+    return np.asarray(rate1) * rate2 * 2 * window * 1e-9
+
+
+def delays_from_steps(steps: Dict[DelayLines, np.ndarray]):
+    """
+    Converts the steps of the delay lines to the relative delay between the counters and the (half) window width.
+    :param steps: the steps of each delay line, scalars or arrays of the same shape.
+    :return: the relative delay and the window, in ns.
+    """
+    delay = {line: line.calculate_delays(np.asarray(steps[line])) for line in DelayLines}
+    relative_delay = delay[DelayLines.CA] - delay[DelayLines.CB]
+    window = 0.5 * ((delay[DelayLines.WA] - delay[DelayLines.CA]) + (delay[DelayLines.WB] - delay[DelayLines.CB]))
+    return relative_delay, np.maximum(window, 0)
+
+
+class PhotonPairSource:
+    """
+    Model of the photon-pair source and the detectors.
+    """
+
+    def __init__(self, rate1: float = 3e4, rate2: float = 3e5, pair_rate: float = 100., sigma: float = 1.,
+                 delay_offset: float = 0., visibility: float = 1., seed: Optional[int] = None):
+        """
+        :param rate1: the single count rate on detector 1 in Hz.
+        :param rate2: the single count rate on detector 2 in Hz.
+        :param pair_rate: the rate of true coincidences in Hz when the delays are aligned and no polarisers are used.
+        :param sigma: the width (in ns) of the edges of the coincidence window.
+        :param delay_offset: the relative delay (in ns) at which the coincidences peak.
+        :param visibility: the visibility of the polarisation correlations.
+        :param seed: the seed of the random number generator.
+        """
+        self.rate1 = rate1
+        self.rate2 = rate2
+        self.pair_rate = pair_rate
+        self.sigma = sigma
+        self.delay_offset = delay_offset
+        self.visibility = visibility
+        self.rng = np.random.default_rng(seed)
+
+    def _expected(self, rate1, rate2, pair_rate, window, gate) -> np.ndarray:
+        """
+        Stacks the expected singles and coincidences (true and accidental) along the last axis.
+        """
+        rate1, rate2, pair_rate, window = np.broadcast_arrays(rate1, rate2, pair_rate, window)
+        return gate * np.stack([rate1, rate2, pair_rate + accidental_coincidences(rate1, rate2, window)], axis=-1)
+
+    def expected_window(self, relative_delay, window, gate: float = 1.) -> np.ndarray:
+        """
+        :param relative_delay: the relative delay (in ns) between the counters.
+        :param window: half the width (in ns) of the coincidence window.
+        :param gate: the gate time in s.
+        :return: the expected counts, the last axis holds counter 1, counter 2 and the coincidences.
+        """
+        overlap = coincidence_window(relative_delay, window, self.sigma, self.delay_offset)
+        return self._expected(self.rate1, self.rate2, self.pair_rate * overlap, window, gate)
+
+    def expected_bell(self, alpha, beta, relative_delay=0., window=12., gate: float = 1.) -> np.ndarray:
+        """
+        The expected counts with polarisers in front of both detectors, for a source that emits the maximally entangled
+        state (|HH> + |VV>) / sqrt(2). The singles are unpolarised, so each polariser transmits half of them.
+        :param alpha: the polarisation angle (in degrees) analysed on side A.
+        :param beta: the polarisation angle (in degrees) analysed on side B.
+        :return: the expected counts, see `expected_window`.
+        """
+        correlation = 1 + self.visibility * np.cos(2 * np.deg2rad(np.asarray(alpha) - np.asarray(beta)))
+        overlap = coincidence_window(relative_delay, window, self.sigma, self.delay_offset)
+        return self._expected(self.rate1 / 2, self.rate2 / 2, self.pair_rate * overlap * correlation / 4, window,
+                              gate)
+
+    def sample(self, expected: np.ndarray, runs: Optional[int] = None, dtype=np.int64) -> np.ndarray:
+        """
+        Draws Poisson distributed counts around the expected counts.
+        :param expected: the expected counts, of any shape.
+        :param runs: if given, a leading axis of this many independent runs is added.
+        :param dtype: the integer type of the counts, e.g. np.uint32 to halve the memory of large batches.
+        """
+        if runs is not None:
+            expected = np.broadcast_to(expected, (runs,) + np.shape(expected))
+        return self.rng.poisson(expected).astype(dtype, copy=False)
+
+    def window_scan(self, steps: Dict[DelayLines, np.ndarray], gate: float = 1., runs: Optional[int] = None,
+                    dtype=np.int64) -> np.ndarray:
+        """
+        Generates the counts of a scan over delay line settings, such as the WindowShiftEffect.
+        :param steps: the steps of each delay line at every point of the scan.
+        :param gate: the gate time in s.
+        :param runs: the number of independent runs, see `sample`.
+        :return: the counts with shape ([runs,] points, 3).
+        """
+        return self.sample(self.expected_window(*delays_from_steps(steps), gate), runs, dtype)
+
+    def bell_test(self, alpha: np.ndarray, beta: np.ndarray, measurements: int, steps: Dict[DelayLines, int] = None,
+                  gate: float = 1., runs: Optional[int] = None, dtype=np.int64) -> np.ndarray:
+        """
+        Generates the counts of a Bell test in the layout of `BellTest.data`.
+        :param alpha: the polarisation angle (in degrees) analysed on side A for every setting.
+        :param beta: the polarisation angle (in degrees) analysed on side B for every setting.
+        :param measurements: the number of measurements per setting.
+        :param steps: the steps of the delay lines, by default the delays are aligned with a 12 ns window.
+        :return: the counts with shape ([runs,] settings, 3, measurements).
+        """
+        relative_delay, window = delays_from_steps(steps) if steps is not None else (self.delay_offset, 12.)
+        expected = self.expected_bell(alpha, beta, relative_delay, window, gate)
+        expected = np.broadcast_to(expected[:, :, None], expected.shape + (measurements,))
+        return self.sample(expected, runs, dtype)
@@ -0,0 +1,161 @@
+"""
+Tools to map the polarisation of the pump and the S/P ratio of the coincidences as a function of the tip-tilt of the
+BBO crystal. The measurement tables are written by hand, with tip-tilt coordinates as fractions of a turn, e.g.
+"(1/4,-3/4)", and powers with decimal commas, e.g. "0,491". This module parses them into typed arrays. All quantities
+are then computed for all points at once, and dense maps are interpolated from the scattered points.
+"""
+import csv
+from fractions import Fraction
+from typing import Callable, Dict, Tuple
+
+import numpy as np
+
+from utils import TIP_TILT_COINCIDENCES_FILE, TIP_TILT_POLARISATION_FILE
+
+# Tilt of the BBO crystal in degrees per turn of the tip-tilt screws.
+ANGLE_PER_TURN = 0.399
+# Angle of the polariser (in degrees) at which the polarisation is horizontal.
+POLARISER_OFFSET = 86
+
+COORDINATE_COLUMN = 'BBO tip-tilt (hor turns, vert turns)'
+RATIO_COLUMN = 'S/P ratio'
+
+
+def parse_coordinate(text: str) -> Tuple[float, float]:
+    """
+    Parses a tip-tilt coordinate, e.g. "(1/4,-3/4)".
+    :return: the horizontal and vertical number of turns.
+    """
+    horizontal, vertical = text.strip().strip('()').split(',')
+    return float(Fraction(horizontal)), float(Fraction(vertical))
+
+
+def parse_number(text: str) -> float:
+    """
+    Parses a number that may use a decimal comma, missing values are parsed as NaN.
+    """
+    text = text.strip()
+    return float(text.replace(',', '.')) if text else np.nan
+
+
+def read_table(file_name: str, converters: Dict[str, Callable[[str], object]]) -> Dict[str, np.ndarray]:
+    """
+    Reads the columns of a CSV file that have a converter. Whitespace around the values is ignored, such that the
+    columns of the file can be aligned.
+    :param file_name: the file to read.
+    :param converters: the function that parses the values of each column, by column name.
+    :return: an array per column, with a row for every row of the file.
+    """
+    with open(file_name, newline='') as file:
+        reader = csv.reader(file)
+        header = [name.strip() for name in next(reader)]
+        indices = {name: header.index(name) for name in converters}
+        values = {name: [] for name in converters}
+        for row in reader:
+            if not any(value.strip() for value in row):
+                continue
+            for name, converter in converters.items():
+                values[name].append(converter(row[indices[name]]))
+    return {name: np.array(column, dtype=float) for name, column in values.items()}
+
+
+def read_polarisation_scan(file_name: str = TIP_TILT_POLARISATION_FILE) -> Dict[str, np.ndarray]:
+    """
+    Reads a scan of the pump polarisation. At every tip-tilt coordinate the polariser angles and powers of two minima
+    and two maxima are measured.
+    :return: a dictionary with the tilts in degrees ('tilt', shape (n, 2)) and the angles in degrees and powers in mW
+        of the minima and maxima ('angle_min', 'power_min', 'angle_max' and 'power_max', each of shape (n, 2)).
+    """
+    converters = {COORDINATE_COLUMN: parse_coordinate}
+    for extremum in ('minimum', 'maximum'):
+        for i in (1, 2):
+            converters[f'angle {extremum} {i}'] = parse_number
+            converters[f'{extremum[:3]}value {i} (mW)'] = parse_number
+    table = read_table(file_name, converters)
+
+    def pair(name: str) -> np.ndarray:
+        return np.stack([table[name.format(i)] for i in (1, 2)], axis=1)
+
+    return {
+        'tilt':      table[COORDINATE_COLUMN] * ANGLE_PER_TURN,
+        'angle_min': pair('angle minimum {}'),
+        'power_min': pair('minvalue {} (mW)'),
+        'angle_max': pair('angle maximum {}'),
+        'power_max': pair('maxvalue {} (mW)'),
+    }
+
+
+def read_ratio_scan(file_name: str = TIP_TILT_COINCIDENCES_FILE) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Reads a scan of the S/P ratio of the coincidences.
+    :return: the tilts in degrees (shape (n, 2)) and the S/P ratio at each tilt.
+    """
+    table = read_table(file_name, {COORDINATE_COLUMN: parse_coordinate, RATIO_COLUMN: parse_number})
+    return table[COORDINATE_COLUMN] * ANGLE_PER_TURN, table[RATIO_COLUMN]
+
+
+def degree_of_polarisation(power_max: np.ndarray, power_min: np.ndarray) -> np.ndarray:
+    """
+    Computes the degree of polarisation from the power behind the polariser in the maxima and minima. Repeated
+    measurements along the last axis are averaged, missing (NaN) measurements are ignored.
+    """
+    power_max = np.nanmean(power_max, axis=-1)
+    power_min = np.nanmean(power_min, axis=-1)
+    return (power_max - power_min) / (power_max + power_min)
+
+
+def polarisation_angle(angle_max: np.ndarray, angle_min: np.ndarray, offset: float = POLARISER_OFFSET) -> np.ndarray:
+    """
+    Computes the angle of the polarisation, in radians in the interval [0, pi], from the polariser angles (in degrees)
+    of two maxima and two minima. The second maximum lies half a turn after the first maximum, the minima a quarter
+    turn before and after it. All four are shifted onto the first maximum and averaged.
+    :param angle_max: the angles of the maxima, shape (..., 2).
+    :param angle_min: the angles of the minima, shape (..., 2).
+    :param offset: the polariser angle (in degrees) at which the polarisation is horizontal.
+    """
+    shifts = np.array([0, np.pi, 3 / 2 * np.pi, 1 / 2 * np.pi])
+    angles = np.deg2rad(np.concatenate([angle_max, angle_min], axis=-1) - offset)
+    angles[..., 1:] = (angles[..., 1:] + shifts[1:]) % (2 * np.pi)
+    angle = np.mean(angles, axis=-1)
+    return np.where(angle > np.pi, angle - np.pi, angle)
+
+
+def polarisation_vectors(degree: np.ndarray, angle: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :return: the horizontal and vertical component of vectors with the degree of polarisation as length, pointing
+        along the polarisation.
+    """
+    return degree * np.cos(angle), degree * np.sin(angle)
+
+
+def sp_ratio(s_coincidences: np.ndarray, p_coincidences: np.ndarray) -> np.ndarray:
+    """
+    Computes the ratio of S to P polarised coincidences, the ratio is NaN where no P coincidences were counted.
+    """
+    s_coincidences = np.asarray(s_coincidences, dtype=float)
+    p_coincidences = np.asarray(p_coincidences, dtype=float)
+    return np.divide(s_coincidences, p_coincidences, out=np.full(np.broadcast(s_coincidences, p_coincidences).shape,
+                                                                 np.nan), where=p_coincidences != 0)
+
+
+def interpolate_map(points: np.ndarray, values: np.ndarray, resolution: int = 200, method: str = 'cubic',
+                    log: bool = False) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Interpolates a dense map from values at scattered tip-tilt points. Outside the convex hull of the points the map
+    is NaN.
+    :param points: the tip-tilt of each point, shape (n, 2).
+    :param values: the value at each point.
+    :param resolution: the number of grid points along each axis.
+    :param method: the interpolation method of `scipy.interpolate.griddata`.
+    :param log: whether to interpolate the logarithm of the values, which suits ratios that span decades.
+    :return: the horizontal and vertical tilts of the grid and the interpolated values, each of shape
+        (resolution, resolution).
+    """
+    from scipy.interpolate import griddata
+
+    valid = np.isfinite(values) & np.all(np.isfinite(points), axis=1)
+    points, values = points[valid], values[valid]
+    horizontal, vertical = np.meshgrid(np.linspace(points[:, 0].min(), points[:, 0].max(), resolution),
+                                       np.linspace(points[:, 1].min(), points[:, 1].max(), resolution))
+    interpolated = griddata(points, np.log(values) if log else values, (horizontal, vertical), method=method)
+    return horizontal, vertical, np.exp(interpolated) if log else interpolated
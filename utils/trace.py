@@ -0,0 +1,151 @@
+"""
+Traces of the serial traffic of a device, see `Arduino.start_capture`. A trace holds every command the host wrote and
+every line and block of binary data it read, with the time at which it happened. Traces of real lab sessions can be fed
+back into the interfaces with `utils.replay`, such that the parsing, scheme and storage code can be tested and
+benchmarked on real replies without the setup.
+
+A trace file starts with a header, followed by a record per event:
+
+    offset  size  field
+    0       8     magic (b'ARDTRACE')
+    8       2     version
+    10      2     length of the name of the device
+    12      n     name of the device, UTF-8
+
+    0       8     time in s since the start of the capture, float64
+    8       1     kind of event: WRITE, LINE or DATA
+    9       4     length of the data
+    13      n     data
+
+All numbers are little-endian.
+"""
+import struct
+import threading
+from time import perf_counter
+from typing import BinaryIO, List, NamedTuple, Optional
+
+TRACE_MAGIC = b'ARDTRACE'
+TRACE_VERSION = 1
+# A command written by the host, including the newline.
+WRITE = 0
+# A line read by the host, including the end of line. A line without end of line was cut short by a read timeout.
+LINE = 1
+# Binary data read by the host, e.g. counter frames.
+DATA = 2
+KINDS = (WRITE, LINE, DATA)
+
+_HEADER = struct.Struct('<8sHH')
+_RECORD = struct.Struct('<dBI')
+
+
+class TraceEvent(NamedTuple):
+    time: float
+    kind: int
+    data: bytes
+
+
+class Trace:
+    """
+    The events of a trace, in the order in which they happened.
+    """
+
+    def __init__(self, name: str, events: List[TraceEvent]):
+        self.name = name
+        self.events = events
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    @property
+    def duration(self) -> float:
+        """
+        The time in s between the start of the capture and the last event.
+        """
+        return self.events[-1].time if self.events else 0.
+
+    def of_kind(self, *kinds: int) -> List[TraceEvent]:
+        return [event for event in self.events if event.kind in kinds]
+
+    def __str__(self) -> str:
+        written = sum(len(event.data) for event in self.of_kind(WRITE))
+        read = sum(len(event.data) for event in self.of_kind(LINE, DATA))
+        return (f"Trace of the {self.name}: {len(self)} events in {self.duration:.3f} s, {written} bytes written and "
+                f"{read} bytes read.")
+
+
+class TraceWriter:
+    """
+    Writes the events of a capture to a trace file as they happen. Events may be recorded from several threads.
+    """
+
+    def __init__(self, file_name: str, name: str):
+        """
+        :param file_name: the trace file, it is overwritten if it exists.
+        :param name: the name of the device.
+        """
+        self.file_name = file_name
+        self.events = 0
+        self._lock = threading.Lock()
+        self._file: Optional[BinaryIO] = open(file_name, 'wb')
+        encoded = name.encode()
+        self._file.write(_HEADER.pack(TRACE_MAGIC, TRACE_VERSION, len(encoded)) + encoded)
+        self._start = perf_counter()
+
+    def __enter__(self) -> 'TraceWriter':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def record(self, kind: int, data: bytes, time: Optional[float] = None):
+        """
+        Records an event, events recorded after the writer was closed are ignored.
+        :param time: the time in s since the start of the capture, by default now.
+        """
+        if time is None:
+            time = perf_counter() - self._start
+        with self._lock:
+            if self._file is not None:
+                self._file.write(_RECORD.pack(time, kind, len(data)) + data)
+                self.events += 1
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def read_trace(file_name: str) -> Trace:
+    """
+    :return: the trace stored in a file.
+    :raises ValueError: if the file is not a trace or has an unsupported version.
+    """
+    with open(file_name, 'rb') as file:
+        contents = file.read()
+
+    if len(contents) < _HEADER.size:
+        raise ValueError(f'{file_name} is not a trace file.')
+    magic, version, name_length = _HEADER.unpack_from(contents)
+    if magic != TRACE_MAGIC:
+        raise ValueError(f'{file_name} is not a trace file.')
+    if version != TRACE_VERSION:
+        raise ValueError(f'{file_name} has version {version} of the trace format, only {TRACE_VERSION} is supported.')
+    offset = _HEADER.size + name_length
+    name = contents[_HEADER.size:offset].decode()
+
+    events = []
+    while offset + _RECORD.size <= len(contents):
+        time, kind, length = _RECORD.unpack_from(contents, offset)
+        offset += _RECORD.size
+        events.append(TraceEvent(time, kind, contents[offset:offset + length]))
+        offset += length
+    # A capture that was interrupted can end with a partial record, which is dropped.
+    if events and offset > len(contents):
+        events.pop()
+    return Trace(name, events)